@@ -36,7 +36,7 @@ from .schemas import (
 )
 from .llm_client import LLMClient
 from .logger import WorkflowLogger
-from .store import SessionStore
+from .store import BaseSessionStore, ConcurrentModificationError, SessionStore, create_session_store
 from .tools import ToolExecutor
 from .standards import default_goals
 
@@ -74,7 +74,10 @@ __all__ = [
     # 基础设施
     "LLMClient",
     "WorkflowLogger",
+    "BaseSessionStore",
     "SessionStore",
+    "create_session_store",
+    "ConcurrentModificationError",
     "ToolExecutor",
     "default_goals",
 ]
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .fallbacks import record_fallback
+
+
+# ============================================================================
+# Per-run deadline and token budget
+# ============================================================================
+# 网关变慢时，单次 LLM 调用最长等待 LLM_TIMEOUT（默认 180 秒），3.3/3.4/3.5 的
+# 多轮调用叠加后 /api/workflow/run 可能挂起数分钟。每次运行可以带一个 RunBudget：
+#   - 截止时间：剩余时间不足以覆盖预期的单次调用延迟（按实际延迟滑动平均）时不再调用
+#   - token 预算：剩余 token 不足以覆盖一次调用的预估用量时不再调用
+#   - 预算通过 contextvar 传给模块函数和 LLMClient；各步骤改走已有的启发式路径
+#     （大纲骨架、基础页面、布局规则打分），并把降级的页面记录在 degraded 里
+#   - LLMClient 发请求前再检查一次（BudgetExhausted），并把超时限制在剩余时间内
+#
+# Env:
+#   - WORKFLOW_DEADLINE_S: 每次运行的截止秒数 (default: 0 = 不限)
+#   - WORKFLOW_TOKEN_BUDGET: 每次运行的 token 上限 (default: 0 = 不限)
+#   - LLM_EXPECTED_LATENCY_S: 单次调用的初始预期延迟 (default: 15)
+
+_LATENCY_ALPHA = 0.3
+_DEFAULT_CALL_TOKENS = 1500
+
+
+class BudgetExhausted(Exception):
+    """The run budget can no longer cover another LLM call.
+
+    A plain Exception on purpose: the modules' `except Exception` fallbacks
+    should treat it like any other failed call and take their heuristic path.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(f"run budget exhausted: {reason}")
+        self.reason = reason
+
+
+class RunBudget:
+    def __init__(
+        self,
+        deadline_s: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        expected_latency_s: float = 15.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.deadline_s = float(deadline_s) if deadline_s and deadline_s > 0 else None
+        self.token_budget = int(token_budget) if token_budget and token_budget > 0 else None
+        self.expected_latency_s = float(expected_latency_s)
+        self.expected_tokens = _DEFAULT_CALL_TOKENS
+        self.tokens_used = 0
+        self.calls = 0
+        self.degraded: List[Dict[str, Any]] = []
+        self._reserved = 0
+        self._clock = clock
+        self._started = clock()
+
+    @classmethod
+    def from_env(
+        cls,
+        deadline_s: Optional[float] = None,
+        token_budget: Optional[int] = None,
+    ) -> Optional["RunBudget"]:
+        """Explicit arguments win over the env defaults; None when neither limit is set."""
+        if deadline_s is None:
+            deadline_s = float(os.getenv("WORKFLOW_DEADLINE_S") or 0)
+        if token_budget is None:
+            token_budget = int(os.getenv("WORKFLOW_TOKEN_BUDGET") or 0)
+        if deadline_s <= 0 and token_budget <= 0:
+            return None
+        return cls(
+            deadline_s=deadline_s,
+            token_budget=token_budget,
+            expected_latency_s=float(os.getenv("LLM_EXPECTED_LATENCY_S") or 15),
+        )
+
+    def remaining_s(self) -> Optional[float]:
+        if self.deadline_s is None:
+            return None
+        return self.deadline_s - (self._clock() - self._started)
+
+    def remaining_tokens(self) -> Optional[int]:
+        if self.token_budget is None:
+            return None
+        return self.token_budget - self.tokens_used - self._reserved
+
+    def shortfall(self, estimated_tokens: Optional[int] = None) -> Optional[str]:
+        """Why another call can't be covered ("deadline" / "token_budget"), or None."""
+        remaining_s = self.remaining_s()
+        if remaining_s is not None and remaining_s < self.expected_latency_s:
+            return "deadline"
+        remaining_tokens = self.remaining_tokens()
+        if remaining_tokens is not None and remaining_tokens < (estimated_tokens or self.expected_tokens):
+            return "token_budget"
+        return None
+
+    def reserve(self, estimated_tokens: int) -> None:
+        """Claim tokens for a call about to start, so parallel calls don't overshoot."""
+        reason = self.shortfall(estimated_tokens)
+        if reason is not None:
+            raise BudgetExhausted(reason)
+        self._reserved += estimated_tokens
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int], latency_s: float) -> None:
+        """Release the reservation and fold the call's real usage into the estimates."""
+        self._reserved = max(0, self._reserved - estimated_tokens)
+        used = actual_tokens if actual_tokens is not None else estimated_tokens
+        self.tokens_used += used
+        self.calls += 1
+        self.expected_latency_s += _LATENCY_ALPHA * (latency_s - self.expected_latency_s)
+        self.expected_tokens = int(self.expected_tokens + _LATENCY_ALPHA * (used - self.expected_tokens))
+
+    def timeout(self, default: float) -> float:
+        """Per-request timeout clamped to the time left before the deadline."""
+        remaining_s = self.remaining_s()
+        if remaining_s is None:
+            return default
+        return max(0.1, min(default, remaining_s))
+
+    def degrade(self, stage: str, index: int, reason: str) -> None:
+        if not self.is_degraded(stage, index):
+            self.degraded.append({"stage": stage, "index": index, "reason": reason})
+
+    def is_degraded(self, stage: str, index: Optional[int] = None) -> bool:
+        return any(d["stage"] == stage and (index is None or d["index"] == index) for d in self.degraded)
+
+    def summary(self) -> Dict[str, Any]:
+        remaining_s = self.remaining_s()
+        return {
+            "deadline_s": self.deadline_s,
+            "token_budget": self.token_budget,
+            "elapsed_s": round(self._clock() - self._started, 3),
+            "remaining_s": round(remaining_s, 3) if remaining_s is not None else None,
+            "tokens_used": self.tokens_used,
+            "calls": self.calls,
+            "expected_latency_s": round(self.expected_latency_s, 3),
+            "degraded": len(self.degraded),
+        }
+
+
+_current_budget: contextvars.ContextVar[Optional[RunBudget]] = contextvars.ContextVar(
+    "run_budget", default=None
+)
+
+
+def bind_run_budget(budget: Optional[RunBudget]) -> contextvars.Token:
+    return _current_budget.set(budget)
+
+
+def unbind_run_budget(token: contextvars.Token) -> None:
+    _current_budget.reset(token)
+
+
+def current_run_budget() -> Optional[RunBudget]:
+    return _current_budget.get()
+
+
+def budget_shortfall(error: Optional[BaseException] = None) -> Optional[str]:
+    """Reason the current run must skip LLM work, or None (also None without a budget).
+
+    Pass the exception from a failed call to recognise BudgetExhausted and
+    timeouts that were clamped to the deadline.
+    """
+    budget = _current_budget.get()
+    if budget is None:
+        return None
+    if isinstance(error, BudgetExhausted):
+        return error.reason
+    return budget.shortfall()
+
+
+def record_degraded(stage: str, index: int, reason: str) -> None:
+    """Note that page `index` of `stage` took the heuristic path because of the budget."""
+    record_fallback(stage, index)
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.degrade(stage, index, reason)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+
+# ============================================================================
+# Request-scoped cancellation
+# ============================================================================
+# 老师关闭页面或重新提交时，/api/workflow/run 仍会把 3.3/3.4 的每个 gather 分支跑完，
+# 白白消耗 token。每次运行持有一个 CancellationToken：
+#   - 取消时立即取消挂在令牌上的任务（asyncio.gather 的子任务随之取消）
+#   - 令牌通过 contextvar 传给模块函数和 LLMClient，取消后不再发起新的 LLM 请求
+#   - RunCancelled 继承 CancelledError，模块里 `except Exception` 的降级分支不会吞掉它
+
+
+class RunCancelled(asyncio.CancelledError):
+    """The run was cancelled through its token (client disconnected, superseded, ...)."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancellationToken:
+    def __init__(self) -> None:
+        self.reason: Optional[str] = None
+        self._tasks: Set["asyncio.Future[Any]"] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancel every attached task; returns False if already cancelled."""
+        if self.cancelled:
+            return False
+        self.reason = reason
+        for task in list(self._tasks):
+            task.cancel()
+        return True
+
+    def raise_if_cancelled(self) -> None:
+        if self.reason is not None:
+            raise RunCancelled(self.reason)
+
+    def attach(self, task: "asyncio.Future[T]") -> "asyncio.Future[T]":
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if self.cancelled:
+            task.cancel()
+        return task
+
+    async def run(self, coro: Awaitable[T]) -> T:
+        """Run `coro` as a task bound to this token; token cancellation surfaces as RunCancelled."""
+        task = self.attach(asyncio.ensure_future(coro))
+        try:
+            return await task
+        except asyncio.CancelledError as e:
+            if self.cancelled and task.cancelled() and not isinstance(e, RunCancelled):
+                raise RunCancelled(self.reason or "cancelled") from None
+            raise
+
+    async def drained(self) -> None:
+        """Wait until every attached task has finished unwinding."""
+        pending = [t for t in self._tasks if not t.done()]
+        if pending:
+            await asyncio.wait(pending)
+
+
+_current_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "cancel_token", default=None
+)
+
+
+def bind_cancel_token(token: Optional[CancellationToken]) -> contextvars.Token:
+    return _current_token.set(token)
+
+
+def unbind_cancel_token(token: contextvars.Token) -> None:
+    _current_token.reset(token)
+
+
+def current_cancel_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+def check_cancelled() -> None:
+    """Raise RunCancelled if the current run's token has been cancelled."""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+async def watch_disconnect(request: Any, token: CancellationToken, interval: float = 0.5) -> None:
+    """Poll a Starlette request and cancel `token` once the client has gone away."""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("client_disconnected")
+            return
+        await asyncio.sleep(interval)
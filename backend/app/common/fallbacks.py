@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import contextvars
+from typing import Optional, Set, Tuple
+
+
+# ============================================================================
+# Per-run fallback tracking
+# ============================================================================
+# 3.3/3.4/3.5 的 LLM 调用失败时，模块函数会吞掉异常改用确定性结果（默认大纲、基础页面、
+# 规则打分布局），返回值本身看不出来。每次运行绑定一个 RunFallbacks，这些降级分支
+# 在其中记下 (阶段, 页码)，运行结束前：
+#   - 阶段缓存不保存走过降级分支的阶段输出（否则一次临时错误会被长期复用）
+#   - 进度事件据此标记 fallback，检查点不记录这些页面
+
+
+class RunFallbacks:
+    def __init__(self) -> None:
+        self._items: Set[Tuple[str, Optional[int]]] = set()
+
+    def record(self, stage: str, index: Optional[int] = None) -> None:
+        self._items.add((stage, index))
+
+    def used(self, stage: str, index: Optional[int] = None) -> bool:
+        """Whether page `index` of `stage` (or, with index=None, any part of it) fell back."""
+        if index is None:
+            return any(s == stage for s, _ in self._items)
+        return (stage, index) in self._items or (stage, None) in self._items
+
+
+_current_fallbacks: contextvars.ContextVar[Optional[RunFallbacks]] = contextvars.ContextVar(
+    "run_fallbacks", default=None
+)
+
+
+def bind_run_fallbacks(fallbacks: Optional[RunFallbacks]) -> contextvars.Token:
+    return _current_fallbacks.set(fallbacks)
+
+
+def unbind_run_fallbacks(token: contextvars.Token) -> None:
+    _current_fallbacks.reset(token)
+
+
+def current_run_fallbacks() -> Optional[RunFallbacks]:
+    return _current_fallbacks.get()
+
+
+def record_fallback(stage: str, index: Optional[int] = None) -> None:
+    """Note that `stage` (page `index`, or the whole stage) used its non-LLM fallback."""
+    fallbacks = _current_fallbacks.get()
+    if fallbacks is not None:
+        fallbacks.record(stage, index)
+
+
+def used_fallback(stage: str, index: Optional[int] = None) -> bool:
+    fallbacks = _current_fallbacks.get()
+    return fallbacks is not None and fallbacks.used(stage, index)
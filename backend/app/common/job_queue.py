@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+# ============================================================================
+# Durable local job queue (SQLite, WAL)
+# ============================================================================
+# 图片生成等长任务不再挂在请求 worker 的 BackgroundTasks 上：
+#   - web 进程只负责 enqueue，立即返回
+#   - 独立的 worker 进程（python -m app.modules.render.worker）lease 任务并执行，可单独扩容
+#   - job_key 幂等（如 session_id + slot_id + prompt hash），重复提交不会重复生成
+#   - lease 带可见性超时：worker 崩溃或重启后，过期的任务自动被其他 worker 重新领取
+# 状态：queued -> leased -> done | failed（失败且未超过 max_attempts 时回到 queued）
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def image_job_key(session_id: str, slot_id: str, prompt: str) -> str:
+    """Idempotency key for one image slot: session + slot + prompt hash."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{session_id}:{slot_id}:{prompt_hash}"
+
+
+class JobQueue:
+    """SQLite-backed job queue with leases and visibility timeouts.
+
+    Safe to share between processes on one host (each opens its own
+    connection); lease() claims jobs inside an IMMEDIATE transaction so two
+    workers never receive the same job.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_key TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " session_id TEXT NOT NULL,"
+            " slot_id TEXT,"
+            " priority INTEGER NOT NULL DEFAULT 1,"
+            " page_index INTEGER NOT NULL DEFAULT 0,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " max_attempts INTEGER NOT NULL,"
+            " lease_owner TEXT,"
+            " lease_expires_at REAL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (kind, status, priority, page_index, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id)")
+
+    @classmethod
+    def from_env(cls, data_dir: str) -> Optional["JobQueue"]:
+        """Env:
+          - IMAGE_QUEUE: "1" to run image generation through the durable queue (default: 0)
+          - IMAGE_QUEUE_PATH (default: data/queue.sqlite)
+          - IMAGE_QUEUE_MAX_ATTEMPTS (default: 3)
+        """
+        if (os.getenv("IMAGE_QUEUE") or "0") != "1":
+            return None
+        return cls(
+            os.getenv("IMAGE_QUEUE_PATH") or os.path.join(data_dir, "queue.sqlite"),
+            max_attempts=int(os.getenv("IMAGE_QUEUE_MAX_ATTEMPTS") or 3),
+        )
+
+    # --- producer side -----------------------------------------------------
+
+    def enqueue(
+        self,
+        job_key: str,
+        kind: str,
+        session_id: str,
+        payload: Dict[str, Any],
+        slot_id: Optional[str] = None,
+        priority: int = 1,
+        page_index: int = 0,
+        requeue_failed: bool = True,
+    ) -> str:
+        """Add a job unless `job_key` already exists; return its current status.
+
+        A finished job is left alone (idempotent resubmit); a failed one is
+        queued again when `requeue_failed` is set (explicit retry).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT status FROM jobs WHERE job_key = ?", (job_key,)).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO jobs (job_key, kind, session_id, slot_id, priority, page_index, payload,"
+                        " status, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_key, kind, session_id, slot_id, priority, page_index,
+                         json.dumps(payload, ensure_ascii=False), QUEUED, self.max_attempts, now, now),
+                    )
+                    status = QUEUED
+                elif row[0] == FAILED and requeue_failed:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = 0, error = NULL, lease_owner = NULL,"
+                        " lease_expires_at = NULL, updated_at = ? WHERE job_key = ?",
+                        (QUEUED, now, job_key),
+                    )
+                    status = QUEUED
+                else:
+                    status = row[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return status
+
+    # --- consumer side -----------------------------------------------------
+
+    def lease(self, kind: str, worker_id: str, limit: int = 1, lease_seconds: float = 300) -> List[Dict[str, Any]]:
+        """Claim up to `limit` ready jobs (queued, or leased with an expired lease).
+
+        Jobs come out by priority, then page index, then age.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT job_key, session_id, slot_id, payload, attempts FROM jobs"
+                    " WHERE kind = ? AND (status = ? OR (status = ? AND lease_expires_at < ?))"
+                    " ORDER BY priority, page_index, created_at LIMIT ?",
+                    (kind, QUEUED, LEASED, now, limit),
+                ).fetchall()
+                for key, *_ in rows:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?,"
+                        " attempts = attempts + 1, updated_at = ? WHERE job_key = ?",
+                        (LEASED, worker_id, now + lease_seconds, now, key),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            {"job_key": key, "session_id": sid, "slot_id": slot, "payload": json.loads(payload), "attempt": attempts + 1}
+            for key, sid, slot, payload, attempts in rows
+        ]
+
+    def heartbeat(self, job_key: str, worker_id: str, lease_seconds: float = 300) -> bool:
+        """Extend a lease; False if the job is no longer ours (expired and re-leased)."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE job_key = ? AND status = ? AND lease_owner = ?",
+                (now + lease_seconds, now, job_key, LEASED, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job_key: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL, lease_expires_at = NULL,"
+                " updated_at = ? WHERE job_key = ? AND lease_owner = ?",
+                (DONE, json.dumps(result or {}, ensure_ascii=False), now, job_key, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def fail(self, job_key: str, worker_id: str, error: str, retry: bool = True) -> str:
+        """Record a failed attempt; requeue while attempts remain. Returns the new status."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE job_key = ? AND lease_owner = ?",
+                (job_key, worker_id),
+            ).fetchone()
+            if row is None:
+                return LEASED
+            status = QUEUED if retry and row[0] < row[1] else FAILED
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL,"
+                " updated_at = ? WHERE job_key = ?",
+                (status, error, now, job_key),
+            )
+        return status
+
+    def release(self, worker_id: str) -> int:
+        """Return all jobs leased by `worker_id` to the queue (graceful shutdown)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL,"
+                " lease_expires_at = NULL, updated_at = ? WHERE status = ? AND lease_owner = ?",
+                (QUEUED, time.time(), LEASED, worker_id),
+            )
+        return cur.rowcount
+
+    # --- inspection --------------------------------------------------------
+
+    def session_jobs(self, session_id: str, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Latest job per slot for a session (newest prompt wins)."""
+        sql = "SELECT job_key, kind, slot_id, status, attempts, result, error FROM jobs WHERE session_id = ?"
+        args: List[Any] = [session_id]
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY created_at", args).fetchall()
+        latest: Dict[str, Dict[str, Any]] = {}
+        for key, k, slot, status, attempts, result, error in rows:
+            latest[slot or key] = {
+                "job_key": key,
+                "kind": k,
+                "slot_id": slot,
+                "status": status,
+                "attempts": attempts,
+                "result": json.loads(result) if result else None,
+                "error": error,
+            }
+        return list(latest.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
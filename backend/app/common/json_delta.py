@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, List
+
+
+# ============================================================================
+# Minimal JSON Patch (RFC 6902: add / remove / replace)
+# ============================================================================
+# 仅用于 SessionStore 历史记录：对相邻两次快照做结构化 diff，只记录变化部分。
+# 列表按下标逐项比较（末尾追加/删除），不做 LCS 对齐，足够覆盖按页更新的场景。
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Return a JSON Patch turning `old` into `new`."""
+    if type(old) is not type(new):
+        return [{"op": "replace", "path": path, "value": new}]
+
+    if isinstance(old, dict):
+        ops: List[Dict[str, Any]] = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(diff(old[key], value, child))
+        return ops
+
+    if isinstance(old, list):
+        ops = []
+        common = min(len(old), len(new))
+        for i in range(common):
+            ops.extend(diff(old[i], new[i], f"{path}/{i}"))
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        # 从尾部删除，保证下标在应用时依然有效
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return ops
+
+    if old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+
+def apply(doc: Any, patch: List[Dict[str, Any]]) -> Any:
+    """Apply a patch produced by `diff` and return the new document (input untouched)."""
+    doc = copy.deepcopy(doc)
+    for op in patch:
+        path = op["path"]
+        if path == "":
+            doc = copy.deepcopy(op.get("value"))
+            continue
+        tokens = [_unescape(t) for t in path.split("/")[1:]]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        kind = op["op"]
+        if isinstance(parent, list):
+            idx = len(parent) if last == "-" else int(last)
+            if kind == "add":
+                parent.insert(idx, copy.deepcopy(op["value"]))
+            elif kind == "remove":
+                del parent[idx]
+            elif kind == "replace":
+                parent[idx] = copy.deepcopy(op["value"])
+            else:
+                raise ValueError(f"unsupported patch op: {kind}")
+        else:
+            if kind in ("add", "replace"):
+                parent[last] = copy.deepcopy(op["value"])
+            elif kind == "remove":
+                del parent[last]
+            else:
+                raise ValueError(f"unsupported patch op: {kind}")
+    return doc
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+# ============================================================================
+# Batched chat_json: N items per request
+# ============================================================================
+# 逐项调用时，每个请求都重复同一份系统提示词和共享上下文（如可选布局列表）。
+# 批量模式把 N 项打包进一次 chat_json，响应为按 index 对齐的数组；
+# 缺失或未通过校验的项再逐项调用 fallback，因此结果与逐项调用等价。
+# 只有传输错误和响应格式错误才转为逐项调用；BudgetExhausted / RunCancelled 直接抛出，
+# 运行已被要求停止时不能再逐项发请求。
+
+# 单批请求失败后可以改为逐项调用的错误（chat_json 对非 JSON 响应抛 RuntimeError）
+_RECOVERABLE_ERRORS = (httpx.HTTPError, RuntimeError, ValueError, KeyError, IndexError, TypeError)
+
+
+def batch_size_from_env(default: int = 10) -> int:
+    """Env:
+      - LLM_BATCH: "1" to enable batching (default: 0, opt-in)
+      - LLM_BATCH_SIZE: items per request (default: 10)
+    """
+    if (os.getenv("LLM_BATCH") or "0") != "1":
+        return 1
+    return max(1, int(os.getenv("LLM_BATCH_SIZE") or default))
+
+
+BATCH_INSTRUCTIONS = """
+
+## 批量模式
+输入中的 `items` 是多个相互独立的任务（`shared` 为它们共用的上下文）。
+请对每一项分别按上面的要求处理，输出：
+{"results": [{"index": <与输入相同的 index>, ...单项结果字段}]}
+每一项都必须有且只有一个结果，index 必须与输入一致。只输出JSON。"""
+
+
+async def batch_chat_json(
+    llm: Any,
+    system_prompt: str,
+    items: List[Dict[str, Any]],
+    item_schema_hint: str,
+    fallback: Callable[[int], Awaitable[Optional[Dict[str, Any]]]],
+    validate: Callable[[Dict[str, Any]], bool] = lambda r: True,
+    shared: Optional[Dict[str, Any]] = None,
+    batch_size: Optional[int] = None,
+    temperature: float = 0.2,
+) -> Dict[str, Any]:
+    """Run `items` through chat_json in batches; map results back by index.
+
+    `fallback(i)` is awaited for every item whose batched result is missing or
+    fails `validate` (and for all items of a batch whose request raised).
+
+    Returns {"results": [result or None, ...], "requests": int, "fallbacks": int}
+    with results aligned to `items`.
+    """
+    size = batch_size or batch_size_from_env()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    stats = {"requests": 0, "fallbacks": 0}
+
+    async def run_batch(start: int) -> None:
+        chunk = items[start:start + size]
+        payload = {
+            "shared": shared or {},
+            "items": [{"index": start + k, **item} for k, item in enumerate(chunk)],
+        }
+        schema = f'{{"results": [{{"index": 0, ...{item_schema_hint}}}]}}'
+        stats["requests"] += 1
+        try:
+            parsed, _ = await llm.chat_json(
+                system_prompt + BATCH_INSTRUCTIONS,
+                json.dumps(payload, ensure_ascii=False),
+                schema,
+                temperature=temperature,
+            )
+        except _RECOVERABLE_ERRORS:
+            parsed = {}
+        for entry in (parsed or {}).get("results") or []:
+            if not isinstance(entry, dict):
+                continue
+            idx = entry.get("index")
+            if isinstance(idx, int) and start <= idx < start + len(chunk) and results[idx] is None:
+                try:
+                    ok = validate(entry)
+                except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                    ok = False
+                if ok:
+                    results[idx] = entry
+
+    if size <= 1:
+        missing = list(range(len(items)))
+    else:
+        await asyncio.gather(*(run_batch(start) for start in range(0, len(items), size)))
+        missing = [i for i, r in enumerate(results) if r is None]
+
+    async def run_fallback(i: int) -> None:
+        stats["requests"] += 1
+        stats["fallbacks"] += 1
+        try:
+            results[i] = await fallback(i)
+        except _RECOVERABLE_ERRORS:
+            results[i] = None
+
+    await asyncio.gather(*(run_fallback(i) for i in missing))
+    return {"results": results, **stats}
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+# ============================================================================
+# Content-addressed LLM response cache
+# ============================================================================
+# 相同的 prompt 会被反复发送（同一页的版式分析、同一主题的素材描述、用户微调后重跑 3.3），
+# 这里按 (model, messages, temperature, schema hint) 的内容哈希缓存响应：
+#   - L1: 进程内 LRU（条目数上限）
+#   - L2: data/cache/llm_cache.sqlite（TTL + 总字节上限，按 last_access 淘汰）
+
+
+def cache_key(
+    model: Optional[str],
+    messages: Any,
+    temperature: Optional[float],
+    schema_hint: Optional[str] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Stable sha256 over the request fields that determine the response."""
+    material = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "schema_hint": schema_hint,
+        "extra": extra or {},
+    }
+    blob = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) cache for JSON-serializable LLM responses."""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: float = 7 * 24 * 3600,
+        memory_entries: int = 512,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = float(ttl_seconds)
+        self.memory_entries = max(0, int(memory_entries))
+        self.max_disk_bytes = int(max_disk_bytes)
+
+        # 内存层保存序列化后的字符串，每次命中都反序列化出新对象，调用方修改结果不会污染缓存
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self._stats = {
+            "hits_memory": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " bytes INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn.commit()
+            self._purge_expired()
+            row = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM llm_cache").fetchone()
+            self._disk_bytes = int(row[0])
+
+    @classmethod
+    def from_env(cls, data_dir: str) -> Optional["LLMResponseCache"]:
+        """Env:
+          - LLM_CACHE: "1" to enable (default: 0, opt-in)
+          - LLM_CACHE_TTL (default: 604800 seconds)
+          - LLM_CACHE_MEMORY_ENTRIES (default: 512)
+          - LLM_CACHE_MAX_MB (default: 256, on-disk tier)
+          - LLM_CACHE_DISK: "0" to keep the cache in memory only (default: 1)
+        """
+        if (os.getenv("LLM_CACHE") or "0") != "1":
+            return None
+        db_path = None
+        if (os.getenv("LLM_CACHE_DISK") or "1") != "0":
+            db_path = os.path.join(data_dir, "cache", "llm_cache.sqlite")
+        return cls(
+            db_path=db_path,
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL") or 7 * 24 * 3600),
+            memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES") or 512),
+            max_disk_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB") or 256) * 1024 * 1024),
+        )
+
+    # --- lookup ------------------------------------------------------------
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                created, raw = hit
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._stats["hits_memory"] += 1
+                    return json.loads(raw)
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created, bytes FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    raw, created, size = row
+                    if not self._expired(created, now):
+                        self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                        self._conn.commit()
+                        self._remember(key, created, raw)
+                        self._stats["hits_disk"] += 1
+                        return json.loads(raw)
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._disk_bytes -= int(size)
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, raw)
+            self._stats["writes"] += 1
+            if self._conn is None:
+                return
+            size = len(raw.encode("utf-8"))
+            old = self._conn.execute("SELECT bytes FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._disk_bytes -= int(old[0])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, last_access, bytes) VALUES (?, ?, ?, ?, ?)",
+                (key, raw, now, now, size),
+            )
+            self._conn.commit()
+            self._disk_bytes += size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    # --- eviction ----------------------------------------------------------
+
+    def _remember(self, key: str, created: float, raw: str) -> None:
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (created, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _purge_expired(self) -> None:
+        if self._conn is None or self.ttl_seconds <= 0:
+            return
+        cur = self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._conn.commit()
+        self._stats["evictions"] += max(cur.rowcount, 0)
+
+    def _evict_disk(self) -> None:
+        """Drop least-recently-used rows until the tier is back under ~90% of its cap."""
+        assert self._conn is not None
+        self._purge_expired()
+        target = int(self.max_disk_bytes * 0.9)
+        row = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM llm_cache").fetchone()
+        self._disk_bytes = int(row[0])
+        if self._disk_bytes <= target:
+            return
+        victims = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, bytes FROM llm_cache ORDER BY last_access ASC"):
+            victims.append((key,))
+            freed += int(size)
+            if self._disk_bytes - freed <= target:
+                break
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self._conn.commit()
+        self._disk_bytes -= freed
+        self._stats["evictions"] += len(victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+            self._disk_bytes = 0
+
+    # --- metrics -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["hits_memory"] + self._stats["hits_disk"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "disk_enabled": self._conn is not None,
+        }
@@ -1,11 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import httpx
 
+from .budget import current_run_budget
+from .cancellation import check_cancelled
+from .llm_cache import LLMResponseCache, cache_key
+from .rate_limit import AdmissionController, current_llm_session, estimate_tokens, get_admission_controller
+
 
 def env(name: str, default: Optional[str] = None) -> Optional[str]:
     v = os.getenv(name)
@@ -14,6 +24,103 @@ def env(name: str, default: Optional[str] = None) -> Optional[str]:
     return v
 
 
+# ============================================================================
+# Process-wide pooled HTTP transport
+# ============================================================================
+# 所有 LLMClient 实例共享同一个 httpx.AsyncClient（连接池 + keep-alive + HTTP/2），
+# 避免 3.3/3.4 并行扇出时每页都重新做 TCP+TLS 握手。
+# 池中的连接绑定在打开它们的事件循环上，因此每个事件循环各持有一个 client
+# （批量 CLI / 后台线程里的 asyncio.run 与 web 进程的主循环互不共用），关闭时统一释放。
+
+_HTTP_CLIENTS: Dict[Optional[asyncio.AbstractEventLoop], httpx.AsyncClient] = {}
+_HTTP_CLIENTS_LOCK = threading.Lock()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """Env:
+      - LLM_TIMEOUT (default: 180 seconds)
+      - LLM_MAX_CONNECTIONS (default: 20)
+      - LLM_MAX_KEEPALIVE (default: 10)
+      - LLM_KEEPALIVE_EXPIRY (default: 60 seconds)
+      - LLM_HTTP2: "1"/"0" (default: 1, requires the `h2` package)
+    """
+    limits = httpx.Limits(
+        max_connections=int(env("LLM_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(env("LLM_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(env("LLM_KEEPALIVE_EXPIRY", "60")),
+    )
+    timeout = httpx.Timeout(float(env("LLM_TIMEOUT", "180")), connect=10.0)
+    use_http2 = env("LLM_HTTP2", "1") != "0" and _http2_available()
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=use_http2, proxy=None)
+
+
+def _close_on_loop(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Close a client that belongs to another event loop, without awaiting it."""
+    if client.is_closed or loop is None or loop.is_closed():
+        # 循环已结束：连接无法再优雅关闭，随 client 一起被回收
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    except RuntimeError:
+        pass
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the calling event loop's shared AsyncClient, creating it on first use.
+
+    Pooled connections are bound to the event loop that opened them, so each
+    loop gets its own client. Clients of loops that have since been closed
+    are dropped here; aclose_http_client() closes the rest.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _HTTP_CLIENTS_LOCK:
+        for other in [l for l in _HTTP_CLIENTS if l is not None and l.is_closed()]:
+            del _HTTP_CLIENTS[other]
+        client = _HTTP_CLIENTS.get(loop)
+        if client is None or client.is_closed:
+            client = _HTTP_CLIENTS[loop] = _build_http_client()
+        return client
+
+
+async def aclose_http_client() -> None:
+    """Close every shared client (FastAPI lifespan shutdown, end of a batch run).
+
+    The calling loop's client is awaited; clients of other loops that are
+    still running are closed on their own loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _HTTP_CLIENTS_LOCK:
+        clients = list(_HTTP_CLIENTS.items())
+        _HTTP_CLIENTS.clear()
+    for owner, client in clients:
+        if owner is loop or owner is None:
+            if not client.is_closed:
+                await client.aclose()
+        else:
+            _close_on_loop(client, owner)
+
+
+@dataclass
+class _AdmittedCall:
+    """One admitted request: the pooled client, per-request kwargs and usage bookkeeping."""
+
+    client: httpx.AsyncClient
+    request_kwargs: Dict[str, Any]
+    queue_wait_s: float
+    actual_tokens: Optional[int] = None
+
+
 class LLMClient:
     """OpenAI-compatible Chat Completions client.
 
@@ -26,37 +133,165 @@ class LLMClient:
     Notes:
       - Works with OpenAI and any compatible gateway.
       - In mock mode, no network calls are made.
+      - All instances share one pooled keep-alive client, see get_http_client().
+      - Pass `cache` (see LLMResponseCache.from_env) to reuse responses for
+        identical chat/chat_json requests; chat_with_tools is never cached.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        admission: Optional[AdmissionController] = None,
+        cache: Optional[LLMResponseCache] = None,
+    ):
         self.mode = env("LLM_MODE", "mock")
         self.base_url = env("OPENAI_BASE_URL", "https://api.openai.com/v1")
         self.api_key = env("OPENAI_API_KEY", "")
         self.model = env("OPENAI_MODEL", "gpt-4o-mini")
+        self.admission = admission or get_admission_controller()
+        self.cache = cache
 
     def is_enabled(self) -> bool:
         return self.mode != "mock" and bool(self.api_key)
 
+    def _endpoint(self) -> str:
+        base = self.base_url.rstrip('/')
+        if base.endswith("/chat/completions"):
+            return base
+        return f"{base}/chat/completions"
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    @asynccontextmanager
+    async def _admitted(self, payload: Dict[str, Any]) -> AsyncIterator[_AdmittedCall]:
+        """Admission and run-budget bookkeeping around one completion request.
+
+        The request first passes the shared admission controller (in-flight
+        limit, RPM/TPM buckets, per-session fairness). Runs whose cancellation
+        token has fired do not start new requests; runs whose budget can't
+        cover another call raise BudgetExhausted, and the timeout is clamped
+        to the run's remaining time. Set `actual_tokens` on the yielded call
+        so the buckets and the budget are corrected with the real usage.
+        """
+        check_cancelled()
+        estimated = estimate_tokens(payload)
+        budget = current_run_budget()
+        if budget is not None:
+            budget.reserve(estimated)
+        started = time.monotonic()
+        call: Optional[_AdmittedCall] = None
+        try:
+            ticket = await self.admission.acquire(current_llm_session(), estimated)
+            try:
+                client = get_http_client()
+                kwargs: Dict[str, Any] = {}
+                if budget is not None:
+                    timeout = budget.timeout(client.timeout.read or float(env("LLM_TIMEOUT", "180")))
+                    kwargs["timeout"] = httpx.Timeout(timeout, connect=min(10.0, timeout))
+                call = _AdmittedCall(client=client, request_kwargs=kwargs, queue_wait_s=ticket.queue_wait_s)
+                yield call
+            finally:
+                self.admission.release(ticket, call.actual_tokens if call is not None else None)
+        finally:
+            if budget is not None:
+                actual = call.actual_tokens if call is not None else None
+                budget.settle(estimated, actual, time.monotonic() - started)
+
+    async def _post_completion(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+        """POST one chat completion over the shared pooled client (see _admitted).
+
+        Returns: (response_json, queue_wait_seconds)
+        """
+        async with self._admitted(payload) as call:
+            r = await call.client.post(self._endpoint(), headers=self._headers(), json=payload, **call.request_kwargs)
+            r.raise_for_status()
+            data = r.json()
+            call.actual_tokens = (data.get("usage") or {}).get("total_tokens")
+            return data, call.queue_wait_s
+
+    async def _iter_stream(self, call: _AdmittedCall, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """POST a `stream: true` request for an admitted call; yield the parsed chunks."""
+        async with call.client.stream(
+            "POST", self._endpoint(), headers=self._headers(), json=payload, **call.request_kwargs
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                # SSE 格式：每个事件一行 "data: {...}"，以 "data: [DONE]" 结束
+                if not line.startswith("data:"):
+                    continue
+                body = line[5:].strip()
+                if body == "[DONE]":
+                    break
+                chunk = json.loads(body)
+                usage = chunk.get("usage")
+                if usage:
+                    call.actual_tokens = usage.get("total_tokens")
+                yield chunk
+
+    async def _stream_completion(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Callable[[str], Awaitable[None]],
+    ) -> Tuple[Dict[str, Any], float]:
+        """Streaming variant of _post_completion: `on_delta` receives each content delta.
+
+        Returns a response shaped like the non-streaming one, so callers parse
+        both the same way.
+        """
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        data: Dict[str, Any] = {}
+        content: List[str] = []
+        reasoning: List[str] = []
+        async with self._admitted(payload) as call:
+            async for chunk in self._iter_stream(call, payload):
+                data.setdefault("id", chunk.get("id"))
+                data.setdefault("model", chunk.get("model"))
+                if chunk.get("usage"):
+                    data["usage"] = chunk["usage"]
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                delta = choices[0].get("delta") or {}
+                if delta.get("reasoning_content"):
+                    reasoning.append(delta["reasoning_content"])
+                if delta.get("content"):
+                    content.append(delta["content"])
+                    await on_delta(delta["content"])
+            queue_wait_s = call.queue_wait_s
+        data["choices"] = [{"message": {"content": "".join(content), "reasoning_content": "".join(reasoning) or None}}]
+        return data, queue_wait_s
+
+    def stats(self) -> Dict[str, Any]:
+        """Runtime metrics (admission queue wait, in-flight requests)."""
+        stats: Dict[str, Any] = {"admission": self.admission.stats()}
+        stats["cache"] = self.cache.stats() if self.cache is not None else None
+        return stats
+
+    def _cache_key(self, payload: Dict[str, Any], schema_hint: Optional[str] = None) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return cache_key(
+            payload.get("model"),
+            payload.get("messages"),
+            payload.get("temperature"),
+            schema_hint,
+            extra={k: payload[k] for k in ("thinking", "response_format") if k in payload},
+        )
+
     async def chat(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
         thinking: Optional[str] = "enabled",
+        use_cache: bool = True,
     ) -> str:
         """Standard chat completion returning text string."""
         if not self.is_enabled():
             raise RuntimeError("LLM disabled")
 
-        base = self.base_url.rstrip('/')
-        if base.endswith("/chat/completions"):
-            url = base
-        else:
-            url = f"{base}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        
         payload = {
             "model": self.model,
             "messages": messages,
@@ -66,12 +301,52 @@ class LLMClient:
         if thinking in ("enabled", "disabled"):
             payload["thinking"] = {"type": thinking}
 
-        async with httpx.AsyncClient(timeout=180.0, proxy=None) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
+        key = self._cache_key(payload) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached["content"]
+
+        data, _ = await self._post_completion(payload)
 
-        return data["choices"][0]["message"].get("content") or ""
+        content = data["choices"][0]["message"].get("content") or ""
+        if key is not None and content:
+            self.cache.put(key, {"content": content})
+        return content
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        thinking: Optional[str] = "enabled",
+    ) -> AsyncIterator[str]:
+        """Streaming chat completion (`stream: true`), yielding content deltas.
+
+        Goes through the same admission, cancellation and run-budget checks
+        as chat(); the admission slot is held until the stream is fully
+        consumed or closed.
+        """
+        if not self.is_enabled():
+            raise RuntimeError("LLM disabled")
+
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if thinking in ("enabled", "disabled"):
+            payload["thinking"] = {"type": thinking}
+
+        async with self._admitted(payload) as call:
+            async for chunk in self._iter_stream(call, payload):
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
 
     async def chat_json(
         self,
@@ -80,22 +355,23 @@ class LLMClient:
         json_schema_hint: str,
         temperature: float = 0.2,
         thinking: Optional[str] = "enabled",  # "enabled" | "disabled" | None
+        use_cache: bool = True,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-        """Return (parsed_json, raw_response_meta)."""
+        """Return (parsed_json, raw_response_meta).
+
+        With a cache configured, an identical request returns the stored
+        result and `meta["cache_hit"]` is True.
+
+        With `on_delta`, the completion is requested with `stream: true` and
+        each content delta is passed to it as it arrives (for progress
+        reporting); the parsed result is the same as without it.
+        """
 
         if not self.is_enabled():
             # Caller should fall back to heuristic.
             raise RuntimeError("LLM disabled (mock mode or missing OPENAI_API_KEY).")
 
-        base = self.base_url.rstrip('/')
-        if base.endswith("/chat/completions"):
-            url = base
-        else:
-            url = f"{base}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
         # DeepSeek JSON mode：prompt 里必须明确要求输出 json（官方建议）:contentReference[oaicite:5]{index=5}
         system2 = system.strip() + "\n\nYou MUST output valid JSON only."
         user2 = (
@@ -117,10 +393,16 @@ class LLMClient:
         if thinking in ("enabled", "disabled"):
             payload["thinking"] = {"type": thinking}
 
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
+        key = self._cache_key(payload, json_schema_hint) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached["parsed"], {**cached["meta"], "queue_wait_s": 0.0, "cache_hit": True}
+
+        if on_delta is not None:
+            data, queue_wait_s = await self._stream_completion(payload, on_delta)
+        else:
+            data, queue_wait_s = await self._post_completion(payload)
 
         msg = data["choices"][0]["message"]
         content = msg.get("content") or ""
@@ -140,7 +422,12 @@ class LLMClient:
             "raw_content": content,
             "reasoning_content": reasoning_content,  # ✅写日志用
             "thinking": payload.get("thinking"),
+            "queue_wait_s": round(queue_wait_s, 3),
+            "cache_hit": False,
         }
+        # 只缓存解析成功的结果，非 JSON 输出下次仍会重试
+        if key is not None:
+            self.cache.put(key, {"parsed": parsed, "meta": meta})
         return parsed, meta
 
     async def chat_with_tools(
@@ -173,16 +460,6 @@ class LLMClient:
         if not self.is_enabled():
             raise RuntimeError("LLM disabled (mock mode or missing OPENAI_API_KEY).")
         
-        base = self.base_url.rstrip('/')
-        if base.endswith("/chat/completions"):
-            url = base
-        else:
-            url = f"{base}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        
         messages = [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
@@ -208,25 +485,22 @@ class LLMClient:
             if thinking in ("enabled", "disabled") and not tools:
                 payload["thinking"] = {"type": thinking}
             
-            async with httpx.AsyncClient(timeout=180.0, proxy=None) as client:
-                try:
-                    r = await client.post(url, headers=headers, json=payload)
-                    r.raise_for_status()
-                    data = r.json()
-                except httpx.HTTPStatusError as e:
-                    # 记录详细的错误信息以便调试
-                    error_detail = {
-                        "status_code": e.response.status_code,
-                        "url": str(e.request.url),
-                        "response_text": e.response.text[:500] if e.response.text else None,
-                        "payload_keys": list(payload.keys()),
-                        "has_tools": bool(tools),
-                        "tools_count": len(tools) if tools else 0,
-                    }
-                    raise RuntimeError(
-                        f"API请求失败 (HTTP {e.response.status_code}): {e.response.text[:200] if e.response.text else '无响应内容'}\n"
-                        f"详细信息: {error_detail}"
-                    ) from e
+            try:
+                data, _ = await self._post_completion(payload)
+            except httpx.HTTPStatusError as e:
+                # 记录详细的错误信息以便调试
+                error_detail = {
+                    "status_code": e.response.status_code,
+                    "url": str(e.request.url),
+                    "response_text": e.response.text[:500] if e.response.text else None,
+                    "payload_keys": list(payload.keys()),
+                    "has_tools": bool(tools),
+                    "tools_count": len(tools) if tools else 0,
+                }
+                raise RuntimeError(
+                    f"API请求失败 (HTTP {e.response.status_code}): {e.response.text[:200] if e.response.text else '无响应内容'}\n"
+                    f"详细信息: {error_detail}"
+                ) from e
             
             msg = data["choices"][0]["message"]
             content = msg.get("content") or ""
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+# 进度回调：各模块在单页完成时推送事件（用于 SSE 流式返回），未传入时不做任何事
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+async def emit_progress(on_progress: Optional[ProgressCallback], event: Dict[str, Any]) -> None:
+    """Deliver one progress event; a failing consumer never breaks generation."""
+    if on_progress is None:
+        return
+    try:
+        await on_progress(event)
+    except Exception:
+        pass
+
+
+def stream_progress(
+    on_progress: Optional[ProgressCallback],
+    stage: str,
+    index: int,
+    every: int = 200,
+) -> Optional[Callable[[str], Awaitable[None]]]:
+    """`on_delta` for LLMClient.chat_json that reports streamed output as "delta" events.
+
+    Events carry the characters received so far and are throttled to one per
+    `every` characters. Returns None without a progress callback, so the
+    request stays non-streaming.
+    """
+    if on_progress is None:
+        return None
+    received = 0
+    reported = -every
+
+    async def on_delta(text: str) -> None:
+        nonlocal received, reported
+        received += len(text)
+        if received - reported >= every:
+            reported = received
+            await emit_progress(on_progress, {"stage": stage, "event": "delta", "index": index, "chars": received})
+
+    return on_delta
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+
+# ============================================================================
+# Session context (used for per-session fairness)
+# ============================================================================
+# LLMClient 的调用方法不带 session_id，这里用 contextvar 传递当前会话。
+# asyncio.gather 创建的子任务会继承 context，因此 3.3/3.4 的扇出自动归属同一会话。
+
+_current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "llm_session", default=None
+)
+
+
+def bind_llm_session(session_id: Optional[str]) -> contextvars.Token:
+    """Attribute subsequent LLM calls in this context to `session_id`."""
+    return _current_session.set(session_id)
+
+
+def unbind_llm_session(token: contextvars.Token) -> None:
+    _current_session.reset(token)
+
+
+def current_llm_session() -> Optional[str]:
+    return _current_session.get()
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Rough prompt+completion token estimate used for the TPM bucket.
+
+    Chinese text is ~1 token per character and English ~4 characters per token,
+    so half the serialized length plus a completion allowance is a conservative
+    middle ground. The bucket is corrected with the real `usage` afterwards.
+    """
+    messages = payload.get("messages") or []
+    text_len = len(json.dumps(messages, ensure_ascii=False))
+    return text_len // 2 + 512
+
+
+# ============================================================================
+# Token bucket
+# ============================================================================
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `per_minute / 60` per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)."""
+        self._refill()
+        # A single request larger than the bucket only needs a full bucket.
+        need = min(amount, self.capacity)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Correct a previous estimate; the balance may go negative."""
+        self.tokens -= delta
+
+
+# ============================================================================
+# Admission controller
+# ============================================================================
+
+@dataclass
+class AdmissionTicket:
+    session_key: str
+    estimated_tokens: int
+    queue_wait_s: float
+
+
+class AdmissionController:
+    """Shared admission control for outgoing LLM requests.
+
+    - max_in_flight: at most N requests on the wire at once
+    - requests/tokens per minute: token buckets in front of the gateway
+    - fairness: waiting requests are granted slots round-robin by session,
+      so one 40-page deck cannot starve a 10-page deck submitted later
+    - metrics: queue-wait time is recorded per admitted request
+
+    One controller is shared by every event loop in the process (the web
+    loop, background `asyncio.run` threads, the batch CLI, image workers), so
+    the limits stay process-wide. Shared state is guarded by a thread lock and
+    a waiter is always woken on its own loop via `call_soon_threadsafe`.
+    """
+
+    DEFAULT_KEY = "_default"
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+    ):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._rpm = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tpm = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._round_robin: Deque[str] = deque()
+        self._lock = threading.Lock()
+        self._stats = {
+            "admitted": 0,
+            "throttled": 0,
+            "queue_wait_total_s": 0.0,
+            "queue_wait_max_s": 0.0,
+            "queue_wait_last_s": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Env:
+          - LLM_MAX_IN_FLIGHT (default: 8)
+          - LLM_RPM: requests per minute, 0 = unlimited (default: 0)
+          - LLM_TPM: tokens per minute, 0 = unlimited (default: 0)
+        """
+        return cls(
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT") or 8),
+            requests_per_minute=int(os.getenv("LLM_RPM") or 0),
+            tokens_per_minute=int(os.getenv("LLM_TPM") or 0),
+        )
+
+    # --- slots -------------------------------------------------------------
+
+    def _has_waiters(self) -> bool:
+        return bool(self._round_robin)
+
+    def _grant_next(self) -> None:
+        """Hand free slots to waiters round-robin (caller holds the lock)."""
+        while self._round_robin and self._in_flight < self.max_in_flight:
+            key = self._round_robin.popleft()
+            queue = self._waiters.get(key)
+            if not queue:
+                self._waiters.pop(key, None)
+                continue
+            fut = queue.popleft()
+            if queue:
+                # Session still has waiters: back of the line.
+                self._round_robin.append(key)
+            else:
+                del self._waiters[key]
+            if fut.done():
+                continue
+            # 槽位在这里记账；等待方的 future 只能在它自己的事件循环里完成
+            try:
+                fut.get_loop().call_soon_threadsafe(self._deliver, fut)
+            except RuntimeError:
+                # 等待方的事件循环已经关闭
+                continue
+            self._in_flight += 1
+
+    def _deliver(self, fut: asyncio.Future) -> None:
+        """Runs on the waiter's loop: wake it, or pass the slot on if it was cancelled meanwhile."""
+        if fut.cancelled():
+            self._release_slot()
+        else:
+            fut.set_result(None)
+
+    async def _acquire_slot(self, key: str) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._has_waiters():
+                self._in_flight += 1
+                return
+            fut = loop.create_future()
+            queue = self._waiters.get(key)
+            if queue is None:
+                queue = self._waiters[key] = deque()
+                self._round_robin.append(key)
+            queue.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                if fut in queue:
+                    queue.remove(fut)
+                elif fut.done() and not fut.cancelled():
+                    # Slot was granted right before cancellation: hand it on.
+                    self._in_flight -= 1
+                    self._grant_next()
+                # 否则槽位已分配但 _deliver 尚未执行：由 _deliver 转交
+            raise
+
+    async def _throttle(self, estimated_tokens: int) -> None:
+        throttled = False
+        while True:
+            with self._lock:
+                delay = 0.0
+                if self._rpm:
+                    delay = max(delay, self._rpm.delay_for(1))
+                if self._tpm:
+                    delay = max(delay, self._tpm.delay_for(estimated_tokens))
+                if delay <= 0:
+                    if self._rpm:
+                        self._rpm.consume(1)
+                    if self._tpm:
+                        self._tpm.consume(estimated_tokens)
+                    if throttled:
+                        self._stats["throttled"] += 1
+                    return
+            throttled = True
+            await asyncio.sleep(delay)
+
+    async def acquire(self, session_key: Optional[str], estimated_tokens: int) -> AdmissionTicket:
+        key = session_key or self.DEFAULT_KEY
+        start = time.monotonic()
+        await self._acquire_slot(key)
+        try:
+            await self._throttle(estimated_tokens)
+        except BaseException:
+            self._release_slot()
+            raise
+        wait = time.monotonic() - start
+        with self._lock:
+            self._stats["admitted"] += 1
+            self._stats["queue_wait_total_s"] += wait
+            self._stats["queue_wait_last_s"] = wait
+            self._stats["queue_wait_max_s"] = max(self._stats["queue_wait_max_s"], wait)
+        return AdmissionTicket(session_key=key, estimated_tokens=estimated_tokens, queue_wait_s=wait)
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_next()
+
+    def release(self, ticket: AdmissionTicket, actual_tokens: Optional[int] = None) -> None:
+        if self._tpm and actual_tokens is not None:
+            with self._lock:
+                self._tpm.adjust(actual_tokens - ticket.estimated_tokens)
+        self._release_slot()
+
+    # --- metrics -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            admitted = self._stats["admitted"]
+            return {
+                **self._stats,
+                "queue_wait_avg_s": (self._stats["queue_wait_total_s"] / admitted) if admitted else 0.0,
+                "in_flight": self._in_flight,
+                "queued": sum(len(q) for q in self._waiters.values()),
+                "queued_sessions": len(self._waiters),
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+_DEFAULT_CONTROLLER: Optional[AdmissionController] = None
+_DEFAULT_CONTROLLER_LOCK = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Process-wide controller shared by all LLMClient instances (and all event loops)."""
+    global _DEFAULT_CONTROLLER
+    if _DEFAULT_CONTROLLER is None:
+        with _DEFAULT_CONTROLLER_LOCK:
+            if _DEFAULT_CONTROLLER is None:
+                _DEFAULT_CONTROLLER = AdmissionController.from_env()
+    return _DEFAULT_CONTROLLER
@@ -471,6 +471,9 @@ class WorkflowRunRequest(BaseModel):
     # NEW: For test mode 3.1->3.3: allow user to specify style_name directly
     # Valid values: "theory_clean", "practice_steps", "review_mindmap"
     style_name: Optional[str] = None
+    # 本次运行的截止秒数 / token 上限（不填时使用 WORKFLOW_DEADLINE_S / WORKFLOW_TOKEN_BUDGET）
+    deadline_s: Optional[float] = None
+    token_budget: Optional[int] = None
 
 
 class WorkflowRunResponse(BaseModel):
@@ -484,6 +487,7 @@ class WorkflowRunResponse(BaseModel):
     outline: Optional[PPTOutline] = None
     deck_content: Optional[SlideDeckContent] = None
     logs_preview: List[Dict[str, Any]] = Field(default_factory=list)
+    degraded: List[Dict[str, Any]] = Field(default_factory=list)
     message: Optional[str] = None
 
 
@@ -505,3 +509,15 @@ class SessionState(BaseModel):
     render_result: Optional[Any] = Field(default=None, description="3.5模块渲染结果")
     image_filler: Optional[Any] = Field(default=None, description="3.5模块图片生成器")
     stage: Literal["3.1", "3.2", "3.3", "3.4", "3.5"] = "3.1"
+    checkpoint: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="被取消的运行中已完成的 3.3/3.4 页面（按阶段输入哈希校验），重跑时复用",
+    )
+    degraded: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="因运行预算（截止时间/token）不足而改走启发式路径的页面：{stage, index, reason}",
+    )
+    version: int = Field(
+        default=0,
+        description="乐观并发版本号：每次保存成功后 +1，保存时若存储中的版本更新则拒绝覆盖",
+    )
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+
+from .schemas import SessionState
+from .store import BaseSessionStore, ConcurrentModificationError
+
+
+# ============================================================================
+# Write-back cache of hydrated SessionState
+# ============================================================================
+# 每次 load() 都要 json 解析 + 完整的 pydantic 校验（大 deck 约 1ms），而前端每 3 秒轮询一次状态。
+# 这里在存储后端前面放一层 LRU：
+#   - 缓存持有每个会话的一份私有 SessionState，命中时返回它的深拷贝（不必解析 JSON、重新校验）
+#     调用方之间互不影响，未 save() 的修改不会被其他请求看到
+#   - 后端支持 peek_version() 时（SQLite / Redis）先比对版本号，其他 worker 写过就重新加载
+#   - coalesce_saves() 作用域内的 save() 只标记 dirty，退出作用域时每个会话只落盘一次，
+#     新版本号回写到最后一次保存的调用方对象
+#   - 保存失败（含版本冲突）时丢弃该会话的缓存，下次从后端重新加载
+#   - 按条目数与序列化大小估算淘汰；dirty 条目不淘汰
+
+
+@dataclass
+class _Entry:
+    state: SessionState
+    size: int
+    dirty: bool = False
+    # 合并写时最后一次 save() 传入的对象，落盘后把新版本号回写给它
+    owner: Optional[SessionState] = None
+
+
+# 当前上下文中处于合并写作用域的会话 id
+_deferred: contextvars.ContextVar[Optional[Set[str]]] = contextvars.ContextVar(
+    "session_deferred_saves", default=None
+)
+
+
+class CachedSessionStore(BaseSessionStore):
+    """LRU cache of hydrated SessionState in front of any BaseSessionStore.
+
+    load() returns a deep copy of the cached state; save() stores a copy of
+    the caller's state, so callers never share mutable objects.
+    """
+
+    def __init__(
+        self,
+        backend: BaseSessionStore,
+        max_entries: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.backend = backend
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "flushes": 0, "coalesced": 0, "evictions": 0}
+
+    @classmethod
+    def from_env(cls, backend: BaseSessionStore) -> BaseSessionStore:
+        """Env:
+          - SESSION_CACHE: "0" to disable (default: 1)
+          - SESSION_CACHE_MAX_ENTRIES (default: 256)
+          - SESSION_CACHE_MAX_MB (default: 64, estimated from serialized size)
+        """
+        if (os.getenv("SESSION_CACHE") or "1") == "0":
+            return backend
+        return cls(
+            backend,
+            max_entries=int(os.getenv("SESSION_CACHE_MAX_ENTRIES") or 256),
+            max_bytes=int(float(os.getenv("SESSION_CACHE_MAX_MB") or 64) * 1024 * 1024),
+        )
+
+    # --- cache bookkeeping -------------------------------------------------
+
+    def _put(self, state: SessionState, dirty: bool = False, owner: Optional[SessionState] = None) -> None:
+        """Cache `state` (not copied: the cache must own it); caller holds the lock."""
+        size = len(state.model_dump_json())
+        old = self._entries.pop(state.session_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[state.session_id] = _Entry(state=state, size=size, dirty=dirty, owner=owner)
+        self._bytes += size
+        self._evict()
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        # dirty 条目属于某个正在进行的合并写作用域，不在这里落盘；全部为 dirty 时允许暂时超出预算
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            victim = next((sid for sid, e in self._entries.items() if not e.dirty), None)
+            if victim is None:
+                return
+            self._drop(victim)
+            self._stats["evictions"] += 1
+
+    def _flush_entry(self, session_id: str, entry: _Entry) -> None:
+        try:
+            self.backend.save(entry.state)
+        except Exception:
+            # 落盘失败（如版本冲突）时丢弃缓存中的待写内容，下次从后端重新加载
+            self._drop(session_id)
+            raise
+        owner, entry.dirty, entry.owner = entry.owner, False, None
+        if owner is not None:
+            owner.version = entry.state.version
+        self._stats["flushes"] += 1
+
+    def invalidate(self, session_id: str) -> None:
+        """Forget the cached instance (e.g. after abandoning unsaved changes)."""
+        with self._lock:
+            self._drop(session_id)
+
+    def _cached(self, session_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if not entry.dirty:
+            stored = self.backend.peek_version(session_id)
+            if stored is not None and stored != entry.state.version:
+                self._drop(session_id)
+                self._stats["stale"] += 1
+                return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    # --- BaseSessionStore --------------------------------------------------
+
+    def peek_version(self, session_id: str) -> Optional[int]:
+        return self.backend.peek_version(session_id)
+
+    def load(self, session_id: str) -> Optional[SessionState]:
+        with self._lock:
+            entry = self._cached(session_id)
+            if entry is not None:
+                self._stats["hits"] += 1
+                return entry.state.model_copy(deep=True)
+            self._stats["misses"] += 1
+        state = self.backend.load(session_id)
+        if state is None:
+            return None
+        with self._lock:
+            # 并发未命中时以先放入的实例为准
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.state.version >= state.version:
+                return entry.state.model_copy(deep=True)
+            self._put(state.model_copy(deep=True))
+        return state
+
+    def load_fields(self, session_id: str, fields: Iterable[str]) -> Optional[Dict[str, Any]]:
+        fields = list(fields)
+        with self._lock:
+            entry = self._cached(session_id)
+            if entry is not None:
+                self._stats["hits"] += 1
+                dumped = entry.state.model_dump(mode="json", include=set(fields))
+                return {f: dumped.get(f) for f in fields}
+        # 未命中时不为一次字段读取去加载完整会话
+        return self.backend.load_fields(session_id, fields)
+
+    def save(self, state: SessionState) -> None:
+        sid = state.session_id
+        deferred = _deferred.get()
+        with self._lock:
+            entry = self._cached(sid)
+            if entry is not None and entry.state.version != state.version:
+                if not entry.dirty:
+                    # 冲突后从后端重新加载；dirty 条目是尚未落盘的合并写，必须保留
+                    self._drop(sid)
+                raise ConcurrentModificationError(
+                    f"session {sid} was saved elsewhere "
+                    f"(cached v{entry.state.version}, saving v{state.version})"
+                )
+            if deferred is not None and (
+                entry is not None or self.backend.peek_version(sid) in (None, state.version)
+            ):
+                # 合并写：只更新缓存，退出作用域时统一落盘
+                self._touch(state)
+                self._put(state.model_copy(deep=True), dirty=True, owner=state)
+                deferred.add(sid)
+                self._stats["coalesced"] += 1
+                return
+        try:
+            self.backend.save(state)
+        except Exception:
+            # 版本冲突或写入失败：缓存内容可能已不是后端的最新版本
+            self.invalidate(sid)
+            raise
+        with self._lock:
+            self._put(state.model_copy(deep=True))
+
+    def flush(self, session_ids: Optional[Iterable[str]] = None) -> None:
+        """Write dirty entries to the backend (all, or only `session_ids`)."""
+        with self._lock:
+            targets = list(session_ids) if session_ids is not None else list(self._entries)
+            for sid in targets:
+                entry = self._entries.get(sid)
+                if entry is not None and entry.dirty:
+                    self._flush_entry(sid, entry)
+
+    @contextmanager
+    def coalesce_saves(self) -> Iterator[None]:
+        """Defer save() calls made in this context; flush once on exit."""
+        if _deferred.get() is not None:
+            # 嵌套作用域并入外层
+            yield
+            return
+        pending: Set[str] = set()
+        token = _deferred.set(pending)
+        try:
+            yield
+        finally:
+            try:
+                self.flush(pending)
+            finally:
+                _deferred.reset(token)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "dirty": sum(1 for e in self._entries.values() if e.dirty),
+            }
+
+    def __getattr__(self, name: str) -> Any:
+        # 透传后端特有的方法（history / compact_history / delete ...）
+        return getattr(self.backend, name)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from .schemas import SessionState
+from .store import BaseSessionStore, ConcurrentModificationError, StageColumnsMixin
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:  # redis 为可选依赖；测试用的内存替身抛出同名异常
+    class WatchError(Exception):
+        pass
+
+
+# ============================================================================
+# Shared session / render-status storage (multi-worker uvicorn, multiple pods)
+# ============================================================================
+# 会话状态与图片生成状态放在同一个 Redis 中：
+#   {prefix}session:{session_id}        hash，阶段字段各占一个 field + meta + version
+#   {prefix}render_status:{session_id}  hash，每个 slot 一个 field（HSET 原子更新单个插槽）
+# 任何实现了 hget/hmget/hset/hgetall/delete/expire/pipeline(watch/multi/execute)
+# 的 redis-py 兼容客户端都可以传入（测试使用进程内替身）。
+
+
+def _redis_from_env() -> Any:
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError("SESSION_STORE=redis requires the `redis` package (pip install redis)") from e
+    return redis.Redis.from_url(os.getenv("REDIS_URL") or "redis://localhost:6379/0", decode_responses=True)
+
+
+def _ttl_from_env() -> Optional[int]:
+    ttl = int(os.getenv("REDIS_SESSION_TTL") or 0)
+    return ttl or None
+
+
+class RenderStatusStore:
+    """Per-session image-generation status, keyed by slot.
+
+    The default implementation is an in-process dict and is only correct with
+    a single worker; use RedisRenderStatusStore when running several.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def reset(self, session_id: str) -> None:
+        with self._lock:
+            self._data[session_id] = {}
+
+    def set_slot(self, session_id: str, slot_id: str, status: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data.setdefault(session_id, {})[slot_id] = dict(status)
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """Return {"images": {slot_id: status}} (empty if unknown)."""
+        with self._lock:
+            return {"images": {k: dict(v) for k, v in self._data.get(session_id, {}).items()}}
+
+
+class RedisRenderStatusStore(RenderStatusStore):
+    def __init__(self, client: Any, prefix: str = "ppt:", ttl_seconds: Optional[int] = 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}render_status:{session_id}"
+
+    def reset(self, session_id: str) -> None:
+        self.client.delete(self._key(session_id))
+
+    def set_slot(self, session_id: str, slot_id: str, status: Dict[str, Any]) -> None:
+        key = self._key(session_id)
+        self.client.hset(key, slot_id, json.dumps(status, ensure_ascii=False))
+        if self.ttl_seconds:
+            self.client.expire(key, self.ttl_seconds)
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        raw = self.client.hgetall(self._key(session_id)) or {}
+        return {"images": {slot: json.loads(value) for slot, value in raw.items()}}
+
+
+class RedisSessionStore(StageColumnsMixin, BaseSessionStore):
+    """SessionState in a Redis hash with optimistic concurrency.
+
+    save() WATCHes the key, checks the stored version and writes only the
+    changed fields in a MULTI/EXEC transaction, so two workers saving the same
+    session cannot silently overwrite each other.
+    """
+
+    def __init__(self, client: Any, prefix: str = "ppt:", ttl_seconds: Optional[int] = None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._init_digests()
+
+    @classmethod
+    def from_env(cls) -> "RedisSessionStore":
+        """Env:
+          - REDIS_URL (default: redis://localhost:6379/0)
+          - REDIS_PREFIX (default: "ppt:")
+          - REDIS_SESSION_TTL: seconds, 0 = never expire (default: 0)
+        """
+        return cls(_redis_from_env(), prefix=os.getenv("REDIS_PREFIX") or "ppt:", ttl_seconds=_ttl_from_env())
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}session:{session_id}"
+
+    def load(self, session_id: str) -> Optional[SessionState]:
+        cols = self._columns
+        values = self.client.hmget(self._key(session_id), [*cols, "version"])
+        if values[-1] is None:
+            return None
+        row = dict(zip(cols, values[:-1]))
+        with self._lock:
+            self._remember(session_id, row)
+        return self._from_row(session_id, row, int(values[-1]))
+
+    def load_fields(self, session_id: str, fields: Iterable[str]) -> Optional[Dict[str, Any]]:
+        fields = list(fields)
+        if any(f not in self.STAGE_FIELDS for f in fields):
+            return super().load_fields(session_id, fields)
+        values = self.client.hmget(self._key(session_id), [*fields, "version"])
+        if values[-1] is None:
+            return None
+        return {f: (json.loads(raw) if raw is not None else None) for f, raw in zip(fields, values[:-1])}
+
+    def peek_version(self, session_id: str) -> Optional[int]:
+        stored = self.client.hget(self._key(session_id), "version")
+        return int(stored) if stored is not None else None
+
+    def save(self, state: SessionState) -> None:
+        self._touch(state)
+        row = self._to_row(state)
+        sid = state.session_id
+        key = self._key(sid)
+        expected = state.version
+        with self._lock:
+            changed = self._changed_columns(sid, row)
+
+        pipe = self.client.pipeline()
+        try:
+            pipe.watch(key)
+            stored = pipe.hget(key, "version")
+            stored_version = int(stored) if stored is not None else 0
+            if stored_version != expected:
+                raise ConcurrentModificationError(
+                    f"session {sid} was saved elsewhere (stored v{stored_version}, saving v{expected})"
+                )
+            # 新建会话需要写整行
+            mapping = dict(row) if stored is None else changed
+            # redis 不能存 None：空字段写成空串，读取时按缺失处理
+            pipe.multi()
+            pipe.hset(key, mapping={**{k: ("" if v is None else v) for k, v in mapping.items()},
+                                    "version": expected + 1})
+            if self.ttl_seconds:
+                pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except WatchError as e:
+            with self._lock:
+                self._forget(sid)
+            raise ConcurrentModificationError(f"session {sid} was modified during save") from e
+        except ConcurrentModificationError:
+            with self._lock:
+                self._forget(sid)
+            raise
+        finally:
+            pipe.reset()
+
+        with self._lock:
+            self._remember(sid, row)
+        state.version = expected + 1
+
+    def _from_row(self, session_id: str, values: Dict[str, Optional[str]], version: int) -> SessionState:
+        return super()._from_row(session_id, {k: (v or None) for k, v in values.items()}, version)
+
+    def _remember(self, session_id: str, row: Dict[str, Optional[str]]) -> None:
+        super()._remember(session_id, {k: (v or None) for k, v in row.items()})
+
+    def delete(self, session_id: str) -> None:
+        self.client.delete(self._key(session_id))
+        with self._lock:
+            self._forget(session_id)
+
+
+def create_render_status_store(session_store: Optional[BaseSessionStore] = None) -> RenderStatusStore:
+    """Render-status backend matching the session store.
+
+    With SESSION_STORE=redis the status lives in the same Redis so every
+    worker sees the same per-slot progress; otherwise an in-process dict.
+    """
+    if isinstance(session_store, RedisSessionStore):
+        return RedisRenderStatusStore(session_store.client, prefix=session_store.prefix)
+    return RenderStatusStore()
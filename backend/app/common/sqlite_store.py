@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from .schemas import SessionState
+from .store import BaseSessionStore, ConcurrentModificationError, StageColumnsMixin
+
+
+class SQLiteSessionStore(StageColumnsMixin, BaseSessionStore):
+    """SessionState persisted in one SQLite table (WAL mode).
+
+    Each stage product (teaching_request, style_config, outline, deck_content,
+    render_result) lives in its own JSON column; everything else goes into
+    `meta`. save() only rewrites columns whose content changed since the last
+    save, and load_fields() reads just the requested columns, so polling
+    endpoints that need render_result never touch the deck.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        stage_cols = ", ".join(f"{c} TEXT" for c in self.STAGE_FIELDS)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " stage TEXT,"
+            " created_at TEXT,"
+            " updated_at TEXT,"
+            f" {stage_cols},"
+            " meta TEXT,"
+            " version INTEGER NOT NULL DEFAULT 0)"
+        )
+        existing = {r[1] for r in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "version" not in existing:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+        self._init_digests()
+
+    def load(self, session_id: str) -> Optional[SessionState]:
+        cols = self._columns
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT {', '.join(cols)}, version FROM sessions WHERE session_id = ?", (session_id,)
+            )
+            found = cur.fetchone()
+            if found is None:
+                return None
+            values = dict(zip(cols, found[:-1]))
+            self._remember(session_id, values)
+        return self._from_row(session_id, values, int(found[-1]))
+
+    def load_fields(self, session_id: str, fields: Iterable[str]) -> Optional[Dict[str, Any]]:
+        fields = list(fields)
+        unknown = [f for f in fields if f not in self.STAGE_FIELDS]
+        if unknown:
+            # 非阶段字段都在 meta 里，退回完整读取
+            return super().load_fields(session_id, fields)
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT {', '.join(fields) or 'session_id'} FROM sessions WHERE session_id = ?",
+                (session_id,),
+            )
+            found = cur.fetchone()
+        if found is None:
+            return None
+        return {f: (json.loads(raw) if raw is not None else None) for f, raw in zip(fields, found)}
+
+    def peek_version(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return int(found[0]) if found is not None else None
+
+    def save(self, state: SessionState) -> None:
+        self._touch(state)
+        row = self._to_row(state)
+        sid = state.session_id
+        expected = state.version
+        with self._lock:
+            changed = self._changed_columns(sid, row)
+            sets = ", ".join([*(f"{k} = ?" for k in changed), "version = version + 1"])
+            cur = self._conn.execute(
+                f"UPDATE sessions SET {sets} WHERE session_id = ? AND version = ?",
+                (*changed.values(), sid, expected),
+            )
+            if cur.rowcount == 0:
+                exists = self._conn.execute(
+                    "SELECT version FROM sessions WHERE session_id = ?", (sid,)
+                ).fetchone()
+                if exists is not None:
+                    self._conn.rollback()
+                    self._forget(sid)
+                    raise ConcurrentModificationError(
+                        f"session {sid} was saved elsewhere (stored v{exists[0]}, saving v{expected})"
+                    )
+                cols = ("session_id", *row.keys(), "version")
+                self._conn.execute(
+                    f"INSERT INTO sessions ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+                    (sid, *row.values(), expected + 1),
+                )
+            self._conn.commit()
+            self._remember(sid, row)
+        state.version = expected + 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+            self._forget(session_id)
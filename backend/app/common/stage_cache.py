@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+# ============================================================================
+# Stage-level memoization (3.2 / 3.3 / 3.4 / 3.5)
+# ============================================================================
+# 用户补充一个无关紧要的回答后重跑、或两位老师提交了等价的需求时，各阶段的输入完全相同，
+# 这里按阶段输入的规范化哈希缓存阶段输出：
+#   - 键：sha256(阶段名, 阶段版本, 规范化后的 pydantic 输入)；下游阶段的键包含上游阶段的*输出*，
+#     上游任何变化（包括上游缓存未命中后重新生成的不同结果）都会精确地使下游失效
+#   - 值：按内容哈希存放（相同输出只存一份），memo 表只记录 键 -> 内容哈希
+#   - 淘汰：总字节超过上限时按 last_access 淘汰 memo 行，再清理无引用的内容
+
+
+# 阶段实现改变（提示词、默认值、输出结构）时递增对应版本号，旧条目自然失效
+STAGE_VERSIONS: Dict[str, int] = {
+    "3.2": 1,
+    "3.3": 1,
+    "3.4": 1,
+    "3.5": 1,
+}
+
+# TeachingRequest 中不影响下游阶段输出的簿记字段（交互状态、时间戳、展示文案等）
+_REQUEST_VOLATILE_FIELDS = (
+    "request_id",
+    "timestamp",
+    "parsing_metadata",
+    "internal_interaction_stage",
+    "stage",
+    "display_summary",
+    "interaction_metadata",
+)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    return value
+
+
+def request_fingerprint(req: BaseModel) -> Dict[str, Any]:
+    """TeachingRequest 去掉簿记字段后的规范形式（等价需求得到相同的键）"""
+    data = req.model_dump(mode="json")
+    for name in _REQUEST_VOLATILE_FIELDS:
+        data.pop(name, None)
+    return data
+
+
+def llm_fingerprint(llm: Any) -> Dict[str, Any]:
+    """LLM 开关与模型会改变阶段输出，必须参与键的计算"""
+    enabled = bool(llm is not None and llm.is_enabled())
+    return {"enabled": enabled, "model": getattr(llm, "model", None) if enabled else None}
+
+
+def stage_key(stage: str, *parts: Any) -> str:
+    """阶段输入的规范化哈希（键排序的 JSON）"""
+    material = [stage, STAGE_VERSIONS.get(stage, 0), *(_normalize(p) for p in parts)]
+    blob = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """Content-addressed SQLite store for JSON-serializable stage outputs."""
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_blobs ("
+            " digest TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_memo ("
+            " key TEXT PRIMARY KEY,"
+            " stage TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_memo_access ON stage_memo(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_memo_digest ON stage_memo(digest)")
+        self._conn.commit()
+        self._bytes = self._total_bytes()
+
+    @classmethod
+    def from_env(cls, data_dir: str) -> Optional["StageCache"]:
+        """Env:
+          - STAGE_CACHE: "1" to enable (default: 0, opt-in)
+          - STAGE_CACHE_MAX_MB (default: 512)
+          - STAGE_CACHE_DISK: "0" to keep the store in memory only (default: 1)
+        """
+        if (os.getenv("STAGE_CACHE") or "0") != "1":
+            return None
+        db_path = None
+        if (os.getenv("STAGE_CACHE_DISK") or "1") != "0":
+            db_path = os.path.join(data_dir, "cache", "stage_cache.sqlite")
+        return cls(
+            db_path=db_path,
+            max_bytes=int(float(os.getenv("STAGE_CACHE_MAX_MB") or 512) * 1024 * 1024),
+        )
+
+    # --- lookup ------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT b.value FROM stage_memo m JOIN stage_blobs b ON b.digest = m.digest WHERE m.key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE stage_memo SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, stage: str, key: str, value: Any) -> str:
+        """保存阶段输出，返回内容哈希"""
+        raw = json.dumps(_normalize(value), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        size = len(raw.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO stage_blobs (digest, value, bytes) VALUES (?, ?, ?)",
+                (digest, raw, size),
+            )
+            if cur.rowcount > 0:
+                self._bytes += size
+            old = self._conn.execute("SELECT digest FROM stage_memo WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_memo (key, stage, digest, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, stage, digest, now, now),
+            )
+            # 同一个键换了内容：旧内容没有其他键引用时一并删除
+            if old is not None and old[0] != digest:
+                self._release(old[0])
+            self._conn.commit()
+            self._stats["writes"] += 1
+            if self._bytes > self.max_bytes:
+                self._evict()
+        return digest
+
+    # --- eviction ----------------------------------------------------------
+
+    def _total_bytes(self) -> int:
+        row = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM stage_blobs").fetchone()
+        return int(row[0])
+
+    def _release(self, digest: str) -> None:
+        """Delete one blob once no memo row references it (indexed lookup, no table scan)."""
+        row = self._conn.execute(
+            "SELECT bytes FROM stage_blobs WHERE digest = ?"
+            " AND NOT EXISTS (SELECT 1 FROM stage_memo WHERE digest = ?)",
+            (digest, digest),
+        ).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM stage_blobs WHERE digest = ?", (digest,))
+            self._bytes -= int(row[0])
+
+    def _evict(self) -> None:
+        """Drop least-recently-used memo rows until the store is back under ~90% of its cap."""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, digest FROM stage_memo ORDER BY last_access ASC")
+        evicted = 0
+        for key, digest in rows.fetchall():
+            if self._bytes <= target:
+                break
+            self._conn.execute("DELETE FROM stage_memo WHERE key = ?", (key,))
+            self._release(digest)
+            evicted += 1
+        self._conn.commit()
+        self._stats["evictions"] += evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM stage_memo")
+            self._conn.execute("DELETE FROM stage_blobs")
+            self._conn.commit()
+            self._bytes = 0
+
+    # --- metrics -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM stage_memo").fetchone()[0]
+            blobs = self._conn.execute("SELECT COUNT(*) FROM stage_blobs").fetchone()[0]
+        return {
+            **self._stats,
+            "hit_rate": (self._stats["hits"] / lookups) if lookups else 0.0,
+            "entries": int(entries),
+            "blobs": int(blobs),
+            "bytes": self._bytes,
+            "disk_enabled": self.db_path is not None,
+        }
@@ -1,33 +1,58 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import tempfile
 import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import nullcontext
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional
 
+from . import json_delta
 from .schemas import SessionState
 from .security import validate_session_id
 
 
-class SessionStore:
-    """A tiny session store.
+def _dumps_compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
-    Demo implementation: persist SessionState to JSON files.
-    In production you can replace it with Redis/MySQL.
-    """
 
-    def __init__(self, data_dir: str):
-        self.data_dir = data_dir
-        self.sessions_dir = os.path.join(data_dir, "sessions")
-        os.makedirs(self.sessions_dir, exist_ok=True)
+def _atomic_write_text(path: str, text: str) -> None:
+    """Write via a temp file in the same directory + os.replace, so readers never see a torn file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
 
-    def _path(self, session_id: str) -> str:
-        return os.path.join(self.sessions_dir, f"{session_id}.json")
 
-    def _history_path(self, session_id: str) -> str:
-        # Optional: keep an append-only history for debugging, one JSON object per line.
-        return os.path.join(self.sessions_dir, f"{session_id}.jsonl")
+class ConcurrentModificationError(RuntimeError):
+    """save() rejected: the stored session is newer than the state being saved."""
+
+
+class BaseSessionStore(ABC):
+    """Session persistence interface used by WorkflowEngine and the API.
+
+    Backends: SessionStore (JSON files, default), SQLiteSessionStore and
+    RedisSessionStore; pick one with create_session_store().
+
+    Saves use optimistic concurrency: `state.version` must match the stored
+    version (0 for a new session), otherwise ConcurrentModificationError is
+    raised. On success the version is incremented in place. Use update() for
+    read-modify-write from background tasks.
+    """
+
+    # SessionState 中按阶段产出的大字段，后端可以分别存储、按需读取
+    STAGE_FIELDS = ("teaching_request", "style_config", "outline", "deck_content", "render_result")
 
     @staticmethod
     def _iso_utc(ts: float) -> str:
@@ -37,6 +62,14 @@ class SessionStore:
     def _iso_local(ts: float) -> str:
         return datetime.fromtimestamp(ts, tz=timezone.utc).astimezone().isoformat(timespec="seconds")
 
+    def _touch(self, state: SessionState) -> float:
+        # Keep timestamps for easier debugging and reproducibility.
+        now = time.time()
+        if state.created_at is None:
+            state.created_at = self._iso_utc(now)
+        state.updated_at = self._iso_utc(now)
+        return now
+
     def create(self, session_id: str) -> SessionState:
         now = time.time()
         state = SessionState(
@@ -47,34 +80,307 @@ class SessionStore:
         self.save(state)
         return state
 
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[SessionState]:
+        ...
+
+    @abstractmethod
+    def save(self, state: SessionState) -> None:
+        ...
+
+    def load_fields(self, session_id: str, fields: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """Load only some top-level fields as plain JSON values (None if no session).
+
+        The default implementation hydrates the whole state; backends that
+        store stage fields separately override it.
+        """
+        state = self.load(session_id)
+        if state is None:
+            return None
+        return {f: state.model_dump(mode="json", include={f}).get(f) for f in fields}
+
+    def peek_version(self, session_id: str) -> Optional[int]:
+        """Cheap stored-version lookup for cache validation; None if unsupported."""
+        return None
+
+    def coalesce_saves(self) -> ContextManager[None]:
+        """Scope in which repeated saves may be merged (see CachedSessionStore)."""
+        return nullcontext()
+
+    def update(
+        self,
+        session_id: str,
+        mutate: Callable[[SessionState], None],
+        retries: int = 5,
+    ) -> SessionState:
+        """Load, apply `mutate`, save; reload and re-apply on version conflicts."""
+        for attempt in range(retries + 1):
+            state = self.load(session_id)
+            if state is None:
+                raise KeyError(f"session not found: {session_id}")
+            mutate(state)
+            try:
+                self.save(state)
+                return state
+            except ConcurrentModificationError:
+                if attempt == retries:
+                    raise
+        raise AssertionError("unreachable")
+
+
+class StageColumnsMixin:
+    """Split a SessionState into stage columns + meta for column-oriented backends.
+
+    Rows are flat {column: JSON text}; per-session digests of the last
+    written/read row let save() rewrite only the columns that changed.
+    """
+
+    STAGE_FIELDS = BaseSessionStore.STAGE_FIELDS
+    SCALAR_COLUMNS = ("stage", "created_at", "updated_at")
+    # 记录最近写入的各列摘要；超出上限按 LRU 丢弃（丢弃后下一次保存写整行）
+    MAX_TRACKED_SESSIONS = 256
+
+    def _init_digests(self) -> None:
+        self._digests: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+    @staticmethod
+    def _digest(text: Optional[str]) -> str:
+        return hashlib.blake2b((text or "").encode("utf-8"), digest_size=16).hexdigest()
+
+    @property
+    def _columns(self) -> tuple:
+        return (*self.SCALAR_COLUMNS, *self.STAGE_FIELDS, "meta")
+
+    def _to_row(self, state: SessionState) -> Dict[str, Optional[str]]:
+        data = state.model_dump(mode="json", exclude={"session_id", "version"})
+        row: Dict[str, Optional[str]] = {k: data.pop(k, None) for k in self.SCALAR_COLUMNS}
+        for field in self.STAGE_FIELDS:
+            value = data.pop(field, None)
+            row[field] = _dumps_compact(value) if value is not None else None
+        row["meta"] = _dumps_compact(data)
+        return row
+
+    def _from_row(self, session_id: str, values: Dict[str, Optional[str]], version: int) -> SessionState:
+        data: Dict[str, Any] = json.loads(values.get("meta") or "{}")
+        data["session_id"] = session_id
+        data["version"] = version
+        for key in self.SCALAR_COLUMNS:
+            if values.get(key) is not None:
+                data[key] = values[key]
+        for field in self.STAGE_FIELDS:
+            raw = values.get(field)
+            data[field] = json.loads(raw) if raw is not None else None
+        return SessionState.model_validate(data)
+
+    def _changed_columns(self, session_id: str, row: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+        known = self._digests.get(session_id)
+        if known is None:
+            return dict(row)
+        return {k: v for k, v in row.items() if known.get(k) != self._digest(v)}
+
+    def _remember(self, session_id: str, row: Dict[str, Optional[str]]) -> None:
+        self._digests[session_id] = {k: self._digest(v) for k, v in row.items()}
+        self._digests.move_to_end(session_id)
+        while len(self._digests) > self.MAX_TRACKED_SESSIONS:
+            self._digests.popitem(last=False)
+
+    def _forget(self, session_id: str) -> None:
+        self._digests.pop(session_id, None)
+
+
+class SessionStore(BaseSessionStore):
+    """A tiny session store.
+
+    Demo implementation: persist SessionState to JSON files.
+    In production use SQLiteSessionStore (SESSION_STORE=sqlite) or
+    RedisSessionStore (SESSION_STORE=redis, required for multiple workers).
+    The version check here only sees saves made by this process.
+
+    - {session_id}.json: latest state, compact JSON, replaced atomically.
+    - {session_id}.jsonl: history; a full "checkpoint" record every
+      `checkpoint_every` saves and JSON-patch "delta" records in between.
+      Use history() to replay and compact_history() to shrink it.
+    """
+
+    # 最近保存过的会话快照（用于计算 delta），超过上限按 LRU 丢弃；丢弃后下一次保存写 checkpoint
+    MAX_TRACKED_SESSIONS = 64
+
+    def __init__(self, data_dir: str, checkpoint_every: Optional[int] = None):
+        self.data_dir = data_dir
+        self.sessions_dir = os.path.join(data_dir, "sessions")
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self.checkpoint_every = max(
+            1, checkpoint_every or int(os.getenv("SESSION_CHECKPOINT_EVERY") or 20)
+        )
+        # session_id -> {"snapshot": dict, "since_checkpoint": int}
+        self._tracked: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.json")
+
+    def _history_path(self, session_id: str) -> str:
+        # Optional: keep an append-only history for debugging, one JSON object per line.
+        return os.path.join(self.sessions_dir, f"{session_id}.jsonl")
+
     def load(self, session_id: str) -> Optional[SessionState]:
         path = self._path(session_id)
         if not os.path.exists(path):
             return None
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        return SessionState.model_validate(data)
+        state = SessionState.model_validate(data)
+        # 磁盘上的文件就是上一次保存的快照，可直接作为下一次 delta 的基准
+        tracked = self._tracked.get(session_id)
+        if tracked is None:
+            self._track(session_id, data, since_checkpoint=0)
+        return state
+
+    def _track(self, session_id: str, snapshot: Dict[str, Any], since_checkpoint: int) -> None:
+        self._tracked[session_id] = {"snapshot": snapshot, "since_checkpoint": since_checkpoint}
+        self._tracked.move_to_end(session_id)
+        while len(self._tracked) > self.MAX_TRACKED_SESSIONS:
+            self._tracked.popitem(last=False)
 
     def save(self, state: SessionState) -> None:
-        # Keep timestamps for easier debugging and reproducibility.
-        now = time.time()
-        if state.created_at is None:
-            state.created_at = self._iso_utc(now)
-        state.updated_at = self._iso_utc(now)
+        tracked = self._tracked.get(state.session_id)
+        if tracked is not None and tracked["snapshot"].get("version", 0) != state.version:
+            raise ConcurrentModificationError(
+                f"session {state.session_id} was saved elsewhere "
+                f"(stored v{tracked['snapshot'].get('version', 0)}, saving v{state.version})"
+            )
+        now = self._touch(state)
 
-        path = self._path(state.session_id)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(state.model_dump(mode="json"), f, ensure_ascii=False, indent=2)
+        state.version += 1
+        snapshot = state.model_dump(mode="json")
+        body = _dumps_compact(snapshot)
+        try:
+            _atomic_write_text(self._path(state.session_id), body)
+        except BaseException:
+            state.version -= 1
+            raise
 
-        # Append a snapshot record (jsonl) so we can quickly inspect the evolution of a session.
-        hist_path = self._history_path(state.session_id)
-        record = {
+        # Append a history record (jsonl) so we can quickly inspect the evolution of a session.
+        record: Dict[str, Any] = {
             "ts": now,
             "ts_utc": self._iso_utc(now),
             "ts_local": self._iso_local(now),
             "session_id": state.session_id,
             "stage": state.stage,
-            "state": state.model_dump(mode="json"),
         }
-        with open(hist_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        patch = None
+        if tracked is not None and tracked["since_checkpoint"] + 1 < self.checkpoint_every:
+            patch = json_delta.diff(tracked["snapshot"], snapshot)
+        patch_text = _dumps_compact(patch) if patch is not None else None
+        # delta 比全量还大（例如整份 deck 被替换）时直接写 checkpoint
+        if patch_text is not None and len(patch_text) < len(body) // 2:
+            record["type"] = "delta"
+            line = _dumps_compact(record)[:-1] + ',"patch":' + patch_text + "}"
+            since_checkpoint = tracked["since_checkpoint"] + 1
+        else:
+            record["type"] = "checkpoint"
+            line = _dumps_compact(record)[:-1] + ',"state":' + body + "}"
+            since_checkpoint = 0
+        with open(self._history_path(state.session_id), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        self._track(state.session_id, snapshot, since_checkpoint)
+
+    # ------------------------------------------------------------------
+    # History replay / compaction
+    # ------------------------------------------------------------------
+
+    def _read_history(self, session_id: str) -> List[Dict[str, Any]]:
+        path = self._history_path(session_id)
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+        return records
+
+    def history(self, session_id: str) -> Iterator[Dict[str, Any]]:
+        """Replay the history log, yielding {"ts", "stage", "state"} per save.
+
+        Records written before delta logging (full "state", no "type") are
+        treated as checkpoints.
+        """
+        current: Optional[Dict[str, Any]] = None
+        for rec in self._read_history(session_id):
+            if rec.get("type", "checkpoint") == "checkpoint":
+                current = rec["state"]
+            elif current is None:
+                # 历史被截断且缺少起始 checkpoint，无法还原
+                continue
+            else:
+                current = json_delta.apply(current, rec["patch"])
+            yield {"ts": rec.get("ts"), "stage": rec.get("stage"), "state": current}
+
+    def compact_history(self, session_id: str, keep_last: Optional[int] = None) -> int:
+        """Rewrite the history log as checkpoints + deltas.
+
+        Args:
+            keep_last: keep only the most recent N saves (default: keep all).
+                       keep_last=1 collapses the log into a single checkpoint.
+
+        Returns: number of records in the rewritten log.
+        """
+        entries = list(self.history(session_id))
+        if keep_last is not None:
+            entries = entries[-max(1, keep_last):] if entries else []
+        if not entries:
+            return 0
+
+        lines: List[str] = []
+        prev: Optional[Dict[str, Any]] = None
+        for i, entry in enumerate(entries):
+            ts = entry["ts"] or time.time()
+            record = {
+                "ts": ts,
+                "ts_utc": self._iso_utc(ts),
+                "ts_local": self._iso_local(ts),
+                "session_id": session_id,
+                "stage": entry["stage"],
+            }
+            if prev is None or i % self.checkpoint_every == 0:
+                record["type"] = "checkpoint"
+                record["state"] = entry["state"]
+            else:
+                record["type"] = "delta"
+                record["patch"] = json_delta.diff(prev, entry["state"])
+            lines.append(_dumps_compact(record))
+            prev = entry["state"]
+
+        _atomic_write_text(self._history_path(session_id), "\n".join(lines) + "\n")
+        # 重写后按 checkpoint 间隔重新计数
+        tracked = self._tracked.get(session_id)
+        if tracked is not None:
+            tracked["since_checkpoint"] = (len(entries) - 1) % self.checkpoint_every
+        return len(lines)
+
+
+def create_session_store(data_dir: str) -> BaseSessionStore:
+    """Build the session store selected by env, wrapped in the hydrated-state
+    cache (see CachedSessionStore.from_env).
+
+    Env:
+      - SESSION_STORE: "file" (default), "sqlite" (data/sessions.sqlite, WAL mode)
+        or "redis" (REDIS_URL, shared across workers/pods)
+    """
+    from .session_cache import CachedSessionStore
+
+    backend = (os.getenv("SESSION_STORE") or "file").lower()
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteSessionStore
+
+        store: BaseSessionStore = SQLiteSessionStore(os.path.join(data_dir, "sessions.sqlite"))
+    elif backend == "redis":
+        from .shared_store import RedisSessionStore
+
+        store = RedisSessionStore.from_env()
+    elif backend == "file":
+        store = SessionStore(data_dir)
+    else:
+        raise ValueError(f"unknown SESSION_STORE backend: {backend}")
+    return CachedSessionStore.from_env(store)
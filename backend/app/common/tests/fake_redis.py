@@ -0,0 +1,98 @@
+"""
+进程内 Redis 替身：只实现 shared_store 用到的命令（hash + WATCH/MULTI/EXEC）
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.common.shared_store import WatchError
+
+
+class FakeRedis:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        # 每个 key 的修改计数，用于模拟 WATCH
+        self._revisions: Dict[str, int] = {}
+
+    def _bump(self, key: str) -> None:
+        self._revisions[key] = self._revisions.get(key, 0) + 1
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        with self._lock:
+            return self._hashes.get(key, {}).get(field)
+
+    def hmget(self, key: str, fields: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            h = self._hashes.get(key, {})
+            return [h.get(f) for f in fields]
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._hashes.get(key, {}))
+
+    def hset(self, key: str, field: Optional[str] = None, value: Any = None,
+             mapping: Optional[Dict[str, Any]] = None) -> int:
+        with self._lock:
+            h = self._hashes.setdefault(key, {})
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            for k, v in items.items():
+                h[k] = str(v)
+            self._bump(key)
+            return len(items)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            n = 0
+            for key in keys:
+                if self._hashes.pop(key, None) is not None:
+                    n += 1
+                self._bump(key)
+            return n
+
+    def expire(self, key: str, seconds: int) -> bool:
+        return key in self._hashes
+
+    def pipeline(self) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self._watched: Dict[str, int] = {}
+        self._queue: List[tuple] = []
+        self._buffering = False
+
+    def watch(self, *keys: str) -> None:
+        with self.client._lock:
+            for key in keys:
+                self._watched[key] = self.client._revisions.get(key, 0)
+
+    def multi(self) -> None:
+        self._buffering = True
+
+    def __getattr__(self, name: str):
+        target = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            if self._buffering:
+                self._queue.append((target, args, kwargs))
+                return self
+            return target(*args, **kwargs)
+
+        return call
+
+    def execute(self) -> List[Any]:
+        with self.client._lock:
+            for key, rev in self._watched.items():
+                if self.client._revisions.get(key, 0) != rev:
+                    raise WatchError("watched key changed")
+            return [fn(*args, **kwargs) for fn, args, kwargs in self._queue]
+
+    def reset(self) -> None:
+        self._watched.clear()
+        self._queue.clear()
+        self._buffering = False
@@ -0,0 +1,58 @@
+"""
+测试共享 HTTP 连接池：每个事件循环一个 client，循环结束后释放，关闭时全部关闭
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.common import llm_client
+from app.common.llm_client import aclose_http_client, get_http_client
+
+
+@pytest.mark.asyncio
+async def test_one_client_per_loop_and_all_closed_on_shutdown():
+    await aclose_http_client()
+    client = get_http_client()
+    assert get_http_client() is client
+
+    # 已结束的 asyncio.run：其 client 在下次获取时被丢弃，不会一直留在表里
+    other = await asyncio.to_thread(lambda: asyncio.run(_get_client()))
+    assert other is not client
+    get_http_client()
+    assert other not in llm_client._HTTP_CLIENTS.values()
+
+    # 仍在运行的另一个循环：关闭时在它自己的循环上关闭
+    loop_ready, stop = threading.Event(), threading.Event()
+    holder = {}
+
+    def background():
+        async def main():
+            holder["client"] = get_http_client()
+            loop_ready.set()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    await asyncio.to_thread(loop_ready.wait, 2)
+    background_client = holder["client"]
+    assert background_client is not client
+
+    await aclose_http_client()
+    assert client.is_closed
+    for _ in range(200):
+        if background_client.is_closed:
+            break
+        await asyncio.sleep(0.01)
+    stop.set()
+    await asyncio.to_thread(thread.join, 2)
+    assert background_client.is_closed
+    assert llm_client._HTTP_CLIENTS == {}
+
+
+async def _get_client():
+    return get_http_client()
@@ -0,0 +1,82 @@
+"""
+测试 SQLite 持久化任务队列（幂等入队、租约、可见性超时、失败重试）
+"""
+
+import time
+
+from app.common.job_queue import DONE, FAILED, QUEUED, JobQueue, image_job_key
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(str(tmp_path / "queue.sqlite"), **kwargs)
+
+
+def test_enqueue_is_idempotent(tmp_path):
+    """同一 job_key 重复提交只有一条任务；已完成的任务不会重新入队"""
+    q = make_queue(tmp_path)
+    key = image_job_key("s1", "slot_a", "一张液压泵示意图")
+    assert key == image_job_key("s1", "slot_a", "一张液压泵示意图")
+    assert key != image_job_key("s1", "slot_a", "另一张图")
+
+    assert q.enqueue(key, "image", "s1", {"n": 1}, slot_id="slot_a") == QUEUED
+    assert q.enqueue(key, "image", "s1", {"n": 2}, slot_id="slot_a") == QUEUED
+    assert q.stats() == {QUEUED: 1}
+
+    job, = q.lease("image", "w1")
+    assert job["payload"] == {"n": 1}
+    q.complete(key, "w1", {"url": "./images/slot_a.png"})
+    assert q.enqueue(key, "image", "s1", {"n": 3}, slot_id="slot_a") == DONE
+    assert q.lease("image", "w1") == []
+
+
+def test_lease_order_and_exclusivity(tmp_path):
+    """按 priority、页码出队；已租出的任务不会再被其他 worker 领取"""
+    q = make_queue(tmp_path)
+    q.enqueue("k3", "image", "s1", {}, slot_id="c", priority=2, page_index=0)
+    q.enqueue("k2", "image", "s1", {}, slot_id="b", priority=1, page_index=5)
+    q.enqueue("k1", "image", "s1", {}, slot_id="a", priority=1, page_index=1)
+
+    first = q.lease("image", "w1", limit=2)
+    assert [j["job_key"] for j in first] == ["k1", "k2"]
+    second = q.lease("image", "w2", limit=5)
+    assert [j["job_key"] for j in second] == ["k3"]
+    assert q.lease("image", "w3", limit=5) == []
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    """worker 崩溃后租约过期，任务被重新领取；旧 worker 无法再提交结果"""
+    q = make_queue(tmp_path)
+    q.enqueue("k1", "image", "s1", {}, slot_id="a")
+    q.lease("image", "dead", lease_seconds=0.01)
+    time.sleep(0.02)
+
+    job, = q.lease("image", "w2")
+    assert job["attempt"] == 2
+    assert not q.heartbeat("k1", "dead")
+    assert not q.complete("k1", "dead")
+    assert q.complete("k1", "w2", {})
+
+
+def test_fail_requeues_until_max_attempts(tmp_path):
+    """失败后回到队列，超过 max_attempts 记为 failed；显式重试会重新入队"""
+    q = make_queue(tmp_path, max_attempts=2)
+    q.enqueue("k1", "image", "s1", {}, slot_id="a")
+
+    q.lease("image", "w1")
+    assert q.fail("k1", "w1", "boom") == QUEUED
+    q.lease("image", "w1")
+    assert q.fail("k1", "w1", "boom") == FAILED
+    job, = q.session_jobs("s1")
+    assert job["status"] == FAILED and job["error"] == "boom"
+
+    assert q.enqueue("k1", "image", "s1", {}, slot_id="a") == QUEUED
+
+
+def test_release_returns_leases(tmp_path):
+    """正常退出时交还租约，不计入尝试次数"""
+    q = make_queue(tmp_path)
+    q.enqueue("k1", "image", "s1", {}, slot_id="a")
+    q.lease("image", "w1")
+    assert q.release("w1") == 1
+    job, = q.lease("image", "w2")
+    assert job["attempt"] == 1
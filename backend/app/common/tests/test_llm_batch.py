@@ -0,0 +1,93 @@
+"""
+测试批量 chat_json：N 项合并为一次调用，按 index 映射结果，未通过校验的项逐项回退，预算耗尽 / 取消时不回退
+"""
+
+import json
+
+import pytest
+
+from app.common.budget import BudgetExhausted
+from app.common.cancellation import RunCancelled
+from app.common.llm_batch import batch_chat_json, batch_size_from_env
+
+
+class BatchLLM:
+    """按 index 回显结果；index 为 3 的项故意返回空值"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        payload = json.loads(user_msg)
+        self.calls.append(payload)
+        results = [
+            {"index": item["index"], "value": "" if item["index"] == 3 else item["name"].upper()}
+            for item in reversed(payload["items"])
+        ]
+        return {"results": results}, {}
+
+
+@pytest.mark.asyncio
+async def test_batches_map_back_by_index_and_fall_back_per_item():
+    llm = BatchLLM()
+    items = [{"name": f"slide{i}"} for i in range(7)]
+    fallbacks = []
+
+    async def fallback(i):
+        fallbacks.append(i)
+        return {"value": f"fallback{i}"}
+
+    batch = await batch_chat_json(
+        llm, "sys", items, '{"value": "string"}',
+        fallback=fallback,
+        validate=lambda r: bool(r.get("value")),
+        shared={"subject": "液压"},
+        batch_size=3,
+    )
+
+    assert len(llm.calls) == 3
+    assert all(call["shared"] == {"subject": "液压"} for call in llm.calls)
+    values = [r["value"] for r in batch["results"]]
+    assert values == ["SLIDE0", "SLIDE1", "SLIDE2", "fallback3", "SLIDE4", "SLIDE5", "SLIDE6"]
+    assert fallbacks == [3]
+    assert batch["requests"] == 4 and batch["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back_for_every_item():
+    class BrokenLLM:
+        async def chat_json(self, *args, **kwargs):
+            raise RuntimeError("bad json")
+
+    async def fallback(i):
+        return {"value": i}
+
+    batch = await batch_chat_json(BrokenLLM(), "sys", [{}, {}], "{}", fallback=fallback, batch_size=5)
+    assert [r["value"] for r in batch["results"]] == [0, 1]
+    assert batch["fallbacks"] == 2
+
+
+@pytest.mark.parametrize("error", [BudgetExhausted("deadline"), RunCancelled("client_disconnected")])
+@pytest.mark.asyncio
+async def test_stop_signals_are_not_turned_into_per_item_calls(error):
+    class StoppedLLM:
+        async def chat_json(self, *args, **kwargs):
+            raise error
+
+    fallbacks = []
+
+    async def fallback(i):
+        fallbacks.append(i)
+        return {"value": i}
+
+    with pytest.raises(type(error)):
+        await batch_chat_json(StoppedLLM(), "sys", [{}, {}], "{}", fallback=fallback, batch_size=5)
+    assert fallbacks == []
+
+
+def test_batching_is_opt_in(monkeypatch):
+    monkeypatch.delenv("LLM_BATCH", raising=False)
+    monkeypatch.setenv("LLM_BATCH_SIZE", "8")
+    assert batch_size_from_env() == 1
+    monkeypatch.setenv("LLM_BATCH", "1")
+    assert batch_size_from_env() == 8
@@ -0,0 +1,110 @@
+"""
+测试 LLM 响应缓存：键的组成、命中/未命中计数、TTL 过期、LRU 淘汰、磁盘容量上限、跨实例持久化、use_cache=False 绕过
+"""
+
+import pytest
+
+from app.common import llm_cache
+from app.common.llm_cache import LLMResponseCache, cache_key
+from app.common.llm_client import LLMClient
+
+
+MESSAGES = [{"role": "system", "content": "s"}, {"role": "user", "content": "液压泵"}]
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def test_cache_key_covers_request_fields():
+    base = cache_key("m1", MESSAGES, 0.2, "hint")
+    assert cache_key("m1", [dict(reversed(list(m.items()))) for m in MESSAGES], 0.2, "hint") == base
+    assert cache_key("m2", MESSAGES, 0.2, "hint") != base
+    assert cache_key("m1", MESSAGES[:1], 0.2, "hint") != base
+    assert cache_key("m1", MESSAGES, 0.7, "hint") != base
+    assert cache_key("m1", MESSAGES, 0.2, "other") != base
+    assert cache_key("m1", MESSAGES, 0.2, "hint", extra={"thinking": {"type": "disabled"}}) != base
+
+
+def test_hit_miss_and_ttl_expiry(clock):
+    cache = LLMResponseCache(ttl_seconds=60)
+    assert cache.get("k") is None
+    cache.put("k", {"content": "v"})
+    hit = cache.get("k")
+    assert hit == {"content": "v"}
+    # 命中返回新对象，调用方修改不影响缓存
+    hit["content"] = "changed"
+    assert cache.get("k") == {"content": "v"}
+
+    clock.now += 61
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["hits_memory"], stats["misses"], stats["writes"]) == (2, 2, 1)
+    assert stats["hit_rate"] == pytest.approx(0.5)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LLMResponseCache(memory_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_restart_and_respects_size_cap(tmp_path, clock):
+    db = str(tmp_path / "cache" / "llm_cache.sqlite")
+    cache = LLMResponseCache(db_path=db, memory_entries=0, max_disk_bytes=1000)
+    value = "x" * 298  # 序列化后 300 字节
+    for i, key in enumerate(["k1", "k2", "k3"]):
+        clock.now = 1000.0 + i
+        cache.put(key, value)
+    clock.now = 1010.0
+    assert cache.get("k1") == value  # k1 最近访问，k2 成为最久未用
+    clock.now = 1011.0
+    cache.put("k4", value)
+
+    # 超过上限后按 last_access 淘汰到 90% 以下
+    assert cache.stats()["disk_bytes"] <= 900
+    assert cache.get("k2") is None
+
+    reopened = LLMResponseCache(db_path=db, memory_entries=0, max_disk_bytes=1000)
+    assert reopened.get("k1") == value and reopened.get("k4") == value
+    assert reopened.stats()["hits_disk"] == 2
+
+
+@pytest.mark.asyncio
+async def test_use_cache_false_bypasses_cache(monkeypatch):
+    monkeypatch.setenv("LLM_MODE", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    client = LLMClient(cache=LLMResponseCache())
+    calls = []
+
+    async def post_completion(payload):
+        calls.append(payload)
+        return {"choices": [{"message": {"content": f"answer {len(calls)}"}}]}, 0.0
+
+    monkeypatch.setattr(client, "_post_completion", post_completion)
+
+    assert await client.chat(MESSAGES) == "answer 1"
+    assert await client.chat(MESSAGES) == "answer 1"
+    assert len(calls) == 1
+
+    # 绕过缓存：既不读也不写
+    assert await client.chat(MESSAGES, use_cache=False) == "answer 2"
+    assert await client.chat(MESSAGES) == "answer 1"
+    assert len(calls) == 2
+    assert client.cache.stats()["writes"] == 1
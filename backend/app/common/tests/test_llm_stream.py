@@ -0,0 +1,105 @@
+"""
+测试流式请求：与普通请求一样经过取消检查、运行预算的预留/结算和截止时间内的超时；chat_json 传入 on_delta 时逐块回调
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.common import llm_client
+from app.common.budget import BudgetExhausted, RunBudget, bind_run_budget, unbind_run_budget
+from app.common.cancellation import CancellationToken, RunCancelled, bind_cancel_token, unbind_cancel_token
+from app.common.llm_client import LLMClient
+
+
+class StreamServer:
+    """按 SSE 返回固定的内容分块，最后一块带 usage"""
+
+    def __init__(self, parts, total_tokens=42):
+        self.parts = parts
+        self.total_tokens = total_tokens
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        chunks = [
+            {"id": "c1", "model": "m", "choices": [{"index": 0, "delta": {"content": part}}]}
+            for part in self.parts
+        ]
+        chunks.append({"id": "c1", "model": "m", "choices": [], "usage": {"total_tokens": self.total_tokens}})
+        body = "".join(f"data: {json.dumps(c, ensure_ascii=False)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("LLM_MODE", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    server = StreamServer(["液压", "泵"])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(server), timeout=httpx.Timeout(180.0))
+    monkeypatch.setattr(llm_client, "get_http_client", lambda: client)
+    return server
+
+
+@pytest.fixture
+def budget():
+    budget = RunBudget(deadline_s=30, token_budget=5000, expected_latency_s=1)
+    binding = bind_run_budget(budget)
+    yield budget
+    unbind_run_budget(binding)
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_reserves_and_settles_budget(server, budget):
+    parts = [part async for part in LLMClient().chat_stream([{"role": "user", "content": "液压泵"}])]
+
+    assert parts == ["液压", "泵"]
+    payload = json.loads(server.requests[0].content)
+    assert payload["stream"] is True and payload["stream_options"] == {"include_usage": True}
+    # 超时被截止时间收紧
+    assert server.requests[0].extensions["timeout"]["read"] <= 30
+    assert budget.calls == 1 and budget.tokens_used == 42
+    assert budget.remaining_tokens() == 5000 - 42
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_respects_exhausted_budget(server):
+    budget = RunBudget(token_budget=10)
+    binding = bind_run_budget(budget)
+    try:
+        with pytest.raises(BudgetExhausted):
+            [part async for part in LLMClient().chat_stream([{"role": "user", "content": "液压泵"}])]
+    finally:
+        unbind_run_budget(binding)
+    assert server.requests == [] and budget.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_does_not_start_after_cancellation(server):
+    token = CancellationToken()
+    token.cancel("client_disconnected")
+    binding = bind_cancel_token(token)
+    try:
+        with pytest.raises(RunCancelled):
+            [part async for part in LLMClient().chat_stream([{"role": "user", "content": "液压泵"}])]
+    finally:
+        unbind_cancel_token(binding)
+    assert server.requests == []
+
+
+@pytest.mark.asyncio
+async def test_chat_json_streams_deltas_when_requested(server, budget):
+    server.parts = ['{"bullets": ', '["液压泵"]}']
+    deltas = []
+
+    async def on_delta(text):
+        deltas.append(text)
+
+    parsed, meta = await LLMClient().chat_json("s", "u", '{"bullets": ["string"]}', on_delta=on_delta)
+
+    assert parsed == {"bullets": ["液压泵"]}
+    assert deltas == server.parts
+    assert meta["usage"] == {"total_tokens": 42} and meta["raw_content"] == "".join(server.parts)
+    assert json.loads(server.requests[0].content)["stream"] is True
+    assert budget.calls == 1 and budget.tokens_used == 42
@@ -0,0 +1,125 @@
+"""
+测试 LLM 准入控制：按会话轮转授予槽位、RPM/TPM 令牌桶、排队期间取消，以及跨事件循环共享
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.common.rate_limit import AdmissionController, TokenBucket
+
+
+async def wait_until(predicate, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_granted_round_robin_by_session():
+    controller = AdmissionController(max_in_flight=1)
+    held = await controller.acquire("holder", 10)
+    order = []
+
+    async def request(session, n):
+        ticket = await controller.acquire(session, 10)
+        order.append(f"{session}{n}")
+        controller.release(ticket)
+
+    # 大课件 a 先排了 3 个请求，小课件 b 随后排 1 个：b 不必等 a 全部完成
+    tasks = [asyncio.create_task(request("a", n)) for n in range(3)]
+    await wait_until(lambda: controller.stats()["queued"] == 3)
+    tasks.append(asyncio.create_task(request("b", 0)))
+    await wait_until(lambda: controller.stats()["queued"] == 4)
+
+    controller.release(held)
+    await asyncio.gather(*tasks)
+    assert order == ["a0", "b0", "a1", "a2"]
+    assert controller.stats()["in_flight"] == 0 and controller.stats()["queued"] == 0
+
+
+def test_token_bucket_refills_and_accepts_corrections():
+    bucket = TokenBucket(60)
+    assert bucket.delay_for(1) == 0
+    bucket.consume(60)
+    assert bucket.delay_for(1) == pytest.approx(1.0, abs=0.05)
+    # 单个超过容量的请求只需要等桶满
+    assert bucket.delay_for(1000) == pytest.approx(60.0, abs=0.5)
+    # 实际用量比预估少：余额退回
+    bucket.adjust(-30)
+    assert bucket.delay_for(30) == 0
+
+
+@pytest.mark.asyncio
+async def test_rpm_and_tpm_buckets_throttle_requests():
+    controller = AdmissionController(max_in_flight=8, requests_per_minute=6000, tokens_per_minute=6000)
+    first = await controller.acquire("s1", 6000)
+    controller.release(first)
+    assert controller.stats()["throttled"] == 0
+
+    # TPM 桶已用完：每秒补充 100，10 个 token 需要等约 0.1 秒
+    second = await controller.acquire("s1", 10)
+    assert second.queue_wait_s >= 0.05
+    assert controller.stats()["throttled"] == 1
+
+    # 用实际用量校正预估后，后续请求不再等待
+    controller.release(second, actual_tokens=0)
+    third = await controller.acquire("s1", 5)
+    assert third.queue_wait_s < 0.05
+    controller.release(third)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_releases_its_place():
+    controller = AdmissionController(max_in_flight=1)
+    held = await controller.acquire("holder", 10)
+
+    # 排队中被取消：从队列移除
+    queued = asyncio.create_task(controller.acquire("a", 10))
+    await wait_until(lambda: controller.stats()["queued"] == 1)
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert controller.stats()["queued"] == 0
+
+    # 槽位刚授予就被取消：槽位转交给下一个等待者
+    granted = asyncio.create_task(controller.acquire("a", 10))
+    waiting = asyncio.create_task(controller.acquire("b", 10))
+    await wait_until(lambda: controller.stats()["queued"] == 2)
+    controller.release(held)
+    granted.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await granted
+    ticket = await asyncio.wait_for(waiting, 1)
+    assert controller.stats()["in_flight"] == 1
+    controller.release(ticket)
+    assert controller.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_controller_is_shared_across_event_loops():
+    controller = AdmissionController(max_in_flight=1)
+    held = await controller.acquire("web", 10)
+    admitted = threading.Event()
+
+    def background_run():
+        # 与后台线程里的 asyncio.run / 批量 CLI / 图片 worker 相同：另一个事件循环
+        async def request():
+            ticket = await controller.acquire("worker", 10)
+            admitted.set()
+            controller.release(ticket)
+
+        asyncio.run(request())
+
+    thread = threading.Thread(target=background_run)
+    thread.start()
+    await wait_until(lambda: controller.stats()["queued"] == 1)
+    assert not admitted.is_set()
+
+    controller.release(held)
+    await asyncio.to_thread(thread.join, 2)
+    assert admitted.is_set() and not thread.is_alive()
+    assert controller.stats()["in_flight"] == 0
@@ -0,0 +1,133 @@
+"""
+测试会话缓存：命中返回副本、合并写、保存失败失效、跨实例版本失效、容量淘汰
+"""
+
+import pytest
+
+from app.common.session_cache import CachedSessionStore
+from app.common.sqlite_store import SQLiteSessionStore
+from app.common.store import ConcurrentModificationError, SessionStore
+
+
+class CountingStore(SessionStore):
+    def __init__(self, data_dir):
+        super().__init__(data_dir)
+        self.loads = 0
+        self.saves = 0
+
+    def load(self, session_id):
+        self.loads += 1
+        return super().load(session_id)
+
+    def save(self, state):
+        self.saves += 1
+        super().save(state)
+
+
+def test_hot_load_hits_cache(tmp_path):
+    """命中缓存时不访问后端；每次返回独立的副本，未保存的修改对其他读者不可见"""
+    backend = CountingStore(str(tmp_path))
+    store = CachedSessionStore(backend)
+    store.create("h1")
+
+    a = store.load("h1")
+    b = store.load("h1")
+    assert a is not b and a == b
+    assert backend.loads == 0
+    assert store.stats()["hits"] == 2
+
+    a.stage = "3.4"
+    assert store.load("h1").stage == "3.1"
+
+    # 保存之后调用方继续修改自己的对象，也不影响缓存
+    store.save(a)
+    a.stage = "3.5"
+    assert store.load("h1").stage == "3.4"
+    assert backend.loads == 0
+
+
+def test_failed_save_invalidates_entry(tmp_path):
+    """保存失败或版本冲突时丢弃缓存，下次从后端重新加载"""
+
+    class FailingStore(CountingStore):
+        fail = False
+
+        def save(self, state):
+            if self.fail:
+                raise OSError("disk full")
+            super().save(state)
+
+    backend = FailingStore(str(tmp_path))
+    store = CachedSessionStore(backend)
+    store.create("h4")
+
+    state = store.load("h4")
+    state.stage = "3.3"
+    backend.fail = True
+    with pytest.raises(OSError):
+        store.save(state)
+    assert store.stats()["entries"] == 0
+    backend.fail = False
+    assert store.load("h4").stage == "3.1"
+    assert backend.loads == 1
+
+    stale = store.load("h4")
+    fresh = store.load("h4")
+    fresh.stage = "3.2"
+    store.save(fresh)
+    with pytest.raises(ConcurrentModificationError):
+        store.save(stale)
+    assert store.stats()["entries"] == 0
+    assert store.load("h4").stage == "3.2"
+
+
+def test_saves_inside_scope_flush_once(tmp_path):
+    """作用域内多次 save 只落盘一次，版本号回写到调用方对象"""
+    backend = CountingStore(str(tmp_path))
+    store = CachedSessionStore(backend)
+    state = store.create("h2")
+    assert backend.saves == 1
+
+    with store.coalesce_saves():
+        for stage in ["3.2", "3.3", "3.4"]:
+            state.stage = stage
+            store.save(state)
+        # 作用域内其他读者看到最新内容
+        assert store.load("h2").stage == "3.4"
+        assert backend.saves == 1
+
+    assert backend.saves == 2
+    assert state.version == 2
+    assert SessionStore(str(tmp_path)).load("h2").stage == "3.4"
+
+    # 落盘后继续使用同一对象保存不会产生版本冲突
+    state.stage = "3.5"
+    store.save(state)
+    assert store.load("h2").stage == "3.5"
+
+
+def test_stale_entry_is_reloaded_after_other_worker_saves(tmp_path):
+    """另一个实例写入后，通过版本号发现缓存过期并重新加载"""
+    db = str(tmp_path / "s.sqlite")
+    worker_a = CachedSessionStore(SQLiteSessionStore(db))
+    worker_b = CachedSessionStore(SQLiteSessionStore(db))
+    worker_a.create("h3")
+    assert worker_a.load("h3").stage == "3.1"
+
+    other = worker_b.load("h3")
+    other.stage = "3.3"
+    worker_b.save(other)
+
+    assert worker_a.load("h3").stage == "3.3"
+    assert worker_a.stats()["stale"] == 1
+
+
+def test_eviction_respects_entry_budget(tmp_path):
+    store = CachedSessionStore(SessionStore(str(tmp_path)), max_entries=2)
+    for sid in ["e1", "e2", "e3"]:
+        store.create(sid)
+    stats = store.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    # 被淘汰的会话仍可从后端读取
+    assert store.load("e1") is not None
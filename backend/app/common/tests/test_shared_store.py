@@ -0,0 +1,79 @@
+"""
+测试共享会话/渲染状态存储（Redis 兼容接口，使用进程内替身）
+"""
+
+import threading
+
+import pytest
+
+from app.common.shared_store import RedisRenderStatusStore, RedisSessionStore, create_render_status_store
+from app.common.sqlite_store import SQLiteSessionStore
+from app.common.store import ConcurrentModificationError, SessionStore
+from app.common.tests.fake_redis import FakeRedis
+
+
+def test_redis_session_roundtrip_and_fields():
+    """会话读写一致；load_fields 只取需要的阶段字段"""
+    store = RedisSessionStore(FakeRedis())
+    state = store.create("r1")
+    assert state.version == 1
+    state.render_result = {"html_path": "outputs/r1/index.html", "image_slots": []}
+    state.stage = "3.5"
+    store.save(state)
+
+    loaded = RedisSessionStore(store.client).load("r1")
+    assert loaded.stage == "3.5"
+    assert loaded.version == 2
+    assert loaded.outline is None
+    assert store.load_fields("r1", ["render_result"])["render_result"]["html_path"] == "outputs/r1/index.html"
+    assert store.load("missing") is None
+
+
+@pytest.mark.parametrize("backend", ["file", "sqlite", "redis"])
+def test_stale_save_is_rejected(tmp_path, backend):
+    """两个副本先后保存：后保存的旧版本被拒绝，update() 重新加载后成功"""
+    if backend == "file":
+        store = SessionStore(str(tmp_path))
+    elif backend == "sqlite":
+        store = SQLiteSessionStore(str(tmp_path / "s.sqlite"))
+    else:
+        store = RedisSessionStore(FakeRedis())
+    store.create("c1")
+
+    a = store.load("c1")
+    b = store.load("c1")
+    a.stage = "3.2"
+    store.save(a)
+    b.stage = "3.3"
+    with pytest.raises(ConcurrentModificationError):
+        store.save(b)
+
+    def mutate(state):
+        state.stage = "3.3"
+
+    updated = store.update("c1", mutate)
+    assert updated.stage == "3.3"
+    assert store.load("c1").stage == "3.3"
+
+
+def test_render_status_per_slot_updates_are_isolated():
+    """并发更新不同插槽互不覆盖"""
+    client = FakeRedis()
+    status = create_render_status_store(RedisSessionStore(client))
+    assert isinstance(status, RedisRenderStatusStore)
+    status.reset("r2")
+
+    def worker(i):
+        status.set_slot("r2", f"slot_{i}", {"status": "done", "url": f"./images/slot_{i}.png"})
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    images = status.get("r2")["images"]
+    assert len(images) == 20
+    assert images["slot_3"]["url"] == "./images/slot_3.png"
+    # 另一个 worker 通过同一个 Redis 读到相同状态
+    assert RedisRenderStatusStore(client).get("r2") == status.get("r2")
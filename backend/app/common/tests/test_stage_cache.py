@@ -0,0 +1,158 @@
+"""
+测试阶段缓存：规范化键、内容去重、按大小淘汰，以及工作流中等价需求直接复用 3.2~3.4 的输出
+"""
+
+import json
+
+import pytest
+
+from app.common import LLMClient, WorkflowLogger
+from app.common.stage_cache import StageCache, request_fingerprint, stage_key
+from app.common.store import create_session_store
+from app.modules.intent import autofill_defaults
+from app.common.schemas import TeachingRequest
+from app.modules.content.core import PAGE_SCHEMA_HINT
+from app.orchestrator import WorkflowEngine
+from app.orchestrator.batch import BatchItem, BatchRunner
+import app.orchestrator.engine as engine_module
+
+
+def make_request(**overrides):
+    return autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+        **overrides,
+    ))
+
+
+def test_stage_key_ignores_bookkeeping_fields():
+    a = make_request()
+    b = a.model_copy(update={"request_id": "other", "display_summary": "摘要", "interaction_metadata": {"x": 1}})
+    assert stage_key("3.2", request_fingerprint(a)) == stage_key("3.2", request_fingerprint(b))
+
+    c = a.model_copy(deep=True)
+    c.knowledge_points[0].name = "液压缸"
+    assert stage_key("3.2", request_fingerprint(a)) != stage_key("3.2", request_fingerprint(c))
+    assert stage_key("3.2", request_fingerprint(a)) != stage_key("3.3", request_fingerprint(a))
+
+
+def test_store_dedupes_content_and_evicts_lru(tmp_path):
+    cache = StageCache(db_path=str(tmp_path / "stage.sqlite"), max_bytes=2000)
+    cache.put("3.3", "k1", {"v": "x" * 100})
+    cache.put("3.3", "k2", {"v": "x" * 100})
+    assert cache.stats()["blobs"] == 1 and cache.stats()["entries"] == 2
+    assert cache.get("k2") == {"v": "x" * 100}
+
+    # 键被覆盖后，不再被引用的旧内容随之删除
+    cache.put("3.3", "k1", {"v": "y" * 100})
+    cache.put("3.3", "k2", {"v": "y" * 100})
+    assert cache.stats()["blobs"] == 1 and cache.stats()["bytes"] == len('{"v":"' + "y" * 100 + '"}')
+
+    for n in range(3, 30):
+        cache.put("3.3", f"k{n}", {"v": str(n) * 200})
+    stats = cache.stats()
+    assert stats["bytes"] <= 2000 and stats["evictions"] > 0
+    assert cache.get("k1") is None
+    assert cache.get("k29") == {"v": "29" * 200}
+
+    # 磁盘层重启后仍可用
+    reopened = StageCache(db_path=str(tmp_path / "stage.sqlite"), max_bytes=2000)
+    assert reopened.get("k29") == {"v": "29" * 200}
+
+
+@pytest.mark.asyncio
+async def test_equivalent_request_reuses_stage_outputs(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    events = []
+
+    class RecordingLogger(WorkflowLogger):
+        def emit(self, session_id, stage, kind, payload):
+            events.append((session_id, stage, kind))
+            super().emit(session_id, stage, kind, payload)
+
+    engine = WorkflowEngine(
+        create_session_store(data_dir), RecordingLogger(data_dir), LLMClient(), stage_cache=StageCache()
+    )
+    calls = {"outline": 0, "deck": 0}
+    generate_outline = engine._generate_outline
+    refine_with_llm = engine_module.refine_with_llm
+
+    async def counting_outline(*args, **kwargs):
+        calls["outline"] += 1
+        return await generate_outline(*args, **kwargs)
+
+    async def counting_refine(*args, **kwargs):
+        calls["deck"] += 1
+        return await refine_with_llm(*args, **kwargs)
+
+    monkeypatch.setattr(engine, "_generate_outline", counting_outline)
+    monkeypatch.setattr(engine_module, "refine_with_llm", counting_refine)
+
+    runner = BatchRunner(engine, stop_at="3.4", concurrency=1)
+    text = "液压传动基础，讲解液压泵的工作原理，理论课"
+    results = await runner.run([BatchItem("first", text), BatchItem("second", text)])
+    assert [r.status for r in results] == ["ok", "ok"]
+    assert calls == {"outline": 1, "deck": 1}
+
+    hits = {stage for sid, stage, kind in events if sid == "second" and kind == "memo_hit"}
+    assert hits == {"3.2", "3.3", "3.4"}
+    first, second = engine.store.load("first"), engine.store.load("second")
+    assert second.outline == first.outline and second.deck_content == first.deck_content
+
+    # 上游输出改变（换模板）时下游全部失效
+    events.clear()
+    results = await runner.run([BatchItem("third", text, style_name="practice_steps")])
+    assert results[0].status == "ok"
+    assert calls == {"outline": 2, "deck": 2}
+    assert not {stage for sid, stage, kind in events if kind == "memo_hit"}
+
+
+@pytest.mark.asyncio
+async def test_llm_failure_fallback_is_not_memoized(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    engine = WorkflowEngine(
+        create_session_store(data_dir), WorkflowLogger(data_dir), LLMClient(), stage_cache=StageCache()
+    )
+    text = "液压传动基础，讲解液压泵的工作原理，理论课"
+    results = await BatchRunner(engine, stop_at="3.3").run([BatchItem("first", text), BatchItem("second", text)])
+    assert [r.status for r in results] == ["ok", "ok"]
+
+    class PageLLM:
+        """3.4 逐页生成；fail=True 时模拟网关临时错误"""
+
+        def __init__(self, fail):
+            self.fail = fail
+            self.calls = 0
+
+        def is_enabled(self):
+            return True
+
+        async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+            if schema_hint != PAGE_SCHEMA_HINT:
+                return {}, {}
+            self.calls += 1
+            if self.fail:
+                raise RuntimeError("gateway timeout")
+            outline = json.loads(user_msg)["current_page_outline"]
+            return {
+                "index": outline["index"],
+                "slide_type": outline["slide_type"],
+                "title": outline["title"],
+                "elements": [{"id": "t1", "type": "text", "content": {"text": outline["title"], "role": "title"}}],
+            }, {}
+
+    # 两个会话的 3.4 输入相同（LLM 指纹只取决于开关与模型）：第一次全部失败退回基础页面
+    engine.llm = failing = PageLLM(fail=True)
+    state, status, _ = await engine.run("first", None, None, True, stop_at="3.4")
+    assert status == "ok" and state.deck_content is not None and failing.calls > 0
+    entries = engine.stage_cache.stats()["entries"]
+
+    # 第二次不会命中失败时的结果，而是重新调用 LLM 并缓存成功的输出
+    engine.llm = healthy = PageLLM(fail=False)
+    state, status, _ = await engine.run("second", None, None, True, stop_at="3.4")
+    assert status == "ok" and healthy.calls == failing.calls
+    assert engine.stage_cache.stats()["entries"] == entries + 1
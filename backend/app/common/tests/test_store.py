@@ -0,0 +1,107 @@
+"""
+测试 SessionStore 的增量历史记录（checkpoint + JSON-patch delta）
+"""
+
+import json
+
+from app.common import json_delta
+from app.common.store import SessionStore
+
+
+def _records(store, session_id):
+    with open(store._history_path(session_id), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_diff_apply_roundtrip():
+    """diff 生成的 patch 应用后应还原目标文档"""
+    old = {"a": 1, "b": [1, 2, 3], "c": {"x": "y/z"}, "d": None}
+    new = {"a": 2, "b": [1, 5], "c": {"x": "y/z", "w~": [1]}, "e": "new"}
+    patch = json_delta.diff(old, new)
+    assert json_delta.apply(old, patch) == new
+    assert json_delta.diff(new, new) == []
+
+
+def test_save_writes_deltas_and_checkpoints(tmp_path):
+    """首次保存写 checkpoint，之后写 delta，达到间隔后再写 checkpoint"""
+    store = SessionStore(str(tmp_path), checkpoint_every=3)
+    state = store.create("s1")
+    for stage in ["3.1", "3.2", "3.3", "3.4"]:
+        state.stage = stage
+        store.save(state)
+
+    types = [r["type"] for r in _records(store, "s1")]
+    assert types == ["checkpoint", "delta", "delta", "checkpoint", "delta"]
+
+    # 主文件为紧凑 JSON 且与最新状态一致
+    with open(store._path("s1"), "r", encoding="utf-8") as f:
+        text = f.read()
+    assert "\n" not in text
+    assert store.load("s1").stage == "3.4"
+
+
+def test_history_replay_and_compaction(tmp_path):
+    """回放历史得到每次保存的完整状态；压缩后最新状态不变"""
+    store = SessionStore(str(tmp_path), checkpoint_every=10)
+    state = store.create("s2")
+    for stage in ["3.2", "3.3", "3.4"]:
+        state.stage = stage
+        store.save(state)
+
+    stages = [h["state"]["stage"] for h in store.history("s2")]
+    assert stages == ["3.1", "3.2", "3.3", "3.4"]
+
+    assert store.compact_history("s2", keep_last=1) == 1
+    history = list(store.history("s2"))
+    assert len(history) == 1
+    assert history[0]["state"]["stage"] == "3.4"
+
+    # 压缩后继续保存仍能正确回放
+    state.stage = "3.5"
+    store.save(state)
+    assert [h["state"]["stage"] for h in store.history("s2")] == ["3.4", "3.5"]
+
+
+def test_legacy_full_snapshot_history_is_readable(tmp_path):
+    """旧格式（每行完整 state，无 type 字段）按 checkpoint 处理"""
+    store = SessionStore(str(tmp_path))
+    state = store.create("s3")
+    legacy = {"ts": 1.0, "session_id": "s3", "stage": "3.1", "state": state.model_dump(mode="json")}
+    with open(store._history_path("s3"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(legacy, ensure_ascii=False) + "\n")
+
+    history = list(store.history("s3"))
+    assert len(history) == 1
+    assert store.compact_history("s3") == 1
+    assert _records(store, "s3")[0]["type"] == "checkpoint"
+
+
+def test_sqlite_store_roundtrip_and_field_load(tmp_path):
+    """SQLite 后端：完整读写一致，load_fields 只读取请求的阶段列"""
+    from app.common.sqlite_store import SQLiteSessionStore
+    from app.common.schemas import TeachingRequest
+    from app.modules.style import choose_style
+
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"))
+    state = store.create("s4")
+    state.style_config = choose_style(TeachingRequest(teaching_scene="theory"))
+    state.render_result = {"html_path": "outputs/s4/index.html", "image_slots": []}
+    state.stage = "3.5"
+    store.save(state)
+
+    # 新实例（无内存摘要）读取
+    reopened = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"))
+    loaded = reopened.load("s4")
+    assert loaded.stage == "3.5"
+    assert loaded.style_config.style_name == "theory_clean"
+    assert reopened.load_fields("s4", ["render_result"]) == {
+        "render_result": {"html_path": "outputs/s4/index.html", "image_slots": []}
+    }
+    assert reopened.load_fields("missing", ["render_result"]) is None
+
+    # 只修改一列后保存，其余列保持不变
+    loaded.render_result = None
+    reopened.save(loaded)
+    again = store.load("s4")
+    assert again.render_result is None
+    assert again.style_config.style_name == "theory_clean"
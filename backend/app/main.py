@@ -1,15 +1,18 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import threading
 import uuid
 import time
 import json
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
 # 使用新的模块化导入
@@ -21,6 +24,14 @@ from .common import (
     WorkflowRunResponse,
 )
 from .common.security import validate_session_id
+from .common.llm_client import aclose_http_client
+from .common.llm_cache import LLMResponseCache
+from .common.stage_cache import StageCache
+from .common.cancellation import CancellationToken, RunCancelled, watch_disconnect
+from .common.job_queue import JobQueue
+from .common.shared_store import create_render_status_store
+from .common.session_cache import CachedSessionStore
+from .common.store import BaseSessionStore, create_session_store
 from .orchestrator import WorkflowEngine
 from .common import (
     LLMClient,
@@ -43,7 +54,32 @@ DATA_DIR = str((BASE_DIR / "data").resolve())
 FRONTEND_DIR = str((BASE_DIR.parents[0] / "frontend").resolve())
 FRONTEND_DIST_DIR = str((Path(FRONTEND_DIR) / "dist").resolve())
 
-app = FastAPI(title="PPT Outline Workflow (3.1-3.4)")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 渲染模板启动时编译一次（共享环境 + 字节码缓存）
+    from .modules.render.templating import precompile_templates
+
+    precompile_templates()
+
+    # 单进程部署时可在 web 进程内顺带运行图片 worker；启动即接管上次未完成（租约过期）的任务
+    stop_worker = threading.Event()
+    worker_thread = None
+    if image_queue is not None and os.getenv("IMAGE_QUEUE_EMBEDDED_WORKER") == "1":
+        from .modules.render.worker import ImageWorker
+
+        worker = ImageWorker(image_queue, store, render_status=render_status)
+        worker_thread = threading.Thread(target=worker.run, args=(stop_worker,), name="image-worker", daemon=True)
+        worker_thread.start()
+    yield
+    stop_worker.set()
+    if worker_thread is not None:
+        worker_thread.join(timeout=30)
+    # 关闭共享的 LLM 连接池
+    await aclose_http_client()
+
+
+app = FastAPI(title="PPT Outline Workflow (3.1-3.4)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -77,9 +113,11 @@ app.add_middleware(
 #     return {"message": f"Another test: {id}"}
 
 
-store = SessionStore(DATA_DIR)
+store = create_session_store(DATA_DIR)
 logger = WorkflowLogger(DATA_DIR)
-llm = LLMClient()
+llm = LLMClient(cache=LLMResponseCache.from_env(DATA_DIR))
+# IMAGE_QUEUE=1 时图片生成写入持久化队列，由独立 worker 进程执行（python -m app.modules.render.worker）
+image_queue = JobQueue.from_env(DATA_DIR)
 print(
     "[LLM]",
     {
@@ -92,7 +130,8 @@ print(
 )
 
 # 使用原版工作流引擎
-engine = WorkflowEngine(store, logger, llm)
+# STAGE_CACHE=1 时 3.2~3.5 各阶段按输入哈希缓存输出（等价需求直接复用）
+engine = WorkflowEngine(store, logger, llm, stage_cache=StageCache.from_env(DATA_DIR))
 print("[WORKFLOW] Using standard WorkflowEngine")
 
 
@@ -101,6 +140,25 @@ def health():
     return {"ok": True, "llm_enabled": llm.is_enabled()}
 
 
+@app.get("/api/metrics/llm")
+def llm_metrics():
+    """LLM 调用运行指标（准入队列等待时间、在途请求数等）"""
+    return {"ok": True, **llm.stats()}
+
+
+@app.get("/api/metrics/session_cache")
+def session_cache_metrics():
+    """会话缓存命中率与 dirty 条目数（SESSION_CACHE=0 时为 null）"""
+    stats = store.stats() if isinstance(store, CachedSessionStore) else None
+    return {"ok": True, "session_cache": stats}
+
+
+@app.get("/api/metrics/image_queue")
+def image_queue_metrics():
+    """图片任务队列各状态的任务数（IMAGE_QUEUE 未开启时为 null）"""
+    return {"ok": True, "image_queue": image_queue.stats() if image_queue is not None else None}
+
+
 @app.post("/api/session")
 def create_session():
     sid = uuid.uuid4().hex
@@ -109,8 +167,21 @@ def create_session():
     return {"session_id": sid}
 
 
+def _cancelled_stage(session_id: Optional[str]) -> str:
+    """被取消的运行停在哪个阶段：有检查点时为其中最靠后的阶段，否则为会话已完成的阶段"""
+    fields = store.load_fields(session_id, ["stage", "checkpoint"]) if session_id else None
+    if not fields:
+        return "3.1"
+    stages = sorted(fields.get("checkpoint") or {}) or [fields.get("stage") or "3.1"]
+    # 响应只区分到 3.4（渲染阶段不经过此接口）
+    return min(stages[-1], "3.4")
+
+
 @app.post("/api/workflow/run", response_model=WorkflowRunResponse)
-async def run_workflow(req: WorkflowRunRequest):
+async def run_workflow(req: WorkflowRunRequest, request: Request):
+    # 客户端断开（关闭页面）时取消本次运行：未完成的 LLM 请求被取消，已完成的页面写入检查点
+    cancel_token = CancellationToken()
+    watcher = asyncio.create_task(watch_disconnect(request, cancel_token))
     try:
         user_text = req.user_text or getattr(req, "user_input_text", None)
         state, status, questions = await engine.run(
@@ -120,6 +191,19 @@ async def run_workflow(req: WorkflowRunRequest):
             auto_fill_defaults_flag=req.auto_fill_defaults,
             stop_at=req.stop_at,
             style_name=req.style_name,
+            cancel_token=cancel_token,
+            deadline_s=req.deadline_s,
+            token_budget=req.token_budget,
+        )
+    except RunCancelled as e:
+        # 断开时响应无人接收；被同一会话的新请求取代时告知调用方
+        sid = req.session_id or "unknown"
+        return WorkflowRunResponse(
+            session_id=sid,
+            status="error",
+            stage=_cancelled_stage(req.session_id),
+            message=f"cancelled: {e.reason}",
+            logs_preview=logger.preview(sid),
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -134,7 +218,86 @@ async def run_workflow(req: WorkflowRunRequest):
             message=str(e),
             logs_preview=logger.preview(sid),
         )
+    finally:
+        watcher.cancel()
+
+    return _build_run_response(state, status, questions)
+
+
+def _sse(event: str, data: Any) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/workflow/run/stream")
+async def run_workflow_stream(req: WorkflowRunRequest):
+    """与 /api/workflow/run 相同，但以 SSE 推送进度。
 
+    事件：
+      - session: {"session_id"}，最先发送
+      - progress: 阶段开始 / 3.3 每页大纲 / 3.4 每页内容（按完成顺序）；
+        LLM 流式生成中的页面另有 {"event": "delta", "index", "chars"}
+      - done: 最终的 WorkflowRunResponse
+      - error: {"message"}
+    """
+    session_id = req.session_id or uuid.uuid4().hex
+    user_text = req.user_text or getattr(req, "user_input_text", None)
+    queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+    cancel_token = CancellationToken()
+
+    async def on_progress(event: Dict[str, Any]) -> None:
+        await queue.put(event)
+
+    async def run() -> Any:
+        try:
+            return await engine.run(
+                session_id=session_id,
+                user_text=user_text,
+                answers=req.answers or {},
+                auto_fill_defaults_flag=req.auto_fill_defaults,
+                stop_at=req.stop_at,
+                style_name=req.style_name,
+                on_progress=on_progress,
+                cancel_token=cancel_token,
+                deadline_s=req.deadline_s,
+                token_budget=req.token_budget,
+            )
+        finally:
+            await queue.put(None)
+
+    async def event_stream():
+        yield _sse("session", {"session_id": session_id})
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield _sse("progress", event)
+            try:
+                state, status, questions = await task
+            except RunCancelled as e:
+                yield _sse("error", {"message": f"cancelled: {e.reason}"})
+                return
+            except Exception as e:
+                logger.emit(session_id, "system", "error", {"error": str(e)})
+                yield _sse("error", {"message": str(e)})
+                return
+            response = _build_run_response(state, status, questions)
+            yield _sse("done", response.model_dump(mode="json"))
+        finally:
+            # 客户端断开时停止后台生成（已完成的页面写入检查点，重跑时继续）
+            if not task.done():
+                cancel_token.cancel("client_disconnected")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _build_run_response(state: Any, status: str, questions: List[Any]) -> WorkflowRunResponse:
     # Choose stage for response
     stage = state.stage
 
@@ -171,6 +334,7 @@ async def run_workflow(req: WorkflowRunRequest):
         deck_content=state.deck_content,
         render_result=state.render_result,
         logs_preview=logger.preview(state.session_id),
+        degraded=state.degraded,
         message=message,
     )
 
@@ -785,12 +949,17 @@ async def render_html_slides_api(req: dict):
         if not state.teaching_request:
             return {"ok": False, "error": "No teaching_request found"}
 
-        from .modules.render import render_html_slides
+        from .modules.render import RenderResult, render_html_slides
 
         # ✅ 关键修复：输出目录必须包含 session_id
         output_dir = Path(DATA_DIR) / "outputs" / session_id
         output_dir.mkdir(parents=True, exist_ok=True)
 
+        # 已有渲染结果时增量渲染：未改变的页面复用布局决策和 HTML 片段
+        previous = state.render_result
+        if isinstance(previous, dict):
+            previous = RenderResult.model_validate(previous)
+
         result = await render_html_slides(
             deck_content=state.deck_content,
             style_config=state.style_config,
@@ -798,6 +967,7 @@ async def render_html_slides_api(req: dict):
             session_id=session_id,
             output_dir=str(output_dir), # 现在指向 outputs/{session_id}
             llm=llm,
+            previous=previous,
         )
 
         state.render_result = result
@@ -810,6 +980,7 @@ async def render_html_slides_api(req: dict):
             {
                 "html_path": result.html_path,
                 "total_pages": result.total_pages,
+                "rerendered_pages": result.metadata.get("rerendered_pages", []),
             },
         )
 
@@ -1446,15 +1617,15 @@ async def render_html_slides_mock_deprecated():
         return {"ok": False, "error": str(e)}
 
 
-# In-memory store for render status (for streaming/polling)
-render_status_store: Dict[str, Dict[str, Any]] = {}
+# Render status (for streaming/polling): 按插槽原子更新；SESSION_STORE=redis 时多 worker 共享
+render_status = create_render_status_store(store)
 
 
 def generate_images_task(session_id: str, slots: List, output_dir: Path):
     """后台任务：生成图片并更新状态"""
     try:
         from .modules.render import ImageService
-        import shutil
+        from .modules.render.image_store import link_or_copy
 
         # 1. 加载 Session 状态以获取上下文 (TeachingRequest, StyleConfig)
         state = store.load(session_id)
@@ -1471,37 +1642,32 @@ def generate_images_task(session_id: str, slots: List, output_dir: Path):
             print("[BG] No API Key, skipping image gen")
             return
 
-        render_status_store[session_id] = {"images": {}}
+        render_status.reset(session_id)
         images_dir = output_dir / "images"
         images_dir.mkdir(parents=True, exist_ok=True)
 
-        # 初始化 ImageService
-        filler = ImageService(api_key=api_key, cache_dir=images_dir)
+        # 初始化 ImageService（使用全局图片存储）
+        filler = ImageService(api_key=api_key)
 
-        for slot in slots:
-            slot_id = slot.slot_id
+        if image_queue is not None:
+            from .modules.render.worker import enqueue_image_slots
+
+            enqueue_image_slots(
+                image_queue, filler, session_id, slots, state.teaching_request, state.style_config, images_dir
+            )
+            print(f"[BG] Queued {len(slots)} slots for {session_id}")
+            return
 
+        for slot in slots:
             # Init status
-            render_status_store[session_id]["images"][slot_id] = {
+            render_status.set_slot(session_id, slot.slot_id, {
                 "status": "generating",
                 "url": None,
-            }
-
-            print(f"[BG] Generating for {slot_id}")
-            
-            # 使用 ImageService 生成图片 (返回的文件名可能是随机Hash)
-            try:
-                # 2. 构建 Prompt
-                prompt = filler.build_prompt(slot, state.teaching_request, state.style_config)
-                
-                # 3. 准备 slot_data (用于传递 aspect_ratio)
-                slot_data = slot.model_dump() if hasattr(slot, "model_dump") else slot.__dict__
+            })
 
-                # 4. 使用 ImageService 生成图片
-                raw_image_path = filler.generate_image(prompt, slot_id, slot_data=slot_data)
-            except Exception as slot_err:
-                print(f"[BG] Error generating slot {slot_id}: {slot_err}")
-                raw_image_path = None
+        def on_result(res):
+            slot_id = res.slot_id
+            raw_image_path = res.image_path if res.status == "done" else None
 
             if raw_image_path:
                 # ✅【关键修改】强制重命名为 slot_id.png
@@ -1513,25 +1679,29 @@ def generate_images_task(session_id: str, slots: List, output_dir: Path):
                 new_filename = f"{slot_id}{ext}"
                 new_image_path = images_dir / new_filename
                 
-                # 移动/重命名文件 (如果路径不同)
-                if Path(raw_image_path).resolve() != new_image_path.resolve():
-                    shutil.move(raw_image_path, new_image_path)
+                # 硬链接到会话目录（不能移动：源文件是全局缓存条目）
+                link_or_copy(raw_image_path, new_image_path)
 
                 # 生成相对路径 URL
                 web_url = f"./images/{new_filename}"
 
-                render_status_store[session_id]["images"][slot_id] = {
+                render_status.set_slot(session_id, slot_id, {
                     "status": "done",
                     "url": web_url,
-                }
+                })
                 print(f"[BG] Done {slot_id} -> {web_url}")
             else:
-                render_status_store[session_id]["images"][slot_id] = {
+                render_status.set_slot(session_id, slot_id, {
                     "status": "failed",
-                    "error": "Image generation returned None"
-                }
+                    "error": res.error or "Image generation returned None"
+                })
                 print(f"[BG] Failed {slot_id}")
 
+        # 有界并发生成；每完成一个插槽立即更新状态
+        filler.generate_for_slots_sync(
+            slots, state.teaching_request, state.style_config, on_result=on_result
+        )
+
     except Exception as e:
         print(f"[BG] Error: {e}")
         import traceback
@@ -1540,9 +1710,39 @@ def generate_images_task(session_id: str, slots: List, output_dir: Path):
 
 @app.get("/api/workflow/render/status/{session_id}")
 def get_render_status(session_id: str):
-    """前端轮询图片生成状态"""
-    status = render_status_store.get(session_id, {})
-    return {"ok": True, "images": status.get("images", {})}
+    """前端轮询图片生成状态
+
+    以会话中保存的 render_result 为底（服务重启后仍可见），叠加进行中的
+    render_status 与任务队列状态。
+    """
+    images: Dict[str, Dict[str, Any]] = {}
+    # 轮询接口只需要 render_result，不加载整个会话
+    fields = store.load_fields(session_id, ["render_result"])
+    if fields and fields["render_result"]:
+        from .modules.render.core import RenderResult
+
+        render_result = RenderResult.model_validate(fields["render_result"])
+        for slot in render_result.image_slots:
+            images[slot.slot_id] = {"status": "pending", "image_path": None, "error": None}
+        for result in render_result.image_results or []:
+            images[result.slot_id] = {"status": result.status, "image_path": result.image_path, "error": result.error}
+
+    images.update(render_status.get(session_id)["images"])
+    if image_queue is not None:
+        # 队列是跨进程的持久状态，以它为准
+        from .modules.render.worker import queued_slot_status
+
+        images.update(queued_slot_status(image_queue, session_id))
+
+    statuses = [image.get("status") for image in images.values()]
+    return {
+        "ok": True,
+        "total": len(images),
+        "done": statuses.count("done"),
+        "generating": statuses.count("generating"),
+        "failed": statuses.count("failed"),
+        "images": images,
+    }
 
 
 @app.post("/api/workflow/render/mock_deprecated")
@@ -1967,6 +2167,12 @@ async def render_html_slides_mock(background_tasks: BackgroundTasks):
         return {"ok": False, "error": str(e)}
 
 
+# Shared, content-versioned render assets: /assets/{version}/static|styles/...
+# 渲染的 index.html 直接引用这里，资源只保存一份并带 immutable 长缓存头
+from .modules.render.assets import ASSET_MOUNT, VersionedAssetFiles
+
+app.mount(ASSET_MOUNT, VersionedAssetFiles(), name="assets")
+
 # Mount static assets (Reveal.js, etc.)
 RENDER_STATIC_DIR = BASE_DIR / "app" / "modules" / "render" / "static"
 if RENDER_STATIC_DIR.exists():
@@ -2013,7 +2219,7 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
     import os
     
     try:
-        from .modules.render import ImageService
+        from .modules.render import ImageService, RenderResult
         
         # 1. 加载 session 状态
         state = store.load(session_id)
@@ -2025,7 +2231,6 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
         
         # 兼容性处理：如果 render_result 是 dict（因为 SessionState 中定义为 Any），则转换为对象
         if isinstance(state.render_result, dict):
-            from .modules.render import RenderResult
             state.render_result = RenderResult.model_validate(state.render_result)
         
         if not state.render_result.image_slots:
@@ -2042,20 +2247,18 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
         if not api_key:
             return {"ok": False, "error": "DASHSCOPE_API_KEY not configured. Please set the environment variable."}
         
-        # 3. 创建 ImageService 实例
-        cache_dir = Path(DATA_DIR) / "outputs" / "images"
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        filler = ImageService(api_key=api_key, cache_dir=str(cache_dir))
+        # 3. 创建 ImageService 实例（使用全局图片存储）
+        filler = ImageService(api_key=api_key)
         
         total_slots = len(state.render_result.image_slots)
         
         # 3.1 立即更新状态为 pending/generating，以便前端 UI 立即响应
         from .modules.render.core import ImageSlotResult
         import time
-        import shutil
+        from .modules.render.image_store import link_or_copy
         
         # 初始化全局状态存储，确保前端轮询能看到进度 (之前遗漏的关键点)
-        render_status_store[session_id] = {"images": {}}
+        render_status.reset(session_id)
 
         initial_results = []
         for slot in state.render_result.image_slots:
@@ -2068,24 +2271,36 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
                 error=None,
             ))
             # 更新全局状态存储
-            render_status_store[session_id]["images"][slot.slot_id] = {
+            render_status.set_slot(session_id, slot.slot_id, {
                 "status": "generating",
                 "url": None,
-            }
+            })
 
         state.render_result.image_results = initial_results
         store.save(state)
+
+        if image_queue is not None:
+            # 持久化队列：由 worker 进程生成，进程重启不丢任务
+            from .modules.render.worker import enqueue_image_slots
+
+            session_dir = Path(DATA_DIR) / os.path.dirname(state.render_result.html_path or f"outputs/{session_id}/index.html")
+            enqueue_image_slots(
+                image_queue, filler, session_id, state.render_result.image_slots,
+                state.teaching_request, state.style_config, session_dir / "images",
+            )
+            logger.emit(session_id, "3.5", "image_generation_queued", {"total_slots": total_slots})
+            return {
+                "ok": True,
+                "session_id": session_id,
+                "total_slots": total_slots,
+                "queued": True,
+                "message": f"Image generation queued for {total_slots} slots",
+            }
         
         # 4. 定义后台任务
         def generate_images_task():
             """后台执行图片生成"""
             try:
-                results = filler.generate_for_slots_sync(
-                    slots=state.render_result.image_slots,
-                    teaching_request=state.teaching_request,
-                    style_config=state.style_config,
-                )
-                
                 # 确定 session 的图片目录
                 # html_path 类似 "outputs/{session_id}/index.html"
                 try:
@@ -2106,8 +2321,8 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
                     logger.error(f"Failed to resolve session dir: {ex}")
                     local_images_dir = None
 
-                # 处理结果：将缓存图片复制到 session 目录并重命名 -> slot_id.png
-                for res in results:
+                # 处理单个结果：将缓存图片复制到 session 目录并重命名 -> slot_id.png
+                def on_result(res):
                     if res.status == "done" and res.image_path and os.path.exists(res.image_path):
                         web_url = None
                         
@@ -2118,8 +2333,8 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
                                 new_filename = f"{res.slot_id}{ext}"
                                 target_path = local_images_dir / new_filename
                                 
-                                # 从共享缓存复制到 session 目录
-                                shutil.copy2(res.image_path, target_path)
+                                # 从全局图片存储硬链接到 session 目录
+                                link_or_copy(res.image_path, target_path)
                                 
                                 # 生成相对路径 URL (用于 HTML 离线访问)
                                 web_url = f"./images/{new_filename}"
@@ -2130,19 +2345,32 @@ async def trigger_image_generation(session_id: str, background_tasks: Background
                                 logger.error(f"Failed to copy image for {res.slot_id}: {copy_err}")
                         
                         # 更新全局状态
-                        render_status_store[session_id]["images"][res.slot_id] = {
+                        render_status.set_slot(session_id, res.slot_id, {
                             "status": "done",
                             "url": web_url or f"/api/files/{os.path.basename(res.image_path)}", # Fallback
-                        }
+                        })
                     else:
-                        render_status_store[session_id]["images"][res.slot_id] = {
+                        render_status.set_slot(session_id, res.slot_id, {
                             "status": "failed",
                             "error": res.error or "Unknown error"
-                        }
+                        })
 
-                # 更新 session 状态
-                state.render_result.image_results = results
-                store.save(state)
+                # 有界并发生成（按优先级/页码调度），每完成一个插槽立即写入状态
+                results = filler.generate_for_slots_sync(
+                    slots=state.render_result.image_slots,
+                    teaching_request=state.teaching_request,
+                    style_config=state.style_config,
+                    on_result=on_result,
+                )
+
+                # 更新 session 状态（重新加载后写入，避免覆盖期间其他请求的修改）
+                def apply_results(latest):
+                    if latest.render_result is not None:
+                        rr = RenderResult.model_validate(latest.render_result)
+                        rr.image_results = results
+                        latest.render_result = rr
+
+                store.update(session_id, apply_results)
                 
                 logger.emit(
                     session_id,
@@ -2205,116 +2433,108 @@ async def debug_generate(session_id: str = None):
 
 
 @app.get("/api/workflow/download/{session_id}")
-async def download_project_package(session_id: str):
+async def download_project_package(session_id: str, request: Request):
     """
     打包下载生成的 PPT 项目 (HTML + 资源 + 图片)
+    边生成边发送的 ZIP：不写临时文件；支持 ETag/If-None-Match 与单区间 Range（断点续传）
     """
-    import shutil
-    from fastapi.responses import FileResponse
+    from starlette.concurrency import run_in_threadpool
+    from .modules.render.bundle import parse_range, plan_offline_bundle
 
     # 1. 定位输出目录
     output_dir = Path(DATA_DIR) / "outputs" / session_id
     if not output_dir.exists():
         raise HTTPException(status_code=404, detail="Project output not found")
 
-    # 2. 准备临时 ZIP 路径
-    temp_dir = Path(DATA_DIR) / "temp"
-    temp_dir.mkdir(parents=True, exist_ok=True)
-    zip_base_name = temp_dir / session_id  # make_archive 会自动加 .zip
-    zip_path = Path(f"{zip_base_name}.zip")
-
     try:
-        # 3. 创建 ZIP (如果已存在且较新则直接返回，这里简单起见每次都覆盖)
-        shutil.make_archive(str(zip_base_name), "zip", str(output_dir))
-
-        # 4. 返回文件
-        return FileResponse(
-            path=zip_path,
-            filename=f"ppt_project_{session_id}.zip",
-            media_type="application/zip",
-        )
+        # 2. 计算 ZIP 布局（读取文件元数据与 CRC，放在线程池中，不阻塞事件循环）
+        plan = await run_in_threadpool(plan_offline_bundle, output_dir)
     except Exception as e:
         logger.emit(session_id, "export", "zip_error", {"error": str(e)})
         raise HTTPException(status_code=500, detail=f"Failed to create zip: {str(e)}")
 
-
-@app.get("/api/workflow/render/status/{session_id}")
-def get_image_status(session_id: str):
-    """
-    获取图片生成状态（供前端轮询）
-    """
+    headers = {
+        "ETag": plan.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f'attachment; filename="ppt_project_{session_id}.zip"',
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and plan.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    # 3. Range：If-Range 不匹配（内容已变化）时返回完整文件
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != plan.etag:
+        range_header = None
     try:
-        state = store.load(session_id)
-        if not state:
-            return {"ok": False, "error": "Session not found"}
-
-        if not state.render_result:
-            return {"ok": False, "error": "No render_result found"}
-
-        # 构建状态信息
-        results = (
-            state.render_result.image_results
-            if state.render_result.image_results
-            else []
-        )
-
-        images = {}
-        done = 0
-        generating = 0
-        failed = 0
-        total = len(state.render_result.image_slots)
-
-        # 初始化未生成的状态
-        for slot in state.render_result.image_slots:
-            images[slot.slot_id] = {
-                "status": "pending",
-                "image_path": None,
-                "error": None,
-            }
+        byte_range = parse_range(range_header, plan.size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{plan.size}"})
+
+    status_code = 200
+    start, end = 0, plan.size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{plan.size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    # 4. 同步迭代器由 StreamingResponse 放到线程池逐块读取
+    return StreamingResponse(
+        plan.iter_range(start, end),
+        status_code=status_code,
+        media_type="application/zip",
+        headers=headers,
+    )
 
-        # 更新已生成的状态
-        for result in results:
-            images[result.slot_id] = {
-                "status": result.status,
-                "image_path": result.image_path,
-                "error": result.error,
-            }
-            if result.status == "done":
-                done += 1
-            elif result.status == "generating":
-                generating += 1
-            elif result.status == "failed":
-                failed += 1
 
-        return {
-            "ok": True,
-            "total": total,
-            "done": done,
-            "generating": generating,
-            "failed": failed,
-            "images": images,
-        }
-
-    except Exception as e:
-        logger.emit(session_id, "3.5", "status_error", {"error": str(e)})
-        return {"ok": False, "error": str(e)}
+@app.get("/api/workflow/export/pptx/{session_id}")
+async def export_pptx(session_id: str):
+    """
+    导出原生 .pptx（3.7）：版式、配色字体、已生成图片与讲稿备注直接写入 PPTX，逐页流式发送
+    """
+    from .modules.export import iter_pptx
+    from .modules.render import RenderResult
+
+    state = store.load(session_id)
+    if not state or not state.deck_content or not state.style_config:
+        raise HTTPException(status_code=404, detail="Slide content not found")
+
+    render_result = state.render_result
+    if isinstance(render_result, dict):
+        render_result = RenderResult.model_validate(render_result)
+    images_dir = Path(DATA_DIR) / "outputs" / session_id / "images"
+    logger.emit(session_id, "export", "pptx_export", {"pages": len(state.deck_content.pages)})
+
+    # 同步生成器由 StreamingResponse 放到线程池逐块生成
+    return StreamingResponse(
+        iter_pptx(state.deck_content, state.style_config, render_result, images_dir if images_dir.exists() else None),
+        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        headers={"Content-Disposition": f'attachment; filename="ppt_{session_id}.pptx"'},
+    )
 
 
 @app.get("/api/workflow/render/image/{session_id}/{slot_id}")
-def get_generated_image(session_id: str, slot_id: str):
+async def get_generated_image(session_id: str, slot_id: str):
     """
     获取指定插槽生成的图片
     """
     try:
-        state = store.load(session_id)
-        if not state:
+        fields = store.load_fields(session_id, ["render_result"])
+        if fields is None:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        if not state.render_result:
+        if not fields["render_result"]:
             raise HTTPException(status_code=404, detail="No render_result found")
 
+        from .modules.render.core import RenderResult
+
+        render_result = RenderResult.model_validate(fields["render_result"])
+
         # 查找对应的结果
-        for result in state.render_result.image_results:
+        for result in render_result.image_results:
             if (
                 result.slot_id == slot_id
                 and result.status == "done"
@@ -2326,24 +2546,24 @@ def get_generated_image(session_id: str, slot_id: str):
                 return FileResponse(result.image_path)
 
         # 如果没找到，尝试从 image_slots 直接生成（实时生成）
-        for slot in state.render_result.image_slots:
+        for slot in render_result.image_slots:
             if slot.slot_id == slot_id:
-                if not state.image_filler:
-                    api_key = os.getenv("DASHSCOPE_API_KEY")
-                    if api_key:
-                        from .modules.render import ImageService
-
-                        state.image_filler = ImageService(
-                            api_key=api_key,
-                            cache_dir=f"{DATA_DIR}/{session_id}/images_cache",
-                        )
-
-                if state.image_filler and state.teaching_request and state.style_config:
-                    # 同步生成
-                    prompt = state.image_filler.build_prompt(
-                        slot, state.teaching_request, state.style_config
+                api_key = os.getenv("DASHSCOPE_API_KEY")
+                # 仅在需要实时生成时才读取构建 prompt 所需的阶段数据
+                ctx = store.load_fields(session_id, ["teaching_request", "style_config"]) if api_key else None
+                if ctx and ctx["teaching_request"] and ctx["style_config"]:
+                    from .modules.render import ImageService
+
+                    image_filler = ImageService(api_key=api_key)
+                    # 实时生成（异步提交 + 轮询，不阻塞事件循环）
+                    prompt = image_filler.build_prompt(
+                        slot,
+                        TeachingRequest.model_validate(ctx["teaching_request"]),
+                        StyleConfig.model_validate(ctx["style_config"]),
+                    )
+                    image_path = await image_filler.agenerate_image(
+                        prompt, slot_id, slot_data=slot.model_dump()
                     )
-                    image_path = state.image_filler.generate_image(prompt, slot_id)
 
                     if image_path:
                         from fastapi.responses import FileResponse
@@ -2377,7 +2597,6 @@ async def update_deck_content(req: UpdateDeckRequest):
         from .common.schemas import SlideDeckContent
         
         # 1. 加载 Session
-        store = SessionStore(DATA_DIR)
         state = store.load(req.session_id)
         if not state:
             raise HTTPException(status_code=404, detail="Session not found")
@@ -2498,9 +2717,7 @@ async def retry_slot_generation(
 
             from .modules.render import ImageService
 
-            image_filler = ImageService(
-                api_key=api_key, cache_dir=f"{DATA_DIR}/{session_id}/images_cache"
-            )
+            image_filler = ImageService(api_key=api_key)
             state.image_filler = image_filler
 
         # 移除旧结果（如果有）
@@ -2509,6 +2726,16 @@ async def retry_slot_generation(
         ]
         store.save(state)
 
+        if image_queue is not None:
+            from .modules.render.worker import enqueue_image_slots
+
+            session_dir = Path(DATA_DIR) / os.path.dirname(state.render_result.html_path or f"outputs/{session_id}/index.html")
+            enqueue_image_slots(
+                image_queue, image_filler, session_id, [target_slot],
+                state.teaching_request, state.style_config, session_dir / "images",
+            )
+            return {"ok": True, "message": "Retry queued"}
+
         # 添加后台任务
         background_tasks.add_task(
             run_single_image_task,
@@ -2535,22 +2762,35 @@ async def run_image_generation_task(
     teaching_request: Any,
     style_config: Any,
     image_filler: Any,
-    store: SessionStore,
+    store: BaseSessionStore,
 ):
     """后台任务：生成所有图片"""
     try:
-        # 调用 image_filler 生成图片
+        # 调用 image_filler 并发生成图片，每完成一个插槽立即写入状态
+        def on_result(res):
+            render_status.set_slot(session_id, res.slot_id, {
+                "status": res.status,
+                "image_path": res.image_path,
+                "error": res.error,
+            })
+
         results = image_filler.generate_for_slots_sync(
             slots=slots,
             teaching_request=teaching_request,
             style_config=style_config,
+            on_result=on_result,
         )
 
-        # 更新状态
-        state = store.load(session_id)
-        if state and state.render_result:
-            state.render_result.image_results = results
-            store.save(state)
+        # 更新状态（版本冲突时重新加载后再写入）
+        from .modules.render.core import RenderResult
+
+        def apply_results(state):
+            if state.render_result:
+                rr = RenderResult.model_validate(state.render_result)
+                rr.image_results = results
+                state.render_result = rr
+
+        store.update(session_id, apply_results)
 
         logger.emit(
             session_id,
@@ -2573,15 +2813,17 @@ async def run_single_image_task(
     teaching_request: Any,
     style_config: Any,
     image_filler: Any,
-    store: SessionStore,
+    store: BaseSessionStore,
 ):
     """后台任务：生成单个图片"""
     try:
         # 生成 prompt
         prompt = image_filler.build_prompt(slot, teaching_request, style_config)
 
-        # 调用 API
-        image_path = image_filler.generate_image(prompt, slot.slot_id)
+        # 调用 API（异步，不阻塞事件循环）
+        image_path = await image_filler.agenerate_image(
+            prompt, slot.slot_id, slot_data=slot.model_dump()
+        )
 
         # 创建结果
         from .modules.render.core import ImageSlotResult
@@ -2600,18 +2842,25 @@ async def run_single_image_task(
             generation_time_seconds=0,
         )
 
-        # 更新状态
-        state = store.load(session_id)
-        if state and state.render_result:
-            # 移除旧结果
-            state.render_result.image_results = [
-                r
-                for r in state.render_result.image_results
-                if r.slot_id != slot.slot_id
-            ]
-            # 添加新结果
-            state.render_result.image_results.append(result)
-            store.save(state)
+        # 更新插槽状态（原子写入单个插槽，供多 worker 轮询）
+        render_status.set_slot(session_id, slot.slot_id, {
+            "status": result.status,
+            "image_path": image_path,
+            "error": result.error,
+        })
+
+        # 更新状态（版本冲突时重新加载后再写入）
+        from .modules.render.core import RenderResult
+
+        def apply_result(state):
+            if state.render_result:
+                rr = RenderResult.model_validate(state.render_result)
+                # 移除旧结果，添加新结果
+                rr.image_results = [r for r in rr.image_results if r.slot_id != slot.slot_id]
+                rr.image_results.append(result)
+                state.render_result = rr
+
+        store.update(session_id, apply_result)
 
         logger.emit(
             session_id,
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
+import os
 import uuid
 from typing import Any, Dict, List, Optional, Tuple
 
+from ...common.budget import budget_shortfall, record_degraded
+from ...common.fallbacks import record_fallback, used_fallback
 from ...common.llm_client import LLMClient
 from ...common.logger import WorkflowLogger
+from ...common.progress import ProgressCallback, emit_progress, stream_progress
 from ...common.schemas import PPTOutline, OutlineSlide, SlideDeckContent, SlideElement, SlidePage, StyleConfig, TeachingRequest
 
 
@@ -19,7 +24,7 @@ PAGE_CONTENT_SYSTEM_PROMPT = """你是高职课程PPT内容生成助手。
 任务：为PPT的**单个页面**生成详细内容。
 
 你会收到：
-1. **完整大纲** (full_outline)：整个PPT的结构，帮助你理解上下文
+1. **大纲上下文** (outline_context)：PPT标题、总页数、大纲摘要，以及当前页前后相邻页面，帮助你衔接上下文
 2. **当前页大纲** (current_page_outline)：这一页的标题、要点、类型
 3. **教学需求** (teaching_request)：课程背景信息
 4. **基础页面** (base_page)：布局参考（可选）
@@ -191,78 +196,78 @@ def _right_placeholder(kind: str, theme: str) -> SlideElement:
     )
 
 
-def build_base_deck(req: TeachingRequest, style: StyleConfig, outline: PPTOutline) -> SlideDeckContent:
-    """Deterministic base pages for Module 3.4 (works even without LLM)."""
-    pages: List[SlidePage] = []
-    for s in outline.slides:
-        els: List[SlideElement] = [_title_el(s.title)]
-
-        # Base mapping by slide_type
-        st = (s.slide_type or "").lower()
-
-        if st == "cover":
-            # Cover: title + meta lines
-            els.append(
-                SlideElement(
-                    id=str(uuid.uuid4()),
-                    type="text",
-                    x=0.06,
-                    y=0.22,
-                    w=0.88,
-                    h=0.20,
-                    content={
-                        "text": f"学科：{req.subject_info.subject_name if req.subject_info else (outline.subject or '_____')}\n知识点：{', '.join(outline.knowledge_points) if outline.knowledge_points else '_____'}\n课时：{req.slide_requirements.lesson_duration_min if req.slide_requirements else '____'} 分钟",
-                        "role": "subtitle",
-                    },
-                    style={"role": "subtitle"},
-                )
-            )
-        elif st in ("agenda", "objectives"):
-            els.append(_bullets_el(s.bullets or ["_____"]))
-        elif st in ("steps", "warning"):
-            # steps: left steps bullets + right visual placeholder
-            els.append(_bullets_el(s.bullets or ["步骤1：_____", "步骤2：_____", "步骤3：_____"]))
-            els.append(_right_placeholder("diagram", theme=s.title))
-        elif st in ("relations", "bridge"):
-            els.append(_bullets_el(s.bullets or ["关联点A—关联点B：_____", "关键联系：_____"]))
-            els.append(_right_placeholder("diagram", theme="知识点关联框架"))
-        elif st in ("exercises", "quiz"):
-            els.append(
-                SlideElement(
-                    id=str(uuid.uuid4()),
-                    type="quiz",
-                    x=0.06,
-                    y=0.20,
-                    w=0.88,
-                    h=0.72,
-                    content={
-                        "questions": s.bullets or ["题目1：_____", "题目2：_____"],
-                        "answer_key": "参考答案：_____（可在讲师备注补充）",
-                    },
-                    style={"role": "body"},
-                )
+def build_base_page(req: TeachingRequest, outline: PPTOutline, s: OutlineSlide) -> SlidePage:
+    """Deterministic base page for one outline slide (see build_base_deck)."""
+    els: List[SlideElement] = [_title_el(s.title)]
+
+    # Base mapping by slide_type
+    st = (s.slide_type or "").lower()
+
+    if st == "cover":
+        # Cover: title + meta lines
+        els.append(
+            SlideElement(
+                id=str(uuid.uuid4()),
+                type="text",
+                x=0.06,
+                y=0.22,
+                w=0.88,
+                h=0.20,
+                content={
+                    "text": f"学科：{req.subject_info.subject_name if req.subject_info else (outline.subject or '_____')}\n知识点：{', '.join(outline.knowledge_points) if outline.knowledge_points else '_____'}\n课时：{req.slide_requirements.lesson_duration_min if req.slide_requirements else '____'} 分钟",
+                    "role": "subtitle",
+                },
+                style={"role": "subtitle"},
             )
-        else:
-            # default: bullets + optional visual placeholder if outline asks assets
-            els.append(_bullets_el(s.bullets or ["_____"]))
-            if s.assets:
-                # choose the first asset as a placeholder
-                a0 = s.assets[0]
-                kind = a0.get("type", "image")
-                theme = a0.get("theme", s.title)
-                els.append(_right_placeholder("image" if kind == "image" else "diagram", theme=theme))
-
-        pages.append(
-            SlidePage(
-                index=s.index,
-                slide_type=s.slide_type,
-                title=s.title,
-                layout={"template": "two-column" if any(e.x > 0.65 for e in els) else "one-column"},
-                elements=els,
-                speaker_notes=s.notes,
+        )
+    elif st in ("agenda", "objectives"):
+        els.append(_bullets_el(s.bullets or ["_____"]))
+    elif st in ("steps", "warning"):
+        # steps: left steps bullets + right visual placeholder
+        els.append(_bullets_el(s.bullets or ["步骤1：_____", "步骤2：_____", "步骤3：_____"]))
+        els.append(_right_placeholder("diagram", theme=s.title))
+    elif st in ("relations", "bridge"):
+        els.append(_bullets_el(s.bullets or ["关联点A—关联点B：_____", "关键联系：_____"]))
+        els.append(_right_placeholder("diagram", theme="知识点关联框架"))
+    elif st in ("exercises", "quiz"):
+        els.append(
+            SlideElement(
+                id=str(uuid.uuid4()),
+                type="quiz",
+                x=0.06,
+                y=0.20,
+                w=0.88,
+                h=0.72,
+                content={
+                    "questions": s.bullets or ["题目1：_____", "题目2：_____"],
+                    "answer_key": "参考答案：_____（可在讲师备注补充）",
+                },
+                style={"role": "body"},
             )
         )
+    else:
+        # default: bullets + optional visual placeholder if outline asks assets
+        els.append(_bullets_el(s.bullets or ["_____"]))
+        if s.assets:
+            # choose the first asset as a placeholder
+            a0 = s.assets[0]
+            kind = a0.get("type", "image")
+            theme = a0.get("theme", s.title)
+            els.append(_right_placeholder("image" if kind == "image" else "diagram", theme=theme))
+
+    return SlidePage(
+        index=s.index,
+        slide_type=s.slide_type,
+        title=s.title,
+        layout={"template": "two-column" if any(e.x > 0.65 for e in els) else "one-column"},
+        elements=els,
+        speaker_notes=s.notes,
+    )
+
 
+def build_base_deck(req: TeachingRequest, style: StyleConfig, outline: PPTOutline) -> SlideDeckContent:
+    """Deterministic base pages for Module 3.4 (works even without LLM)."""
+    pages = [build_base_page(req, outline, s) for s in outline.slides]
     return SlideDeckContent(deck_title=outline.deck_title, pages=pages)
 
 
@@ -398,6 +403,144 @@ def _review_and_fix_page(
     return page
 
 
+# ============================================================================
+# Prompt compaction (逐页提示词压缩)
+# ============================================================================
+# 每页只发送相邻页面 + 大纲摘要哈希，而不是整份大纲（否则 n 页总提示词为 O(n²)）；
+# schema hint 在导入时生成一次并去掉冗余的 title 字段、压缩空白。
+
+def _minify_schema(node: Any) -> Any:
+    if isinstance(node, dict):
+        # 去掉 pydantic 自动生成的标题（字符串；properties 中名为 title 的字段是 dict，保留）、
+        # 模型 docstring 与默认的 additionalProperties=true，字段说明保留
+        return {
+            k: _minify_schema(v)
+            for k, v in node.items()
+            if not (k == "title" and isinstance(v, str))
+            and not (k == "description" and "properties" in node)
+            and not (k == "additionalProperties" and v is True)
+        }
+    if isinstance(node, list):
+        return [_minify_schema(v) for v in node]
+    return node
+
+
+PAGE_SCHEMA_HINT = json.dumps(
+    _minify_schema(SlidePage.model_json_schema()), ensure_ascii=False, separators=(",", ":")
+)
+
+
+def _context_window() -> int:
+    """Env:
+      - CONTENT_CONTEXT_WINDOW: 当前页前后各带几页大纲 (default: 2)
+    """
+    return max(0, int(os.getenv("CONTENT_CONTEXT_WINDOW") or 2))
+
+
+def _page_token_budget() -> int:
+    """Env:
+      - CONTENT_PAGE_TOKEN_BUDGET: 单页提示词（含 schema hint）的估算 token 上限，0 = 不限制 (default: 3000)
+    """
+    return max(0, int(os.getenv("CONTENT_PAGE_TOKEN_BUDGET") or 3000))
+
+
+def _estimate_tokens(text: str) -> int:
+    # 与 rate_limit.estimate_tokens 相同的粗略口径：序列化长度的一半
+    return len(text) // 2
+
+
+def outline_digest(outline: PPTOutline) -> str:
+    """大纲结构哈希：同一份大纲的所有页面共享，便于模型侧前缀缓存与日志关联"""
+    summary = [(s.index, s.slide_type, s.title) for s in outline.slides]
+    return hashlib.sha256(json.dumps(summary, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+def _outline_context(outline: PPTOutline, page_outline: OutlineSlide, total_pages: int, window: int, digest: str) -> Dict[str, Any]:
+    slides = outline.slides
+    pos = next((i for i, s in enumerate(slides) if s.index == page_outline.index), 0)
+    return {
+        "deck_title": outline.deck_title,
+        "total_pages": total_pages,
+        "outline_digest": digest,
+        "previous_slides": [
+            {"index": s.index, "title": s.title, "type": s.slide_type} for s in slides[max(0, pos - window):pos]
+        ],
+        "next_slides": [
+            {"index": s.index, "title": s.title, "type": s.slide_type} for s in slides[pos + 1:pos + 1 + window]
+        ],
+    }
+
+
+def _layout_reference(base_page: SlidePage) -> Dict[str, Any]:
+    """基础页面只作布局参考：标题/要点与 current_page_outline 重复，只保留位置和占位元素内容"""
+    elements = []
+    for el in base_page.elements:
+        item: Dict[str, Any] = {"type": el.type, "x": el.x, "y": el.y, "w": el.w, "h": el.h}
+        if el.type not in ("text", "bullets"):
+            item["content"] = el.content
+        elements.append(item)
+    return {"layout": base_page.layout, "elements": elements}
+
+
+def build_page_prompt(
+    req: TeachingRequest,
+    style: StyleConfig,
+    outline: PPTOutline,
+    page_outline: OutlineSlide,
+    base_page: SlidePage,
+    page_index: int,
+    total_pages: int,
+    digest: Optional[str] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """组装单页 user message，返回 (user_msg, 统计信息)。
+
+    超出单页 token 预算时依次裁剪：缩小相邻窗口 -> 基础页面只保留版式名 -> 去掉相邻页面。
+    当前页大纲与教学需求始终完整保留。
+    """
+    digest = digest or outline_digest(outline)
+    budget = _page_token_budget()
+    window = _context_window()
+    payload: Dict[str, Any] = {
+        "teaching_request": {
+            "subject": req.subject,
+            "professional_category": req.professional_category,
+            "teaching_scene": req.teaching_scene,
+            "knowledge_points": req.kp_names,
+        },
+        "outline_context": _outline_context(outline, page_outline, total_pages, window, digest),
+        "current_page": {
+            "index": page_index,
+            "position": f"第 {page_index} 页 / 共 {total_pages} 页",
+        },
+        "current_page_outline": page_outline.model_dump(mode="json", exclude_none=True),
+        "base_page": _layout_reference(base_page),
+        "style_theme": style.style_name,
+    }
+
+    def render() -> str:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+    def tokens(msg: str) -> int:
+        return _estimate_tokens(msg) + _estimate_tokens(PAGE_SCHEMA_HINT)
+
+    user_msg = render()
+    trimmed: List[str] = []
+    while budget and tokens(user_msg) > budget and window > 1:
+        window -= 1
+        payload["outline_context"] = _outline_context(outline, page_outline, total_pages, window, digest)
+        user_msg = render()
+        trimmed.append(f"window={window}")
+    if budget and tokens(user_msg) > budget:
+        payload["base_page"] = {"layout": base_page.layout}
+        user_msg = render()
+        trimmed.append("base_page")
+    if budget and tokens(user_msg) > budget:
+        payload["outline_context"] = _outline_context(outline, page_outline, total_pages, 0, digest)
+        user_msg = render()
+        trimmed.append("neighbours")
+    return user_msg, {"prompt_tokens_est": tokens(user_msg), "context_trimmed": trimmed}
+
+
 # ============================================================================
 # Per-Page Content Generation (方案B核心实现)
 # ============================================================================
@@ -413,13 +556,18 @@ async def _generate_single_page(
     base_page: SlidePage,
     page_index: int,
     total_pages: int,
+    digest: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
 ) -> SlidePage:
-    """Generate content for a single page with full outline context.
+    """Generate content for a single page with compacted outline context.
     
     This is the core of Plan B: each page receives:
-    1. full_outline: The complete PPT outline for context
+    1. outline_context: deck digest plus neighbouring slides (see build_page_prompt)
     2. page_outline: The specific page's outline (title, bullets, type)
     3. base_page: Layout reference (optional)
+    
+    With `on_progress`, the completion is streamed and "delta" events report
+    the page's output while it is being generated.
     """
     
     # 🚨 Special handling for exercises/quiz pages
@@ -454,46 +602,30 @@ async def _generate_single_page(
             speaker_notes=f"习题页：请学生先独立完成后再讲解答案。"
         )
     
-    schema_hint = SlidePage.model_json_schema()
-    
-    # Build context-rich user message
-    user_payload = {
-        "teaching_request": {
-            "subject": req.subject,
-            "professional_category": req.professional_category,
-            "teaching_scene": req.teaching_scene,
-            "knowledge_points": req.kp_names,
-        },
-        "full_outline": {
-            "deck_title": full_outline.deck_title,
-            "total_pages": total_pages,
-            "slides_summary": [
-                {"index": s.index, "title": s.title, "type": s.slide_type}
-                for s in full_outline.slides
-            ],
-        },
-        "current_page": {
-            "index": page_index,
-            "position": f"第 {page_index} 页 / 共 {total_pages} 页",
-        },
-        "current_page_outline": page_outline.model_dump(mode="json"),
-        "base_page": base_page.model_dump(mode="json"),
-        "style_theme": style.style_name,
-    }
-    
-    user_msg = json.dumps(user_payload, ensure_ascii=False)
+    user_msg, prompt_stats = build_page_prompt(
+        req, style, full_outline, page_outline, base_page, page_index, total_pages, digest=digest
+    )
     
     logger.emit(session_id, "3.4", "llm_page_prompt", {
         "page_index": page_index,
         "slide_type": page_outline.slide_type,
         "title": page_outline.title,
+        **prompt_stats,
     })
     
+    # 运行预算不足以覆盖一次调用：直接使用基础页面
+    reason = budget_shortfall()
+    if reason:
+        record_degraded("3.4", page_index, reason)
+        return base_page
+    
     try:
+        on_delta = stream_progress(on_progress, "3.4", page_index)
         parsed, meta = await llm.chat_json(
             PAGE_CONTENT_SYSTEM_PROMPT,
             user_msg,
-            json.dumps(schema_hint, ensure_ascii=False)
+            PAGE_SCHEMA_HINT,
+            **({"on_delta": on_delta} if on_delta else {}),
         )
         logger.emit(session_id, "3.4", "llm_page_response", {
             "page_index": page_index,
@@ -525,6 +657,10 @@ async def _generate_single_page(
             "page_index": page_index,
             "error": str(e)
         })
+        record_fallback("3.4", page_index)
+        reason = budget_shortfall(e)
+        if reason:
+            record_degraded("3.4", page_index, reason)
         # Fallback to base page
         return base_page
 
@@ -537,40 +673,77 @@ async def refine_with_llm(
     style: StyleConfig,
     outline: PPTOutline,
     base: SlideDeckContent,
+    on_progress: Optional[ProgressCallback] = None,
+    completed: Optional[Dict[int, SlidePage]] = None,
 ) -> SlideDeckContent:
     """Refine base pages with LLM using per-page generation (Plan B).
     
-    Each page is generated independently with full outline context,
+    Each page is generated independently with a compacted outline context,
     enabling better contextual understanding and proper handling of
     special page types like exercises, steps, and quizzes.
     
+    If `on_progress` is given, a "page" event is pushed as soon as each
+    page finishes (in completion order, not page order).
+    
+    Pages in `completed` (by index, checkpointed by a cancelled run) are
+    reused as-is instead of being regenerated.
+    
     Falls back to base if anything fails.
     """
     if not llm.is_enabled():
         return base
 
     total_pages = len(outline.slides)
+    digest = outline_digest(outline)
     logger.emit(session_id, "3.4", "per_page_start", {
         "total_pages": total_pages,
-        "generation_mode": "per-page-parallel"
+        "generation_mode": "per-page-parallel",
+        "outline_digest": digest,
     })
     
+    async def generate_and_report(slide_outline: OutlineSlide, base_page: SlidePage) -> SlidePage:
+        if completed and slide_outline.index in completed:
+            page = completed[slide_outline.index].model_copy(deep=True)
+            await emit_progress(on_progress, {
+                "stage": "3.4", "event": "page", "index": page.index,
+                "total": total_pages, "fallback": False, "resumed": True,
+                "page": page.model_dump(mode="json"),
+            })
+            return page
+        try:
+            page = await _generate_single_page(
+                session_id=session_id,
+                llm=llm,
+                logger=logger,
+                req=req,
+                style=style,
+                full_outline=outline,
+                page_outline=slide_outline,
+                base_page=base_page,
+                page_index=slide_outline.index,
+                total_pages=total_pages,
+                digest=digest,
+                on_progress=on_progress,
+            )
+        except Exception:
+            await emit_progress(on_progress, {
+                "stage": "3.4", "event": "page", "index": base_page.index,
+                "total": total_pages, "fallback": True,
+                "page": base_page.model_dump(mode="json"),
+            })
+            raise
+        await emit_progress(on_progress, {
+            "stage": "3.4", "event": "page", "index": page.index,
+            "total": total_pages, "fallback": used_fallback("3.4", page.index),
+            "page": page.model_dump(mode="json"),
+        })
+        return page
+
     # Create tasks for parallel generation
-    tasks = []
-    for slide_outline, base_page in zip(outline.slides, base.pages):
-        task = _generate_single_page(
-            session_id=session_id,
-            llm=llm,
-            logger=logger,
-            req=req,
-            style=style,
-            full_outline=outline,
-            page_outline=slide_outline,
-            base_page=base_page,
-            page_index=slide_outline.index,
-            total_pages=total_pages,
-        )
-        tasks.append(task)
+    tasks = [
+        generate_and_report(slide_outline, base_page)
+        for slide_outline, base_page in zip(outline.slides, base.pages)
+    ]
     
     # Run all pages in parallel
     refined_pages = await asyncio.gather(*tasks, return_exceptions=True)
@@ -583,6 +756,7 @@ async def refine_with_llm(
                 "page_index": i + 1,
                 "reason": str(result)
             })
+            record_fallback("3.4", base.pages[i].index)
             final_pages.append(base.pages[i])
         else:
             # Result is SlidePage
@@ -0,0 +1,105 @@
+"""
+测试 3.4 逐页提示词压缩：只带相邻页面与大纲哈希，单页提示词不随页数增长，超预算时裁剪上下文
+"""
+
+import json
+
+import pytest
+
+from app.common.schemas import OutlineSlide, PPTOutline, SlidePage, TeachingRequest
+from app.modules.content.core import PAGE_SCHEMA_HINT, build_base_deck, build_page_prompt, refine_with_llm
+from app.modules.intent.parser import autofill_defaults
+from app.modules.style.core import choose_style
+
+
+class DummyLogger:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, session_id, stage, kind, payload):
+        self.events.append((kind, payload))
+
+
+class EchoLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        self.prompts.append((user_msg, schema_hint))
+        outline = json.loads(user_msg)["current_page_outline"]
+        return {
+            "index": outline["index"],
+            "slide_type": outline["slide_type"],
+            "title": outline["title"],
+            "elements": [{"id": "b1", "type": "bullets", "content": {"items": outline["bullets"]}}],
+        }, {}
+
+
+def make_inputs(n):
+    tr = autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    ))
+    style = choose_style(tr)
+    slides = [
+        OutlineSlide(index=i, slide_type="concept", title=f"液压泵的结构与工作原理 {i}",
+                     bullets=["齿轮泵的吸油与压油过程", "叶片泵的结构特点与应用"])
+        for i in range(1, n + 1)
+    ]
+    outline = PPTOutline(deck_title="液压传动", subject="液压", knowledge_points=["液压泵"],
+                         teaching_scene="theory", slides=slides)
+    return tr, style, outline, build_base_deck(tr, style, outline)
+
+
+def test_schema_hint_is_minified_and_still_describes_slide_page():
+    hint = json.loads(PAGE_SCHEMA_HINT)
+    assert set(hint["required"]) == set(SlidePage.model_json_schema()["required"])
+    assert "title" in hint["properties"]
+    assert len(PAGE_SCHEMA_HINT) < len(json.dumps(SlidePage.model_json_schema(), ensure_ascii=False))
+
+
+def test_page_prompt_is_independent_of_deck_size():
+    sizes = []
+    for n in (40, 120):
+        tr, style, outline, base = make_inputs(n)
+        msg, stats = build_page_prompt(tr, style, outline, outline.slides[20], base.pages[20], 21, n)
+        context = json.loads(msg)["outline_context"]
+        assert [s["index"] for s in context["previous_slides"]] == [19, 20]
+        assert [s["index"] for s in context["next_slides"]] == [22, 23]
+        assert stats["context_trimmed"] == []
+        sizes.append(len(msg) - len(str(n)) * 2)
+    assert sizes[0] == sizes[1]
+
+
+def test_token_budget_trims_context(monkeypatch):
+    tr, style, outline, base = make_inputs(10)
+    monkeypatch.setenv("CONTENT_PAGE_TOKEN_BUDGET", "50")
+    msg, stats = build_page_prompt(tr, style, outline, outline.slides[5], base.pages[5], 6, 10)
+    payload = json.loads(msg)
+    assert stats["context_trimmed"] == ["window=1", "base_page", "neighbours"]
+    assert payload["outline_context"]["previous_slides"] == []
+    assert payload["current_page_outline"]["bullets"] == outline.slides[5].bullets
+
+
+@pytest.mark.asyncio
+async def test_refine_sends_compact_prompts():
+    tr, style, outline, base = make_inputs(40)
+    llm, logger = EchoLLM(), DummyLogger()
+    deck = await refine_with_llm("s1", llm, logger, tr, style, outline, base)
+
+    assert [p.title for p in deck.pages] == [s.title for s in outline.slides]
+    assert all(hint == PAGE_SCHEMA_HINT for _, hint in llm.prompts)
+    # 整份大纲摘要不再随每页发送
+    full_summary = json.dumps(
+        [{"index": s.index, "title": s.title, "type": s.slide_type} for s in outline.slides], ensure_ascii=False
+    )
+    legacy_schema = json.dumps(SlidePage.model_json_schema(), ensure_ascii=False)
+    compact = sum(len(msg) + len(hint) for msg, hint in llm.prompts)
+    assert compact * 2 < len(llm.prompts) * (len(full_summary) + len(legacy_schema))
+    digests = {payload["outline_digest"] for kind, payload in logger.events if kind == "per_page_start"}
+    assert len(digests) == 1
@@ -1,7 +1,6 @@
 # modules/export - 3.7 网页版PPT转换为PPTX文件模块
 # 负责格式转换、样式保持、素材嵌入
 
-# TODO: 待实现
-# from .pptx_builder import export_to_pptx
+from .pptx_builder import export_to_pptx, iter_pptx
 
-__all__ = []
+__all__ = ["export_to_pptx", "iter_pptx"]
@@ -0,0 +1,542 @@
+# modules/export - 3.7 SlideDeckContent -> PPTX
+# 直接生成 PresentationML：版式来自 VOCATIONAL_LAYOUTS 的网格定义，配色/字体来自 StyleConfig，
+# 图片来自 3.5 生成的插槽。逐页生成 XML 并写入 ZIP 流，内存占用与页数无关。
+
+from __future__ import annotations
+
+import re
+import struct
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+
+from ...common.schemas import SlideDeckContent, SlidePage, StyleConfig
+from ..render.config import VOCATIONAL_LAYOUTS
+from ..render.core import ImageSlotRequest, RenderResult, extract_bullets
+from . import pptx_parts as parts
+from .pptx_parts import GROUP_PROPS, NS_ATTRS, SLIDE_CX, SLIDE_CY, XML_HEADER, xfrm
+
+Box = Tuple[float, float, float, float]  # 归一化 (x, y, w, h)
+
+# 与 HTML 版式一致的页边距 / 间距（相对幻灯片宽高）
+MARGIN_X = 0.06
+MARGIN_TOP = 0.06
+MARGIN_BOTTOM = 0.06
+REM = 0.0125          # 1rem ≈ 16px / 1280px
+TITLE_ROW = 0.16      # auto 行：标题
+AUTO_ROW = 0.12       # auto 行：其它（如图注）
+PX_TO_PT = 0.75       # HTML 画布 1280x720px -> 960x540pt
+
+# 封面 / 章节 / 致谢：标题居中
+CENTERED_LAYOUTS = {"title_only", "title_only_center", "section_title_impact", "thank_you_minimal"}
+FALLBACK_LAYOUT = "title_bullets"
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+GENERIC_FONTS = {"sans-serif", "serif", "monospace", "system-ui", "cursive", "fantasy", "inherit"}
+DEFAULT_FONT = "Microsoft YaHei"
+_CHUNK = 256 * 1024
+_INVALID_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+# ============================================================================
+# 样式
+# ============================================================================
+
+def _hex(value: Optional[str], default: str) -> str:
+    value = (value or "").strip()
+    m = re.fullmatch(r"#?([0-9a-fA-F]{6})", value)
+    if m:
+        return m.group(1).upper()
+    m = re.fullmatch(r"#?([0-9a-fA-F]{3})", value)
+    if m:
+        return "".join(c * 2 for c in m.group(1)).upper()
+    m = re.fullmatch(r"rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+).*\)", value)
+    if m:
+        return "".join(f"{min(int(c), 255):02X}" for c in m.groups())
+    return default
+
+
+def _font(family: Optional[str]) -> str:
+    for name in (family or "").split(","):
+        name = name.strip().strip("'\"")
+        if name and name.lower() not in GENERIC_FONTS:
+            return name
+    return DEFAULT_FONT
+
+
+class _Style:
+    """StyleConfig -> OOXML 颜色 (RRGGBB)、字体、字号 (1/100 pt)"""
+
+    def __init__(self, style: StyleConfig):
+        c = style.color
+        self.primary = _hex(c.primary, "1F4E79")
+        self.secondary = _hex(c.secondary, "2E75B6")
+        self.accent = _hex(c.accent, "F4B183")
+        self.muted = _hex(c.muted, "D9D9D9")
+        self.text = _hex(c.text, "222222")
+        self.background = _hex(c.background, "FFFFFF")
+        self.surface = _hex(c.surface, "F2F2F2")
+        self.warning = _hex(c.warning, "C00000")
+        self.title_font = _font(style.font.title_family)
+        self.body_font = _font(style.font.body_family)
+        self.title_size = int(style.font.title_size * PX_TO_PT * 100)
+        self.body_size = int(style.font.body_size * PX_TO_PT * 100)
+        self.line_height = style.font.line_height
+        self.header_rule = style.layout.header_rule
+        self.centered = style.layout.alignment == "center"
+
+    def theme_colors(self) -> Dict[str, str]:
+        return {
+            "dk1": self.text, "lt1": self.background, "dk2": self.primary, "lt2": self.surface,
+            "accent1": self.primary, "accent2": self.secondary, "accent3": self.accent,
+            "accent4": self.muted, "accent5": self.warning, "accent6": self.secondary,
+            "hlink": self.secondary, "folHlink": self.primary,
+        }
+
+
+# ============================================================================
+# 版式网格：CSS grid-template -> 归一化矩形
+# ============================================================================
+
+def _tracks(spec: str, count: int) -> List[float]:
+    """'var(--col-text, 3fr) var(--col-img, 2fr)' / 'auto 1fr' -> fr 权重，auto 记为 0"""
+    spec = re.sub(r"var\(\s*--[\w-]+\s*,\s*([^)]+)\)", r"\1", spec or "")
+    weights = []
+    for token in spec.split():
+        m = re.fullmatch(r"([\d.]+)fr", token)
+        weights.append(float(m.group(1)) if m else 0.0)
+    weights += [1.0] * (count - len(weights))
+    return weights[:count]
+
+
+def _gap(spec: str) -> float:
+    m = re.match(r"([\d.]+)rem", spec or "")
+    return float(m.group(1)) * REM if m else 0.0
+
+
+def grid_areas(layout_id: str) -> Dict[str, Box]:
+    """按 VOCATIONAL_LAYOUTS 的 grid-template-areas 计算各区域位置"""
+    cfg = VOCATIONAL_LAYOUTS.get(layout_id) or VOCATIONAL_LAYOUTS[FALLBACK_LAYOUT]
+    rows = [r.split() for r in re.findall(r'"([^"]*)"', cfg.grid_template_areas)]
+    n_rows, n_cols = len(rows), max(len(r) for r in rows)
+    gap = _gap(cfg.gap)
+
+    col_w = _tracks(cfg.grid_template_columns, n_cols)
+    col_w = [w or 1.0 for w in col_w]
+    width = 1 - 2 * MARGIN_X - gap * (n_cols - 1)
+    cols = [width * w / sum(col_w) for w in col_w]
+
+    row_w = _tracks(cfg.grid_template_rows, n_rows)
+    height = 1 - MARGIN_TOP - MARGIN_BOTTOM - gap * (n_rows - 1)
+    fixed = [0.0 if w else (TITLE_ROW if "title" in rows[i] else AUTO_ROW) for i, w in enumerate(row_w)]
+    flexible = max(height - sum(fixed), 0.0)
+    total_fr = sum(row_w) or 1.0
+    heights = [fixed[i] or flexible * row_w[i] / total_fr for i in range(n_rows)]
+
+    xs = [MARGIN_X + sum(cols[:i]) + gap * i for i in range(n_cols)]
+    ys = [MARGIN_TOP + sum(heights[:i]) + gap * i for i in range(n_rows)]
+    spans: Dict[str, List[int]] = {}
+    for r, row in enumerate(rows):
+        for c, name in enumerate(row):
+            if name == ".":
+                continue
+            span = spans.setdefault(name, [r, c, r, c])
+            span[0], span[1] = min(span[0], r), min(span[1], c)
+            span[2], span[3] = max(span[2], r), max(span[3], c)
+    return {
+        name: (xs[c0], ys[r0], xs[c1] + cols[c1] - xs[c0], ys[r1] + heights[r1] - ys[r0])
+        for name, (r0, c0, r1, c1) in spans.items()
+    }
+
+
+def _is_image_area(name: str) -> bool:
+    return name.startswith("image") or name.startswith("img")
+
+
+def _plan_regions(layout_id: str, image_count: int) -> Tuple[Optional[Box], List[Box], List[Box]]:
+    """(标题区, 文本区列表, 图片区列表)；图片区不够时从文本区上部划出"""
+    if layout_id in CENTERED_LAYOUTS:
+        return (0.1, 0.28, 0.8, 0.24), [(0.15, 0.56, 0.7, 0.26)], []
+    areas = grid_areas(layout_id)
+    title = areas.pop("title", None)
+    images = [box for name, box in areas.items() if _is_image_area(name)][:image_count]
+    texts = [box for name, box in areas.items() if not _is_image_area(name)]
+    k = 0
+    while len(images) < image_count and k < len(texts):
+        x, y, w, h = texts[k]
+        images.append((x, y, w, h * 0.55))
+        texts[k] = (x, y + h * 0.58, w, h * 0.42)
+        k += 1
+    return title, texts, images
+
+
+# ============================================================================
+# 形状 XML
+# ============================================================================
+
+def _emu(box: Box) -> Tuple[int, int, int, int]:
+    x, y, w, h = box
+    return int(x * SLIDE_CX), int(y * SLIDE_CY), max(int(w * SLIDE_CX), 1), max(int(h * SLIDE_CY), 1)
+
+
+def _text(value: str) -> str:
+    return escape(_INVALID_XML.sub("", value))
+
+
+def _run(text: str, size: int, color: str, font: str, bold: bool = False) -> str:
+    weight = ' b="1"' if bold else ""
+    return (
+        f'<a:r><a:rPr lang="zh-CN" sz="{size}"{weight} dirty="0">'
+        f'<a:solidFill><a:srgbClr val="{color}"/></a:solidFill>'
+        f"<a:latin typeface={quoteattr(font)}/><a:ea typeface={quoteattr(font)}/></a:rPr>"
+        f"<a:t>{_text(text)}</a:t></a:r>"
+    )
+
+
+def _paragraph(run: str, align: str = "l", bullet: Optional[str] = None, line_height: float = 1.2, space_before: int = 0) -> str:
+    spacing = f'<a:lnSpc><a:spcPct val="{int(line_height * 100000)}"/></a:lnSpc>'
+    if space_before:
+        spacing += f'<a:spcBef><a:spcPts val="{space_before}"/></a:spcBef>'
+    if bullet:
+        ppr = (
+            f'<a:pPr marL="342900" indent="-342900" algn="{align}">{spacing}'
+            f'<a:buClr><a:srgbClr val="{bullet}"/></a:buClr><a:buFont typeface="Arial"/><a:buChar char="&#8226;"/></a:pPr>'
+        )
+    else:
+        ppr = f'<a:pPr algn="{align}">{spacing}<a:buNone/></a:pPr>'
+    return f"<a:p>{ppr}{run}</a:p>"
+
+
+def _text_shape(shape_id: int, name: str, box: Box, paragraphs: str, anchor: str = "t", title: bool = False) -> str:
+    ph = '<p:nvPr><p:ph type="title"/></p:nvPr>' if title else "<p:nvPr/>"
+    locks = '<p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr>' if title else '<p:cNvSpPr txBox="1"/>'
+    return (
+        f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name={quoteattr(name)}/>{locks}{ph}</p:nvSpPr>'
+        f'<p:spPr>{xfrm(*_emu(box))}<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+        f'<p:txBody><a:bodyPr wrap="square" lIns="0" tIns="0" rIns="0" bIns="0" anchor="{anchor}"><a:normAutofit/></a:bodyPr>'
+        f"<a:lstStyle/>{paragraphs}</p:txBody></p:sp>"
+    )
+
+
+def _rule(shape_id: int, box: Box, color: str) -> str:
+    x, y, w, _ = _emu(box)
+    return (
+        f'<p:cxnSp><p:nvCxnSpPr><p:cNvPr id="{shape_id}" name="Header Rule"/><p:cNvCxnSpPr/><p:nvPr/></p:nvCxnSpPr>'
+        f'<p:spPr>{xfrm(x, y, w, 0)}<a:prstGeom prst="line"><a:avLst/></a:prstGeom>'
+        f'<a:ln w="19050"><a:solidFill><a:srgbClr val="{color}"/></a:solidFill></a:ln></p:spPr></p:cxnSp>'
+    )
+
+
+def _picture(shape_id: int, rid: str, box: Box, descr: str) -> str:
+    return (
+        f'<p:pic><p:nvPicPr><p:cNvPr id="{shape_id}" name="Picture {shape_id}" descr={quoteattr(_INVALID_XML.sub("", descr))}/>'
+        '<p:cNvPicPr><a:picLocks noChangeAspect="1"/></p:cNvPicPr><p:nvPr/></p:nvPicPr>'
+        f'<p:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></p:blipFill>'
+        f'<p:spPr>{xfrm(*_emu(box))}<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr></p:pic>'
+    )
+
+
+def _placeholder_box(shape_id: int, box: Box, label: str, st: _Style) -> str:
+    run = _run(label, int(st.body_size * 0.7), st.text, st.body_font)
+    return (
+        f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name="Image Placeholder {shape_id}"/><p:cNvSpPr/><p:nvPr/></p:nvSpPr>'
+        f'<p:spPr>{xfrm(*_emu(box))}<a:prstGeom prst="rect"><a:avLst/></a:prstGeom>'
+        f'<a:solidFill><a:srgbClr val="{st.surface}"/></a:solidFill>'
+        f'<a:ln w="9525"><a:solidFill><a:srgbClr val="{st.muted}"/></a:solidFill><a:prstDash val="dash"/></a:ln></p:spPr>'
+        f'<p:txBody><a:bodyPr anchor="ctr"/><a:lstStyle/>{_paragraph(run, align="ctr")}</p:txBody></p:sp>'
+    )
+
+
+def image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """读取 PNG / JPEG 头部得到像素尺寸（不解码图片）"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                return struct.unpack(">II", head[16:24])
+            if head[:2] == b"\xff\xd8":
+                f.seek(2)
+                while True:
+                    marker = f.read(4)
+                    if len(marker) < 4 or marker[0] != 0xFF:
+                        return None
+                    length = struct.unpack(">H", marker[2:])[0]
+                    if marker[1] in (0xC0, 0xC1, 0xC2):
+                        h, w = struct.unpack(">xHH", f.read(5))
+                        return w, h
+                    f.seek(length - 2, 1)
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def _contain(box: Box, size: Optional[Tuple[int, int]]) -> Box:
+    """等比缩放居中放入区域"""
+    if not size or not size[0] or not size[1]:
+        return box
+    x, y, w, h = box
+    box_ratio = (w * SLIDE_CX) / (h * SLIDE_CY)
+    img_ratio = size[0] / size[1]
+    if img_ratio > box_ratio:
+        new_h = h * box_ratio / img_ratio
+        return x, y + (h - new_h) / 2, w, new_h
+    new_w = w * img_ratio / box_ratio
+    return x + (w - new_w) / 2, y, new_w, h
+
+
+# ============================================================================
+# 页面
+# ============================================================================
+
+def _default_layout(page: SlidePage) -> str:
+    from ..render.engine import LayoutEngine
+
+    return LayoutEngine._map_by_slide_type(page.slide_type) or LayoutEngine._match_by_keywords(page) or FALLBACK_LAYOUT
+
+
+Placed = Tuple[ImageSlotRequest, Optional[str], Optional[Tuple[int, int]]]
+
+
+def _slide_xml(page: SlidePage, layout_id: str, images: List[Placed], st: _Style) -> str:
+    """images: [(插槽, 媒体 rId 或 None, 像素尺寸)]"""
+    title_box, text_boxes, image_boxes = _plan_regions(layout_id, len(images))
+    shapes: List[str] = []
+    next_id = iter(range(2, 10000))
+    centered = layout_id in CENTERED_LAYOUTS
+
+    if title_box:
+        size = int(st.title_size * (1.5 if centered else 1))
+        align = "ctr" if centered or st.centered else "l"
+        run = _run(page.title, size, st.primary, st.title_font, bold=True)
+        shapes.append(_text_shape(next(next_id), "Title", title_box, _paragraph(run, align=align), anchor="ctr" if centered else "b", title=True))
+        if st.header_rule and not centered:
+            x, y, w, h = title_box
+            shapes.append(_rule(next(next_id), (x, y + h + 0.01, w, 0), st.primary))
+
+    bullets = extract_bullets(page)
+    if text_boxes and bullets:
+        per_box = -(-len(bullets) // len(text_boxes))
+        for i, box in enumerate(text_boxes):
+            chunk = bullets[i * per_box:(i + 1) * per_box]
+            if not chunk:
+                continue
+            if centered:
+                body = "".join(
+                    _paragraph(_run(b, st.body_size, st.text, st.body_font), align="ctr", line_height=st.line_height)
+                    for b in chunk
+                )
+            else:
+                body = "".join(
+                    _paragraph(_run(b, st.body_size, st.text, st.body_font), bullet=st.accent,
+                               line_height=st.line_height, space_before=600)
+                    for b in chunk
+                )
+            shapes.append(_text_shape(next(next_id), f"Content {i + 1}", box, body))
+
+    for (slot, rid, size), box in zip(images, image_boxes):
+        if rid:
+            shapes.append(_picture(next(next_id), rid, _contain(box, size), slot.theme or page.title))
+        else:
+            shapes.append(_placeholder_box(next(next_id), box, slot.theme if slot.theme and slot.theme != "default" else "图片", st))
+
+    return (
+        f"{XML_HEADER}<p:sld {NS_ATTRS}><p:cSld>"
+        f'<p:bg><p:bgPr><a:solidFill><a:srgbClr val="{st.background}"/></a:solidFill><a:effectLst/></p:bgPr></p:bg>'
+        f'<p:spTree>{GROUP_PROPS}{"".join(shapes)}</p:spTree></p:cSld>'
+        "<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sld>"
+    )
+
+
+def _notes_xml(notes: Optional[str]) -> str:
+    lines = (notes or "").splitlines() or [""]
+    paragraphs = "".join(
+        f'<a:p><a:r><a:rPr lang="zh-CN" dirty="0"/><a:t>{_text(line)}</a:t></a:r></a:p>' if line
+        else '<a:p><a:endParaRPr lang="zh-CN"/></a:p>'
+        for line in lines
+    )
+    return (
+        f"{XML_HEADER}<p:notes {NS_ATTRS}><p:cSld><p:spTree>{GROUP_PROPS}"
+        '<p:sp><p:nvSpPr><p:cNvPr id="2" name="Slide Image Placeholder 1"/>'
+        '<p:cNvSpPr><a:spLocks noGrp="1" noRot="1" noChangeAspect="1"/></p:cNvSpPr>'
+        '<p:nvPr><p:ph type="sldImg" idx="2"/></p:nvPr></p:nvSpPr><p:spPr/></p:sp>'
+        '<p:sp><p:nvSpPr><p:cNvPr id="3" name="Notes Placeholder 2"/>'
+        '<p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr><p:nvPr><p:ph type="body" idx="3"/></p:nvPr></p:nvSpPr>'
+        f"<p:spPr/><p:txBody><a:bodyPr/><a:lstStyle/>{paragraphs}</p:txBody></p:sp>"
+        "</p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:notes>"
+    )
+
+
+# ============================================================================
+# 插槽图片
+# ============================================================================
+
+def _slot_index(slot: ImageSlotRequest) -> int:
+    m = re.search(r"(\d+)$", slot.slot_id)
+    return int(m.group(1)) if m else 0
+
+
+def _resolve_slots(
+    pages: List[SlidePage],
+    layouts: List[str],
+    render_result: Optional[RenderResult],
+    images_dir: Optional[Path],
+) -> List[List[Tuple[ImageSlotRequest, Optional[Path]]]]:
+    """每页的 [(插槽, 图片文件或 None)]"""
+    by_page: Dict[int, List[ImageSlotRequest]] = {}
+    generated: Dict[str, Path] = {}
+    if render_result is not None:
+        for slot in render_result.image_slots:
+            by_page.setdefault(slot.page_index, []).append(slot)
+        for result in render_result.image_results:
+            if result.status == "done" and result.image_path and Path(result.image_path).is_file():
+                generated[result.slot_id] = Path(result.image_path)
+
+    resolved = []
+    for page, layout_id in zip(pages, layouts):
+        slots = sorted(by_page.get(page.index, []), key=_slot_index)
+        if render_result is None:
+            # 没有渲染结果时按版式定义绘制占位框
+            from ..render.engine import LayoutEngine
+
+            slots = LayoutEngine._generate_image_slots(page, layout_id, page.index)
+        entries = []
+        for slot in slots:
+            path = None
+            if images_dir is not None:
+                path = next((images_dir / f"{slot.slot_id}{ext}" for ext in IMAGE_SUFFIXES
+                             if (images_dir / f"{slot.slot_id}{ext}").is_file()), None)
+            entries.append((slot, path or generated.get(slot.slot_id)))
+        resolved.append(entries)
+    return resolved
+
+
+# ============================================================================
+# 打包
+# ============================================================================
+
+class _Sink:
+    """ZipFile 的不可 seek 输出：写入的字节按块取走（ZipFile 自动改用 data descriptor）"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_pptx(
+    deck: SlideDeckContent,
+    style_config: StyleConfig,
+    render_result: Optional[RenderResult] = None,
+    images_dir: Optional[Union[str, Path]] = None,
+) -> Iterator[bytes]:
+    """逐块产出 .pptx 字节：每页生成后立即写出，图片按块从磁盘复制"""
+    st = _Style(style_config)
+    pages = deck.pages
+    n = len(pages)
+    layouts = [_default_layout(page) for page in pages]
+    recorded = (render_result.metadata.get("pages") if render_result is not None else None) or []
+    if len(recorded) == n:
+        layouts = [entry.get("layout_id") or layouts[i] for i, entry in enumerate(recorded)]
+    slots = _resolve_slots(pages, layouts, render_result, Path(images_dir) if images_dir else None)
+    media_exts = sorted({
+        path.suffix.lower().lstrip(".") for entries in slots for _, path in entries if path is not None
+    })
+
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def xml(name: str, content: str) -> bytes:
+        zf.writestr(name, content.encode("utf-8"))
+        return sink.drain()
+
+    created = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    title_box = _plan_regions(FALLBACK_LAYOUT, 0)[0]
+    yield xml("[Content_Types].xml", parts.content_types(n, media_exts))
+    yield xml("_rels/.rels", parts.root_rels())
+    yield xml("docProps/core.xml", parts.core_props(deck.deck_title, created))
+    yield xml("docProps/app.xml", parts.app_props(n))
+    yield xml("ppt/presentation.xml", parts.presentation(n))
+    yield xml("ppt/_rels/presentation.xml.rels", parts.presentation_rels(n))
+    yield xml("ppt/presProps.xml", parts.pres_props())
+    yield xml("ppt/viewProps.xml", parts.view_props())
+    yield xml("ppt/tableStyles.xml", parts.table_styles())
+    theme = parts.theme(st.theme_colors(), st.title_font, st.body_font)
+    yield xml("ppt/theme/theme1.xml", theme)
+    yield xml("ppt/theme/theme2.xml", theme)
+    yield xml("ppt/slideMasters/slideMaster1.xml", parts.slide_master(_emu(title_box), st.title_size, st.body_size))
+    yield xml("ppt/slideMasters/_rels/slideMaster1.xml.rels", parts.slide_master_rels())
+    yield xml("ppt/slideLayouts/slideLayout1.xml", parts.slide_layout())
+    yield xml("ppt/slideLayouts/_rels/slideLayout1.xml.rels", parts.slide_layout_rels())
+    yield xml("ppt/notesMasters/notesMaster1.xml", parts.notes_master())
+    yield xml("ppt/notesMasters/_rels/notesMaster1.xml.rels", parts.notes_master_rels())
+
+    media: Dict[Path, str] = {}
+    for number, (page, layout_id, entries) in enumerate(zip(pages, layouts, slots), start=1):
+        rels = [("rId1", "slideLayout", "../slideLayouts/slideLayout1.xml")]
+        placed: List[Placed] = []
+        new_media: List[Tuple[Path, str]] = []
+        for slot, path in entries:
+            if path is None:
+                placed.append((slot, None, None))
+                continue
+            target = media.get(path)
+            if target is None:
+                target = media[path] = f"image{len(media) + 1}{path.suffix.lower()}"
+                new_media.append((path, target))
+            rid = f"rId{len(rels) + 1}"
+            rels.append((rid, "image", f"../media/{target}"))
+            placed.append((slot, rid, image_size(path)))
+        rels.append((f"rId{len(rels) + 1}", "notesSlide", f"../notesSlides/notesSlide{number}.xml"))
+
+        yield xml(f"ppt/slides/slide{number}.xml", _slide_xml(page, layout_id, placed, st))
+        yield xml(f"ppt/slides/_rels/slide{number}.xml.rels", parts.relationships(rels))
+        yield xml(f"ppt/notesSlides/notesSlide{number}.xml", _notes_xml(page.speaker_notes))
+        yield xml(f"ppt/notesSlides/_rels/notesSlide{number}.xml.rels", parts.relationships([
+            ("rId1", "notesMaster", "../notesMasters/notesMaster1.xml"),
+            ("rId2", "slide", f"../slides/slide{number}.xml"),
+        ]))
+
+        for path, target in new_media:
+            info = zipfile.ZipInfo(f"ppt/media/{target}", date_time=datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED  # 图片已压缩
+            with open(path, "rb") as src, zf.open(info, "w") as dest:
+                for chunk in iter(lambda: src.read(_CHUNK), b""):
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+
+    zf.close()
+    yield sink.drain()
+
+
+def export_to_pptx(
+    deck: SlideDeckContent,
+    style_config: StyleConfig,
+    dest: Union[str, Path, BinaryIO],
+    render_result: Optional[RenderResult] = None,
+    images_dir: Optional[Union[str, Path]] = None,
+) -> int:
+    """导出为 .pptx 文件（或写入可写的二进制流），返回写入的字节数"""
+    written = 0
+    if isinstance(dest, (str, Path)):
+        Path(dest).parent.mkdir(parents=True, exist_ok=True)
+        with open(dest, "wb") as f:
+            for chunk in iter_pptx(deck, style_config, render_result, images_dir):
+                f.write(chunk)
+                written += len(chunk)
+        return written
+    for chunk in iter_pptx(deck, style_config, render_result, images_dir):
+        dest.write(chunk)
+        written += len(chunk)
+    return written
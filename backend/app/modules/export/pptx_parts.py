@@ -0,0 +1,258 @@
+# modules/export - PPTX 包中固定结构的部件（OOXML）
+# 母版、版式、主题、备注母版等每个文件只生成一次；逐页部件见 pptx_builder.py
+
+from __future__ import annotations
+
+from typing import Dict, List
+from xml.sax.saxutils import escape, quoteattr
+
+NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+NS_ATTRS = f'xmlns:a="{NS_A}" xmlns:r="{NS_R}" xmlns:p="{NS_P}"'
+
+# 16:9，单位 EMU
+SLIDE_CX = 12192000
+SLIDE_CY = 6858000
+NOTES_CX = 6858000
+NOTES_CY = 9144000
+
+CT_MAIN = "application/vnd.openxmlformats-officedocument.presentationml"
+
+GROUP_PROPS = (
+    '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+    '<p:grpSpPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/>'
+    '<a:chOff x="0" y="0"/><a:chExt cx="0" cy="0"/></a:xfrm></p:grpSpPr>'
+)
+
+
+def xfrm(x: int, y: int, cx: int, cy: int) -> str:
+    return f'<a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+
+
+def relationships(rels: List[tuple]) -> str:
+    """[(rId, type 后缀, target)] -> .rels 文件"""
+    items = "".join(
+        f'<Relationship Id="{rid}" Type="{REL}/{kind}" Target={quoteattr(target)}/>'
+        for rid, kind, target in rels
+    )
+    return f'{XML_HEADER}<Relationships xmlns="{NS_PKG_REL}">{items}</Relationships>'
+
+
+def content_types(slide_count: int, media_exts: List[str]) -> str:
+    defaults = {
+        "rels": "application/vnd.openxmlformats-package.relationships+xml",
+        "xml": "application/xml",
+        "png": "image/png",
+        "jpeg": "image/jpeg",
+        "jpg": "image/jpeg",
+        "gif": "image/gif",
+        "webp": "image/webp",
+    }
+    used = {"rels", "xml", *media_exts}
+    parts = [f'<Default Extension="{ext}" ContentType="{ct}"/>' for ext, ct in defaults.items() if ext in used]
+    overrides: Dict[str, str] = {
+        "/ppt/presentation.xml": f"{CT_MAIN}.presentation.main+xml",
+        "/ppt/slideMasters/slideMaster1.xml": f"{CT_MAIN}.slideMaster+xml",
+        "/ppt/slideLayouts/slideLayout1.xml": f"{CT_MAIN}.slideLayout+xml",
+        "/ppt/notesMasters/notesMaster1.xml": f"{CT_MAIN}.notesMaster+xml",
+        "/ppt/theme/theme1.xml": "application/vnd.openxmlformats-officedocument.theme+xml",
+        "/ppt/theme/theme2.xml": "application/vnd.openxmlformats-officedocument.theme+xml",
+        "/ppt/presProps.xml": f"{CT_MAIN}.presProps+xml",
+        "/ppt/viewProps.xml": f"{CT_MAIN}.viewProps+xml",
+        "/ppt/tableStyles.xml": f"{CT_MAIN}.tableStyles+xml",
+        "/docProps/core.xml": "application/vnd.openxmlformats-package.core-properties+xml",
+        "/docProps/app.xml": "application/vnd.openxmlformats-officedocument.extended-properties+xml",
+    }
+    for n in range(1, slide_count + 1):
+        overrides[f"/ppt/slides/slide{n}.xml"] = f"{CT_MAIN}.slide+xml"
+        overrides[f"/ppt/notesSlides/notesSlide{n}.xml"] = f"{CT_MAIN}.notesSlide+xml"
+    parts += [f'<Override PartName="{name}" ContentType="{ct}"/>' for name, ct in overrides.items()]
+    return (
+        f'{XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        f'{"".join(parts)}</Types>'
+    )
+
+
+def root_rels() -> str:
+    return (
+        f'{XML_HEADER}<Relationships xmlns="{NS_PKG_REL}">'
+        f'<Relationship Id="rId1" Type="{REL}/officeDocument" Target="ppt/presentation.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+        f'<Relationship Id="rId3" Type="{REL}/extended-properties" Target="docProps/app.xml"/>'
+        "</Relationships>"
+    )
+
+
+def core_props(title: str, created: str) -> str:
+    return (
+        f'{XML_HEADER}<cp:coreProperties '
+        'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+        f"<dc:title>{escape(title)}</dc:title><dc:creator>make_ppt</dc:creator>"
+        f'<dcterms:created xsi:type="dcterms:W3CDTF">{created}</dcterms:created>'
+        f'<dcterms:modified xsi:type="dcterms:W3CDTF">{created}</dcterms:modified>'
+        "</cp:coreProperties>"
+    )
+
+
+def app_props(slide_count: int) -> str:
+    return (
+        f'{XML_HEADER}<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+        f"<Application>make_ppt</Application><Slides>{slide_count}</Slides><Notes>{slide_count}</Notes>"
+        "</Properties>"
+    )
+
+
+def presentation(slide_count: int) -> str:
+    slide_ids = "".join(
+        f'<p:sldId id="{256 + n}" r:id="rId{100 + n}"/>' for n in range(1, slide_count + 1)
+    )
+    return (
+        f'{XML_HEADER}<p:presentation {NS_ATTRS} saveSubsetFonts="1">'
+        '<p:sldMasterIdLst><p:sldMasterId id="2147483648" r:id="rId1"/></p:sldMasterIdLst>'
+        '<p:notesMasterIdLst><p:notesMasterId r:id="rId2"/></p:notesMasterIdLst>'
+        f"<p:sldIdLst>{slide_ids}</p:sldIdLst>"
+        f'<p:sldSz cx="{SLIDE_CX}" cy="{SLIDE_CY}"/><p:notesSz cx="{NOTES_CX}" cy="{NOTES_CY}"/>'
+        "</p:presentation>"
+    )
+
+
+def presentation_rels(slide_count: int) -> str:
+    rels = [
+        ("rId1", "slideMaster", "slideMasters/slideMaster1.xml"),
+        ("rId2", "notesMaster", "notesMasters/notesMaster1.xml"),
+        ("rId3", "theme", "theme/theme1.xml"),
+        ("rId4", "presProps", "presProps.xml"),
+        ("rId5", "viewProps", "viewProps.xml"),
+        ("rId6", "tableStyles", "tableStyles.xml"),
+    ]
+    rels += [(f"rId{100 + n}", "slide", f"slides/slide{n}.xml") for n in range(1, slide_count + 1)]
+    return relationships(rels)
+
+
+def pres_props() -> str:
+    return f"{XML_HEADER}<p:presentationPr {NS_ATTRS}/>"
+
+
+def view_props() -> str:
+    return (
+        f"{XML_HEADER}<p:viewPr {NS_ATTRS}>"
+        '<p:normalViewPr><p:restoredLeft sz="15620"/><p:restoredTop sz="94660"/></p:normalViewPr>'
+        '<p:gridSpacing cx="76200" cy="76200"/></p:viewPr>'
+    )
+
+
+def table_styles() -> str:
+    return (
+        f'{XML_HEADER}<a:tblStyleLst xmlns:a="{NS_A}" def="{{5C22544A-7EE6-4342-B048-85BDC9FD1C3A}}"/>'
+    )
+
+
+def _solid(color: str) -> str:
+    return f'<a:solidFill><a:srgbClr val="{color}"/></a:solidFill>'
+
+
+def theme(colors: Dict[str, str], title_font: str, body_font: str) -> str:
+    """colors: dk1 lt1 dk2 lt2 accent1-6 hlink folHlink -> RRGGBB"""
+    order = ["dk1", "lt1", "dk2", "lt2", "accent1", "accent2", "accent3", "accent4", "accent5", "accent6", "hlink", "folHlink"]
+    scheme = "".join(f'<a:{name}><a:srgbClr val="{colors[name]}"/></a:{name}>' for name in order)
+    line = '<a:ln w="{w}" cap="flat" cmpd="sng" algn="ctr"><a:solidFill><a:schemeClr val="phClr"/></a:solidFill><a:prstDash val="solid"/></a:ln>'
+    fills = '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>' * 3
+    return (
+        f'{XML_HEADER}<a:theme xmlns:a="{NS_A}" name="make_ppt">'
+        f'<a:themeElements><a:clrScheme name="make_ppt">{scheme}</a:clrScheme>'
+        '<a:fontScheme name="make_ppt">'
+        f'<a:majorFont><a:latin typeface={quoteattr(title_font)}/><a:ea typeface={quoteattr(title_font)}/><a:cs typeface=""/></a:majorFont>'
+        f'<a:minorFont><a:latin typeface={quoteattr(body_font)}/><a:ea typeface={quoteattr(body_font)}/><a:cs typeface=""/></a:minorFont>'
+        "</a:fontScheme>"
+        '<a:fmtScheme name="make_ppt">'
+        f"<a:fillStyleLst>{fills}</a:fillStyleLst>"
+        f'<a:lnStyleLst>{line.format(w=6350)}{line.format(w=12700)}{line.format(w=19050)}</a:lnStyleLst>'
+        "<a:effectStyleLst>" + "<a:effectStyle><a:effectLst/></a:effectStyle>" * 3 + "</a:effectStyleLst>"
+        f"<a:bgFillStyleLst>{fills}</a:bgFillStyleLst>"
+        "</a:fmtScheme></a:themeElements><a:objectDefaults/><a:extraClrSchemeLst/></a:theme>"
+    )
+
+
+_CLR_MAP = (
+    'bg1="lt1" tx1="dk1" bg2="lt2" tx2="dk2" accent1="accent1" accent2="accent2" accent3="accent3" '
+    'accent4="accent4" accent5="accent5" accent6="accent6" hlink="hlink" folHlink="folHlink"'
+)
+
+
+def _title_placeholder(box: tuple = None, shape_id: int = 2) -> str:
+    sp_pr = f'<p:spPr>{xfrm(*box)}<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr>' if box else "<p:spPr/>"
+    return (
+        f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name="Title {shape_id}"/>'
+        '<p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr><p:nvPr><p:ph type="title"/></p:nvPr></p:nvSpPr>'
+        f'{sp_pr}<p:txBody><a:bodyPr anchor="b"><a:normAutofit/></a:bodyPr><a:lstStyle/>'
+        '<a:p><a:endParaRPr lang="zh-CN"/></a:p></p:txBody></p:sp>'
+    )
+
+
+def slide_master(title_box: tuple, title_size: int, body_size: int) -> str:
+    return (
+        f"{XML_HEADER}<p:sldMaster {NS_ATTRS}>"
+        '<p:cSld><p:bg><p:bgRef idx="1001"><a:schemeClr val="bg1"/></p:bgRef></p:bg>'
+        f"<p:spTree>{GROUP_PROPS}{_title_placeholder(title_box)}</p:spTree></p:cSld>"
+        f"<p:clrMap {_CLR_MAP}/>"
+        '<p:sldLayoutIdLst><p:sldLayoutId id="2147483649" r:id="rId1"/></p:sldLayoutIdLst>'
+        "<p:txStyles>"
+        f'<p:titleStyle><a:lvl1pPr><a:defRPr sz="{title_size}" b="1"><a:solidFill><a:schemeClr val="tx2"/></a:solidFill>'
+        '<a:latin typeface="+mj-lt"/><a:ea typeface="+mj-ea"/></a:defRPr></a:lvl1pPr></p:titleStyle>'
+        f'<p:bodyStyle><a:lvl1pPr><a:defRPr sz="{body_size}"><a:solidFill><a:schemeClr val="tx1"/></a:solidFill>'
+        '<a:latin typeface="+mn-lt"/><a:ea typeface="+mn-ea"/></a:defRPr></a:lvl1pPr></p:bodyStyle>'
+        f'<p:otherStyle><a:lvl1pPr><a:defRPr sz="{body_size}"/></a:lvl1pPr></p:otherStyle>'
+        "</p:txStyles></p:sldMaster>"
+    )
+
+
+def slide_master_rels() -> str:
+    return relationships([
+        ("rId1", "slideLayout", "../slideLayouts/slideLayout1.xml"),
+        ("rId2", "theme", "../theme/theme1.xml"),
+    ])
+
+
+def slide_layout() -> str:
+    return (
+        f'{XML_HEADER}<p:sldLayout {NS_ATTRS} type="titleOnly" preserve="1">'
+        f'<p:cSld name="Title Only"><p:spTree>{GROUP_PROPS}{_title_placeholder()}</p:spTree></p:cSld>'
+        "<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sldLayout>"
+    )
+
+
+def slide_layout_rels() -> str:
+    return relationships([("rId1", "slideMaster", "../slideMasters/slideMaster1.xml")])
+
+
+def notes_master() -> str:
+    img = xfrm(1143000, 685800, 4572000, 2571750)
+    body = xfrm(685800, 3429000, 5486400, 4800600)
+    return (
+        f"{XML_HEADER}<p:notesMaster {NS_ATTRS}>"
+        '<p:cSld><p:bg><p:bgRef idx="1001"><a:schemeClr val="bg1"/></p:bgRef></p:bg>'
+        f"<p:spTree>{GROUP_PROPS}"
+        '<p:sp><p:nvSpPr><p:cNvPr id="2" name="Slide Image Placeholder 1"/>'
+        '<p:cNvSpPr><a:spLocks noGrp="1" noRot="1" noChangeAspect="1"/></p:cNvSpPr>'
+        '<p:nvPr><p:ph type="sldImg" idx="2"/></p:nvPr></p:nvSpPr>'
+        f'<p:spPr>{img}<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr></p:sp>'
+        '<p:sp><p:nvSpPr><p:cNvPr id="3" name="Notes Placeholder 2"/>'
+        '<p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr><p:nvPr><p:ph type="body" sz="quarter" idx="3"/></p:nvPr></p:nvSpPr>'
+        f'<p:spPr>{body}<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr>'
+        '<p:txBody><a:bodyPr/><a:lstStyle/><a:p><a:endParaRPr lang="zh-CN"/></a:p></p:txBody></p:sp>'
+        f"</p:spTree></p:cSld><p:clrMap {_CLR_MAP}/>"
+        '<p:notesStyle><a:lvl1pPr marL="0" algn="l"><a:defRPr sz="1200"><a:solidFill><a:schemeClr val="tx1"/></a:solidFill>'
+        '<a:latin typeface="+mn-lt"/><a:ea typeface="+mn-ea"/></a:defRPr></a:lvl1pPr></p:notesStyle>'
+        "</p:notesMaster>"
+    )
+
+
+def notes_master_rels() -> str:
+    return relationships([("rId1", "theme", "../theme/theme2.xml")])
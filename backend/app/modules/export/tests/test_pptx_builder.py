@@ -0,0 +1,110 @@
+"""
+测试 PPTX 导出：逐块写出的包是合法 ZIP，版式网格、样式、图片插槽与备注都映射到幻灯片
+"""
+
+import io
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+from app.common.schemas import SlideDeckContent, SlideElement, SlidePage, TeachingRequest
+from app.modules.export import export_to_pptx, iter_pptx
+from app.modules.export.pptx_builder import grid_areas, image_size
+from app.modules.intent.parser import autofill_defaults
+from app.modules.render.core import ImageSlotRequest, RenderResult
+from app.modules.style.core import choose_style
+
+
+def make_png(path, width, height):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = b"".join(b"\x00" + b"\x80\x80\x80" * width for _ in range(height))
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def make_style():
+    return choose_style(autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    )))
+
+
+def make_deck(n):
+    pages = [SlidePage(index=0, slide_type="title", title="液压传动 & <基础>")]
+    for i in range(1, n):
+        pages.append(SlidePage(
+            index=i,
+            slide_type="concept",
+            title=f"液压泵原理 {i}",
+            elements=[SlideElement(id=f"e{i}", type="bullets", content={"items": ["吸油", "压油", "容积变化"]})],
+            speaker_notes=f"讲解第 {i} 页",
+        ))
+    return SlideDeckContent(deck_title="液压传动", pages=pages)
+
+
+def test_grid_areas_follow_layout_definition():
+    areas = grid_areas("title_bullets_right_img")
+    title, text, image = areas["title"], areas["bullets"], areas["image"]
+    assert title[1] < text[1]
+    assert text[0] < image[0]
+    # 3fr : 2fr
+    assert text[2] / image[2] == pytest.approx(1.5, rel=0.01)
+
+
+def test_image_size_reads_png_header(tmp_path):
+    make_png(tmp_path / "a.png", 40, 30)
+    assert image_size(tmp_path / "a.png") == (40, 30)
+
+
+def test_large_deck_streams_valid_package(tmp_path):
+    n = 60
+    deck = make_deck(n)
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    slots, pages_meta = [], []
+    for page in deck.pages:
+        layout_id = "title_only_center" if page.index == 0 else "title_bullets_right_img"
+        pages_meta.append({"layout_id": layout_id})
+        if page.index:
+            slot = ImageSlotRequest(slot_id=f"page{page.index}_slot0", page_index=page.index, theme="液压泵",
+                                    layout_position="right", x=0.6, y=0.2, w=0.35, h=0.6)
+            slots.append(slot)
+            if page.index % 2:
+                make_png(images_dir / f"{slot.slot_id}.png", 64, 48)
+    render_result = RenderResult(session_id="s1", html_path="", image_slots=slots, metadata={"pages": pages_meta})
+
+    chunks = list(iter_pptx(deck, make_style(), render_result, images_dir))
+    assert len(chunks) > n
+    data = b"".join(chunks)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        names = zf.namelist()
+        assert sum(name.startswith("ppt/slides/slide") for name in names) == n
+        assert zf.getinfo("ppt/media/image1.png").compress_type == zipfile.ZIP_STORED
+        cover = zf.read("ppt/slides/slide1.xml").decode("utf-8")
+        assert "液压传动 &amp; &lt;基础&gt;" in cover
+        assert "<p:pic>" in zf.read("ppt/slides/slide2.xml").decode("utf-8")
+        # 未生成的图片画占位框
+        assert "Image Placeholder" in zf.read("ppt/slides/slide3.xml").decode("utf-8")
+        assert "讲解第 1 页" in zf.read("ppt/notesSlides/notesSlide2.xml").decode("utf-8")
+
+    out = tmp_path / "deck.pptx"
+    assert export_to_pptx(deck, make_style(), out, render_result, images_dir) == out.stat().st_size
+
+    pptx = pytest.importorskip("pptx")
+    prs = pptx.Presentation(str(out))
+    assert len(prs.slides) == n
+    slide = prs.slides[1]
+    assert slide.shapes.title.text == "液压泵原理 1"
+    assert any(shape.shape_type == 13 for shape in slide.shapes)  # PICTURE
+    assert slide.notes_slide.notes_text_frame.text == "讲解第 1 页"
@@ -5,6 +5,10 @@ import os
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from ...common.budget import budget_shortfall, record_degraded
+from ...common.fallbacks import record_fallback, used_fallback
+from ...common.llm_batch import batch_chat_json, batch_size_from_env
+from ...common.progress import ProgressCallback, emit_progress, stream_progress
 from ...common.schemas import OutlineSlide, PPTOutline, TeachingRequest
 from ...prompts.outline import OUTLINE_PLANNING_SYSTEM_PROMPT
 
@@ -22,6 +26,45 @@ SLIDE_TYPES_WITHOUT_IMAGES = {
 # Assets后处理：生成图片描述和补充size/style字段
 # ============================================================================
 
+ASSET_DESCRIPTION_SYSTEM_PROMPT = """你是PPT图片描述生成专家。你的任务是根据PPT页面的主题内容，为图片素材生成详细的文字描述，这个描述将用于后续AI图片生成的prompt。
+
+## 任务要求
+1. 根据页面标题、要点内容和知识点，理解这一页的教学主题
+2. 结合asset的type（diagram或photo）和theme，生成详细的图片描述
+3. 描述应该：
+   - 具体明确，包含关键元素和场景细节
+   - 适合作为AI图片生成的prompt
+   - 体现教学内容的专业性和准确性
+   - 如果是diagram，描述应该包含图表的结构、元素关系等
+   - 如果是photo，描述应该包含场景、对象、环境等
+
+## 输出格式
+返回JSON格式：
+{
+  "description": "详细的图片描述文字，用于AI图片生成"
+}
+
+只输出JSON，不要解释。"""
+
+ASSET_DESCRIPTION_SCHEMA = '{"description": "string"}'
+
+
+def _needs_description(asset: Dict[str, Any]) -> bool:
+    return asset.get("type", "").lower() in ["diagram", "photo"] and not (asset.get("description") or "").strip()
+
+
+def _asset_context(asset: Dict[str, Any], slide: OutlineSlide, req: TeachingRequest) -> Dict[str, Any]:
+    return {
+        "slide_title": slide.title,
+        "slide_type": slide.slide_type,
+        "bullets": slide.bullets,
+        "subject": req.subject,
+        "knowledge_points": req.kp_names,
+        "teaching_scene": req.teaching_scene,
+        "asset_type": asset.get("type", "").lower(),
+        "theme": asset.get("theme", ""),
+    }
+
 async def _generate_asset_description(
     asset: Dict[str, Any],
     slide: OutlineSlide,
@@ -34,57 +77,24 @@ async def _generate_asset_description(
     
     asset_type = asset.get("type", "").lower()
     
-    # 只处理diagram和photo类型
-    if asset_type not in ["diagram", "photo"]:
-        return asset
-    
-    # 如果已经有description字段且不为空，直接返回
-    if asset.get("description") and asset.get("description").strip():
+    # 只处理diagram和photo类型；已有非空description的直接返回
+    if not _needs_description(asset):
         return asset
     
     # 构建上下文信息
-    context = {
-        "slide_title": slide.title,
-        "slide_type": slide.slide_type,
-        "bullets": slide.bullets,
-        "subject": req.subject,
-        "knowledge_points": req.kp_names,
-        "teaching_scene": req.teaching_scene,
-        "asset_type": asset_type,
-        "theme": asset.get("theme", ""),
-    }
+    context = _asset_context(asset, slide, req)
     
     # 如果LLM可用，使用LLM生成描述
     if llm and llm.is_enabled():
         try:
-            system_prompt = """你是PPT图片描述生成专家。你的任务是根据PPT页面的主题内容，为图片素材生成详细的文字描述，这个描述将用于后续AI图片生成的prompt。
-
-## 任务要求
-1. 根据页面标题、要点内容和知识点，理解这一页的教学主题
-2. 结合asset的type（diagram或photo）和theme，生成详细的图片描述
-3. 描述应该：
-   - 具体明确，包含关键元素和场景细节
-   - 适合作为AI图片生成的prompt
-   - 体现教学内容的专业性和准确性
-   - 如果是diagram，描述应该包含图表的结构、元素关系等
-   - 如果是photo，描述应该包含场景、对象、环境等
-
-## 输出格式
-返回JSON格式：
-{
-  "description": "详细的图片描述文字，用于AI图片生成"
-}
-
-只输出JSON，不要解释。"""
+            system_prompt = ASSET_DESCRIPTION_SYSTEM_PROMPT
             
             user_payload = json.dumps(context, ensure_ascii=False, indent=2)
             
-            schema_hint = '{"description": "string"}'
-            
             parsed, meta = await llm.chat_json(
                 system_prompt,
                 user_payload,
-                schema_hint,
+                ASSET_DESCRIPTION_SCHEMA,
                 temperature=0.7,
             )
             
@@ -212,6 +222,60 @@ async def _process_slide_assets(
     return slide
 
 
+async def _describe_assets_batched(
+    outline: PPTOutline,
+    req: TeachingRequest,
+    llm: Any,
+    logger: Any,
+    session_id: str,
+) -> None:
+    """批量生成asset描述：多个asset合并为一次LLM调用，学科/知识点等共用上下文只发送一次。
+
+    批量结果中缺失或描述为空的asset逐个调用 _generate_asset_description。
+    """
+    pending = []
+    for slide in outline.slides:
+        if slide.slide_type in SLIDE_TYPES_WITHOUT_IMAGES and not slide.assets:
+            continue
+        slide.assets = [_ensure_asset_fields(asset.copy()) for asset in slide.assets]
+        pending.extend((slide, asset) for asset in slide.assets if _needs_description(asset))
+    if not pending:
+        return
+
+    shared_keys = ("subject", "knowledge_points", "teaching_scene")
+    items = []
+    for slide, asset in pending:
+        context = _asset_context(asset, slide, req)
+        items.append({k: v for k, v in context.items() if k not in shared_keys})
+
+    async def describe_one(i: int) -> Dict[str, Any]:
+        slide, asset = pending[i]
+        await _generate_asset_description(asset, slide, req, llm, logger, session_id)
+        return {"description": asset.get("description")}
+
+    batch = await batch_chat_json(
+        llm,
+        ASSET_DESCRIPTION_SYSTEM_PROMPT,
+        items,
+        ASSET_DESCRIPTION_SCHEMA,
+        fallback=describe_one,
+        validate=lambda r: isinstance(r.get("description"), str) and bool(r["description"].strip()),
+        shared={"subject": req.subject, "knowledge_points": req.kp_names, "teaching_scene": req.teaching_scene},
+        temperature=0.7,
+    )
+    for (slide, asset), result in zip(pending, batch["results"]):
+        description = (result or {}).get("description")
+        if not description:
+            description = _generate_fallback_asset_description(asset, slide, _asset_context(asset, slide, req))
+        asset["description"] = description
+
+    logger.emit(session_id, "3.3", "asset_descriptions_batched", {
+        "assets": len(pending),
+        "llm_calls": batch["requests"],
+        "fallbacks": batch["fallbacks"],
+    })
+
+
 async def _post_process_outline_assets(
     outline: PPTOutline,
     req: TeachingRequest,
@@ -223,14 +287,17 @@ async def _post_process_outline_assets(
     
     import asyncio
     
-    # 并行处理所有slides的assets
-    processed_slides = await asyncio.gather(*[
-        _process_slide_assets(slide, req, llm, logger, session_id)
-        for slide in outline.slides
-    ])
-    
-    # 更新outline的slides
-    outline.slides = list(processed_slides)
+    if llm and llm.is_enabled() and batch_size_from_env() > 1:
+        await _describe_assets_batched(outline, req, llm, logger, session_id)
+    else:
+        # 并行处理所有slides的assets
+        processed_slides = await asyncio.gather(*[
+            _process_slide_assets(slide, req, llm, logger, session_id)
+            for slide in outline.slides
+        ])
+        
+        # 更新outline的slides
+        outline.slides = list(processed_slides)
     
     logger.emit(session_id, "3.3", "assets_post_processed", {
         "total_slides": len(outline.slides),
@@ -1292,12 +1359,144 @@ SLIDE_OPTIMIZATION_PROMPTS = {
 }
 
 
+def _deck_context(req: TeachingRequest, total_slides: int) -> Dict[str, Any]:
+    """逐页优化时共用的课程上下文"""
+    return {
+        "subject": req.subject,
+        "teaching_scene": req.teaching_scene,
+        "knowledge_points": req.kp_names,
+        "objectives": {
+            "knowledge": req.teaching_objectives.knowledge,
+            "ability": req.teaching_objectives.ability,
+            "literacy": req.teaching_objectives.literacy,
+        },
+        "total_slides": total_slides,
+    }
+
+
+async def optimize_outline_slide(
+    slide: OutlineSlide,
+    deck_context: Dict[str, Any],
+    llm: Any,
+    logger: Any,
+    session_id: str,
+    on_progress: Optional[ProgressCallback] = None,
+) -> OutlineSlide:
+    """优化单个页面的内容（传入 on_progress 时流式请求，生成过程中推送 "delta" 事件）"""
+    # 确定页面类型对应的prompt
+    slide_type_key = slide.slide_type
+    if slide_type_key not in SLIDE_OPTIMIZATION_PROMPTS:
+        # 根据页面类型映射到通用类型
+        type_mapping = {
+            "title": "title",
+            "objectives": "objectives",
+            "intro": "intro",
+            "concept": "concept",
+            "principle": "content",
+            "content": "content",
+            "case": "case",
+            "case_compare": "case",
+            "exercise": "exercise",
+            "exercises": "exercise",
+            "discussion": "discussion",
+            "qa": "discussion",
+            "summary": "summary",
+        }
+        slide_type_key = type_mapping.get(slide.slide_type, "content")
+
+    optimization_prompt = SLIDE_OPTIMIZATION_PROMPTS.get(slide_type_key, SLIDE_OPTIMIZATION_PROMPTS["content"])
+
+    system_prompt = f"""{optimization_prompt}
+
+## 上下文
+- 学科：{deck_context['subject']}
+- 教学场景：{deck_context['teaching_scene']}
+- 知识点：{', '.join(deck_context['knowledge_points'])}
+
+## 输出格式
+返回JSON格式：
+{{
+  "bullets": ["要点1", "要点2", "要点3"],
+  "assets": [{{"type": "image|diagram|chart", "theme": "描述主题"}}],
+  "interactions": ["互动设计（如有）"]
+}}
+
+只输出JSON，不要解释。"""
+
+    user_payload = {
+        "slide_index": slide.index,
+        "slide_type": slide.slide_type,
+        "title": slide.title,
+        "current_bullets": slide.bullets,
+    }
+
+    # 运行预算不足以覆盖一次调用：保留骨架内容
+    reason = budget_shortfall()
+    if reason:
+        record_degraded("3.3", slide.index, reason)
+        return slide
+
+    try:
+        on_delta = stream_progress(on_progress, "3.3", slide.index)
+        parsed, meta = await llm.chat_json(
+            system_prompt,
+            json.dumps(user_payload, ensure_ascii=False),
+            '{"bullets": ["string"], "assets": [{"type": "string", "theme": "string"}], "interactions": ["string"]}',
+            temperature=0.5,
+            **({"on_delta": on_delta} if on_delta else {}),
+        )
+
+        # 更新页面内容 - 使用特异性评分决定是否覆盖
+        if parsed:
+            new_bullets = parsed.get("bullets", [])
+            if new_bullets and len(new_bullets) >= 2:
+                # 计算原始和新内容的特异性评分
+                original_score = _calculate_content_specificity(slide.bullets, deck_context)
+                new_score = _calculate_content_specificity(new_bullets, deck_context)
+
+                # 只有当新内容评分更高或原始内容过于通用时才覆盖
+                if new_score > original_score or original_score < 0.3:
+                    slide.bullets = new_bullets
+                # 否则保留原有更具体的内容
+
+            if parsed.get("assets"):
+                slide.assets = parsed["assets"]
+            if parsed.get("interactions"):
+                slide.interactions = parsed["interactions"]
+
+        return slide
+
+    except Exception as e:
+        logger.emit(session_id, "3.3", "slide_optimization_error", {
+            "slide_index": slide.index,
+            "error": str(e)
+        })
+        record_fallback("3.3", slide.index)
+        reason = budget_shortfall(e)
+        if reason:
+            record_degraded("3.3", slide.index, reason)
+        return slide  # 保持原有内容
+
+
+def outline_from_slides(req: TeachingRequest, slides: List[OutlineSlide]) -> PPTOutline:
+    """按预估分布生成的页面 -> PPTOutline"""
+    return PPTOutline(
+        deck_title=f"{req.subject or '未指定学科'}：{_deck_title(req)}",
+        subject=req.subject or "未指定学科",
+        knowledge_points=req.kp_names or ["未指定知识点"],
+        teaching_scene=req.teaching_scene,
+        slides=slides,
+    )
+
+
 async def generate_outline_from_distribution(
     req: TeachingRequest,
     llm: Any,
     logger: Any,
     session_id: str,
     style_name: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    completed: Optional[Dict[int, OutlineSlide]] = None,
 ) -> PPTOutline:
     """
     根据3.1模块的预估页面分布，结合LLM智能优化，生成PPT大纲。
@@ -1313,6 +1512,8 @@ async def generate_outline_from_distribution(
         logger: 日志记录器
         session_id: 会话ID
         style_name: 可选的样式名称
+        on_progress: 可选的进度回调，每页优化完成后推送 "slide" 事件
+        completed: 上次被取消的运行中已优化完成的页面（按 index），直接复用不再调用LLM
         
     Returns:
         优化后的PPTOutline
@@ -1341,106 +1542,22 @@ async def generate_outline_from_distribution(
             "slide_count": len(slides)
         })
         
-        # 构建上下文信息
-        deck_context = {
-            "subject": req.subject,
-            "teaching_scene": req.teaching_scene,
-            "knowledge_points": req.kp_names,
-            "objectives": {
-                "knowledge": req.teaching_objectives.knowledge,
-                "ability": req.teaching_objectives.ability,
-                "literacy": req.teaching_objectives.literacy,
-            },
-            "total_slides": len(slides),
-        }
-        
-        # 并行优化所有页面
-        async def optimize_slide(slide: OutlineSlide) -> OutlineSlide:
-            """优化单个页面的内容"""
-            # 确定页面类型对应的prompt
-            slide_type_key = slide.slide_type
-            if slide_type_key not in SLIDE_OPTIMIZATION_PROMPTS:
-                # 根据页面类型映射到通用类型
-                type_mapping = {
-                    "title": "title",
-                    "objectives": "objectives",
-                    "intro": "intro",
-                    "concept": "concept",
-                    "principle": "content",
-                    "content": "content",
-                    "case": "case",
-                    "case_compare": "case",
-                    "exercise": "exercise",
-                    "exercises": "exercise",
-                    "discussion": "discussion",
-                    "qa": "discussion",
-                    "summary": "summary",
-                }
-                slide_type_key = type_mapping.get(slide.slide_type, "content")
-            
-            optimization_prompt = SLIDE_OPTIMIZATION_PROMPTS.get(slide_type_key, SLIDE_OPTIMIZATION_PROMPTS["content"])
-            
-            system_prompt = f"""{optimization_prompt}
-
-## 上下文
-- 学科：{deck_context['subject']}
-- 教学场景：{deck_context['teaching_scene']}
-- 知识点：{', '.join(deck_context['knowledge_points'])}
-
-## 输出格式
-返回JSON格式：
-{{
-  "bullets": ["要点1", "要点2", "要点3"],
-  "assets": [{{"type": "image|diagram|chart", "theme": "描述主题"}}],
-  "interactions": ["互动设计（如有）"]
-}}
+        deck_context = _deck_context(req, len(slides))
+
+        async def optimize_and_report(slide: OutlineSlide) -> OutlineSlide:
+            if completed and slide.index in completed:
+                result = completed[slide.index].model_copy(deep=True)
+            else:
+                result = await optimize_outline_slide(slide, deck_context, llm, logger, session_id, on_progress)
+            await emit_progress(on_progress, {
+                "stage": "3.3", "event": "slide", "index": result.index,
+                "total": len(slides), "slide": result.model_dump(mode="json"),
+                "fallback": used_fallback("3.3", result.index),
+            })
+            return result
 
-只输出JSON，不要解释。"""
-            
-            user_payload = {
-                "slide_index": slide.index,
-                "slide_type": slide.slide_type,
-                "title": slide.title,
-                "current_bullets": slide.bullets,
-            }
-            
-            try:
-                parsed, meta = await llm.chat_json(
-                    system_prompt,
-                    json.dumps(user_payload, ensure_ascii=False),
-                    '{"bullets": ["string"], "assets": [{"type": "string", "theme": "string"}], "interactions": ["string"]}',
-                    temperature=0.5,
-                )
-                
-                # 更新页面内容 - 使用特异性评分决定是否覆盖
-                if parsed:
-                    new_bullets = parsed.get("bullets", [])
-                    if new_bullets and len(new_bullets) >= 2:
-                        # 计算原始和新内容的特异性评分
-                        original_score = _calculate_content_specificity(slide.bullets, deck_context)
-                        new_score = _calculate_content_specificity(new_bullets, deck_context)
-                        
-                        # 只有当新内容评分更高或原始内容过于通用时才覆盖
-                        if new_score > original_score or original_score < 0.3:
-                            slide.bullets = new_bullets
-                        # 否则保留原有更具体的内容
-                    
-                    if parsed.get("assets"):
-                        slide.assets = parsed["assets"]
-                    if parsed.get("interactions"):
-                        slide.interactions = parsed["interactions"]
-                
-                return slide
-                
-            except Exception as e:
-                logger.emit(session_id, "3.3", "slide_optimization_error", {
-                    "slide_index": slide.index,
-                    "error": str(e)
-                })
-                return slide  # 保持原有内容
-        
         # 并行优化所有页面
-        optimized_slides = await asyncio.gather(*[optimize_slide(s) for s in slides])
+        optimized_slides = await asyncio.gather(*[optimize_and_report(s) for s in slides])
         slides = list(optimized_slides)
         
         logger.emit(session_id, "3.3", "llm_optimization_complete", {
@@ -1451,13 +1568,7 @@ async def generate_outline_from_distribution(
     for idx, s in enumerate(slides, start=1):
         s.index = idx
     
-    outline = PPTOutline(
-        deck_title=f"{req.subject or '未指定学科'}：{_deck_title(req)}",
-        subject=req.subject or "未指定学科",
-        knowledge_points=req.kp_names or ["未指定知识点"],
-        teaching_scene=req.teaching_scene,
-        slides=slides,
-    )
+    outline = outline_from_slides(req, slides)
     
     logger.emit(session_id, "3.3", "outline_from_distribution_complete", {
         "total_slides": len(slides),
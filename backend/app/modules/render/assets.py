@@ -0,0 +1,97 @@
+"""
+Module 3.5: 共享静态资源 (Assets)
+reveal.js、字体、图标和样式在服务端只保存一份，按内容哈希版本挂载在 /assets/{version}/ 下并带长缓存头；
+每次渲染只写 index.html，离线 ZIP 导出时才把资源打包进去（见 bundle.py）。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from .config import MODULE_DIR, SRC_STATIC_DIR, SRC_STYLES_DIR
+
+# HTML 中的引用形如 {asset_base}/static/reveal.js/... 与 {asset_base}/styles/themes/...
+ASSET_DIRS = {"static": SRC_STATIC_DIR, "styles": SRC_STYLES_DIR}
+ASSET_MOUNT = "/assets"
+# 离线包中资源与 index.html 同级
+OFFLINE_ASSET_BASE = "."
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 不对外提供、也不打进离线包的目录
+IGNORED_NAMES = {"node_modules", ".git", ".github", "test", "examples"}
+
+_VERSIONED_PREFIX = re.compile(r"""(?<=["'(])""" + re.escape(ASSET_MOUNT) + r"/[0-9a-f]{6,64}/")
+
+
+def iter_asset_files() -> Iterator[Tuple[str, Path]]:
+    """(zip 内路径, 源文件) 按路径排序"""
+    for prefix, root in ASSET_DIRS.items():
+        if not root.exists():
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_NAMES)
+            for name in sorted(filenames):
+                path = Path(dirpath) / name
+                yield f"{prefix}/{path.relative_to(root).as_posix()}", path
+
+
+@lru_cache(maxsize=1)
+def asset_version() -> str:
+    """资源内容哈希（进程内计算一次）；资源变化时 URL 随之变化，因此可以永久缓存"""
+    digest = hashlib.sha256()
+    for arcname, path in iter_asset_files():
+        digest.update(arcname.encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def asset_base_url() -> str:
+    """渲染 HTML 时使用的资源前缀。
+
+    Env:
+      - RENDER_ASSET_BASE_URL: 例如 CDN 地址 (default: /assets/{asset_version})
+    """
+    return (os.getenv("RENDER_ASSET_BASE_URL") or f"{ASSET_MOUNT}/{asset_version()}").rstrip("/")
+
+
+def localize_html(html: str) -> str:
+    """把共享资源前缀改写为离线包内的相对路径"""
+    base = asset_base_url()
+    html = html.replace(f"{base}/", f"{OFFLINE_ASSET_BASE}/")
+    # 旧版本资源前缀（资源更新前渲染的页面）
+    return _VERSIONED_PREFIX.sub(f"{OFFLINE_ASSET_BASE}/", html)
+
+
+class VersionedAssetFiles(StaticFiles):
+    """/assets/{version}/{static|styles}/... 的 StaticFiles。
+
+    当前版本的响应带 immutable 长缓存头；其它版本号（旧页面）同样返回当前文件，
+    但不允许长缓存，避免浏览器把新内容缓存在旧 URL 下。
+    """
+
+    def __init__(self) -> None:
+        super().__init__(directory=str(MODULE_DIR))
+
+    def get_path(self, scope: Scope) -> str:
+        parts = super().get_path(scope).split(os.sep)
+        if len(parts) < 3 or parts[1] not in ASSET_DIRS or IGNORED_NAMES.intersection(parts):
+            return os.path.join("static", "__missing__")
+        return os.path.join(*parts[1:])
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        version = super().get_path(scope).split(os.sep)[0]
+        response.headers["Cache-Control"] = (
+            IMMUTABLE_CACHE_CONTROL if version == asset_version() else "no-cache"
+        )
+        return response
@@ -0,0 +1,260 @@
+"""
+Module 3.5: 离线包 (Bundle)
+边读边发的 ZIP：先根据会话目录和共享资源算出每个条目的头部与大小，再按需输出任意字节区间，
+不写临时文件。PNG 等已压缩文件用 STORED，文本资源用 DEFLATE（共享资源的压缩结果进程内缓存）。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from .assets import ASSET_DIRS, iter_asset_files, localize_html
+
+# 已压缩格式再 DEFLATE 只会浪费 CPU
+STORED_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".woff", ".woff2", ".zip", ".gz", ".mp4"}
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+_UTF8_FLAG = 0x800
+_VERSION = 20
+_MAX_32 = 0xFFFFFFFF
+_CHUNK = 256 * 1024
+
+
+
+class _FileCache:
+    """按路径的进程内 LRU，(mtime_ns, 大小) 不一致视为未命中；限制条目数，可选再限制字节数。
+
+    每个路径只保留最新版本，文件被修改后旧结果在下次写入时直接被替换。
+    """
+
+    def __init__(self, max_entries: int, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, Tuple[Tuple[int, int], Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, stat: os.stat_result) -> Optional[Any]:
+        key = str(path)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != (stat.st_mtime_ns, stat.st_size):
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, path: Path, stat: os.stat_result, value: Any, nbytes: int = 0) -> None:
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        key = str(path)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._data[key] = ((stat.st_mtime_ns, stat.st_size), value, nbytes)
+            self.bytes += nbytes
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                _, (_, _, dropped) = self._data.popitem(last=False)
+                self.bytes -= dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# STORED 文件的 CRC；共享资源的压缩结果
+# Env:
+#   - BUNDLE_CACHE_ENTRIES: 每个缓存的条目上限 (default: 4096)
+#   - BUNDLE_CACHE_MAX_MB: 压缩结果缓存的字节上限 (default: 64)
+_CACHE_ENTRIES = int(os.getenv("BUNDLE_CACHE_ENTRIES") or 4096)
+_crc_cache = _FileCache(_CACHE_ENTRIES)
+_deflate_cache = _FileCache(_CACHE_ENTRIES, max_bytes=int(float(os.getenv("BUNDLE_CACHE_MAX_MB") or 64) * 1024 * 1024))
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(max(mtime, 315532800))  # ZIP 不能表示 1980 年以前
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _file_crc(path: Path, stat: os.stat_result) -> int:
+    crc = _crc_cache.get(path, stat)
+    if crc is None:
+        crc = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                crc = zlib.crc32(chunk, crc)
+        _crc_cache.put(path, stat, crc)
+    return crc
+
+
+def _deflated_asset(path: Path, stat: os.stat_result) -> Tuple[int, bytes]:
+    cached = _deflate_cache.get(path, stat)
+    if cached is None:
+        data = path.read_bytes()
+        cached = (zlib.crc32(data), _deflate(data))
+        _deflate_cache.put(path, stat, cached, nbytes=len(cached[1]))
+    return cached
+
+
+@dataclass
+class _Entry:
+    name: str
+    method: int
+    crc: int
+    size: int
+    mtime: float
+    # DEFLATE 条目为压缩后的字节；STORED 条目从 path 读取
+    data: Optional[bytes] = None
+    path: Optional[Path] = None
+    mode: int = 0o644
+
+    @property
+    def compressed_size(self) -> int:
+        return len(self.data) if self.data is not None else self.size
+
+
+Segment = Union[bytes, Tuple[Path, int]]
+
+
+@dataclass
+class ZipPlan:
+    """ZIP 的完整字节布局：内存片段或 (文件, 长度)；可以从任意偏移开始输出"""
+
+    segments: List[Segment] = field(default_factory=list)
+    size: int = 0
+    etag: str = ""
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield bytes [start, end] (inclusive)."""
+        end = self.size - 1 if end is None else end
+        offset = 0
+        for segment in self.segments:
+            length = len(segment) if isinstance(segment, bytes) else segment[1]
+            seg_start, seg_end = offset, offset + length - 1
+            offset += length
+            if seg_end < start or length == 0:
+                continue
+            if seg_start > end:
+                break
+            lo, hi = max(start, seg_start) - seg_start, min(end, seg_end) - seg_start
+            if isinstance(segment, bytes):
+                yield segment[lo:hi + 1]
+                continue
+            with open(segment[0], "rb") as f:
+                f.seek(lo)
+                remaining = hi - lo + 1
+                while remaining > 0:
+                    chunk = f.read(min(_CHUNK, remaining))
+                    if not chunk:
+                        raise IOError(f"{segment[0]} shrank while streaming")
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+def _collect_entries(output_dir: Path) -> List[_Entry]:
+    entries: List[_Entry] = []
+    for path in sorted(output_dir.rglob("*")):
+        if not path.is_file():
+            continue
+        arcname = path.relative_to(output_dir).as_posix()
+        # 旧会话目录里可能还有整份资源副本，统一用当前共享资源
+        if arcname.split("/", 1)[0] in ASSET_DIRS or arcname.startswith(".") or "/." in arcname:
+            continue
+        stat = path.stat()
+        if arcname == "index.html":
+            raw = localize_html(path.read_text(encoding="utf-8")).encode("utf-8")
+            entries.append(_Entry(arcname, ZIP_DEFLATED, zlib.crc32(raw), len(raw), stat.st_mtime, data=_deflate(raw)))
+        elif path.suffix.lower() in STORED_SUFFIXES:
+            entries.append(_Entry(arcname, ZIP_STORED, _file_crc(path, stat), stat.st_size, stat.st_mtime, path=path))
+        else:
+            raw = path.read_bytes()
+            entries.append(_Entry(arcname, ZIP_DEFLATED, zlib.crc32(raw), len(raw), stat.st_mtime, data=_deflate(raw)))
+
+    for arcname, path in iter_asset_files():
+        stat = path.stat()
+        if path.suffix.lower() in STORED_SUFFIXES:
+            entries.append(_Entry(arcname, ZIP_STORED, _file_crc(path, stat), stat.st_size, stat.st_mtime, path=path))
+        else:
+            crc, data = _deflated_asset(path, stat)
+            entries.append(_Entry(arcname, ZIP_DEFLATED, crc, stat.st_size, stat.st_mtime, data=data))
+    return entries
+
+
+def plan_zip(entries: List[_Entry]) -> ZipPlan:
+    """Lay out local headers, data and the central directory (no zip64: < 4 GiB)."""
+    plan = ZipPlan()
+    central: List[bytes] = []
+    digest = hashlib.sha256()
+    offset = 0
+    for entry in entries:
+        name = entry.name.encode("utf-8")
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        if offset > _MAX_32 or entry.size > _MAX_32:
+            raise ValueError("bundle too large for a non-zip64 archive")
+        header = struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, _VERSION, _UTF8_FLAG, entry.method, dos_time, dos_date,
+            entry.crc, entry.compressed_size, entry.size, len(name), 0,
+        ) + name
+        central.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | _VERSION, _VERSION, _UTF8_FLAG, entry.method,
+            dos_time, dos_date, entry.crc, entry.compressed_size, entry.size, len(name), 0, 0, 0, 0,
+            (0o100000 | entry.mode) << 16, offset,
+        ) + name)
+        plan.segments.append(header)
+        plan.segments.append(entry.data if entry.data is not None else (entry.path, entry.size))
+        offset += len(header) + entry.compressed_size
+        digest.update(f"{entry.name}\0{entry.method}\0{entry.crc}\0{entry.size}\0{dos_date}{dos_time}\n".encode("utf-8"))
+
+    directory = b"".join(central)
+    if offset > _MAX_32 or len(entries) > 0xFFFF:
+        raise ValueError("bundle too large for a non-zip64 archive")
+    plan.segments.append(directory)
+    plan.segments.append(struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, len(entries), len(entries), len(directory), offset, 0,
+    ))
+    plan.size = offset + len(directory) + 22
+    plan.etag = f'"{digest.hexdigest()[:32]}"'
+    return plan
+
+
+def plan_offline_bundle(output_dir: Union[str, Path]) -> ZipPlan:
+    """会话输出目录 + 共享资源 -> 离线包布局（index.html 中的资源引用改为相对路径）"""
+    return plan_zip(_collect_entries(Path(output_dir)))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单区间 Range 头，返回闭区间 (start, end)；无效或多区间时抛 ValueError，没有 Range 返回 None"""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+    else:
+        # bytes=-N：最后 N 个字节
+        start, end = max(size - int(last), 0), size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
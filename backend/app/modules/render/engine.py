@@ -2,16 +2,40 @@
 Module 3.5: 布局引擎 (Engine)
 负责智能选择布局模板，并生成图片插槽请求。
 """
+import asyncio
 import json
+import logging
+import os
 import jieba
+from dataclasses import dataclass, field
 from typing import Tuple, List, Optional, Any, Dict
+from ...common.budget import budget_shortfall, record_degraded
+from ...common.fallbacks import record_fallback
 from ...common.schemas import SlidePage, TeachingRequest
 from ...common.llm_client import LLMClient
+from ...common.llm_batch import batch_chat_json, batch_size_from_env
 from ...prompts.render import LAYOUT_AGENT_SYSTEM_PROMPT
 
 from .core import ImageSlotRequest, ImageStyle, AspectRatio, calculate_text_length
 from .config import VOCATIONAL_LAYOUTS
 
+logger = logging.getLogger(__name__)
+
+LAYOUT_SCHEMA = """{"selected_layout_id": "string", "alternative_layout_ids": ["string"], "reasoning": "string"}"""
+
+
+@dataclass
+class LayoutProposal:
+    """第一阶段（可并行）的布局决策结果，不依赖前一页"""
+    layout_id: str
+    # 强制映射的页面（封面/目录/章节/致谢）不参与去重
+    fixed: bool = False
+    # 次优候选，按适合程度排序；第二阶段用于避免与前一页重复
+    alternatives: List[str] = field(default_factory=list)
+    # 运行预算不足时改用规则打分得出，不写入布局缓存
+    degraded: bool = False
+
+
 class LayoutEngine:
     """
     布局决策引擎
@@ -31,27 +55,137 @@ class LayoutEngine:
         template_id: Optional[str] = "business"
     ) -> Tuple[str, List[ImageSlotRequest]]:
         """主入口：决定布局并生成插槽"""
-        
+        proposal = await LayoutEngine.propose_layout(
+            page, teaching_request, page_index, llm, template_id, previous_layout=previous_layout
+        )
+        return LayoutEngine.finalize_layout(page, proposal, page_index, previous_layout)
+
+    @staticmethod
+    async def propose_layouts(
+        pages: List[SlidePage],
+        teaching_request: TeachingRequest,
+        llm: Optional[LLMClient] = None,
+        template_id: Optional[str] = "business",
+        max_concurrency: Optional[int] = None,
+    ) -> List[LayoutProposal]:
+        """第一阶段（批量或并行）：各页布局候选，与前一页无关，可按页缓存"""
+        if not pages:
+            return []
+        batch_size = batch_size_from_env()
+        if llm and llm.is_enabled() and batch_size > 1:
+            proposals = await LayoutEngine._propose_batched(pages, teaching_request, llm, template_id, batch_size)
+        else:
+            limit = max_concurrency or int(os.getenv("RENDER_LAYOUT_CONCURRENCY") or 8)
+            sem = asyncio.Semaphore(max(1, limit))
+
+            async def propose(page: SlidePage) -> LayoutProposal:
+                async with sem:
+                    return await LayoutEngine.propose_layout(page, teaching_request, page.index, llm, template_id)
+
+            proposals = await asyncio.gather(*(propose(page) for page in pages))
+        return list(proposals)
+
+    @staticmethod
+    async def _propose_batched(
+        pages: List[SlidePage],
+        teaching_request: TeachingRequest,
+        llm: LLMClient,
+        template_id: Optional[str],
+        batch_size: int,
+    ) -> List[LayoutProposal]:
+        """第一阶段的批量版本：非强制映射的页面每 batch_size 页合并为一次 LLM 调用"""
+        proposals: List[Optional[LayoutProposal]] = []
+        pending: List[int] = []
+        for i, page in enumerate(pages):
+            layout_id = LayoutEngine._map_by_slide_type(page.slide_type)
+            proposals.append(LayoutProposal(layout_id=layout_id, fixed=True) if layout_id else None)
+            if not layout_id:
+                pending.append(i)
+
+        if pending:
+            error: Optional[Exception] = None
+            if budget_shortfall():
+                ranked = [(None, [])] * len(pending)
+            else:
+                try:
+                    ranked = await LayoutEngine._rank_batch_with_llm(
+                        [pages[i] for i in pending], teaching_request, llm, template_id, batch_size
+                    )
+                except Exception as e:
+                    logger.warning("Layout Agent batch failed: %s", e)
+                    error = e
+                    ranked = [(None, [])] * len(pending)
+            for i, (layout_id, alternatives) in zip(pending, ranked):
+                reason = None
+                if not layout_id:
+                    record_fallback("3.5", pages[i].index)
+                    reason = budget_shortfall(error)
+                    if reason:
+                        record_degraded("3.5", pages[i].index, reason)
+                    layout_id = LayoutEngine._score_and_select(pages[i], teaching_request, None)
+                proposals[i] = LayoutProposal(layout_id=layout_id, alternatives=alternatives, degraded=bool(reason))
+        return proposals
+
+    @staticmethod
+    async def propose_layout(
+        page: SlidePage,
+        teaching_request: TeachingRequest,
+        page_index: int,
+        llm: Optional[LLMClient] = None,
+        template_id: Optional[str] = "business",
+        previous_layout: Optional[str] = None,
+    ) -> LayoutProposal:
+        """第一阶段：布局候选（previous_layout 仅在逐页调用时传给 LLM 作参考）"""
+
         # 1. 快速路径：基于 slide_type 强制映射
         layout_id = LayoutEngine._map_by_slide_type(page.slide_type)
         if layout_id:
-            return layout_id, LayoutEngine._generate_image_slots(page, layout_id, page_index)
+            return LayoutProposal(layout_id=layout_id, fixed=True)
 
         # 2. 智能路径：LLM 分析 或 规则打分
-        if llm and llm.is_enabled():
+        alternatives: List[str] = []
+        reason = budget_shortfall() if llm and llm.is_enabled() else None
+        if reason:
+            # 运行预算不足以覆盖一次调用：规则打分
+            record_degraded("3.5", page_index, reason)
+            layout_id = LayoutEngine._score_and_select(page, teaching_request, previous_layout)
+        elif llm and llm.is_enabled():
             try:
-                layout_id = await LayoutEngine._analyze_with_llm(page, teaching_request, llm, previous_layout, template_id)
+                layout_id, alternatives = await LayoutEngine._rank_with_llm(
+                    page, teaching_request, llm, previous_layout, template_id
+                )
             except Exception as e:
                 print(f"Layout Agent failed for page {page_index}: {e}")
+                record_fallback("3.5", page_index)
+                reason = budget_shortfall(e)
+                if reason:
+                    record_degraded("3.5", page_index, reason)
                 layout_id = LayoutEngine._score_and_select(page, teaching_request, previous_layout)
         else:
             layout_id = LayoutEngine._match_by_keywords(page)
             if not layout_id:
                 layout_id = LayoutEngine._score_and_select(page, teaching_request, previous_layout)
 
-        # 3. 避免连续重复
+        return LayoutProposal(layout_id=layout_id, alternatives=alternatives, degraded=bool(reason))
+
+    @staticmethod
+    def finalize_layout(
+        page: SlidePage,
+        proposal: LayoutProposal,
+        page_index: int,
+        previous_layout: Optional[str] = None,
+    ) -> Tuple[str, List[ImageSlotRequest]]:
+        """第二阶段：去重、溢出检查并生成插槽（不调用 LLM）"""
+        layout_id = proposal.layout_id
+        if proposal.fixed:
+            return layout_id, LayoutEngine._generate_image_slots(page, layout_id, page_index)
+
+        # 3. 避免连续重复：优先用 LLM 给出的次优候选，其次用规则替代表
         if layout_id == previous_layout and previous_layout is not None:
-            layout_id = LayoutEngine._find_alternative_layout(layout_id)
+            layout_id = next(
+                (alt for alt in proposal.alternatives if alt != previous_layout),
+                None,
+            ) or LayoutEngine._find_alternative_layout(layout_id)
 
         # 4. 安全检查（文本溢出降级）
         layout_id = LayoutEngine._check_text_overflow_and_downgrade(page, layout_id)
@@ -163,44 +297,96 @@ class LayoutEngine:
         prev: Optional[str],
         template_id: str = "business"
     ) -> Optional[str]:
-        # 简化的LLM分析
-        slide_content = {
+        layout_id, _ = await LayoutEngine._rank_with_llm(page, req, llm, prev, template_id)
+        return layout_id
+
+    @staticmethod
+    def _slide_content(page: SlidePage, req: TeachingRequest) -> Dict[str, Any]:
+        return {
             "title": page.title,
             "type": page.slide_type,
             "bullets": [str(e.content) for e in page.elements if e.type in ["text", "bullets"]],
             "image_count": sum(1 for e in page.elements if e.type in ["image", "diagram"]),
             "domain": req.subject_info.subject_name
         }
-        
-        # 这里的 Layout Schema 需要能获取
-        from .config import VOCATIONAL_LAYOUTS
+
+    @staticmethod
+    def _available_layouts() -> List[Dict[str, Any]]:
+        return [
+            {"layout_id": lid, "description": cfg.description, "keywords": cfg.suitable_keywords}
+            for lid, cfg in VOCATIONAL_LAYOUTS.items()
+        ]
+
+    @staticmethod
+    def _layout_system_prompt(template_id: str) -> str:
         from ...prompts.render import get_layout_prompt
         from .templates_registry import get_template
-        
-        available_layouts = []
-        for lid, cfg in VOCATIONAL_LAYOUTS.items():
-            available_layouts.append({
-                "layout_id": lid,
-                "description": cfg.description,
-                "keywords": cfg.suitable_keywords
-            })
-            
-        user_msg = json.dumps({
-            "slide_content": slide_content,
-            "available_layouts": available_layouts,
-            "previous_layout": prev,
-            "avoid": [prev] if prev else []
-        }, ensure_ascii=False)
-        
-        LAYOUT_SCHEMA = """{"selected_layout_id": "string", "reasoning": "string"}"""
-        
+
         # 获取模版特定的 Prompt Modifier
         template = get_template(template_id)
         prompt_modifier = template.system_prompt_modifier if template else ""
-        system_prompt = get_layout_prompt(prompt_modifier)
-        
-        response, _ = await llm.chat_json(system_prompt, user_msg, LAYOUT_SCHEMA)
+        return get_layout_prompt(prompt_modifier)
+
+    @staticmethod
+    def _parse_ranking(response: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
         lid = response.get("selected_layout_id")
+        alternatives = [
+            a for a in (response.get("alternative_layout_ids") or [])
+            if isinstance(a, str) and a in VOCATIONAL_LAYOUTS and a != lid
+        ]
         if lid in VOCATIONAL_LAYOUTS:
-            return lid
-        return None
+            return lid, alternatives
+        return None, alternatives
+
+    @staticmethod
+    async def _rank_with_llm(
+        page: SlidePage,
+        req: TeachingRequest,
+        llm: LLMClient,
+        prev: Optional[str],
+        template_id: str = "business"
+    ) -> Tuple[Optional[str], List[str]]:
+        """LLM 选择布局，返回 (首选, 次优候选列表)"""
+        user_msg = json.dumps({
+            "slide_content": LayoutEngine._slide_content(page, req),
+            "available_layouts": LayoutEngine._available_layouts(),
+            "previous_layout": prev,
+            "avoid": [prev] if prev else []
+        }, ensure_ascii=False)
+
+        system_prompt = LayoutEngine._layout_system_prompt(template_id)
+        response, _ = await llm.chat_json(system_prompt, user_msg, LAYOUT_SCHEMA)
+        return LayoutEngine._parse_ranking(response)
+
+    @staticmethod
+    async def _rank_batch_with_llm(
+        pages: List[SlidePage],
+        req: TeachingRequest,
+        llm: LLMClient,
+        template_id: str = "business",
+        batch_size: Optional[int] = None,
+    ) -> List[Tuple[Optional[str], List[str]]]:
+        """一次请求为多页选择布局（可选布局列表只发送一次），结果按 index 对应回各页。
+
+        批量结果中缺失或 layout_id 无效的页面逐页调用 _rank_with_llm。
+        """
+        async def rank_one(i: int) -> Dict[str, Any]:
+            lid, alternatives = await LayoutEngine._rank_with_llm(pages[i], req, llm, None, template_id)
+            return {"selected_layout_id": lid, "alternative_layout_ids": alternatives}
+
+        batch = await batch_chat_json(
+            llm,
+            LayoutEngine._layout_system_prompt(template_id),
+            [{"slide_content": LayoutEngine._slide_content(page, req)} for page in pages],
+            LAYOUT_SCHEMA,
+            fallback=rank_one,
+            validate=lambda r: r.get("selected_layout_id") in VOCATIONAL_LAYOUTS,
+            shared={"available_layouts": LayoutEngine._available_layouts()},
+            batch_size=batch_size,
+        )
+        ranked = [LayoutEngine._parse_ranking(r) if r else (None, []) for r in batch["results"]]
+        logger.info(
+            "Layout Agent: %d pages in %d LLM calls (%d fallbacks)",
+            len(pages), batch["requests"], batch["fallbacks"],
+        )
+        return ranked
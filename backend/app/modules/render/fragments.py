@@ -0,0 +1,92 @@
+"""
+Module 3.5: 片段缓存 (Fragments)
+按内容哈希缓存每页的布局候选与 HTML 片段；index.html 由片段拼接而成，
+修改一页时只重新渲染该页（以及因“不与前一页重复”约束而布局改变的相邻页）。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from ...common.schemas import SlidePage, StyleConfig
+
+
+def canonical_hash(*parts: Any) -> str:
+    """pydantic 模型 / dict / 标量的稳定哈希（键排序的 JSON）"""
+    normalized = [p.model_dump(mode="json") if isinstance(p, BaseModel) else p for p in parts]
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def page_key(page: SlidePage, template_id: str, subject: str) -> str:
+    """布局候选只取决于页面内容、模板和学科（与前一页无关）"""
+    return canonical_hash("page", page, template_id, subject)
+
+
+def style_key(style_config: StyleConfig, template_id: str) -> str:
+    return canonical_hash("style", style_config, template_id)
+
+
+def fragment_key(page_key: str, layout_id: str, style_key: str, template_id: str) -> str:
+    return canonical_hash("fragment", page_key, layout_id, style_key, template_id)
+
+
+class FragmentCache:
+    """进程内 LRU：key -> 布局候选 / HTML 片段 / CSS 变量"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[FragmentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_fragment_cache() -> FragmentCache:
+    """Process-wide fragment cache.
+
+    Env:
+      - RENDER_FRAGMENT_CACHE_ENTRIES (default: 4096)
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FragmentCache(int(os.getenv("RENDER_FRAGMENT_CACHE_ENTRIES") or 4096))
+    return _cache
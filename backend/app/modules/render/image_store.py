@@ -0,0 +1,260 @@
+"""
+Module 3.5: 全局图片存储 (Image Store)
+所有会话共享的内容寻址图片缓存：同一 (模型, 尺寸, 提示词) 只调用一次生成 API。
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 布局：
+#   {root}/objects/ab/abcdef....png   图片按内容 sha256 存储，内容相同的结果只存一份
+#   {root}/index.sqlite               请求键 -> 对象，以及 prompt_hash/model/size/created/last_access/bytes
+# 会话目录中的 images/{slot_id}.png 通过硬链接指向对象（不支持时复制），
+# 淘汰对象不会影响已经链接出去的会话文件。
+
+DEFAULT_ROOT = Path(__file__).resolve().parents[3] / "data" / "image_store"
+
+
+def request_key(prompt: str, model: str, size: str) -> str:
+    return hashlib.sha256(f"{model}\n{size}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def link_or_copy(src: Union[str, Path], dst: Union[str, Path]) -> None:
+    """把 src 放到 dst：优先硬链接（零拷贝），跨文件系统等情况退回复制。已存在的 dst 会被替换。"""
+    src, dst = Path(src), Path(dst)
+    if dst.exists() and src.resolve() == dst.resolve():
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ImageStore:
+    """Content-addressed image cache shared by every session.
+
+    get()/put() are keyed by (prompt, model, size); objects are deduplicated
+    by content hash. evict() trims by total bytes / entry count in LRU order
+    using the index instead of scanning the directory.
+    """
+
+    def __init__(self, root: Union[str, Path] = DEFAULT_ROOT, max_bytes: int = 0, max_entries: int = 0):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 请求键 -> [锁, 引用数]：最后一个使用者退出时才移除，等待中的请求不会被新来的绕过
+        self._inflight: Dict[str, List[Any]] = {}
+        self._async_inflight: Dict[Tuple[int, str], List[Any]] = {}
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " key TEXT PRIMARY KEY,"
+            " prompt_hash TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " size TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS images_lru ON images (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS images_content ON images (content_hash)")
+        self._conn.commit()
+
+    def _object_path(self, content_hash: str) -> Path:
+        return self.objects_dir / content_hash[:2] / f"{content_hash}.png"
+
+    def get(self, prompt: str, model: str, size: str) -> Optional[str]:
+        """Path of the cached image, or None. Refreshes last_access."""
+        key = request_key(prompt, model, size)
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM images WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            path = self._object_path(row[0])
+            if not path.exists():
+                # 对象被外部删除：丢弃索引项，按未命中处理
+                self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE images SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return str(path)
+
+    def put(self, prompt: str, model: str, size: str, content: bytes) -> str:
+        """Store generated bytes and return the object path."""
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self._object_path(content_hash)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(content)
+            os.replace(tmp, path)
+        return self._index(prompt, model, size, content_hash, len(content))
+
+    def put_file(self, prompt: str, model: str, size: str, src: Union[str, Path]) -> str:
+        """Move a downloaded file into the store (hashed in chunks) and return the object path."""
+        src = Path(src)
+        digest = hashlib.sha256()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        path = self._object_path(content_hash)
+        nbytes = src.stat().st_size
+        if path.exists():
+            src.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(src, path)
+        return self._index(prompt, model, size, content_hash, nbytes)
+
+    def staging_path(self) -> Path:
+        """临时下载位置（与对象目录同一文件系统，便于 put_file 原子移动）"""
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f"{os.getpid()}-{threading.get_ident()}-{time.time_ns()}.part"
+
+    def _index(self, prompt: str, model: str, size: str, content_hash: str, nbytes: int) -> str:
+        key = request_key(prompt, model, size)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (key, prompt_hash, model, size, content_hash, bytes, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, hashlib.md5(prompt.encode("utf-8")).hexdigest(), model, size, content_hash, nbytes, now, now),
+            )
+            self._conn.commit()
+        if self.max_bytes or self.max_entries:
+            self.evict()
+        return str(self._object_path(content_hash))
+
+    def _acquire_entry(self, table: Dict[Any, List[Any]], key: Any, factory) -> List[Any]:
+        with self._lock:
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = [factory(), 0]
+            entry[1] += 1
+            return entry
+
+    def _release_entry(self, table: Dict[Any, List[Any]], key: Any, entry: List[Any]) -> None:
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0 and table.get(key) is entry:
+                del table[key]
+
+    @contextmanager
+    def singleflight(self, prompt: str, model: str, size: str) -> Iterator[None]:
+        """同一进程内相同请求串行执行：后到者等待先到者写入缓存后直接命中"""
+        key = request_key(prompt, model, size)
+        entry = self._acquire_entry(self._inflight, key, threading.Lock)
+        try:
+            with entry[0]:
+                yield
+        finally:
+            self._release_entry(self._inflight, key, entry)
+
+    @asynccontextmanager
+    async def asingleflight(self, prompt: str, model: str, size: str) -> AsyncIterator[None]:
+        """singleflight 的协程版本：同一事件循环内相同请求串行执行（跨 ImageService 实例）"""
+        key = (id(asyncio.get_running_loop()), request_key(prompt, model, size))
+        entry = self._acquire_entry(self._async_inflight, key, asyncio.Lock)
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            self._release_entry(self._async_inflight, key, entry)
+
+    def _drop(self, keys) -> int:
+        """Remove index entries and any objects no longer referenced; caller holds the lock."""
+        removed = 0
+        for key, content_hash in keys:
+            self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+            still_used = self._conn.execute(
+                "SELECT 1 FROM images WHERE content_hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+            if still_used is None:
+                try:
+                    self._object_path(content_hash).unlink()
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        self._conn.commit()
+        return removed
+
+    def evict(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None) -> int:
+        """Drop least-recently-used entries until both limits hold (0 = unlimited)."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_entries = self.max_entries if max_entries is None else max_entries
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM images").fetchone()
+            victims = []
+            if (max_bytes and total > max_bytes) or (max_entries and count > max_entries):
+                for key, content_hash, size in self._conn.execute(
+                    "SELECT key, content_hash, bytes FROM images ORDER BY last_access"
+                ):
+                    if not ((max_bytes and total > max_bytes) or (max_entries and count > max_entries)):
+                        break
+                    victims.append((key, content_hash))
+                    total -= size
+                    count -= 1
+            return self._drop(victims)
+
+    def evict_older_than(self, seconds: float) -> int:
+        """Drop entries not accessed within `seconds`."""
+        cutoff = time.time() - seconds
+        with self._lock:
+            victims = self._conn.execute(
+                "SELECT key, content_hash FROM images WHERE last_access < ?", (cutoff,)
+            ).fetchall()
+            return self._drop(victims)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM images").fetchone()
+            objects = self._conn.execute("SELECT COUNT(DISTINCT content_hash) FROM images").fetchone()[0]
+        return {"entries": count, "objects": objects, "bytes": total}
+
+
+_stores: Dict[str, ImageStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_image_store(root: Optional[Union[str, Path]] = None) -> ImageStore:
+    """Process-wide ImageStore for `root`.
+
+    Env:
+      - IMAGE_STORE_DIR (default: backend/data/image_store)
+      - IMAGE_STORE_MAX_MB: LRU size cap, 0 = unlimited (default: 2048)
+      - IMAGE_STORE_MAX_ENTRIES: 0 = unlimited (default: 0)
+    """
+    root = str(Path(root or os.getenv("IMAGE_STORE_DIR") or DEFAULT_ROOT).resolve())
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = ImageStore(
+                root,
+                max_bytes=int(float(os.getenv("IMAGE_STORE_MAX_MB") or 2048) * 1024 * 1024),
+                max_entries=int(os.getenv("IMAGE_STORE_MAX_ENTRIES") or 0),
+            )
+        return store
@@ -0,0 +1,156 @@
+"""
+Module 3.5: 异步图片生成提供方 (Providers)
+基于共享的 httpx.AsyncClient 连接池，不阻塞事件循环。
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ...common.llm_client import get_http_client
+
+
+class ImageThrottledError(RuntimeError):
+    """提供方限流或暂时不可用，可以重试"""
+
+
+class ImageProviderError(RuntimeError):
+    """提供方明确拒绝或任务失败，不重试"""
+
+
+def is_transient_error(status_code: int, code: str = "") -> bool:
+    """429 / 5xx / Throttling.* 错误码：限流或暂时不可用，值得退避重试"""
+    return status_code == 429 or status_code >= 500 or str(code or "").startswith("Throttling")
+
+
+class ImageProvider(ABC):
+    """Async text-to-image provider: generate an image and stream it to `dest`."""
+
+    name: str = "provider"
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # 默认复用进程级连接池（与 LLMClient 共享）
+        return self._client or get_http_client()
+
+    @abstractmethod
+    async def generate(self, prompt: str, size: str, dest: Path) -> bool:
+        """Generate one image into `dest`; False if the provider returned nothing."""
+
+    async def download(self, url: str, dest: Path) -> None:
+        """Stream `url` to `dest` chunk by chunk (no full-body buffering).
+
+        The body goes to a temporary file next to `dest` that is moved into
+        place once complete, so an interrupted download never leaves a
+        truncated image at `dest`.
+        """
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            async with self.client.stream("GET", url) as resp:
+                if is_transient_error(resp.status_code):
+                    raise ImageThrottledError(f"download {resp.status_code}")
+                resp.raise_for_status()
+                with open(tmp, "wb") as f:
+                    async for chunk in resp.aiter_bytes(64 * 1024):
+                        f.write(chunk)
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+
+class DashScopeImageProvider(ImageProvider):
+    """DashScope text-to-image via the async task protocol.
+
+    POST .../services/aigc/text2image/image-synthesis with
+    `X-DashScope-Async: enable` returns a task id; GET .../tasks/{id} is
+    polled until SUCCEEDED, then the result URL is streamed to disk.
+
+    Env:
+      - DASHSCOPE_BASE_URL (default: https://dashscope.aliyuncs.com/api/v1)
+      - DASHSCOPE_IMAGE_MODEL (default: qwen-image-plus)
+      - IMAGE_POLL_INTERVAL (default: 2 seconds)
+      - IMAGE_TASK_TIMEOUT (default: 300 seconds)
+    """
+
+    name = "dashscope"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: Optional[str] = None,
+        base_url: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        poll_interval: Optional[float] = None,
+        task_timeout: Optional[float] = None,
+    ):
+        super().__init__(client)
+        self.api_key = api_key
+        self.model = model or os.getenv("DASHSCOPE_IMAGE_MODEL", "qwen-image-plus")
+        self.base_url = (base_url or os.getenv("DASHSCOPE_BASE_URL") or "https://dashscope.aliyuncs.com/api/v1").rstrip("/")
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv("IMAGE_POLL_INTERVAL") or 2)
+        self.task_timeout = task_timeout if task_timeout is not None else float(os.getenv("IMAGE_TASK_TIMEOUT") or 300)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    @staticmethod
+    def _check(resp: httpx.Response) -> Dict[str, Any]:
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code != 200:
+            code, message = data.get("code", ""), data.get("message", resp.text[:200])
+            if is_transient_error(resp.status_code, code):
+                raise ImageThrottledError(f"{resp.status_code} {code} {message}")
+            raise ImageProviderError(f"{resp.status_code} {code} {message}")
+        return data
+
+    async def submit(self, prompt: str, size: str) -> str:
+        resp = await self.client.post(
+            f"{self.base_url}/services/aigc/text2image/image-synthesis",
+            headers={**self._headers(), "X-DashScope-Async": "enable"},
+            json={"model": self.model, "input": {"prompt": prompt}, "parameters": {"size": size, "n": 1}},
+        )
+        task_id = (self._check(resp).get("output") or {}).get("task_id")
+        if not task_id:
+            raise ImageProviderError("submit returned no task_id")
+        return task_id
+
+    async def wait(self, task_id: str) -> Optional[str]:
+        """Poll the task until it finishes; return the first result URL."""
+        deadline = time.monotonic() + self.task_timeout
+        while True:
+            resp = await self.client.get(f"{self.base_url}/tasks/{task_id}", headers=self._headers())
+            output = self._check(resp).get("output") or {}
+            status = output.get("task_status")
+            if status == "SUCCEEDED":
+                results = output.get("results") or []
+                return results[0].get("url") if results else None
+            if status in ("FAILED", "CANCELED", "UNKNOWN"):
+                code = output.get("code", "")
+                if str(code).startswith("Throttling"):
+                    raise ImageThrottledError(f"task {task_id} {code}")
+                raise ImageProviderError(f"task {task_id} {status} {code} {output.get('message', '')}")
+            if time.monotonic() > deadline:
+                raise ImageProviderError(f"task {task_id} timed out after {self.task_timeout:.0f}s")
+            await asyncio.sleep(self.poll_interval)
+
+    async def generate(self, prompt: str, size: str, dest: Path) -> bool:
+        url = await self.wait(await self.submit(prompt, size))
+        if not url:
+            return False
+        await self.download(url, dest)
+        return True
@@ -1,18 +1,21 @@
 """
 Module 3.5: HTML渲染器 (Renderer)
-负责 Jinja2 模板渲染和静态资源管理。纯IO操作，不含API调用。
+负责 Jinja2 模板渲染。纯IO操作，不含API调用。
 """
 import os
-import shutil
+from dataclasses import asdict
 from pathlib import Path
 from typing import List, Dict, Any, Optional
-from jinja2 import Environment, FileSystemLoader
 
-from ...common.schemas import SlideDeckContent, StyleConfig, TeachingRequest
+from markupsafe import Markup
+
+from ...common.schemas import SlideDeckContent, SlidePage, StyleConfig, TeachingRequest
 from ...common.llm_client import LLMClient
-from .core import RenderResult, extract_bullets
-from .config import TEMPLATE_DIR, SRC_STATIC_DIR, SRC_STYLES_DIR
-from .engine import LayoutEngine
+from .core import ImageSlotRequest, RenderResult, extract_bullets
+from .assets import asset_base_url
+from .engine import LayoutEngine, LayoutProposal
+from .fragments import fragment_key, get_fragment_cache, page_key, style_key
+from .templating import render_deck, render_slide_fragment
 
 class HTMLRenderer:
     """
@@ -28,68 +31,100 @@ class HTMLRenderer:
         output_dir: str,
         llm: Optional[LLMClient] = None,
         template_id: str = "business",
+        previous: Optional[RenderResult] = None,
     ) -> RenderResult:
-        """渲染主入口"""
-        
-        # 1. 准备 Jinja2
-        # SECURITY: Enable autoescape to prevent XSS/SSTI
-        env = Environment(
-            loader=FileSystemLoader(str(TEMPLATE_DIR)),
-            autoescape=True
+        """渲染主入口
+
+        增量渲染：布局候选与 HTML 片段按内容哈希缓存（进程内 LRU，另外记录在
+        RenderResult.metadata["pages"] 中，重启后也能复用上次会话的布局决策）。
+        只有内容改变的页面重新调用布局 LLM；“不与前一页重复”约束仍对整套课件顺序执行，
+        布局因此改变的相邻页会得到新的片段，其余页面直接复用缓存片段。
+        """
+        cache = get_fragment_cache()
+        subject = HTMLRenderer._subject(teaching_request)
+        pages = deck_content.pages
+        page_keys = [page_key(page, template_id, subject) for page in pages]
+        known = {
+            entry["key"]: LayoutProposal(**entry["proposal"])
+            for entry in ((previous.metadata.get("pages") if previous else None) or [])
+            if isinstance(entry, dict) and entry.get("key") and entry.get("proposal")
+            and not entry["proposal"].get("degraded")
+        }
+
+        # 1. 布局候选：命中缓存的页面跳过 LLM，其余页面批量/并行获取
+        proposals: List[Optional[LayoutProposal]] = []
+        for key in page_keys:
+            proposals.append(cache.get(f"proposal:{key}") or known.get(key))
+        missing = [i for i, p in enumerate(proposals) if p is None]
+        fresh = await LayoutEngine.propose_layouts(
+            [pages[i] for i in missing], teaching_request, llm, template_id
         )
-        
-        slides_data = []
+        for i, proposal in zip(missing, fresh):
+            proposals[i] = proposal
+        for key, proposal in zip(page_keys, proposals):
+            if not proposal.degraded:
+                cache.put(f"proposal:{key}", proposal)
+
+        # 2. 顺序阶段：去重约束与插槽生成（纯本地计算）
+        skey = style_key(style_config, template_id)
+        css_variables = cache.get(f"css:{skey}")
+        if css_variables is None:
+            # 3. 生成 CSS 变量
+            css_variables = HTMLRenderer._generate_css_variables(style_config, template_id)
+            cache.put(f"css:{skey}", css_variables)
+
+        fragments: List[Markup] = []
+        page_entries: List[Dict[str, Any]] = []
+        rerendered: List[int] = []
         all_image_slots = []
         layouts_used: Dict[str, int] = {}
         warnings = []
-        
-        # 2. 处理每一页 (Layout Decision)
         previous_layout = None
-        for page in deck_content.pages:
-            # 调用 Engine 决定布局
-            layout_id, image_slots = await LayoutEngine.resolve_layout(
-                page, teaching_request, page.index, previous_layout, llm, template_id
-            )
+        for page, key, proposal in zip(pages, page_keys, proposals):
+            layout_id, image_slots = LayoutEngine.finalize_layout(page, proposal, page.index, previous_layout)
             previous_layout = layout_id
-            
             layouts_used[layout_id] = layouts_used.get(layout_id, 0) + 1
             all_image_slots.extend(image_slots)
-            
-            # 提取要点
-            bullets = extract_bullets(page)
-            
-            # 动态样式变量
-            dynamic_vars = HTMLRenderer._calculate_dynamic_layout_vars(
-                len(page.title) + sum(len(b) for b in bullets), 
-                layout_id
-            )
-            
-            slides_data.append({
+
+            fkey = fragment_key(key, layout_id, skey, template_id)
+            fragment = cache.get(f"fragment:{fkey}")
+            if fragment is None:
+                fragment = HTMLRenderer.render_slide(page, layout_id, image_slots)
+                cache.put(f"fragment:{fkey}", fragment)
+                rerendered.append(page.index)
+            fragments.append(Markup(fragment))
+            page_entries.append({
+                "key": key,
+                "proposal": asdict(proposal),
                 "layout_id": layout_id,
-                "slide_type": page.slide_type,
-                "title": page.title,
-                "bullets": bullets,
-                "image_slots": image_slots,
-                "dynamic_style": dynamic_vars,
+                "fragment_key": fkey,
             })
-            
-        # 3. 生成 CSS 变量
-        css_variables = HTMLRenderer._generate_css_variables(style_config, template_id)
-        
-        # 4. 渲染 HTML
-        template = env.get_template("base.html")
-        html_content = template.render(
+
+        # 4. 拼接 HTML（共享的已编译模板环境）
+        html_content = render_deck(
             deck_title=deck_content.deck_title,
-            slides=slides_data,
+            slide_fragments=fragments,
             theme_name=template_id,
             css_variables=css_variables,
             poll_script=HTMLRenderer._generate_polling_script(session_id, len(all_image_slots)),
+            asset_base=asset_base_url(),
         )
-        
-        # 5. 复制资源 (Assets)
-        HTMLRenderer._copy_assets(output_dir)
-        
-        # 6. 保存文件
+
+        # 片段未变的页面，已生成的图片继续沿用
+        image_results = []
+        if previous:
+            previous_fragments = {
+                entry.get("fragment_key") for entry in (previous.metadata.get("pages") or [])
+                if isinstance(entry, dict)
+            }
+            unchanged_pages = {
+                page.index for page, entry in zip(pages, page_entries)
+                if entry["fragment_key"] in previous_fragments
+            }
+            kept_slots = {slot.slot_id for slot in all_image_slots if slot.page_index in unchanged_pages}
+            image_results = [r for r in previous.image_results if r.slot_id in kept_slots]
+
+        # 5. 保存文件（静态资源由共享的 /assets 挂载提供，不再复制到会话目录）
         out_path = Path(output_dir) / "index.html"
         out_path.parent.mkdir(parents=True, exist_ok=True)
         with open(out_path, "w", encoding="utf-8") as f:
@@ -100,9 +135,12 @@ class HTMLRenderer:
             html_path=f"outputs/{session_id}/index.html",
             html_content=html_content,
             image_slots=all_image_slots,
+            image_results=image_results,
             metadata={
                 "total_pages": len(deck_content.pages),
-                "layouts_used": layouts_used
+                "layouts_used": layouts_used,
+                "pages": page_entries,
+                "rerendered_pages": rerendered,
             },
             warnings=warnings,
             total_pages=len(deck_content.pages),
@@ -110,25 +148,51 @@ class HTMLRenderer:
         )
 
     @staticmethod
-    def _copy_assets(output_dir: str):
-        try:
-            # 定义忽略函数，跳过 node_modules 和其他不必要的目录
-            def ignore_patterns(directory, files):
-                ignored = []
-                for f in files:
-                    if f in ('node_modules', '.git', '.github', 'test', 'examples'):
-                        ignored.append(f)
-                return ignored
-            
-            target_static = Path(output_dir) / "static"
-            if target_static.exists(): shutil.rmtree(target_static)
-            if SRC_STATIC_DIR.exists(): shutil.copytree(SRC_STATIC_DIR, target_static, ignore=ignore_patterns)
-            
-            target_styles = Path(output_dir) / "styles"
-            if target_styles.exists(): shutil.rmtree(target_styles)
-            if SRC_STYLES_DIR.exists(): shutil.copytree(SRC_STYLES_DIR, target_styles)
-        except Exception as e:
-            print(f"[Render] ⚠️ Failed to copy assets: {e}")
+    def _subject(teaching_request: TeachingRequest) -> str:
+        return teaching_request.subject_info.subject_name if teaching_request.subject_info else ""
+
+    @staticmethod
+    async def prefetch_layout(
+        page: SlidePage,
+        teaching_request: TeachingRequest,
+        llm: Optional[LLMClient] = None,
+        template_id: str = "business",
+    ) -> LayoutProposal:
+        """单页布局候选提前写入缓存（流水线模式下页面一生成就调用），之后整套渲染直接命中"""
+        cache = get_fragment_cache()
+        key = f"proposal:{page_key(page, template_id, HTMLRenderer._subject(teaching_request))}"
+        proposal = cache.get(key)
+        if proposal is None:
+            proposal = await LayoutEngine.propose_layout(page, teaching_request, page.index, llm, template_id)
+            if not proposal.degraded:
+                cache.put(key, proposal)
+        return proposal
+
+    @staticmethod
+    def _slide_data(page: SlidePage, layout_id: str, image_slots: List[ImageSlotRequest]) -> Dict[str, Any]:
+        """单页模板上下文"""
+        # 提取要点
+        bullets = extract_bullets(page)
+
+        # 动态样式变量
+        dynamic_vars = HTMLRenderer._calculate_dynamic_layout_vars(
+            len(page.title) + sum(len(b) for b in bullets),
+            layout_id
+        )
+
+        return {
+            "layout_id": layout_id,
+            "slide_type": page.slide_type,
+            "title": page.title,
+            "bullets": bullets,
+            "image_slots": image_slots,
+            "dynamic_style": dynamic_vars,
+        }
+
+    @staticmethod
+    def render_slide(page: SlidePage, layout_id: str, image_slots: List[ImageSlotRequest]) -> str:
+        """只渲染一页（已确定布局）的 HTML 片段，用于单页修改后的局部更新"""
+        return render_slide_fragment(HTMLRenderer._slide_data(page, layout_id, image_slots))
 
     @staticmethod
     def _calculate_dynamic_layout_vars(text_len: int, layout_id: str) -> str:
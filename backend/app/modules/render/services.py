@@ -4,12 +4,15 @@ Module 3.5: 图片生成服务 (Services)
 """
 import os
 import asyncio
-import hashlib
 import logging
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
 from http import HTTPStatus
 
 import requests
@@ -20,16 +23,88 @@ from ...common.schemas import TeachingRequest, StyleConfig
 
 # Imports from local core
 from .core import ImageSlotRequest, ImageSlotResult, AspectRatio, ImageStyle
+from .image_store import get_image_store
+from .providers import DashScopeImageProvider, ImageProvider, ImageThrottledError, is_transient_error
 
 logger = logging.getLogger(__name__)
 
+SlotResultCallback = Callable[[ImageSlotResult], None]
+
+
+# ============================================================================
+# Concurrency limits & retry
+# ============================================================================
+# 各提供方的并发上限在进程内所有 ImageService 实例间共享（多个会话同时生成时总量不超限）
+#   IMAGE_MAX_WORKERS                单次批量生成的并发插槽数 (default: 4)
+#   IMAGE_PROVIDER_CONCURRENCY       每个提供方同时在途的 API 调用数 (default: 4)
+#   IMAGE_PROVIDER_CONCURRENCY_<NAME> 覆盖单个提供方，如 IMAGE_PROVIDER_CONCURRENCY_DASHSCOPE=2
+#   IMAGE_MAX_RETRIES                限流/5xx 时的重试次数 (default: 4)
+#   IMAGE_RETRY_BASE_SECONDS         退避基数，第 n 次等待 base*2^n 秒内随机 (default: 2)
+
+_provider_lock = threading.Lock()
+_provider_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+# asyncio.Semaphore 绑定事件循环，按 (提供方, 循环) 分别创建
+_async_provider_semaphores: Dict[tuple, asyncio.Semaphore] = {}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+
+def provider_limit(provider: str) -> int:
+    return max(1, _env_int(f"IMAGE_PROVIDER_CONCURRENCY_{provider.upper()}",
+                           _env_int("IMAGE_PROVIDER_CONCURRENCY", 4)))
+
+
+@contextmanager
+def provider_slot(provider: str) -> Iterator[None]:
+    """占用一个提供方并发名额"""
+    with _provider_lock:
+        sem = _provider_semaphores.get(provider)
+        if sem is None:
+            sem = _provider_semaphores[provider] = threading.BoundedSemaphore(provider_limit(provider))
+    with sem:
+        yield
+
+
+@asynccontextmanager
+async def async_provider_slot(provider: str) -> AsyncIterator[None]:
+    """provider_slot 的异步版本，等待名额时不阻塞事件循环"""
+    key = (provider, id(asyncio.get_running_loop()))
+    with _provider_lock:
+        sem = _async_provider_semaphores.get(key)
+        if sem is None:
+            sem = _async_provider_semaphores[key] = asyncio.Semaphore(provider_limit(provider))
+    async with sem:
+        yield
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """带抖动的指数退避（equal jitter）：[d/2, d]，d = min(cap, base * 2^attempt)"""
+    d = min(cap, base * (2 ** attempt))
+    return d / 2 + random.uniform(0, d / 2)
+
+
+def _notify(callback: Optional[SlotResultCallback], result: ImageSlotResult) -> None:
+    if callback is None:
+        return
+    try:
+        callback(result)
+    except Exception:
+        logger.exception(f"on_result callback failed for slot {result.slot_id}")
+
+
 class ImageService:
     """
     图片生成服务
     职责：
     1. 综合上下文组装提示词
     2. 调用百炼 API (qwen-image-plus)
-    3. 管理 MD5 缓存
+    3. 管理全局图片缓存 (ImageStore)
+    4. 有界并发批量生成（按优先级/页码调度，限流时退避重试）
     """
 
     SUBJECT_STYLE_MAP = {
@@ -102,10 +177,24 @@ class ImageService:
         },
     }
 
-    def __init__(self, api_key: str, cache_dir: str = "outputs/images_cache"):
+    PROVIDER = "dashscope"
+
+    def __init__(
+        self,
+        api_key: str,
+        cache_dir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        provider: Optional[ImageProvider] = None,
+    ):
+        """cache_dir 为全局图片存储的根目录，默认 IMAGE_STORE_DIR（所有会话共用）；
+        provider 为异步路径使用的提供方，默认 DashScope 异步任务接口"""
         self.api_key = api_key
-        self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.provider = provider or DashScopeImageProvider(api_key)
+        self.max_workers = max(1, max_workers or _env_int("IMAGE_MAX_WORKERS", 4))
+        self.max_retries = max(0, _env_int("IMAGE_MAX_RETRIES", 4))
+        self.retry_base_seconds = float(os.getenv("IMAGE_RETRY_BASE_SECONDS") or 2)
+        self.store = get_image_store(cache_dir)
+        self.cache_dir = self.store.root
         logger.info(f"ImageService initialized with cache_dir: {self.cache_dir}")
 
     def build_prompt(
@@ -194,177 +283,273 @@ class ImageService:
         else:
             return "1024*1024"
 
+    def _call_provider(self, prompt: str, size: str) -> Optional[bytes]:
+        """调用 DashScope 并下载结果；限流/服务端错误抛出 ImageThrottledError 以便重试"""
+        response = ImageSynthesis.call(
+            api_key=self.api_key,
+            model=os.getenv("DASHSCOPE_IMAGE_MODEL", "qwen-image-plus"),
+            prompt=prompt,
+            n=1,
+            size=size,
+        )
+
+        if response.status_code != HTTPStatus.OK:
+            if is_transient_error(response.status_code, getattr(response, "code", "")):
+                raise ImageThrottledError(f"{response.status_code} {response.code} {response.message}")
+            logger.error(f"[IMG_GEN_ERROR] API error: {response.code} {response.message}")
+            return None
+
+        if not (response.output and response.output.results):
+            return None
+        image_url = response.output.results[0].url
+        if not image_url:
+            return None
+
+        img_response = requests.get(image_url, timeout=60)
+        if is_transient_error(img_response.status_code):
+            raise ImageThrottledError(f"download {img_response.status_code}")
+        img_response.raise_for_status()
+        return img_response.content
+
+    def _request_params(self, slot_data: Optional[Dict]) -> tuple:
+        """(aspect_ratio, size, model)"""
+        aspect_ratio = "4:3"
+        if slot_data and "aspect_ratio" in slot_data:
+            ar = slot_data["aspect_ratio"]
+            if hasattr(ar, "value"):
+                aspect_ratio = ar.value
+            else:
+                aspect_ratio = str(ar)
+        size = self._map_ratio_to_size(aspect_ratio)
+        return aspect_ratio, size, os.getenv("DASHSCOPE_IMAGE_MODEL", "qwen-image-plus")
+
     def generate_image(self, prompt: str, slot_id: str, slot_data: Dict = None) -> Optional[str]:
-        """同步生成单张图片"""
+        """同步生成单张图片（全局缓存优先；限流时按抖动指数退避重试）
+
+        供线程池 / worker 进程使用；事件循环中请使用 agenerate_image。
+        """
         logger.info(f"[IMG_GEN_START] slot={slot_id}, api_key={'SET' if self.api_key else 'MISSING'}")
-        
+
+        aspect_ratio, size, model = self._request_params(slot_data)
+
+        # 1. 全局缓存检查（所有会话共享，按 模型+尺寸+提示词 寻址）
+        cached = self.store.get(prompt, model, size)
+        if cached:
+            logger.info(f"[CACHE HIT] Image for slot {slot_id} at {cached}")
+            return cached
+
         if not self.api_key:
             logger.error(f"[IMG_GEN_FATAL] No API key configured for slot {slot_id}")
             return None
-        
-        # 1. MD5缓存检查
-        prompt_hash = hashlib.md5(prompt.encode("utf-8")).hexdigest()
-        cache_path = self.cache_dir / f"{prompt_hash}.png"
-        
-        if cache_path.exists():
-            logger.info(f"[CACHE HIT] Image for slot {slot_id} at {cache_path}")
-            return str(cache_path)
-
-        # 2. 调用API
-        logger.info(f"[CACHE MISS] Generating image for slot {slot_id}")
-        
+
         try:
-            aspect_ratio = "4:3"
-            if slot_data and "aspect_ratio" in slot_data:
-                ar = slot_data["aspect_ratio"]
-                if hasattr(ar, "value"):
-                    aspect_ratio = ar.value
-                else:
-                    aspect_ratio = str(ar)
-            
-            size = self._map_ratio_to_size(aspect_ratio)
-            logger.info(f"[IMG_GEN] Calling DashScope: size={size}, ratio={aspect_ratio}")
-            
-            response = ImageSynthesis.call(
-                api_key=self.api_key,
-                model=os.getenv("DASHSCOPE_IMAGE_MODEL", "qwen-image-plus"),
-                prompt=prompt,
-                n=1,
-                size=size,
-            )
-
-            if response.status_code == HTTPStatus.OK:
-                if response.output and response.output.results:
-                    image_url = response.output.results[0].url
-                    
-                    if not image_url:
-                        return None
-
-                    # 3. 下载图片
-                    img_response = requests.get(image_url, timeout=60)
-                    img_response.raise_for_status()
-                    
-                    # 4. 保存到缓存
-                    with open(cache_path, "wb") as f:
-                        f.write(img_response.content)
-
-                    logger.info(f"[IMG_GEN_SUCCESS] Image saved to {cache_path}")
-                    return str(cache_path)
-            else:
-                logger.error(f"[IMG_GEN_ERROR] API error: {response.code} {response.message}")
+            # 相同请求同时到达时只调用一次 API，其余等待后命中缓存
+            with self.store.singleflight(prompt, model, size):
+                cached = self.store.get(prompt, model, size)
+                if cached:
+                    logger.info(f"[CACHE HIT] Image for slot {slot_id} at {cached} (after wait)")
+                    return cached
+
+                # 2. 调用API
+                logger.info(f"[CACHE MISS] Generating image for slot {slot_id}")
+                logger.info(f"[IMG_GEN] Calling DashScope: size={size}, ratio={aspect_ratio}")
+
+                content = None
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        # 同一提供方的并发调用数在所有 ImageService 实例间共享上限
+                        with provider_slot(self.PROVIDER):
+                            content = self._call_provider(prompt, size)
+                        break
+                    except ImageThrottledError as e:
+                        if attempt >= self.max_retries:
+                            logger.error(f"[IMG_GEN_ERROR] slot={slot_id} still throttled after {attempt + 1} attempts: {e}")
+                            return None
+                        delay = backoff_delay(attempt, self.retry_base_seconds)
+                        logger.warning(f"[IMG_GEN_RETRY] slot={slot_id} attempt={attempt + 1} ({e}), sleeping {delay:.1f}s")
+                        time.sleep(delay)
+
+                if content:
+                    # 3. 写入全局存储
+                    path = self.store.put(prompt, model, size, content)
+                    logger.info(f"[IMG_GEN_SUCCESS] Image saved to {path}")
+                    return path
+
+        except Exception as e:
+            logger.exception(f"[IMG_GEN_FATAL] Error for slot {slot_id}: {e}")
+
+        return None
+
+    async def agenerate_image(self, prompt: str, slot_id: str, slot_data: Dict = None) -> Optional[str]:
+        """异步生成单张图片：经 self.provider（httpx 连接池）提交任务、轮询并流式下载到全局存储"""
+        logger.info(f"[IMG_GEN_START] slot={slot_id}, api_key={'SET' if self.api_key else 'MISSING'} (async)")
 
+        aspect_ratio, size, model = self._request_params(slot_data)
+
+        cached = self.store.get(prompt, model, size)
+        if cached:
+            logger.info(f"[CACHE HIT] Image for slot {slot_id} at {cached}")
+            return cached
+
+        if not self.api_key:
+            logger.error(f"[IMG_GEN_FATAL] No API key configured for slot {slot_id}")
+            return None
+
+        try:
+            async with self.store.asingleflight(prompt, model, size):
+                cached = self.store.get(prompt, model, size)
+                if cached:
+                    logger.info(f"[CACHE HIT] Image for slot {slot_id} at {cached} (after wait)")
+                    return cached
+
+                logger.info(f"[CACHE MISS] Generating image for slot {slot_id}")
+                logger.info(f"[IMG_GEN] Calling {self.provider.name}: size={size}, ratio={aspect_ratio}")
+
+                for attempt in range(self.max_retries + 1):
+                    staging = self.store.staging_path()
+                    try:
+                        async with async_provider_slot(self.provider.name):
+                            ok = await self.provider.generate(prompt, size, staging)
+                        if not ok:
+                            return None
+                        path = self.store.put_file(prompt, model, size, staging)
+                        logger.info(f"[IMG_GEN_SUCCESS] Image saved to {path}")
+                        return path
+                    except ImageThrottledError as e:
+                        if attempt >= self.max_retries:
+                            logger.error(f"[IMG_GEN_ERROR] slot={slot_id} still throttled after {attempt + 1} attempts: {e}")
+                            return None
+                        delay = backoff_delay(attempt, self.retry_base_seconds)
+                        logger.warning(f"[IMG_GEN_RETRY] slot={slot_id} attempt={attempt + 1} ({e}), sleeping {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                    finally:
+                        if staging.exists():
+                            staging.unlink()
         except Exception as e:
             logger.exception(f"[IMG_GEN_FATAL] Error for slot {slot_id}: {e}")
 
         return None
 
+    def _slot_request(self, slot, teaching_request, style_config) -> tuple:
+        """(空结果, prompt, slot_data)"""
+        result = ImageSlotResult(
+            slot_id=slot.slot_id,
+            page_index=slot.page_index,
+            status="generating",
+            prompt="",
+        )
+        # 生成prompt
+        result.prompt = self.build_prompt(slot, teaching_request, style_config)
+        # 准备 slot_data
+        slot_data = slot.model_dump() if hasattr(slot, "model_dump") else slot.__dict__
+        return result, result.prompt, slot_data
+
+    @staticmethod
+    def _finish(result: ImageSlotResult, image_path: Optional[str], start_time: float) -> ImageSlotResult:
+        if image_path:
+            result.status = "done"
+            result.image_path = image_path
+            result.generated_at = datetime.utcnow()
+            result.generation_time_seconds = time.time() - start_time
+            result.cache_hit = False
+        else:
+            result.status = "failed"
+            result.error = "Image generation failed"
+        return result
+
+    @staticmethod
+    def _failed(slot: ImageSlotRequest, error: Exception) -> ImageSlotResult:
+        logger.exception(f"Failed to generate slot {slot.slot_id}")
+        return ImageSlotResult(slot_id=slot.slot_id, page_index=slot.page_index, status="failed", error=str(error))
+
+    def generate_slot(
+        self,
+        slot: ImageSlotRequest,
+        teaching_request: TeachingRequest,
+        style_config: StyleConfig,
+    ) -> ImageSlotResult:
+        """生成单个插槽（同步，不抛异常）"""
+        start_time = time.time()
+        try:
+            result, prompt, slot_data = self._slot_request(slot, teaching_request, style_config)
+            image_path = self.generate_image(prompt=prompt, slot_id=slot.slot_id, slot_data=slot_data)
+            return self._finish(result, image_path, start_time)
+        except Exception as e:
+            return self._failed(slot, e)
+
+    async def agenerate_slot(
+        self,
+        slot: ImageSlotRequest,
+        teaching_request: TeachingRequest,
+        style_config: StyleConfig,
+    ) -> ImageSlotResult:
+        """生成单个插槽（异步，不抛异常）"""
+        start_time = time.time()
+        try:
+            result, prompt, slot_data = self._slot_request(slot, teaching_request, style_config)
+            image_path = await self.agenerate_image(prompt=prompt, slot_id=slot.slot_id, slot_data=slot_data)
+            return self._finish(result, image_path, start_time)
+        except Exception as e:
+            return self._failed(slot, e)
+
+    @staticmethod
+    def schedule_order(slots: List[ImageSlotRequest]) -> List[ImageSlotRequest]:
+        """调度顺序：priority 数值小的先生成（1 为主图），同优先级按页码"""
+        return sorted(slots, key=lambda s: (s.priority, s.page_index))
+
     async def generate_for_slots(
         self,
         slots: List[ImageSlotRequest],
         teaching_request: TeachingRequest,
         style_config: StyleConfig,
+        on_result: Optional[SlotResultCallback] = None,
+        max_workers: Optional[int] = None,
     ) -> List[ImageSlotResult]:
-        """批量生成图片 (Async)"""
-        results = []
-        for slot in slots:
-            start_time = time.time()
-            result = ImageSlotResult(
-                slot_id=slot.slot_id,
-                page_index=slot.page_index,
-                status="generating",
-                prompt="",
-            )
-
-            try:
-                # 生成prompt
-                prompt = self.build_prompt(slot, teaching_request, style_config)
-                result.prompt = prompt
-
-                # 准备 slot_data
-                slot_data = slot.model_dump() if hasattr(slot, "model_dump") else slot.__dict__
-                
-                # 在线程池中执行同步生成
-                image_path = await asyncio.to_thread(
-                    self.generate_image, 
-                    prompt=prompt, 
-                    slot_id=slot.slot_id,
-                    slot_data=slot_data
-                )
-
-                if image_path:
-                    result.status = "done"
-                    result.image_path = image_path
-                    result.generated_at = datetime.utcnow()
-                    result.generation_time_seconds = time.time() - start_time
-                    result.cache_hit = False
-                else:
-                    result.status = "failed"
-                    result.error = "Image generation failed"
-
-            except Exception as e:
-                result.status = "failed"
-                result.error = str(e)
-                logger.exception(f"Failed to generate slot {slot.slot_id}")
-
-            results.append(result)
-        return results
+        """批量生成图片 (Async)
+
+        最多 max_workers 个插槽同时生成；每完成一个立即回调 on_result。
+        返回值与 slots 顺序一致。
+        """
+        sem = asyncio.Semaphore(max_workers or self.max_workers)
+        results: Dict[str, ImageSlotResult] = {}
+
+        async def run(slot: ImageSlotRequest) -> None:
+            async with sem:
+                result = await self.agenerate_slot(slot, teaching_request, style_config)
+            results[slot.slot_id] = result
+            _notify(on_result, result)
+
+        # 按调度顺序创建任务；Semaphore 按等待顺序唤醒，因此高优先级先拿到名额
+        await asyncio.gather(*(run(slot) for slot in self.schedule_order(slots)))
+        return [results[slot.slot_id] for slot in slots]
 
     def generate_for_slots_sync(
         self,
         slots: List[ImageSlotRequest],
         teaching_request: TeachingRequest,
         style_config: StyleConfig,
+        on_result: Optional[SlotResultCallback] = None,
+        max_workers: Optional[int] = None,
     ) -> List[ImageSlotResult]:
-        """批量生成图片 (Sync version for background tasks)"""
-        results = []
-        for slot in slots:
-            start_time = time.time()
-            result = ImageSlotResult(
-                slot_id=slot.slot_id,
-                page_index=slot.page_index,
-                status="generating",
-                prompt="",
-            )
-
-            try:
-                # 生成prompt
-                prompt = self.build_prompt(slot, teaching_request, style_config)
-                result.prompt = prompt
-
-                # 准备 slot_data
-                slot_data = slot.model_dump() if hasattr(slot, "model_dump") else slot.__dict__
-                
-                # 直接同步执行
-                image_path = self.generate_image(
-                    prompt=prompt, 
-                    slot_id=slot.slot_id,
-                    slot_data=slot_data
-                )
-
-                if image_path:
-                    result.status = "done"
-                    result.image_path = image_path
-                    result.generated_at = datetime.utcnow()
-                    result.generation_time_seconds = time.time() - start_time
-                    result.cache_hit = False
-                else:
-                    result.status = "failed"
-                    result.error = "Image generation failed"
-
-            except Exception as e:
-                result.status = "failed"
-                result.error = str(e)
-                logger.exception(f"Failed to generate slot {slot.slot_id}")
-
-            results.append(result)
-        return results
+        """批量生成图片 (Sync version for background tasks)
+
+        在有界线程池中并发执行，语义同 generate_for_slots。
+        """
+        if not slots:
+            return []
+        results: Dict[str, ImageSlotResult] = {}
+        workers = min(max_workers or self.max_workers, len(slots))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-gen") as pool:
+            futures = [
+                pool.submit(self.generate_slot, slot, teaching_request, style_config)
+                for slot in self.schedule_order(slots)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.slot_id] = result
+                _notify(on_result, result)
+        return [results[slot.slot_id] for slot in slots]
 
     def clear_cache(self, older_than_days: int = 7) -> int:
-        """清理过期缓存"""
-        cutoff = time.time() - (older_than_days * 24 * 60 * 60)
-        removed = 0
-        for cache_file in self.cache_dir.glob("*.png"):
-            if cache_file.stat().st_mtime < cutoff:
-                cache_file.unlink()
-                removed += 1
-        return removed
+        """清理超过 N 天未访问的缓存（基于索引，不扫描目录）"""
+        return self.store.evict_older_than(older_than_days * 24 * 60 * 60)
@@ -0,0 +1,79 @@
+"""
+Module 3.5: 模板环境 (Templating)
+进程级共享的 Jinja2 Environment：模板只解析编译一次，编译结果写入字节码缓存供重启后复用；
+支持单页片段渲染，修改一页时无需重新渲染整套课件。
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from .config import TEMPLATE_DIR
+
+DEFAULT_BYTECODE_DIR = Path(__file__).resolve().parents[3] / "data" / "cache" / "jinja"
+
+SLIDE_TEMPLATE = "slide.html"
+DECK_TEMPLATE = "base.html"
+
+_env: Optional[Environment] = None
+_env_lock = threading.Lock()
+
+
+def _build_environment() -> Environment:
+    """Env:
+      - RENDER_TEMPLATE_AUTO_RELOAD: "1" 开发时模板修改后自动重新加载 (default: 0)
+      - RENDER_TEMPLATE_CACHE_DIR: 字节码缓存目录，"" 关闭 (default: backend/data/cache/jinja)
+    """
+    cache_dir = os.getenv("RENDER_TEMPLATE_CACHE_DIR", str(DEFAULT_BYTECODE_DIR))
+    bytecode_cache = None
+    if cache_dir:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    return Environment(
+        loader=FileSystemLoader(str(TEMPLATE_DIR)),
+        # SECURITY: Enable autoescape to prevent XSS/SSTI
+        autoescape=True,
+        bytecode_cache=bytecode_cache,
+        # 生产环境不检查模板文件 mtime；缓存全部模板（数量固定且很少）
+        auto_reload=os.getenv("RENDER_TEMPLATE_AUTO_RELOAD") == "1",
+        cache_size=-1,
+    )
+
+
+def get_environment() -> Environment:
+    """进程级共享的模板环境（首次调用时创建）"""
+    global _env
+    if _env is None:
+        with _env_lock:
+            if _env is None:
+                _env = _build_environment()
+    return _env
+
+
+def reset_environment() -> None:
+    """丢弃共享环境（测试或修改配置后使用）"""
+    global _env
+    with _env_lock:
+        _env = None
+
+
+def precompile_templates() -> int:
+    """启动时编译全部模板，首个渲染请求不再承担解析开销。返回模板数量"""
+    env = get_environment()
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def render_deck(**context: Any) -> str:
+    return get_environment().get_template(DECK_TEMPLATE).render(**context)
+
+
+def render_slide_fragment(slide: Dict[str, Any]) -> str:
+    """只渲染一页的 <section>，与整套渲染中该页的输出相同"""
+    return get_environment().get_template(SLIDE_TEMPLATE).render(slide=slide)
@@ -0,0 +1,16 @@
+"""
+渲染测试的公共 fixture
+"""
+
+import pytest
+
+from app.modules.render import templating
+
+
+@pytest.fixture(autouse=True)
+def template_cache_dir(tmp_path, monkeypatch):
+    """模板字节码写到临时目录，不污染 backend/data/cache/jinja"""
+    monkeypatch.setenv("RENDER_TEMPLATE_CACHE_DIR", str(tmp_path / "jinja"))
+    templating.reset_environment()
+    yield tmp_path / "jinja"
+    templating.reset_environment()
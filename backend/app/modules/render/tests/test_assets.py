@@ -0,0 +1,65 @@
+"""
+测试共享静态资源：渲染只写 index.html，/assets 带长缓存头，离线 ZIP 才包含资源
+"""
+
+import io
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.common.schemas import SlideDeckContent, SlidePage, TeachingRequest
+from app.modules.intent.parser import autofill_defaults
+from app.modules.render.assets import (
+    ASSET_MOUNT, IMMUTABLE_CACHE_CONTROL, VersionedAssetFiles, asset_base_url, asset_version,
+)
+from app.modules.render.bundle import plan_offline_bundle
+from app.modules.render.renderer import HTMLRenderer
+from app.modules.style.core import choose_style
+
+
+@pytest.mark.asyncio
+async def test_render_writes_only_index_and_bundle_inlines_assets(tmp_path):
+    tr = autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    ))
+    deck = SlideDeckContent(deck_title="液压传动", pages=[SlidePage(index=0, slide_type="title", title="液压传动")])
+    out = tmp_path / "outputs" / "s1"
+
+    result = await HTMLRenderer.render(deck, choose_style(tr), tr, "s1", str(out))
+
+    assert [p.name for p in out.iterdir()] == ["index.html"]
+    assert f'href="{asset_base_url()}/static/reveal.js/' in result.html_content
+    (out / "images").mkdir()
+    (out / "images" / "slot.png").write_bytes(b"png")
+
+    plan = plan_offline_bundle(out)
+    with zipfile.ZipFile(io.BytesIO(b"".join(plan.iter_range()))) as zf:
+        names = set(zf.namelist())
+        html = zf.read("index.html").decode("utf-8")
+    assert "images/slot.png" in names
+    assert "styles/layouts/vocational.css" in names
+    assert any(n.startswith("static/reveal.js/") for n in names)
+    assert ASSET_MOUNT not in html and 'href="./static/reveal.js/' in html
+
+
+def test_asset_mount_serves_with_long_cache():
+    app = FastAPI()
+    app.mount(ASSET_MOUNT, VersionedAssetFiles())
+    client = TestClient(app)
+
+    resp = client.get(f"{ASSET_MOUNT}/{asset_version()}/styles/layouts/vocational.css")
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    # 旧版本号仍可访问，但不允许长缓存
+    resp = client.get(f"{ASSET_MOUNT}/000000000000/styles/layouts/vocational.css")
+    assert resp.status_code == 200 and resp.headers["cache-control"] == "no-cache"
+
+    # 只暴露 static/ 与 styles/，不暴露模块源码
+    assert client.get(f"{ASSET_MOUNT}/{asset_version()}/renderer.py").status_code == 404
+    assert client.get(f"{ASSET_MOUNT}/{asset_version()}/static/../renderer.py").status_code == 404
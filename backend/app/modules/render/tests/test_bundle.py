@@ -0,0 +1,94 @@
+"""
+测试流式离线包：ZIP 可被标准库解压、PNG 使用 STORED、Range/ETag 行为正确且不写临时文件
+"""
+
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.modules.render.bundle import ZIP_STORED, _FileCache, parse_range, plan_offline_bundle
+
+
+def make_output(tmp_path):
+    out = tmp_path / "outputs" / "s1"
+    (out / "images").mkdir(parents=True)
+    (out / "index.html").write_text('<link href="/assets/0123456789ab/static/fonts/fonts.css">', encoding="utf-8")
+    for i in range(3):
+        (out / "images" / f"page{i}_slot0.png").write_bytes(bytes(range(256)) * (i + 1) * 40)
+    return out
+
+
+def test_bundle_is_valid_zip_with_stored_images(tmp_path):
+    plan = plan_offline_bundle(make_output(tmp_path))
+    data = b"".join(plan.iter_range())
+    assert len(data) == plan.size
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        info = zf.getinfo("images/page2_slot0.png")
+        assert info.compress_type == ZIP_STORED
+        assert zf.read("images/page2_slot0.png") == bytes(range(256)) * 120
+        assert zf.read("index.html") == b'<link href="./static/fonts/fonts.css">'
+        assert "styles/layouts/vocational.css" in zf.namelist()
+
+    # 任意区间与完整内容一致；内容不变时 ETag 稳定
+    assert b"".join(plan.iter_range(1000, 5000)) == data[1000:5001]
+    assert plan_offline_bundle(tmp_path / "outputs" / "s1").etag == plan.etag
+
+
+def test_file_cache_is_bounded(tmp_path):
+    cache = _FileCache(max_entries=2, max_bytes=100)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"f{i}.css"
+        path.write_bytes(b"x" * (i + 1))
+        paths.append(path)
+        cache.put(path, path.stat(), f"v{i}", nbytes=40)
+    # 条目数上限：最久未用的 f0 被淘汰
+    assert len(cache) == 2 and cache.get(paths[0], paths[0].stat()) is None
+    assert cache.get(paths[2], paths[2].stat()) == "v2"
+
+    # 字节上限：写入 60 字节后只剩最近使用的条目；超过上限的单个值不缓存
+    cache.put(paths[0], paths[0].stat(), "big", nbytes=60)
+    assert len(cache) == 2 and cache.bytes == 100 and cache.get(paths[1], paths[1].stat()) is None
+    cache.put(paths[1], paths[1].stat(), "huge", nbytes=101)
+    assert cache.get(paths[1], paths[1].stat()) is None
+
+    # 文件变化后视为未命中，新版本替换旧版本
+    paths[2].write_bytes(b"changed")
+    assert cache.get(paths[2], paths[2].stat()) is None
+    cache.put(paths[2], paths[2].stat(), "v2b", nbytes=10)
+    assert len(cache) == 2 and cache.bytes == 70
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-", 100) == (10, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=0-1000", 100) == (0, 99)
+    for bad in ("bytes=200-", "items=0-1", "bytes=0-1,5-6"):
+        with pytest.raises(ValueError):
+            parse_range(bad, 100)
+
+
+def test_download_endpoint_supports_etag_and_range(tmp_path, monkeypatch):
+    import app.main as main
+
+    make_output(tmp_path)
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+    client = TestClient(main.app)
+
+    resp = client.get("/api/workflow/download/s1")
+    assert resp.status_code == 200
+    full, etag = resp.content, resp.headers["etag"]
+    assert zipfile.ZipFile(io.BytesIO(full)).testzip() is None
+    assert not (tmp_path / "temp").exists()
+
+    assert client.get("/api/workflow/download/s1", headers={"If-None-Match": etag}).status_code == 304
+
+    resp = client.get("/api/workflow/download/s1", headers={"Range": "bytes=100-199"})
+    assert resp.status_code == 206
+    assert resp.content == full[100:200]
+    assert resp.headers["content-range"] == f"bytes 100-199/{len(full)}"
@@ -0,0 +1,76 @@
+"""
+测试图片生成接口：默认（带会话缓存的）存储下，后台任务把生成结果写回会话；
+状态轮询接口合并会话中保存的结果与进行中的状态
+"""
+
+from fastapi.testclient import TestClient
+
+from app.common import WorkflowLogger
+from app.common.schemas import TeachingRequest
+from app.common.session_cache import CachedSessionStore
+from app.common.shared_store import create_render_status_store
+from app.common.store import create_session_store
+from app.modules.intent.parser import autofill_defaults
+from app.modules.render.core import ImageSlotRequest, RenderResult
+from app.modules.render.services import ImageService
+from app.modules.style.core import choose_style
+
+
+def test_generated_images_are_saved_with_cached_store(tmp_path, monkeypatch):
+    import app.main as main
+
+    store = create_session_store(str(tmp_path / "data"))
+    assert isinstance(store, CachedSessionStore)
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "logger", WorkflowLogger(str(tmp_path / "data")))
+    monkeypatch.setattr(main, "render_status", create_render_status_store(store))
+    monkeypatch.setattr(main, "image_queue", None)
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+    monkeypatch.setenv("IMAGE_STORE_DIR", str(tmp_path / "image_store"))
+    monkeypatch.setattr(ImageService, "_call_provider", lambda self, prompt, size: b"png")
+
+    tr = autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+    ))
+    state = store.create("img1")
+    state.teaching_request = tr
+    state.style_config = choose_style(tr)
+    state.render_result = RenderResult(
+        session_id="img1",
+        html_path="outputs/img1/index.html",
+        image_slots=[
+            ImageSlotRequest(
+                slot_id=f"s{i}", page_index=i, theme="液压泵",
+                context="白色背景上的液压泵剖面示意图，标注清晰，用于测试图片生成接口的结果回写",
+                layout_position="main", x=0, y=0, w=1, h=1,
+            )
+            for i in (1, 2)
+        ],
+    )
+    store.save(state)
+
+    # 缓存命中时 render_result 已是 RenderResult 对象而不是 dict
+    assert isinstance(store.load("img1").render_result, RenderResult)
+
+    client = TestClient(main.app)
+    status = client.get("/api/workflow/render/status/img1").json()
+    assert status["total"] == 2 and status["images"]["s1"]["status"] == "pending"
+
+    response = client.post("/api/workflow/render/generate/img1")
+    assert response.json()["ok"] is True
+
+    # TestClient 在返回响应后同步执行后台任务
+    results = store.load("img1").render_result.image_results
+    assert [(r.slot_id, r.status) for r in results] == [("s1", "done"), ("s2", "done")]
+    assert (tmp_path / "data" / "outputs" / "img1" / "images" / "s1.png").exists()
+
+    status = client.get("/api/workflow/render/status/img1").json()
+    assert (status["total"], status["done"], status["failed"]) == (2, 2, 0)
+
+    # 进行中的状态丢失（如服务重启）时仍能从会话读到已保存的结果
+    monkeypatch.setattr(main, "render_status", create_render_status_store(store))
+    status = client.get("/api/workflow/render/status/img1").json()
+    assert status["done"] == 2 and status["images"]["s2"]["image_path"]
@@ -0,0 +1,131 @@
+"""
+测试 ImageService 的有界并发批量生成（调度顺序、并发上限、限流重试）
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.modules.render.core import ImageSlotRequest
+from app.modules.render.providers import ImageProvider
+from app.modules.render.services import ImageService, ImageThrottledError, backoff_delay
+
+
+def make_slot(slot_id, page_index, priority=1):
+    return ImageSlotRequest(
+        slot_id=slot_id,
+        page_index=page_index,
+        theme=slot_id,
+        # context 足够长时 build_prompt 直接使用，不依赖教学需求/风格配置
+        context=f"插槽 {slot_id} 的完整图片描述：白色背景上的液压泵剖面示意图，标注清晰，用于测试并发调度与重试逻辑",
+        layout_position="main",
+        x=0, y=0, w=1, h=1,
+        priority=priority,
+    )
+
+
+class StubImageService(ImageService):
+    """用睡眠代替真实 API 调用，并记录调用顺序与最大并发"""
+
+    def __init__(self, cache_dir, throttle_times=0, **kwargs):
+        super().__init__(api_key="test", cache_dir=cache_dir, **kwargs)
+        self.retry_base_seconds = 0
+        self.throttle_times = throttle_times
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _call_provider(self, prompt, size):
+        with self._lock:
+            self.calls.append(prompt)
+            if len(self.calls) <= self.throttle_times:
+                raise ImageThrottledError("429 Throttling")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self._lock:
+            self.in_flight -= 1
+        return b"png"
+
+
+def test_sync_pool_is_bounded_and_ordered(tmp_path):
+    """并发数不超过 max_workers；先调度 priority 小的，同优先级按页码；返回顺序与输入一致"""
+    slots = [
+        make_slot("p3_b", 3, priority=2),
+        make_slot("p2_a", 2),
+        make_slot("p1_b", 1, priority=2),
+        make_slot("p1_a", 1),
+        make_slot("p4_a", 4),
+        make_slot("p5_a", 5),
+    ]
+    service = StubImageService(str(tmp_path), max_workers=2)
+    seen = []
+
+    results = service.generate_for_slots_sync(slots, None, None, on_result=lambda r: seen.append(r.slot_id))
+
+    assert [r.slot_id for r in results] == [s.slot_id for s in slots]
+    assert all(r.status == "done" for r in results)
+    assert sorted(seen) == sorted(s.slot_id for s in slots)
+    assert service.max_in_flight == 2
+    # 前两个启动的是优先级 1 中页码最小的两个
+    assert {service.calls[0], service.calls[1]} == {
+        service.build_prompt(slots[3], None, None),
+        service.build_prompt(slots[1], None, None),
+    }
+
+
+class StubProvider(ImageProvider):
+    """异步路径的替身提供方"""
+
+    name = "stub"
+
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, prompt, size, dest):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        dest.write_bytes(prompt.encode("utf-8"))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_async_pool_is_bounded(tmp_path):
+    """异步版本同样受 max_workers 限制，并对每个完成的插槽回调"""
+    slots = [make_slot(f"s{i}", i) for i in range(5)]
+    provider = StubProvider()
+    service = ImageService(api_key="test", cache_dir=str(tmp_path), max_workers=3, provider=provider)
+    seen = []
+
+    results = await service.generate_for_slots(slots, None, None, on_result=lambda r: seen.append(r.slot_id))
+
+    assert [r.status for r in results] == ["done"] * 5
+    assert len(seen) == 5
+    assert provider.max_in_flight == 3
+
+
+def test_throttled_calls_are_retried(tmp_path):
+    """限流错误按退避重试，重试耗尽前成功则返回图片"""
+    service = StubImageService(str(tmp_path), throttle_times=2)
+    path = service.generate_image("一张测试图片", "s1")
+    assert path is not None
+    assert len(service.calls) == 3
+
+    service = StubImageService(str(tmp_path / "b"), throttle_times=10)
+    service.max_retries = 1
+    assert service.generate_image("另一张测试图片", "s2") is None
+    assert len(service.calls) == 2
+
+
+def test_backoff_delay_has_jitter_and_cap():
+    for attempt in range(8):
+        d = backoff_delay(attempt, base=1.0, cap=10.0)
+        full = min(10.0, 2 ** attempt)
+        assert full / 2 <= d <= full
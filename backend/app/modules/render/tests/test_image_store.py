@@ -0,0 +1,72 @@
+"""
+测试全局图片存储（跨会话去重、并发合并请求、LRU 淘汰、硬链接到会话目录）
+"""
+
+import os
+import threading
+import time
+
+from app.modules.render.image_store import ImageStore, link_or_copy
+from app.modules.render.services import ImageService
+
+
+class CountingImageService(ImageService):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def _call_provider(self, prompt, size):
+        self.calls += 1
+        time.sleep(0.05)
+        return f"{prompt}-{size}".encode("utf-8")
+
+
+def test_same_prompt_costs_one_call_across_sessions(tmp_path):
+    """50 个会话同时请求同一张“液压系统示意图”，只调用一次 API"""
+    service = CountingImageService(api_key="test", cache_dir=str(tmp_path))
+    paths = []
+
+    def worker(i):
+        paths.append(service.generate_image("液压系统示意图", f"session{i}_slot"))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert service.calls == 1
+    assert len(set(paths)) == 1 and paths[0] is not None
+
+    # 不同尺寸是不同的请求
+    service.generate_image("液压系统示意图", "wide", slot_data={"aspect_ratio": "1:1"})
+    assert service.calls == 2
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    """超出容量时淘汰最久未访问的条目；内容相同的对象只存一份"""
+    store = ImageStore(tmp_path)
+    store.put("a", "m", "s", b"x" * 100)
+    time.sleep(0.01)
+    store.put("b", "m", "s", b"y" * 100)
+    store.put("b-dup", "m", "s", b"y" * 100)
+    time.sleep(0.01)
+    assert store.get("a", "m", "s")  # 刷新 a 的访问时间
+    assert store.stats()["objects"] == 2
+
+    assert store.evict(max_bytes=150) == 2
+    assert store.get("a", "m", "s") is not None
+    assert store.get("b", "m", "s") is None
+    assert store.stats() == {"entries": 1, "objects": 1, "bytes": 100}
+
+
+def test_session_link_survives_eviction(tmp_path):
+    """会话目录中的图片是硬链接/副本，缓存淘汰后仍可访问"""
+    store = ImageStore(tmp_path / "store")
+    src = store.put("p", "m", "s", b"png-bytes")
+    target = tmp_path / "outputs" / "s1" / "images" / "slot_a.png"
+    link_or_copy(src, target)
+
+    store.evict(max_entries=0, max_bytes=1)
+    assert not os.path.exists(src)
+    assert target.read_bytes() == b"png-bytes"
@@ -0,0 +1,48 @@
+"""
+测试图片 worker：从持久化队列领取任务、生成并发布结果
+"""
+
+from app.common.job_queue import JobQueue
+from app.common.shared_store import RenderStatusStore
+from app.modules.render.services import ImageService
+from app.modules.render.worker import ImageWorker, enqueue_image_slots, queued_slot_status
+from app.modules.render.tests.test_image_pool import make_slot
+
+
+class StubImageService(ImageService):
+    def _call_provider(self, prompt, size):
+        return b"png"
+
+
+class StubWorker(ImageWorker):
+    def __init__(self, *args, cache_dir, **kwargs):
+        self.cache_dir = cache_dir
+        super().__init__(*args, **kwargs)
+
+    def _service(self):
+        return StubImageService(api_key="test", cache_dir=self.cache_dir)
+
+
+def test_worker_drains_queue_and_publishes(tmp_path):
+    """入队的插槽由 worker 生成，复制为 slot_id.png 并写入状态；重复入队不会重复生成"""
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    service = StubImageService(api_key="test", cache_dir=str(tmp_path / "cache"))
+    images_dir = tmp_path / "outputs" / "s1" / "images"
+    slots = [make_slot("slot_a", 1), make_slot("slot_b", 2)]
+
+    enqueue_image_slots(queue, service, "s1", slots, None, None, images_dir)
+    assert {v["status"] for v in queued_slot_status(queue, "s1").values()} == {"generating"}
+
+    status = RenderStatusStore()
+    StubWorker(
+        queue, store=None, render_status=status, api_key="test", concurrency=2, cache_dir=str(tmp_path / "cache")
+    ).run(once=True)
+
+    images = queued_slot_status(queue, "s1")
+    assert images["slot_a"]["status"] == "done"
+    assert images["slot_a"]["url"] == "./images/slot_a.png"
+    assert (images_dir / "slot_b.png").exists()
+    assert status.get("s1")["images"]["slot_b"]["status"] == "done"
+
+    enqueue_image_slots(queue, service, "s1", slots, None, None, images_dir)
+    assert queue.lease("image", "w") == []
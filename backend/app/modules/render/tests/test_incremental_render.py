@@ -0,0 +1,70 @@
+"""
+测试增量渲染：修改一页只重新调用一次布局 LLM、只重新渲染受影响的片段
+"""
+
+import pytest
+
+from app.common.schemas import SlideDeckContent, SlidePage, TeachingRequest
+from app.modules.intent.parser import autofill_defaults
+from app.modules.render.core import ImageSlotResult
+from app.modules.render.fragments import get_fragment_cache
+from app.modules.render.renderer import HTMLRenderer
+from app.modules.style.core import choose_style
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        self.calls += 1
+        return {"selected_layout_id": "title_bullets", "alternative_layout_ids": ["title_bullets_right_img"]}, {}
+
+
+def make_deck(edited_title=None):
+    pages = [SlidePage(index=0, slide_type="title", title="液压传动")]
+    for i in range(1, 12):
+        title = edited_title if (i == 6 and edited_title) else f"液压泵原理 {i}"
+        pages.append(SlidePage(index=i, slide_type="concept", title=title))
+    return SlideDeckContent(deck_title="液压传动", pages=pages)
+
+
+@pytest.mark.asyncio
+async def test_editing_one_slide_rerenders_one_fragment(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_BATCH", "0")
+    get_fragment_cache().clear()
+    tr = autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    ))
+    style = choose_style(tr)
+    llm = CountingLLM()
+
+    first = await HTMLRenderer.render(make_deck(), style, tr, "s1", str(tmp_path), llm=llm)
+    assert llm.calls == 11
+    assert len(first.metadata["rerendered_pages"]) == 12
+    first.image_results = [
+        ImageSlotResult(slot_id=slot.slot_id, page_index=slot.page_index, status="done", image_path="images/x.png")
+        for slot in first.image_slots
+    ]
+
+    llm.calls = 0
+    second = await HTMLRenderer.render(make_deck("齿轮泵结构"), style, tr, "s1", str(tmp_path), llm=llm, previous=first)
+    assert llm.calls == 1
+    assert second.metadata["rerendered_pages"] == [6]
+    assert "齿轮泵结构" in second.html_content and "液压泵原理 6" not in second.html_content
+    assert (tmp_path / "index.html").read_text(encoding="utf-8") == second.html_content
+    # 第 6 页的插图需要重新生成，其余页面的插图保留
+    assert {r.page_index for r in second.image_results} == {2, 4, 8, 10}
+
+    # 进程重启（内存缓存清空）后，上次的布局决策仍从 RenderResult 中复用
+    get_fragment_cache().clear()
+    llm.calls = 0
+    third = await HTMLRenderer.render(make_deck("齿轮泵结构"), style, tr, "s1", str(tmp_path), llm=llm, previous=second)
+    assert llm.calls == 0
+    assert third.html_content == second.html_content
@@ -0,0 +1,127 @@
+"""
+测试两阶段布局决策（propose_layouts -> finalize_layout，与 HTMLRenderer 的用法一致）：
+各页 LLM 调用并行，顺序阶段避免相邻页重复
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.common.schemas import SlidePage, TeachingRequest
+from app.modules.intent.parser import autofill_defaults
+from app.modules.render.engine import LayoutEngine, LayoutProposal
+
+
+def make_request():
+    return autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    ))
+
+
+async def resolve(pages, llm):
+    proposals = await LayoutEngine.propose_layouts(pages, make_request(), llm)
+    layouts, previous = [], None
+    for page, proposal in zip(pages, proposals):
+        previous, _ = LayoutEngine.finalize_layout(page, proposal, page.index, previous)
+        layouts.append(previous)
+    return layouts
+
+
+class SlowLLM:
+    """每次调用固定耗时，总是首选同一布局并给出次优候选"""
+
+    def __init__(self, latency=0.1):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+        return {"selected_layout_id": "title_bullets_right_img",
+                "alternative_layout_ids": ["center_visual", "title_bullets"]}, {}
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_run_concurrently_and_repeats_are_avoided():
+    pages = [SlidePage(index=0, slide_type="title", title="液压传动")] + [
+        SlidePage(index=i, slide_type="concept", title=f"液压泵原理 {i}") for i in range(1, 11)
+    ]
+    llm = SlowLLM()
+
+    start = time.perf_counter()
+    layouts = await resolve(pages, llm)
+    elapsed = time.perf_counter() - start
+
+    # 10 次 LLM 往返并行，耗时约为 1-2 次往返
+    assert elapsed < 0.1 * 4
+    assert llm.max_in_flight > 1
+
+    assert layouts[0] == "title_only_center"
+    assert all(a != b for a, b in zip(layouts[1:], layouts[2:]))
+    assert layouts[1] == "title_bullets_right_img" and layouts[2] == "center_visual"
+
+
+def test_finalize_prefers_llm_alternatives_then_rules():
+    page = SlidePage(index=3, slide_type="concept", title="要点")
+    proposal = LayoutProposal(layout_id="title_bullets_right_img", alternatives=["grid_4"])
+    assert LayoutEngine.finalize_layout(page, proposal, 3, "title_bullets_right_img")[0] == "grid_4"
+
+    proposal = LayoutProposal(layout_id="title_bullets_right_img")
+    assert LayoutEngine.finalize_layout(page, proposal, 3, "title_bullets_right_img")[0] == "title_bullets_left_img"
+
+    fixed = LayoutProposal(layout_id="section_title_impact", fixed=True)
+    assert LayoutEngine.finalize_layout(page, fixed, 3, "section_title_impact")[0] == "section_title_impact"
+
+
+class BatchLayoutLLM:
+    """批量请求：按 index 返回布局；index 1 返回无效布局，触发逐页回退"""
+
+    def __init__(self):
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        payload = json.loads(user_msg)
+        if "items" not in payload:
+            self.single_calls += 1
+            return {"selected_layout_id": "grid_4", "alternative_layout_ids": []}, {}
+        self.batch_calls += 1
+        results = [
+            {"index": item["index"],
+             "selected_layout_id": "no_such_layout" if item["index"] == 1 else "title_bullets_right_img",
+             "alternative_layout_ids": ["center_visual"]}
+            for item in payload["items"]
+        ]
+        return {"results": results}, {}
+
+
+@pytest.mark.asyncio
+async def test_batched_layout_selection(monkeypatch):
+    monkeypatch.setenv("LLM_BATCH", "1")
+    monkeypatch.setenv("LLM_BATCH_SIZE", "4")
+    pages = [SlidePage(index=0, slide_type="title", title="液压传动")] + [
+        SlidePage(index=i, slide_type="concept", title=f"液压泵原理 {i}") for i in range(1, 9)
+    ]
+    llm = BatchLayoutLLM()
+
+    layouts = await resolve(pages, llm)
+
+    # 8 个非封面页分两批，批内 index 1（第 2 页）无效，单独回退一次
+    assert llm.batch_calls == 2 and llm.single_calls == 1
+    assert layouts[0] == "title_only_center"
+    assert layouts[2] == "grid_4"
+    assert all(a != b for a, b in zip(layouts[1:], layouts[2:]))
@@ -0,0 +1,143 @@
+"""
+测试异步 DashScope 提供方：对本地替身服务器走完 提交 -> 轮询 -> 流式下载；
+下载中断不留下残缺文件，多个 ImageService 实例的相同请求只生成一次
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.modules.render.providers import DashScopeImageProvider, ImageProvider, ImageProviderError
+from app.modules.render.services import ImageService
+
+IMAGE_BYTES = b"\x89PNG" + b"0" * 200_000
+
+
+class StubDashScope(BaseHTTPRequestHandler):
+    """模拟 DashScope 异步任务接口：第一次轮询返回 RUNNING，第二次 SUCCEEDED"""
+
+    polls = {}
+    throttle_submits = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert self.headers["X-DashScope-Async"] == "enable"
+        if StubDashScope.throttle_submits:
+            StubDashScope.throttle_submits -= 1
+            return self._json(429, {"code": "Throttling.RateQuota", "message": "slow down"})
+        if body["input"]["prompt"] == "rejected":
+            return self._json(400, {"code": "DataInspectionFailed", "message": "bad prompt"})
+        self._json(200, {"output": {"task_id": "t1", "task_status": "PENDING"}})
+
+    def do_GET(self):
+        if self.path.startswith("/api/v1/tasks/"):
+            n = StubDashScope.polls[self.path] = StubDashScope.polls.get(self.path, 0) + 1
+            if n < 2:
+                return self._json(200, {"output": {"task_status": "RUNNING"}})
+            url = f"http://127.0.0.1:{self.server.server_address[1]}/files/out.png"
+            return self._json(200, {"output": {"task_status": "SUCCEEDED", "results": [{"url": url}]}})
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(IMAGE_BYTES)))
+        self.end_headers()
+        self.wfile.write(IMAGE_BYTES)
+
+
+@pytest.fixture
+def stub_server():
+    StubDashScope.polls = {}
+    StubDashScope.throttle_submits = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDashScope)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_submit_poll_and_stream_download(stub_server, tmp_path):
+    async with httpx.AsyncClient() as client:
+        provider = DashScopeImageProvider("key", base_url=stub_server, client=client, poll_interval=0.01)
+        dest = tmp_path / "out.png"
+        assert await provider.generate("液压系统示意图", "1024*1024", dest)
+        assert dest.read_bytes() == IMAGE_BYTES
+
+        with pytest.raises(ImageProviderError):
+            await provider.generate("rejected", "1024*1024", tmp_path / "x.png")
+
+
+@pytest.mark.asyncio
+async def test_image_service_async_path_retries_and_caches(stub_server, tmp_path):
+    """限流时退避重试；成功后写入全局存储，第二次直接命中缓存"""
+    StubDashScope.throttle_submits = 1
+    async with httpx.AsyncClient() as client:
+        provider = DashScopeImageProvider("key", base_url=stub_server, client=client, poll_interval=0.01)
+        service = ImageService(api_key="key", cache_dir=str(tmp_path / "store"), provider=provider)
+        service.retry_base_seconds = 0
+
+        path = await service.agenerate_image("液压系统示意图", "slot_a")
+        assert path is not None
+        assert open(path, "rb").read() == IMAGE_BYTES
+        assert not list((tmp_path / "store" / "tmp").iterdir())
+
+        StubDashScope.throttle_submits = 99
+        assert await service.agenerate_image("液压系统示意图", "slot_b") == path
+
+
+class BrokenBody(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"\x89PNG" + b"0" * 1000
+        raise httpx.ReadError("connection reset")
+
+
+@pytest.mark.asyncio
+async def test_interrupted_download_keeps_previous_file(tmp_path):
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=BrokenBody()))
+    async with httpx.AsyncClient(transport=transport) as client:
+        provider = DashScopeImageProvider("key", client=client)
+        dest = tmp_path / "out.png"
+        dest.write_bytes(IMAGE_BYTES)
+        with pytest.raises(httpx.ReadError):
+            await provider.download("http://images/out.png", dest)
+    assert dest.read_bytes() == IMAGE_BYTES
+    assert list(tmp_path.iterdir()) == [dest]
+
+
+class SlowProvider(ImageProvider):
+    name = "slow"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def generate(self, prompt, size, dest):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        dest.write_bytes(IMAGE_BYTES)
+        return True
+
+
+@pytest.mark.asyncio
+async def test_same_request_is_generated_once_across_services(tmp_path):
+    provider = SlowProvider()
+    services = [ImageService(api_key="key", cache_dir=str(tmp_path / "store"), provider=provider) for _ in range(3)]
+
+    paths = await asyncio.gather(*(s.agenerate_image("液压系统示意图", f"slot_{i}") for i, s in enumerate(services * 2)))
+
+    assert provider.calls == 1
+    assert len(set(paths)) == 1 and paths[0] is not None
+    assert services[0].store._async_inflight == {}
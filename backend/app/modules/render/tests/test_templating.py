@@ -0,0 +1,34 @@
+"""
+测试共享模板环境：只编译一次、字节码缓存、单页片段与整套渲染一致
+"""
+
+from app.common.schemas import SlidePage
+from app.modules.render import templating
+from app.modules.render.renderer import HTMLRenderer
+
+
+def test_environment_is_shared_and_precompiled(template_cache_dir):
+    env = templating.get_environment()
+    assert templating.get_environment() is env
+    assert not env.auto_reload
+
+    count = templating.precompile_templates()
+    assert count >= 8
+    # 编译结果写入字节码缓存，重启后直接加载
+    assert len(list(template_cache_dir.iterdir())) == count
+    assert env.get_template("slide.html") is env.get_template("slide.html")
+
+
+def test_slide_fragment_matches_full_deck():
+    page = SlidePage(index=1, slide_type="concept", title="液压泵原理")
+    fragment = HTMLRenderer.render_slide(page, "title_bullets", [])
+    deck = templating.render_deck(
+        deck_title="液压传动",
+        slides=[HTMLRenderer._slide_data(page, "title_bullets", [])],
+        theme_name="business",
+        css_variables="",
+        poll_script="",
+        asset_base=".",
+    )
+    assert fragment.strip().startswith('<section')
+    assert fragment in deck
@@ -0,0 +1,248 @@
+"""
+Module 3.5: 图片生成 worker
+从持久化队列 (common.job_queue) 领取图片任务并执行，可与 web 进程分开部署、独立扩容。
+运行命令: cd backend && python -m app.modules.render.worker [--concurrency 4] [--once]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ...common.job_queue import FAILED, JobQueue, image_job_key
+from ...common.schemas import StyleConfig, TeachingRequest
+from ...common.shared_store import RenderStatusStore
+from ...common.store import BaseSessionStore
+from .core import ImageSlotRequest, ImageSlotResult, RenderResult
+from .image_store import link_or_copy
+from .services import ImageService
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = "image"
+
+
+def enqueue_image_slots(
+    queue: JobQueue,
+    service: ImageService,
+    session_id: str,
+    slots: List[ImageSlotRequest],
+    teaching_request: TeachingRequest,
+    style_config: StyleConfig,
+    images_dir: Path,
+) -> Dict[str, str]:
+    """为每个插槽入队一个任务，返回 {slot_id: 任务状态}。
+
+    提示词在入队时生成并写入 payload，worker 不需要再加载会话上下文。
+    """
+    statuses = {}
+    for slot in service.schedule_order(slots):
+        prompt = service.build_prompt(slot, teaching_request, style_config)
+        statuses[slot.slot_id] = queue.enqueue(
+            image_job_key(session_id, slot.slot_id, prompt),
+            JOB_KIND,
+            session_id,
+            {
+                "slot": slot.model_dump(mode="json"),
+                "prompt": prompt,
+                "images_dir": str(images_dir),
+            },
+            slot_id=slot.slot_id,
+            priority=slot.priority,
+            page_index=slot.page_index,
+        )
+    return statuses
+
+
+def queued_slot_status(queue: JobQueue, session_id: str) -> Dict[str, Dict[str, Any]]:
+    """队列中各插槽的状态，格式同 render_status（供轮询接口合并）"""
+    images = {}
+    for job in queue.session_jobs(session_id, kind=JOB_KIND):
+        if job["status"] == "done":
+            images[job["slot_id"]] = {"status": "done", **(job["result"] or {})}
+        elif job["status"] == FAILED:
+            images[job["slot_id"]] = {"status": "failed", "error": job["error"]}
+        else:
+            images[job["slot_id"]] = {"status": "generating", "url": None}
+    return images
+
+
+class ImageWorker:
+    """Lease image jobs, generate them on a bounded pool, publish results.
+
+    Results go to the render-status store (per slot) and into the session's
+    render_result.image_results via store.update(), so any web worker sees
+    them. Leases are extended while a job runs; if this process dies the
+    lease expires and another worker picks the job up.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        store: Optional[BaseSessionStore],
+        render_status: Optional[RenderStatusStore] = None,
+        api_key: Optional[str] = None,
+        concurrency: int = 4,
+        lease_seconds: float = 300,
+        poll_interval: float = 1.0,
+        worker_id: Optional[str] = None,
+    ):
+        self.queue = queue
+        self.store = store
+        self.render_status = render_status
+        self.api_key = api_key if api_key is not None else os.getenv("DASHSCOPE_API_KEY", "")
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.service = self._service()
+
+    def _service(self) -> ImageService:
+        return ImageService(api_key=self.api_key)
+
+    # --- single job --------------------------------------------------------
+
+    def process(self, job: Dict[str, Any]) -> ImageSlotResult:
+        payload = job["payload"]
+        slot = ImageSlotRequest.model_validate(payload["slot"])
+        service = self.service
+        start = time.time()
+
+        image_path = service.generate_image(payload["prompt"], slot.slot_id, slot_data=payload["slot"])
+        result = ImageSlotResult(
+            slot_id=slot.slot_id,
+            page_index=slot.page_index,
+            status="done" if image_path else "failed",
+            prompt=payload["prompt"],
+            image_path=image_path,
+            error=None if image_path else "Image generation failed",
+            model_used=os.getenv("DASHSCOPE_IMAGE_MODEL", "qwen-image-plus"),
+            generation_time_seconds=time.time() - start,
+        )
+        if not image_path:
+            status = self.queue.fail(job["job_key"], self.worker_id, result.error)
+            if status == FAILED:
+                self._publish(job["session_id"], result, None)
+            return result
+
+        # 从全局图片存储硬链接到会话目录并命名为 slot_id.png，HTML 离线时也能按约定路径引用
+        target = Path(payload["images_dir"]) / f"{slot.slot_id}{os.path.splitext(image_path)[1] or '.png'}"
+        link_or_copy(image_path, target)
+        url = f"./images/{target.name}"
+
+        self.queue.complete(job["job_key"], self.worker_id, {"url": url, "image_path": image_path})
+        self._publish(job["session_id"], result, url)
+        return result
+
+    def _publish(self, session_id: str, result: ImageSlotResult, url: Optional[str]) -> None:
+        if self.render_status is not None:
+            self.render_status.set_slot(session_id, result.slot_id, {
+                "status": result.status,
+                "url": url,
+                "image_path": result.image_path,
+                "error": result.error,
+            })
+        if self.store is None or self.store.load_fields(session_id, ["render_result"]) is None:
+            # mock 渲染没有会话记录，只更新状态
+            return
+
+        def apply_result(state):
+            if state.render_result:
+                rr = RenderResult.model_validate(state.render_result)
+                rr.image_results = [r for r in rr.image_results if r.slot_id != result.slot_id] + [result]
+                state.render_result = rr
+
+        self.store.update(session_id, apply_result)
+
+    def _run_job(self, job: Dict[str, Any]) -> None:
+        try:
+            self.process(job)
+        except Exception as e:
+            logger.exception(f"[IMG_WORKER] job {job['job_key']} crashed")
+            self.queue.fail(job["job_key"], self.worker_id, str(e))
+        finally:
+            with self._lock:
+                self._inflight.pop(job["job_key"], None)
+
+    # --- loop --------------------------------------------------------------
+
+    def _heartbeat(self) -> None:
+        with self._lock:
+            keys = list(self._inflight)
+        for key in keys:
+            self.queue.heartbeat(key, self.worker_id, self.lease_seconds)
+
+    def run(self, stop: Optional[threading.Event] = None, once: bool = False) -> None:
+        """Process jobs until `stop` is set (or the queue is drained when `once`)."""
+        stop = stop or threading.Event()
+        last_beat = time.time()
+        logger.info(f"[IMG_WORKER] {self.worker_id} started (concurrency={self.concurrency})")
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="image-worker") as pool:
+                while not stop.is_set():
+                    with self._lock:
+                        free = self.concurrency - len(self._inflight)
+                    jobs = self.queue.lease(JOB_KIND, self.worker_id, free, self.lease_seconds) if free > 0 else []
+                    for job in jobs:
+                        with self._lock:
+                            self._inflight[job["job_key"]] = pool.submit(self._run_job, job)
+
+                    if time.time() - last_beat > self.lease_seconds / 3:
+                        self._heartbeat()
+                        last_beat = time.time()
+
+                    if once and not jobs:
+                        with self._lock:
+                            futures = list(self._inflight.values())
+                        if not futures:
+                            break
+                        for future in futures:
+                            future.result()
+                        continue
+                    if not jobs:
+                        stop.wait(self.poll_interval)
+        finally:
+            # 线程池退出时已等待在途任务完成；异常退出时把仍持有的租约交还队列
+            self.queue.release(self.worker_id)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from dotenv import load_dotenv
+
+    from ...common.shared_store import create_render_status_store
+    from ...common.store import create_session_store
+
+    load_dotenv()
+    data_dir = str((Path(__file__).resolve().parents[3] / "data").resolve())
+
+    parser = argparse.ArgumentParser(description="Image generation worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("IMAGE_MAX_WORKERS") or 4))
+    parser.add_argument("--lease-seconds", type=float, default=float(os.getenv("IMAGE_QUEUE_LEASE_SECONDS") or 300))
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    queue = JobQueue.from_env(data_dir) or JobQueue(os.path.join(data_dir, "queue.sqlite"))
+    store = create_session_store(data_dir)
+    worker = ImageWorker(
+        queue,
+        store,
+        render_status=create_render_status_store(store),
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+    )
+    try:
+        worker.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
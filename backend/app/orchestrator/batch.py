@@ -0,0 +1,232 @@
+"""批量生成：从 CSV / JSONL 读取 user_text，为整门课的每节课各跑一次 WorkflowEngine.run。
+
+运行命令: cd backend && python -m app.orchestrator.batch lessons.csv [--stop-at 3.4] [--concurrency 4]
+
+- 输入：CSV（表头含 user_text，可选 session_id / style_name）或 JSONL（每行一个同名字段的对象）
+- 并发：最多 --concurrency 个会话同时运行；所有 LLM 请求仍经过进程级准入控制
+  （LLM_MAX_IN_FLIGHT / LLM_RPM / LLM_TPM，见 common/rate_limit.py），即全局 LLM 预算
+- 可恢复：session_id 由行内容确定，已到达目标阶段的会话直接跳过，中断后重跑只补未完成的部分
+- 报告：每个会话的各阶段耗时、状态与错误，写入 JSON 并在结束时打印汇总
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..common.security import validate_session_id
+from .engine import WorkflowEngine
+
+# run() 支持的 stop_at；"3.5" 表示跑完整个流程（stop_at=None）
+STAGES = ["3.1", "3.2", "3.3", "3.4", "3.5"]
+
+
+@dataclass
+class BatchItem:
+    session_id: str
+    user_text: str
+    style_name: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    session_id: str
+    status: str  # "ok" | "skipped" | "failed"
+    stage: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def _session_id_for(user_text: str) -> str:
+    return "batch-" + hashlib.sha1(user_text.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def load_items(path: str) -> List[BatchItem]:
+    """读取 CSV / JSONL；没有 session_id 的行按 user_text 生成稳定 ID（重跑时可恢复）"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    items: List[BatchItem] = []
+    seen = set()
+    for n, row in enumerate(rows, start=1):
+        user_text = (row.get("user_text") or "").strip()
+        if not user_text:
+            raise ValueError(f"{path}: row {n} has no user_text")
+        session_id = validate_session_id((row.get("session_id") or "").strip() or _session_id_for(user_text))
+        if session_id in seen:
+            continue
+        seen.add(session_id)
+        items.append(BatchItem(session_id, user_text, (row.get("style_name") or "").strip() or None))
+    return items
+
+
+def reached(state, target: str) -> bool:
+    """会话是否已完成目标阶段（3.1 需已确认需求）"""
+    if state is None or state.teaching_request is None:
+        return False
+    if state.teaching_request.interaction_stage != "confirmed":
+        return False
+    if target == "3.5":
+        return state.render_result is not None
+    return STAGES.index(state.stage) >= STAGES.index(target)
+
+
+class BatchRunner:
+    def __init__(self, engine: WorkflowEngine, stop_at: str = "3.4", concurrency: int = 4):
+        if stop_at not in STAGES:
+            raise ValueError(f"stop_at must be one of {STAGES}")
+        self.engine = engine
+        self.stop_at = stop_at
+        self.concurrency = max(1, concurrency)
+
+    async def _run_stage(self, item: BatchItem, stage: str, first: bool):
+        return await self.engine.run(
+            item.session_id,
+            item.user_text if first else None,
+            None,
+            True,
+            stop_at=None if stage == "3.5" else stage,
+            style_name=item.style_name,
+        )
+
+    async def run_one(self, item: BatchItem) -> BatchResult:
+        store, logger = self.engine.store, self.engine.logger
+        state = store.load(item.session_id)
+        if reached(state, self.stop_at):
+            return BatchResult(item.session_id, "skipped", stage=state.stage)
+
+        result = BatchResult(item.session_id, "ok")
+        try:
+            # 逐阶段调用 run()：已完成的阶段会被 run() 跳过，因此每次调用的耗时就是该阶段的耗时
+            for stage in STAGES[:STAGES.index(self.stop_at) + 1]:
+                if reached(state, stage):
+                    continue
+                start = time.perf_counter()
+                state, status, _ = await self._run_stage(item, stage, first=state is None or state.teaching_request is None)
+                if status == "need_user_input":
+                    # 批量模式没有人回答追问：直接采用解析结果与默认值
+                    state.teaching_request.interaction_stage = "confirmed"
+                    store.save(state)
+                    logger.emit(item.session_id, "3.1", "batch_auto_confirm", {})
+                    state, status, _ = await self._run_stage(item, stage, first=False)
+                result.timings[stage] = round(time.perf_counter() - start, 3)
+                if status != "ok":
+                    raise RuntimeError(f"stage {stage} ended with status {status}")
+            result.stage = state.stage
+        except Exception as e:
+            result.status = "failed"
+            result.stage = state.stage if state is not None else None
+            result.error = f"{type(e).__name__}: {e}"
+            logger.emit(item.session_id, "batch", "session_failed", {"error": result.error})
+        return result
+
+    async def run(self, items: List[BatchItem], on_result=None) -> List[BatchResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(item: BatchItem) -> BatchResult:
+            async with semaphore:
+                result = await self.run_one(item)
+            if on_result:
+                on_result(result)
+            return result
+
+        return list(await asyncio.gather(*(guarded(item) for item in items)))
+
+
+def summarize(results: List[BatchResult], stop_at: str, elapsed_s: float) -> Dict[str, Any]:
+    stage_stats: Dict[str, Dict[str, float]] = {}
+    for stage in STAGES:
+        values = sorted(r.timings[stage] for r in results if stage in r.timings)
+        if values:
+            stage_stats[stage] = {
+                "count": len(values),
+                "avg_s": round(sum(values) / len(values), 3),
+                "p50_s": values[len(values) // 2],
+                "max_s": values[-1],
+            }
+    counts = {status: sum(r.status == status for r in results) for status in ("ok", "skipped", "failed")}
+    return {
+        "stop_at": stop_at,
+        "total": len(results),
+        **counts,
+        "elapsed_s": round(elapsed_s, 3),
+        "stages": stage_stats,
+        "failures": [{"session_id": r.session_id, "stage": r.stage, "error": r.error} for r in results if r.status == "failed"],
+        "sessions": [asdict(r) for r in results],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from dotenv import load_dotenv
+
+    from ..common import LLMClient, WorkflowLogger
+    from ..common.llm_cache import LLMResponseCache
+    from ..common.llm_client import aclose_http_client
+    from ..common.stage_cache import StageCache
+    from ..common.store import create_session_store
+
+    load_dotenv()
+    data_dir = str((Path(__file__).resolve().parents[2] / "data").resolve())
+
+    parser = argparse.ArgumentParser(description="Batch deck generation from a CSV/JSONL of user_text prompts")
+    parser.add_argument("input", help="CSV (user_text column) or JSONL file")
+    parser.add_argument("--stop-at", default="3.4", choices=STAGES)
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY") or 4),
+                        help="sessions running at once (default: BATCH_CONCURRENCY or 4)")
+    parser.add_argument("--max-in-flight", type=int, help="global LLM requests in flight (overrides LLM_MAX_IN_FLIGHT)")
+    parser.add_argument("--tpm", type=int, help="global LLM tokens per minute (overrides LLM_TPM)")
+    parser.add_argument("--report", help="summary JSON path (default: data/batch/report-<time>.json)")
+    args = parser.parse_args(argv)
+
+    # 准入控制器首次使用时按环境变量创建，这里覆盖即可对所有会话生效
+    if args.max_in_flight:
+        os.environ["LLM_MAX_IN_FLIGHT"] = str(args.max_in_flight)
+    if args.tpm:
+        os.environ["LLM_TPM"] = str(args.tpm)
+
+    items = load_items(args.input)
+    engine = WorkflowEngine(
+        create_session_store(data_dir),
+        WorkflowLogger(data_dir),
+        LLMClient(cache=LLMResponseCache.from_env(data_dir)),
+        stage_cache=StageCache.from_env(data_dir),
+    )
+    runner = BatchRunner(engine, stop_at=args.stop_at, concurrency=args.concurrency)
+    done = [0]
+
+    def progress(result: BatchResult) -> None:
+        done[0] += 1
+        detail = result.error or ", ".join(f"{k}={v}s" for k, v in result.timings.items())
+        print(f"[{done[0]}/{len(items)}] {result.session_id} {result.status} {detail}", flush=True)
+
+    async def run_all() -> List[BatchResult]:
+        try:
+            return await runner.run(items, on_result=progress)
+        finally:
+            await aclose_http_client()
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    report = summarize(results, args.stop_at, time.perf_counter() - start)
+
+    report_path = Path(args.report or Path(data_dir) / "batch" / f"report-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(json.dumps({k: v for k, v in report.items() if k != "sessions"}, ensure_ascii=False, indent=2))
+    print(f"report: {report_path}")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,83 @@
+"""运行中断时的逐页检查点。
+
+3.3 / 3.4 每完成一页都会推送进度事件（slide / page，带完整的页面数据）。RunCheckpoint
+包装进度回调记下这些页面；运行被取消（客户端断开、重新提交）时写入 SessionState.checkpoint。
+重跑同一阶段时，只有阶段输入哈希与检查点一致才复用其中的页面，其余页面照常生成。
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from ..common.progress import ProgressCallback, emit_progress
+from ..common.schemas import OutlineSlide, SessionState, SlidePage
+
+# 阶段 -> (进度事件名, 事件中的数据字段, 模型)
+_ITEMS: Dict[str, tuple] = {
+    "3.3": ("slide", "slide", OutlineSlide),
+    "3.4": ("page", "page", SlidePage),
+}
+
+
+class RunCheckpoint:
+    def __init__(self) -> None:
+        self.state: Optional[SessionState] = None
+        self._keys: Dict[str, str] = {}
+        self._items: Dict[str, Dict[int, Dict[str, Any]]] = {}
+
+    def bind(self, state: SessionState) -> None:
+        self.state = state
+
+    def begin(self, stage: str, key: str) -> Dict[int, BaseModel]:
+        """开始记录 `stage`；返回可复用的已完成页面（检查点的输入哈希必须一致）"""
+        model = _ITEMS[stage][2]
+        saved = (self.state.checkpoint.get(stage) if self.state else None) or {}
+        items: Dict[int, Dict[str, Any]] = {}
+        if saved.get("key") == key:
+            items = {int(i): data for i, data in (saved.get("items") or {}).items()}
+        self._keys[stage] = key
+        self._items[stage] = dict(items)
+        return {i: model.model_validate(data) for i, data in items.items()}
+
+    def finish(self, stage: str) -> bool:
+        """阶段完成后检查点作废；返回会话中是否有需要清除的旧检查点"""
+        self._keys.pop(stage, None)
+        self._items.pop(stage, None)
+        if self.state is None:
+            return False
+        return self.state.checkpoint.pop(stage, None) is not None
+
+    def record(self, event: Dict[str, Any]) -> None:
+        stage = event.get("stage")
+        if stage not in self._keys or event.get("fallback"):
+            return
+        name, field, _ = _ITEMS[stage]
+        if event.get("event") == name and isinstance(event.get(field), dict):
+            self._items[stage][int(event["index"])] = event[field]
+
+    def wrap(self, on_progress: Optional[ProgressCallback]) -> ProgressCallback:
+        async def recording(event: Dict[str, Any]) -> None:
+            self.record(event)
+            await emit_progress(on_progress, event)
+
+        return recording
+
+    def save(self, store: Any, reason: str) -> int:
+        """把已完成的页面写入会话状态，返回记录的页数"""
+        if self.state is None:
+            return 0
+        count = 0
+        for stage, key in self._keys.items():
+            items = self._items.get(stage) or {}
+            if not items:
+                continue
+            self.state.checkpoint[stage] = {
+                "key": key,
+                "reason": reason,
+                "items": {str(i): data for i, data in sorted(items.items())},
+            }
+            count += len(items)
+        if count:
+            store.save(self.state)
+        return count
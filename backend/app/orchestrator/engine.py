@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import re
@@ -14,6 +15,7 @@ from ..common import (
     StyleConfig,
     StyleSampleSlide,
     PPTOutline,
+    OutlineSlide,
     SlideDeckContent,
     SessionState,
 )
@@ -36,18 +38,107 @@ from ..modules.content import build_base_deck, refine_with_llm, validate_deck
 from ..prompts.intent import INTENT_SYSTEM_PROMPT, INTENT_SCHEMA_HINT
 from ..prompts.style import STYLE_SYSTEM_PROMPT, STYLE_SCHEMA_HINT
 from ..prompts.outline import OUTLINE_SYSTEM_PROMPT
+from ..common.progress import ProgressCallback, emit_progress
+from ..common.budget import RunBudget, bind_run_budget, budget_shortfall, current_run_budget, record_degraded, unbind_run_budget
+from ..common.cancellation import CancellationToken, bind_cancel_token, unbind_cancel_token
+from ..common.fallbacks import RunFallbacks, bind_run_fallbacks, record_fallback, unbind_run_fallbacks, used_fallback
+from ..common.rate_limit import bind_llm_session, unbind_llm_session
+from ..common.stage_cache import StageCache, llm_fingerprint, request_fingerprint, stage_key
+from .checkpoint import RunCheckpoint
+from .pipeline import pipeline_applicable, run_pipeline
+from .speculation import SPECULATIVE_STAGES, SpeculationResult, SpeculativeExecutor
 
 
 # Enhanced system prompt with Few-Shot examples and tool usage guidance
 
 
 class WorkflowEngine:
-    def __init__(self, store, logger: WorkflowLogger, llm: LLMClient):
+    def __init__(
+        self,
+        store,
+        logger: WorkflowLogger,
+        llm: LLMClient,
+        stage_cache: Optional[StageCache] = None,
+        speculation: Optional[SpeculativeExecutor] = None,
+    ):
         self.store = store
         self.logger = logger
         self.llm = llm
+        self.stage_cache = stage_cache
+        # WORKFLOW_SPECULATION=1 时在 3.1 最终确认期间推测执行 3.2 + 3.3
+        self.speculation = speculation or SpeculativeExecutor.from_env(logger)
+        # 每个会话当前运行的取消令牌：同一会话重新提交时取消上一次运行
+        self._active_runs: Dict[str, CancellationToken] = {}
         self.tool_executor = ToolExecutor()
 
+    # ==================== 阶段缓存 (STAGE_CACHE=1) ====================
+
+    def _memo_get(self, session_id: str, stage: str, key: str) -> Optional[Any]:
+        if self.stage_cache is None:
+            return None
+        value = self.stage_cache.get(key)
+        self.logger.emit(session_id, stage, "memo_hit" if value is not None else "memo_miss", {"key": key[:16]})
+        return value
+
+    # ==================== 推测执行 (WORKFLOW_SPECULATION=1) ====================
+
+    def _speculation_key(self, req: TeachingRequest) -> str:
+        return stage_key("speculation", request_fingerprint(req), llm_fingerprint(self.llm))
+
+    def _speculate(
+        self,
+        session_id: str,
+        state: SessionState,
+        auto_fill_defaults_flag: bool,
+        style_name: Optional[str],
+    ) -> None:
+        """按“老师直接确认”的假设准备确认后的需求，在后台先跑 3.2 + 3.3"""
+        if (
+            self.speculation is None
+            or state.teaching_request.interaction_stage not in SPECULATIVE_STAGES
+            or state.style_config is not None
+            or state.outline is not None
+        ):
+            return
+        req = apply_user_answers(state.teaching_request.model_copy(deep=True), {"final_confirm": "确认，开始生成"})
+        if auto_fill_defaults_flag:
+            req = autofill_defaults(req)
+        if style_name:
+            req.style_name = style_name
+        key = self._speculation_key(req)
+
+        async def speculate() -> SpeculationResult:
+            cfg = choose_style(req)
+            samples = build_style_samples(req, cfg)
+            outline = await self._generate_outline(session_id, req, style_config=cfg)
+            return SpeculationResult(request=req, style_config=cfg, style_samples=samples, outline=outline)
+
+        self.speculation.start(session_id, key, speculate)
+
+    def _memo_put(self, session_id: str, stage: str, key: str, value: Any) -> None:
+        if self.stage_cache is None:
+            return
+        if used_fallback(stage):
+            # LLM 失败或预算不足时的降级结果不代表该输入的正常产出，不缓存
+            self.logger.emit(session_id, stage, "memo_skip", {"key": key[:16], "reason": "fallback"})
+            return
+        try:
+            digest = self.stage_cache.put(stage, key, value)
+            self.logger.emit(session_id, stage, "memo_store", {"key": key[:16], "digest": digest[:16]})
+        except Exception as e:
+            # 缓存写入失败不影响流程
+            self.logger.emit(session_id, stage, "memo_error", {"key": key[:16], "error": str(e)})
+
+    @staticmethod
+    def _note_degraded(state: SessionState, stage: str) -> None:
+        """阶段产出更新后，用本次运行的降级记录替换该阶段的旧记录"""
+        budget = current_run_budget()
+        state.degraded = [d for d in state.degraded if d["stage"] != stage]
+        if budget is not None:
+            state.degraded += sorted(
+                (dict(d) for d in budget.degraded if d["stage"] == stage), key=lambda d: d["index"]
+            )
+
     async def _parse_intent(
         self,
         session_id: str,
@@ -427,6 +518,8 @@ class WorkflowEngine:
         req: TeachingRequest,
         style_config: Optional[StyleConfig] = None,
         style_name: Optional[str] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        completed: Optional[Dict[int, OutlineSlide]] = None,
     ) -> PPTOutline:
         """生成PPT大纲（3.3模块）
 
@@ -436,6 +529,7 @@ class WorkflowEngine:
             style_config: 可选的StyleConfig对象（正常流程）
             style_name: 可选的style_name字符串（测试模式3.1->3.3）
                        如果都未提供，则从teaching_scene推断
+            completed: 上次被取消的运行中已优化完成的页面，直接复用
         """
         # 确定style_name：优先使用参数，其次从style_config获取，最后从teaching_scene推断
         if style_name:
@@ -451,8 +545,12 @@ class WorkflowEngine:
             else:
                 final_style_name = "theory_clean"
 
+        # 运行预算已不足以覆盖一次调用：整个阶段直接走确定性生成
+        budget_reason = budget_shortfall() if self.llm.is_enabled() else None
+        use_llm = self.llm.is_enabled() and budget_reason is None
+
         # 优先使用LLM智能规划
-        if self.llm.is_enabled():
+        if use_llm:
             try:
                 # 优先使用基于3.1预估分布的智能优化生成
                 outline = await generate_outline_from_distribution(
@@ -461,6 +559,8 @@ class WorkflowEngine:
                     logger=self.logger,
                     session_id=session_id,
                     style_name=final_style_name,
+                    on_progress=on_progress,
+                    completed=completed,
                 )
                 self.logger.emit(
                     session_id, "3.3", "outline_final", outline.model_dump(mode="json")
@@ -488,9 +588,12 @@ class WorkflowEngine:
         self.logger.emit(
             session_id, "3.3", "outline_base", outline.model_dump(mode="json")
         )
+        if budget_reason:
+            for slide in outline.slides:
+                record_degraded("3.3", slide.index, budget_reason)
 
         # 如果LLM启用，尝试对确定性生成的结果进行优化
-        if self.llm.is_enabled():
+        if use_llm:
             try:
                 schema_hint = outline.model_json_schema()
                 user_msg = json.dumps(
@@ -523,25 +626,28 @@ class WorkflowEngine:
                 
                 return optimized
             except Exception as e:
+                record_fallback("3.3")
                 self._handle_workflow_error(
                     session_id, "3.3", e, {"outline_available": True}
                 )
 
         # 即使LLM未启用优化，也尝试进行类型判断（如果LLM可用）
-        if self.llm.is_enabled():
+        if use_llm:
             try:
                 outline = await _refine_slide_types(
                     outline, self.llm, self.logger, session_id
                 )
             except Exception as e:
+                record_fallback("3.3")
                 self._handle_workflow_error(session_id, "3.3", e, {"type_refinement_failed": True})
         
         # 后处理assets：生成描述、补充size/style字段（如果LLM可用）
-        if self.llm.is_enabled():
+        if use_llm:
             try:
                 from ..modules.outline.core import _post_process_outline_assets
                 outline = await _post_process_outline_assets(outline, req, self.llm, self.logger, session_id)
             except Exception as e:
+                record_fallback("3.3")
                 self._handle_workflow_error(session_id, "3.3", e, {"assets_post_process_failed": True})
         else:
             # LLM不可用时，使用同步版本只补充字段
@@ -1013,6 +1119,10 @@ class WorkflowEngine:
         stop_at: Optional[str] = None,
         style_name: Optional[str] = None,
         intent_params: Optional[Dict[str, Any]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        deadline_s: Optional[float] = None,
+        token_budget: Optional[int] = None,
     ) -> Tuple[SessionState, str, List[Any]]:
         """Run the workflow until it either completes or needs user input.
 
@@ -1020,6 +1130,18 @@ class WorkflowEngine:
             stop_at: If set to "3.1", "3.2", "3.3", or "3.4", stop after that module.
             style_name: For test mode 3.1->3.3, allow user to specify style_name directly.
                        Valid values: "theory_clean", "practice_steps", "review_mindmap"
+            on_progress: Optional async callback receiving stage and per-slide
+                       events while 3.3/3.4 are running (used by the SSE endpoint).
+            cancel_token: Request-scoped token (cancelled e.g. when the client
+                       disconnects). Cancelling it cancels all pending LLM calls,
+                       checkpoints the finished 3.3/3.4 pages in the session and
+                       raises RunCancelled; the next run resumes from there.
+                       A new run for the same session cancels the previous one.
+            deadline_s / token_budget: Per-run limits (default: WORKFLOW_DEADLINE_S /
+                       WORKFLOW_TOKEN_BUDGET, 0 = unlimited). Once the remaining budget
+                       can't cover the expected latency of another LLM call, outline
+                       optimization, page refinement and the layout agent fall back to
+                       their heuristic paths; affected pages are listed in state.degraded.
 
         Returns: (state, status, questions)
           status: "ok" | "need_user_input"
@@ -1029,7 +1151,74 @@ class WorkflowEngine:
             import uuid
             session_id = uuid.uuid4().hex
 
+        cancel_token = cancel_token or CancellationToken()
+        previous = self._active_runs.get(session_id)
+        if previous is not None and previous is not cancel_token:
+            # 等上一次运行写完检查点再加载会话
+            previous.cancel("superseded")
+            await previous.drained()
+        self._active_runs[session_id] = cancel_token
+
+        # 本次运行中的所有 LLM 调用归属到该会话（用于准入控制的公平调度）
+        token = bind_llm_session(session_id)
+        cancel_binding = bind_cancel_token(cancel_token)
+        budget = RunBudget.from_env(deadline_s, token_budget)
+        budget_binding = bind_run_budget(budget)
+        fallbacks_binding = bind_run_fallbacks(RunFallbacks())
+        checkpoint = RunCheckpoint()
+        try:
+            # 各阶段的多次 save() 合并为运行结束时的一次落盘（存储支持时）
+            with self.store.coalesce_saves():
+                try:
+                    result = await cancel_token.run(self._run(
+                        session_id,
+                        user_text,
+                        answers,
+                        auto_fill_defaults_flag,
+                        stop_at=stop_at,
+                        style_name=style_name,
+                        intent_params=intent_params,
+                        on_progress=on_progress,
+                        checkpoint=checkpoint,
+                    ))
+                    if budget is not None and budget.degraded:
+                        self.logger.emit(session_id, "system", "run_degraded", {
+                            **budget.summary(), "pages": budget.degraded,
+                        })
+                    return result
+                except asyncio.CancelledError:
+                    reason = cancel_token.reason or "cancelled"
+                    saved = checkpoint.save(self.store, reason)
+                    self.logger.emit(session_id, "system", "run_cancelled", {
+                        "reason": reason,
+                        "stage": checkpoint.state.stage if checkpoint.state else None,
+                        "checkpointed_items": saved,
+                    })
+                    raise
+        finally:
+            unbind_run_fallbacks(fallbacks_binding)
+            unbind_run_budget(budget_binding)
+            unbind_cancel_token(cancel_binding)
+            unbind_llm_session(token)
+            if self._active_runs.get(session_id) is cancel_token:
+                del self._active_runs[session_id]
+
+    async def _run(
+        self,
+        session_id: str,
+        user_text: Optional[str],
+        answers: Optional[Dict[str, Any]],
+        auto_fill_defaults_flag: bool,
+        stop_at: Optional[str] = None,
+        style_name: Optional[str] = None,
+        intent_params: Optional[Dict[str, Any]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        checkpoint: Optional[RunCheckpoint] = None,
+    ) -> Tuple[SessionState, str, List[Any]]:
         state = self.store.load(session_id) or self.store.create(session_id)
+        checkpoint = checkpoint or RunCheckpoint()
+        checkpoint.bind(state)
+        on_progress = checkpoint.wrap(on_progress)
 
         # --- Stage 3.1 ---
         if state.teaching_request is None:
@@ -1162,6 +1351,7 @@ class WorkflowEngine:
                 state.teaching_request
             )
             self.store.save(state)
+            self._speculate(session_id, state, auto_fill_defaults_flag, style_name)
             return state, "need_user_input", questions
 
         # Check if user has confirmed (interaction_stage == "confirmed")
@@ -1216,6 +1406,7 @@ class WorkflowEngine:
 
         # --- Stage 3.2 (自动执行，无交互) ---
         # 已删除3.2交互流程，直接基于TeachingRequest自动生成StyleConfig
+        speculated: Optional[SpeculationResult] = None
         if state.style_config is None:
             # 使用 TeachingRequest 中的 style_name（在3.1中自动设置或用户指定）
             # 如果前端传入了 style_name 参数，优先使用（兼容旧接口）
@@ -1224,6 +1415,25 @@ class WorkflowEngine:
                 # 临时设置 style_name 以便 choose_style 使用正确的模板
                 state.teaching_request.style_name = final_style_name
 
+            # 确认后的需求与推测时完全一致才采用推测结果，否则推测任务被取消
+            if self.speculation is not None and state.outline is None:
+                speculated = await self.speculation.take(
+                    session_id, self._speculation_key(state.teaching_request)
+                )
+
+        if state.style_config is None and speculated is not None:
+            state.style_config = speculated.style_config
+            state.style_samples = speculated.style_samples
+            state.stage = "3.2"
+            self.store.save(state)
+            self.logger.emit(
+                session_id,
+                "3.2",
+                "auto_complete",
+                {"style_name": speculated.style_config.style_name, "mode": "speculation"},
+            )
+
+        if state.style_config is None:
             self.logger.emit(session_id, "3.2", "auto_generate", {
                 "mode": "auto",
                 "style_name": final_style_name or "auto_from_teaching_scene",
@@ -1232,8 +1442,15 @@ class WorkflowEngine:
             })
 
             # 自动生成 StyleConfig（无LLM交互，纯规则生成）
-            cfg = choose_style(state.teaching_request)
-            samples = build_style_samples(state.teaching_request, cfg)
+            style_memo_key = stage_key("3.2", request_fingerprint(state.teaching_request))
+            memo = self._memo_get(session_id, "3.2", style_memo_key)
+            if memo is not None:
+                cfg = StyleConfig.model_validate(memo["style_config"])
+                samples = [StyleSampleSlide.model_validate(s) for s in memo["style_samples"]]
+            else:
+                cfg = choose_style(state.teaching_request)
+                samples = build_style_samples(state.teaching_request, cfg)
+                self._memo_put(session_id, "3.2", style_memo_key, {"style_config": cfg, "style_samples": samples})
 
             state.style_config = cfg
             state.style_samples = samples
@@ -1251,6 +1468,63 @@ class WorkflowEngine:
         if stop_at == "3.2":
             return state, "ok", []
 
+        if state.outline is None and speculated is not None:
+            state.outline = speculated.outline
+            state.stage = "3.3"
+            self._note_degraded(state, "3.3")
+            self.store.save(state)
+            self.logger.emit(
+                session_id,
+                "3.3",
+                "complete",
+                {"slide_count": len(speculated.outline.slides), "mode": "speculation"},
+            )
+
+        # 下游阶段的缓存键包含上游阶段的输出：上游任何变化都会使下游失效
+        req_fp = request_fingerprint(state.teaching_request)
+        llm_fp = llm_fingerprint(self.llm)
+
+        def outline_memo_key() -> str:
+            return stage_key("3.3", req_fp, state.style_config, llm_fp)
+
+        def deck_memo_key() -> str:
+            return stage_key("3.4", req_fp, state.style_config, state.outline, llm_fp)
+
+        if state.outline is None:
+            memo = self._memo_get(session_id, "3.3", outline_memo_key())
+            if memo is not None:
+                state.outline = PPTOutline.model_validate(memo)
+                state.stage = "3.3"
+                self._note_degraded(state, "3.3")
+                self.store.save(state)
+                await emit_progress(on_progress, {"stage": "3.3", "event": "memo_hit"})
+
+        # --- Stage 3.3 + 3.4 流水线（WORKFLOW_PIPELINE=1，可选） ---
+        pipelined_deck: Optional[SlideDeckContent] = None
+        if (
+            state.outline is None
+            and state.deck_content is None
+            and stop_at != "3.3"
+            and pipeline_applicable(state.teaching_request, self.llm)
+        ):
+            outline, pipelined_deck = await run_pipeline(
+                session_id,
+                state.teaching_request,
+                state.style_config,
+                self.llm,
+                self.logger,
+                on_progress=on_progress,
+                completed_slides=checkpoint.begin("3.3", outline_memo_key()),
+                completed_pages=checkpoint.begin("3.4", stage_key("3.4", outline_memo_key(), "pipeline")),
+            )
+            self.logger.emit(session_id, "3.3", "outline_final", outline.model_dump(mode="json"))
+            self._memo_put(session_id, "3.3", outline_memo_key(), outline)
+            state.outline = outline
+            state.stage = "3.3"
+            self._note_degraded(state, "3.3")
+            self.store.save(state)
+            self.logger.emit(session_id, "3.3", "complete", {"slide_count": len(outline.slides), "mode": "pipeline"})
+
         # --- Stage 3.3 ---
         if state.outline is None:
             # 使用自动生成的 style_config
@@ -1264,11 +1538,18 @@ class WorkflowEngine:
                     "style_config_available": True,
                 },
             )
+            await emit_progress(on_progress, {"stage": "3.3", "event": "stage_start"})
             outline = await self._generate_outline(
-                session_id, state.teaching_request, style_config=state.style_config
+                session_id,
+                state.teaching_request,
+                style_config=state.style_config,
+                on_progress=on_progress,
+                completed=checkpoint.begin("3.3", outline_memo_key()),
             )
+            self._memo_put(session_id, "3.3", outline_memo_key(), outline)
             state.outline = outline
             state.stage = "3.3"
+            self._note_degraded(state, "3.3")
             self.store.save(state)
             self.logger.emit(
                 session_id,
@@ -1277,6 +1558,9 @@ class WorkflowEngine:
                 {"slide_count": len(outline.slides) if outline.slides else 0},
             )
 
+        if state.outline is not None and checkpoint.finish("3.3"):
+            self.store.save(state)
+
         # Check if we should stop at 3.3
         if stop_at == "3.3":
             return state, "ok", []
@@ -1286,15 +1570,25 @@ class WorkflowEngine:
             base = build_base_deck(
                 state.teaching_request, state.style_config, state.outline
             )
-            deck = await refine_with_llm(
-                session_id,
-                self.llm,
-                self.logger,
-                state.teaching_request,
-                state.style_config,
-                state.outline,
-                base,
-            )
+            memo = None if pipelined_deck is not None else self._memo_get(session_id, "3.4", deck_memo_key())
+            if pipelined_deck is not None:
+                deck = pipelined_deck
+            elif memo is not None:
+                deck = SlideDeckContent.model_validate(memo)
+                await emit_progress(on_progress, {"stage": "3.4", "event": "memo_hit"})
+            else:
+                await emit_progress(on_progress, {"stage": "3.4", "event": "stage_start"})
+                deck = await refine_with_llm(
+                    session_id,
+                    self.llm,
+                    self.logger,
+                    state.teaching_request,
+                    state.style_config,
+                    state.outline,
+                    base,
+                    on_progress=on_progress,
+                    completed=checkpoint.begin("3.4", deck_memo_key()),
+                )
             ok, errs = validate_deck(state.outline, deck)
             if not ok:
                 self.logger.emit(session_id, "3.4", "validate_failed", {"errors": errs})
@@ -1303,19 +1597,33 @@ class WorkflowEngine:
                 self.logger.emit(
                     session_id, "3.4", "validate_ok", {"pages": len(deck.pages)}
                 )
+                if memo is None:
+                    self._memo_put(session_id, "3.4", deck_memo_key(), deck)
+            checkpoint.finish("3.4")
             state.deck_content = deck
             state.stage = "3.4"
+            self._note_degraded(state, "3.4")
             self.store.save(state)
 
+        # Check if we should stop at 3.4 (3.5 由 /api/workflow/render 渲染到会话输出目录)
+        if stop_at == "3.4":
+            return state, "ok", []
+
         # --- Stage 3.5 ---
         if state.render_result is None:
-            from ..modules.render import render_html_slides
+            await emit_progress(on_progress, {"stage": "3.5", "event": "stage_start"})
+            from ..modules.render import RenderResult, render_html_slides
             from ..modules.render.services import ImageService
 
-            # 渲染HTML幻灯片
             # 渲染HTML幻灯片
             template_id = state.style_config.style_name if state.style_config else "business"
-            
+
+            # HTML 内嵌会话 ID、图片属于各自会话，因此只缓存布局决策（metadata.pages）：
+            # 命中时作为 previous 传入，渲染器跳过布局 LLM，只在本会话目录重新拼接 HTML
+            render_memo_key = stage_key(
+                "3.5", req_fp, state.style_config, state.deck_content, template_id, llm_fp
+            )
+            memo = self._memo_get(session_id, "3.5", render_memo_key)
             render_result = await render_html_slides(
                 deck_content=state.deck_content,
                 style_config=state.style_config,
@@ -1324,18 +1632,25 @@ class WorkflowEngine:
                 output_dir=f"outputs/{session_id}",
                 llm=self.llm,
                 template_id=template_id,
+                previous=RenderResult.model_validate(memo) if memo is not None else None,
             )
+            if memo is None:
+                self._memo_put(
+                    session_id,
+                    "3.5",
+                    render_memo_key,
+                    render_result.model_copy(update={"html_content": None, "image_results": []}),
+                )
 
             state.render_result = render_result
 
             # 初始化图片生成器（用于后续API调用）
             api_key = os.getenv("DASHSCOPE_API_KEY")
             if api_key:
-                state.image_filler = ImageService(
-                    api_key=api_key, cache_dir=f"outputs/{session_id}/images_cache"
-                )
+                state.image_filler = ImageService(api_key=api_key)
 
             state.stage = "3.5"
+            self._note_degraded(state, "3.5")
             self.store.save(state)
 
             self.logger.emit(
@@ -0,0 +1,190 @@
+"""3.3 -> 3.4 -> 布局 的跨阶段流水线（可选）。
+
+默认流程按阶段顺序执行：全部大纲页优化完 -> 素材描述 -> 基础页 -> 逐页内容 -> 渲染时再选布局，
+整体耗时是各阶段最慢一页之和。流水线模式下每一页大纲优化完立即进入 3.4 逐页生成，
+生成完立即预取布局候选（写入渲染缓存），阶段之间用有界队列连接（下游慢时上游自然背压）。
+总耗时约等于最慢的单页链路。
+
+页面骨架（序号、标题、类型）在优化前已确定，3.4 的大纲上下文（相邻页 + 大纲哈希）直接取自骨架，
+因此任何一页都不需要等待其它页完成。
+
+Env:
+  - WORKFLOW_PIPELINE: 1 = 启用 (default: 0)
+  - WORKFLOW_PIPELINE_QUEUE: 阶段间队列长度 (default: 4)
+  - WORKFLOW_PIPELINE_WORKERS: 3.4 与布局阶段各自的并发数 (default: 8)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..common import LLMClient, WorkflowLogger
+from ..common.fallbacks import record_fallback, used_fallback
+from ..common.progress import ProgressCallback, emit_progress
+from ..common.schemas import OutlineSlide, PPTOutline, SlideDeckContent, SlidePage, StyleConfig, TeachingRequest
+from ..modules.content.core import _generate_single_page, build_base_page, outline_digest
+from ..modules.outline.core import (
+    _build_slides_from_distribution,
+    _deck_context,
+    _has_valid_distribution,
+    _process_slide_assets,
+    optimize_outline_slide,
+    outline_from_slides,
+)
+
+_DONE = object()
+
+
+def pipeline_enabled() -> bool:
+    return os.getenv("WORKFLOW_PIPELINE") == "1"
+
+
+def pipeline_applicable(req: TeachingRequest, llm: LLMClient) -> bool:
+    """流水线只替代“按预估分布 + LLM 逐页优化”这条主路径，其余情况走原有顺序流程"""
+    return pipeline_enabled() and llm.is_enabled() and _has_valid_distribution(req.estimated_page_distribution)
+
+
+async def run_pipeline(
+    session_id: str,
+    req: TeachingRequest,
+    style: StyleConfig,
+    llm: LLMClient,
+    logger: WorkflowLogger,
+    template_id: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    completed_slides: Optional[Dict[int, OutlineSlide]] = None,
+    completed_pages: Optional[Dict[int, SlidePage]] = None,
+) -> Tuple[PPTOutline, SlideDeckContent]:
+    """返回 (3.3 大纲, 3.4 页面内容)；布局候选作为副作用写入渲染缓存
+
+    completed_slides / completed_pages 为上次被取消的运行中已完成的页面，直接复用。
+    """
+    completed_slides = completed_slides or {}
+    completed_pages = completed_pages or {}
+    from ..modules.render.renderer import HTMLRenderer
+
+    queue_size = max(1, int(os.getenv("WORKFLOW_PIPELINE_QUEUE") or 4))
+    workers = max(1, int(os.getenv("WORKFLOW_PIPELINE_WORKERS") or 8))
+    template_id = template_id or style.style_name
+
+    skeleton = _build_slides_from_distribution(req)
+    total = len(skeleton)
+    # 3.4 的上下文只用到序号/标题/类型，优化过程中不会改变
+    context_outline = outline_from_slides(req, [s.model_copy() for s in skeleton])
+    digest = outline_digest(context_outline)
+    deck_context = _deck_context(req, total)
+
+    slides: Dict[int, OutlineSlide] = {}
+    pages: Dict[int, SlidePage] = {}
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    to_content: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    to_layout: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    logger.emit(session_id, "pipeline", "start", {
+        "slide_count": total, "queue_size": queue_size, "workers": workers, "outline_digest": digest,
+    })
+    await emit_progress(on_progress, {"stage": "3.3", "event": "stage_start"})
+    await emit_progress(on_progress, {"stage": "3.4", "event": "stage_start"})
+
+    async def outline_stage(slide: OutlineSlide) -> None:
+        if slide.index in completed_slides:
+            slide = completed_slides[slide.index].model_copy(deep=True)
+        else:
+            slide = await optimize_outline_slide(slide, deck_context, llm, logger, session_id, on_progress)
+            try:
+                slide = await _process_slide_assets(slide, req, llm, logger, session_id)
+            except Exception as e:
+                logger.emit(session_id, "3.3", "slide_assets_error", {"slide_index": slide.index, "error": str(e)})
+                record_fallback("3.3", slide.index)
+        slides[slide.index] = slide
+        await emit_progress(on_progress, {
+            "stage": "3.3", "event": "slide", "index": slide.index,
+            "total": total, "slide": slide.model_dump(mode="json"),
+            "fallback": used_fallback("3.3", slide.index),
+        })
+        await to_content.put(slide)
+
+    async def outline_producer() -> None:
+        try:
+            await asyncio.gather(*(outline_stage(s) for s in skeleton))
+        finally:
+            timings["outline_s"] = round(time.perf_counter() - start, 3)
+            for _ in range(workers):
+                await to_content.put(_DONE)
+
+    async def content_worker() -> None:
+        while True:
+            slide = await to_content.get()
+            if slide is _DONE:
+                break
+            base_page = build_base_page(req, context_outline, slide)
+            try:
+                if slide.index in completed_pages:
+                    page = completed_pages[slide.index].model_copy(deep=True)
+                else:
+                    page = await _generate_single_page(
+                        session_id=session_id,
+                        llm=llm,
+                        logger=logger,
+                        req=req,
+                        style=style,
+                        full_outline=context_outline,
+                        page_outline=slide,
+                        base_page=base_page,
+                        page_index=slide.index,
+                        total_pages=total,
+                        digest=digest,
+                        on_progress=on_progress,
+                    )
+                fallback = used_fallback("3.4", slide.index)
+            except Exception as e:
+                logger.emit(session_id, "3.4", "page_fallback", {"page_index": slide.index, "reason": str(e)})
+                record_fallback("3.4", slide.index)
+                page, fallback = base_page, True
+            pages[page.index] = page
+            timings.setdefault("first_page_s", round(time.perf_counter() - start, 3))
+            await emit_progress(on_progress, {
+                "stage": "3.4", "event": "page", "index": page.index,
+                "total": total, "fallback": fallback, "page": page.model_dump(mode="json"),
+            })
+            await to_layout.put(page)
+
+    async def content_stage() -> None:
+        try:
+            await asyncio.gather(*(content_worker() for _ in range(workers)))
+        finally:
+            timings["content_s"] = round(time.perf_counter() - start, 3)
+            for _ in range(workers):
+                await to_layout.put(_DONE)
+
+    async def layout_worker() -> None:
+        while True:
+            page = await to_layout.get()
+            if page is _DONE:
+                break
+            try:
+                await HTMLRenderer.prefetch_layout(page, req, llm, template_id)
+            except Exception as e:
+                # 渲染阶段会重新选择布局
+                logger.emit(session_id, "pipeline", "layout_prefetch_error", {"page_index": page.index, "error": str(e)})
+
+    tasks = [
+        asyncio.ensure_future(outline_producer()),
+        asyncio.ensure_future(content_stage()),
+        *(asyncio.ensure_future(layout_worker()) for _ in range(workers)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    outline = outline_from_slides(req, [slides[s.index] for s in skeleton])
+    deck = SlideDeckContent(deck_title=outline.deck_title, pages=[pages[s.index] for s in skeleton])
+    timings["total_s"] = round(time.perf_counter() - start, 3)
+    logger.emit(session_id, "pipeline", "complete", {"slide_count": total, **timings})
+    return outline, deck
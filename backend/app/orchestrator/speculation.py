@@ -0,0 +1,158 @@
+"""3.1 确认阶段的推测执行（可选）。
+
+confirm_goals / final_confirm 时 run() 返回 need_user_input，老师通常 30~120 秒后才回答，
+而且大多数情况只是确认默认值。推测执行在问题返回的同时，用当前 TeachingRequest
+（按确认时的方式补全默认值）在后台先跑 3.2 + 3.3：
+  - 确认后的需求指纹与推测时一致：直接采用推测结果（仍在运行则等待其完成）
+  - 不一致（老师修改了页数、知识点等）：取消并丢弃
+推测结果从不写入会话状态，只有被采用时才由 run() 保存。
+
+预算：同时运行的推测数有上限；LLM 准入队列已有等待请求时不再发起推测，
+推测请求也按独立会话参与准入控制的轮转调度，不会挤占正式请求。
+
+Env:
+  - WORKFLOW_SPECULATION: 1 = 启用 (default: 0)
+  - WORKFLOW_SPECULATION_MAX: 同时运行的推测数上限 (default: 2)
+  - WORKFLOW_SPECULATION_TTL: 推测结果保留秒数 (default: 600)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..common import WorkflowLogger
+from ..common.budget import bind_run_budget, unbind_run_budget
+from ..common.cancellation import bind_cancel_token, unbind_cancel_token
+from ..common.fallbacks import bind_run_fallbacks, unbind_run_fallbacks
+from ..common.rate_limit import bind_llm_session, get_admission_controller, unbind_llm_session
+from ..common.schemas import PPTOutline, StyleConfig, StyleSampleSlide, TeachingRequest
+
+# 会在确认问题之后直接进入 3.2 的交互阶段
+SPECULATIVE_STAGES = ("confirm_goals", "final_confirm")
+
+
+@dataclass
+class SpeculationResult:
+    request: TeachingRequest
+    style_config: StyleConfig
+    style_samples: List[StyleSampleSlide]
+    outline: PPTOutline
+
+
+@dataclass
+class _Speculation:
+    key: str
+    task: "asyncio.Task[SpeculationResult]"
+    started: float = field(default_factory=time.monotonic)
+
+
+class SpeculativeExecutor:
+    """每个会话最多一个推测任务，按需求指纹提交或丢弃"""
+
+    def __init__(self, logger: WorkflowLogger, max_in_flight: int = 2, ttl_seconds: float = 600, admission=None):
+        self.logger = logger
+        self.max_in_flight = max(0, int(max_in_flight))
+        self.ttl_seconds = float(ttl_seconds)
+        self.admission = admission or get_admission_controller()
+        self._speculations: Dict[str, _Speculation] = {}
+        self._stats = {"started": 0, "skipped_budget": 0, "committed": 0, "discarded": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls, logger: WorkflowLogger) -> Optional["SpeculativeExecutor"]:
+        if os.getenv("WORKFLOW_SPECULATION") != "1":
+            return None
+        return cls(
+            logger,
+            max_in_flight=int(os.getenv("WORKFLOW_SPECULATION_MAX") or 2),
+            ttl_seconds=float(os.getenv("WORKFLOW_SPECULATION_TTL") or 600),
+        )
+
+    def _running(self) -> int:
+        return sum(not s.task.done() for s in self._speculations.values())
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for session_id, spec in list(self._speculations.items()):
+            if spec.task.done() and now - spec.started > self.ttl_seconds:
+                del self._speculations[session_id]
+
+    def start(
+        self,
+        session_id: str,
+        key: str,
+        factory: Callable[[], Awaitable[SpeculationResult]],
+    ) -> bool:
+        """在预算内发起推测；同一会话同一指纹的推测已存在时不重复发起"""
+        self._purge_expired()
+        existing = self._speculations.get(session_id)
+        if existing is not None:
+            if existing.key == key:
+                return False
+            self.discard(session_id, "request_changed")
+
+        if self._running() >= self.max_in_flight or self.admission.stats()["queued"] > 0:
+            self._stats["skipped_budget"] += 1
+            self.logger.emit(session_id, "speculation", "skipped", {
+                "running": self._running(), "max_in_flight": self.max_in_flight,
+            })
+            return False
+
+        async def run() -> SpeculationResult:
+            # 推测请求在准入控制中单独轮转，不与该会话的正式请求共用队列；
+            # 推测比发起它的请求活得久，不受该请求取消令牌和运行预算的影响（由 take/discard 取消）
+            token = bind_llm_session(f"speculation:{session_id}")
+            cancel_binding = bind_cancel_token(None)
+            budget_binding = bind_run_budget(None)
+            fallbacks_binding = bind_run_fallbacks(None)
+            try:
+                return await factory()
+            finally:
+                unbind_run_fallbacks(fallbacks_binding)
+                unbind_run_budget(budget_binding)
+                unbind_cancel_token(cancel_binding)
+                unbind_llm_session(token)
+
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._speculations[session_id] = _Speculation(key, task)
+        self._stats["started"] += 1
+        self.logger.emit(session_id, "speculation", "start", {"key": key[:16]})
+        return True
+
+    async def take(self, session_id: str, key: str) -> Optional[SpeculationResult]:
+        """指纹一致时返回推测结果（必要时等待完成），否则取消并返回 None"""
+        spec = self._speculations.pop(session_id, None)
+        if spec is None:
+            return None
+        if spec.key != key:
+            spec.task.cancel()
+            self._stats["discarded"] += 1
+            self.logger.emit(session_id, "speculation", "discarded", {"reason": "request_changed"})
+            return None
+        if spec.task.cancelled():
+            return None
+        try:
+            result = await spec.task
+        except Exception as e:
+            self._stats["failed"] += 1
+            self.logger.emit(session_id, "speculation", "failed", {"error": str(e)})
+            return None
+        self._stats["committed"] += 1
+        self.logger.emit(session_id, "speculation", "commit", {
+            "key": key[:16], "age_s": round(time.monotonic() - spec.started, 3),
+        })
+        return result
+
+    def discard(self, session_id: str, reason: str) -> None:
+        spec = self._speculations.pop(session_id, None)
+        if spec is None:
+            return
+        spec.task.cancel()
+        self._stats["discarded"] += 1
+        self.logger.emit(session_id, "speculation", "discarded", {"reason": reason})
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "running": self._running(), "sessions": len(self._speculations)}
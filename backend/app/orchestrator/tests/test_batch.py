@@ -0,0 +1,72 @@
+"""
+测试批量生成：CSV/JSONL 输入、并发跑到目标阶段、失败记录进报告、重跑时跳过或从断点继续
+"""
+
+import json
+
+import pytest
+
+from app.common import LLMClient, WorkflowLogger
+from app.common.store import create_session_store
+from app.orchestrator import WorkflowEngine
+from app.orchestrator.batch import BatchRunner, load_items, summarize
+
+
+def make_engine(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    return WorkflowEngine(create_session_store(data_dir), WorkflowLogger(data_dir), LLMClient())
+
+
+def test_load_items_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "lessons.csv"
+    csv_path.write_text('user_text,style_name\n液压传动基础，理论课,\n"电工基础：欧姆定律,实训课",practice_steps\n液压传动基础，理论课,\n', encoding="utf-8")
+    items = load_items(str(csv_path))
+    assert len(items) == 2
+    assert items[1].style_name == "practice_steps"
+    assert load_items(str(csv_path))[0].session_id == items[0].session_id
+
+    jsonl_path = tmp_path / "lessons.jsonl"
+    jsonl_path.write_text(json.dumps({"session_id": "lesson-01", "user_text": "机械制图"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    assert load_items(str(jsonl_path))[0].session_id == "lesson-01"
+
+    jsonl_path.write_text(json.dumps({"session_id": "../x", "user_text": "机械制图"}) + "\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_items(str(jsonl_path))
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_concurrently_and_resumes(tmp_path, monkeypatch):
+    engine = make_engine(tmp_path, monkeypatch)
+    path = tmp_path / "lessons.jsonl"
+    path.write_text("\n".join(json.dumps({"session_id": sid, "user_text": text}, ensure_ascii=False) for sid, text in [
+        ("hydraulics", "液压传动基础，讲解液压泵的工作原理，理论课"),
+        ("circuits", "电工基础：欧姆定律，实训课"),
+        ("bad", "机械制图：三视图，理论课"),
+    ]), encoding="utf-8")
+    items = load_items(str(path))
+
+    generate_outline = engine._generate_outline
+
+    async def flaky_outline(session_id, *args, **kwargs):
+        if session_id == "bad":
+            raise RuntimeError("outline service down")
+        return await generate_outline(session_id, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "_generate_outline", flaky_outline)
+    runner = BatchRunner(engine, stop_at="3.4", concurrency=2)
+    results = await runner.run(items)
+    report = summarize(results, "3.4", 1.0)
+
+    assert (report["ok"], report["failed"]) == (2, 1)
+    assert report["failures"] == [{"session_id": "bad", "stage": "3.2", "error": "RuntimeError: outline service down"}]
+    assert report["stages"]["3.4"]["count"] == 2
+    ok = engine.store.load("hydraulics")
+    assert ok.stage == "3.4" and ok.deck_content is not None and ok.render_result is None
+
+    # 重跑：已完成的跳过，失败的从 3.3 继续
+    monkeypatch.setattr(engine, "_generate_outline", generate_outline)
+    results = {r.session_id: r for r in await runner.run(items)}
+    assert results["hydraulics"].status == "skipped"
+    assert results["bad"].status == "ok"
+    assert sorted(results["bad"].timings) == ["3.3", "3.4"]
@@ -0,0 +1,131 @@
+"""
+测试运行预算：截止时间 / token 预算不足以覆盖一次调用时，各步骤改走启发式路径并记录降级页面
+"""
+
+import json
+
+import pytest
+
+from app.common import LLMClient, WorkflowLogger
+from app.common.budget import BudgetExhausted, RunBudget, bind_run_budget, unbind_run_budget
+from app.common.stage_cache import StageCache
+from app.common.store import create_session_store
+from app.modules.content import build_base_deck
+from app.modules.content.core import PAGE_SCHEMA_HINT
+from app.modules.render.engine import LayoutEngine
+from app.orchestrator import WorkflowEngine
+from app.orchestrator.batch import BatchItem, BatchRunner
+
+
+class PageLLM:
+    """3.4 逐页生成，记录被调用的页面"""
+
+    def __init__(self):
+        self.calls = []
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        if schema_hint != PAGE_SCHEMA_HINT:
+            return {}, {}
+        outline = json.loads(user_msg)["current_page_outline"]
+        self.calls.append(outline["index"])
+        return {
+            "index": outline["index"],
+            "slide_type": outline["slide_type"],
+            "title": outline["title"],
+            "elements": [
+                {"id": "t1", "type": "text", "content": {"text": outline["title"], "role": "title"}},
+                {"id": "b1", "type": "bullets", "content": {"items": ["LLM 生成"]}},
+            ],
+        }, {}
+
+
+async def engine_at_outline(tmp_path, monkeypatch, stage_cache=None):
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    engine = WorkflowEngine(
+        create_session_store(data_dir), WorkflowLogger(data_dir), LLMClient(), stage_cache=stage_cache,
+    )
+    results = await BatchRunner(engine, stop_at="3.3").run([BatchItem("s1", "液压传动基础，讲解液压泵的工作原理，理论课")])
+    assert results[0].status == "ok"
+    return engine
+
+
+def test_run_budget_accounting():
+    now = [0.0]
+    budget = RunBudget(deadline_s=60, token_budget=3000, expected_latency_s=10, clock=lambda: now[0])
+    assert budget.shortfall() is None
+    budget.reserve(1000)
+    budget.reserve(1000)
+    with pytest.raises(BudgetExhausted) as exc:
+        budget.reserve(1500)
+    assert exc.value.reason == "token_budget"
+
+    now[0] = 20.0
+    budget.settle(1000, 800, latency_s=20.0)
+    assert budget.tokens_used == 800 and budget.expected_latency_s == pytest.approx(13.0)
+    assert budget.timeout(180) == pytest.approx(40.0)
+
+    now[0] = 50.0
+    assert budget.shortfall() == "deadline"
+    assert RunBudget.from_env() is None
+
+
+@pytest.mark.asyncio
+async def test_exhausted_deadline_falls_back_to_base_pages(tmp_path, monkeypatch):
+    engine = await engine_at_outline(tmp_path, monkeypatch, stage_cache=StageCache())
+    state = engine.store.load("s1")
+    base = build_base_deck(state.teaching_request, state.style_config, state.outline)
+    engine.llm = llm = PageLLM()
+
+    fallbacks = []
+
+    async def on_progress(event):
+        if event.get("event") == "page":
+            fallbacks.append((event["index"], event["fallback"]))
+
+    entries = engine.stage_cache.stats()["entries"]
+
+    # 预期单次调用 15 秒，截止时间只剩 1 秒：不发起任何页面生成请求
+    monkeypatch.setenv("LLM_EXPECTED_LATENCY_S", "15")
+    state, status, _ = await engine.run("s1", None, None, True, stop_at="3.4", on_progress=on_progress, deadline_s=1)
+    assert status == "ok" and state.stage == "3.4"
+    assert llm.calls == []
+
+    degraded = [d["index"] for d in state.degraded if d["stage"] == "3.4"]
+    assert degraded and all(d["reason"] == "deadline" for d in state.degraded)
+    for index in degraded:
+        # 基础页面的元素 id 每次随机生成，只比较内容
+        page, base_page = state.deck_content.pages[index - 1], base.pages[index - 1]
+        assert [e.content for e in page.elements] == [e.content for e in base_page.elements]
+    assert sorted(i for i, fallback in fallbacks if fallback) == degraded
+    # 降级的产出不写入阶段缓存
+    assert engine.stage_cache.stats()["entries"] == entries
+
+    # 不限预算重跑：被降级的页面走 LLM 生成，该阶段的降级记录随之清除
+    state.deck_content = None
+    engine.store.save(state)
+    state, status, _ = await engine.run("s1", None, None, True, stop_at="3.4")
+    assert status == "ok" and sorted(llm.calls) == degraded
+    assert [d for d in state.degraded if d["stage"] == "3.4"] == []
+
+
+@pytest.mark.asyncio
+async def test_layout_agent_degrades_to_rule_scoring(tmp_path, monkeypatch):
+    engine = await engine_at_outline(tmp_path, monkeypatch)
+    state = engine.store.load("s1")
+    deck = build_base_deck(state.teaching_request, state.style_config, state.outline)
+    page = next(p for p in deck.pages if LayoutEngine._map_by_slide_type(p.slide_type) is None)
+
+    budget = RunBudget(token_budget=100)
+    binding = bind_run_budget(budget)
+    try:
+        proposal = await LayoutEngine.propose_layout(page, state.teaching_request, page.index, PageLLM())
+    finally:
+        unbind_run_budget(binding)
+
+    assert proposal.degraded
+    assert proposal.layout_id == LayoutEngine._score_and_select(page, state.teaching_request, None)
+    assert budget.degraded == [{"stage": "3.5", "index": page.index, "reason": "token_budget"}]
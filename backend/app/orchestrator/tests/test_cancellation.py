@@ -0,0 +1,170 @@
+"""
+测试取消传播：客户端断开 / 重新提交时取消未完成的 LLM 请求，已完成的页面写入检查点，重跑时只生成剩余页面；接口返回被取消运行所在的阶段
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from app.common import LLMClient, WorkflowLogger
+from app.common.cancellation import CancellationToken, RunCancelled, watch_disconnect
+from app.common.store import create_session_store
+from app.modules.content.core import PAGE_SCHEMA_HINT
+from app.orchestrator import WorkflowEngine
+from app.orchestrator.batch import BatchItem, BatchRunner
+
+FAST_PAGES = {1, 2, 3, 4}
+
+
+class PageLLM:
+    """3.4 逐页生成：FAST_PAGES 立即返回，其余页面阻塞直到 release 被设置"""
+
+    def __init__(self, fast=None):
+        self.fast = FAST_PAGES if fast is None else fast
+        self.release = asyncio.Event()
+        self.calls = []
+        self.cancelled = 0
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        if schema_hint != PAGE_SCHEMA_HINT:
+            return {}, {}
+        outline = json.loads(user_msg)["current_page_outline"]
+        self.calls.append(outline["index"])
+        if outline["index"] not in self.fast:
+            try:
+                await self.release.wait()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return {
+            "index": outline["index"],
+            "slide_type": outline["slide_type"],
+            "title": outline["title"],
+            "elements": [
+                {"id": "t1", "type": "text", "content": {"text": outline["title"], "role": "title"}},
+                {"id": "b1", "type": "bullets", "content": {"items": outline.get("bullets") or ["要点"]}},
+            ],
+        }, {}
+
+
+class FakeRequest:
+    def __init__(self):
+        self.gone = False
+
+    async def is_disconnected(self):
+        return self.gone
+
+
+async def engine_at_outline(tmp_path, monkeypatch):
+    """用确定性流程跑到 3.3，之后换成可控的 LLM"""
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    engine = WorkflowEngine(create_session_store(data_dir), WorkflowLogger(data_dir), LLMClient())
+    results = await BatchRunner(engine, stop_at="3.3").run([BatchItem("s1", "液压传动基础，讲解液压泵的工作原理，理论课")])
+    assert results[0].status == "ok"
+    return engine
+
+
+async def wait_for_pages(pages, count):
+    for _ in range(200):
+        if len(pages) >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"only {len(pages)} pages finished")
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_fanout_and_rerun_resumes(tmp_path, monkeypatch):
+    engine = await engine_at_outline(tmp_path, monkeypatch)
+    total = len(engine.store.load("s1").outline.slides)
+    engine.llm = llm = PageLLM()
+
+    pages = []
+
+    async def on_progress(event):
+        if event.get("event") == "page":
+            pages.append(event["index"])
+
+    token, request = CancellationToken(), FakeRequest()
+    watcher = asyncio.create_task(watch_disconnect(request, token, interval=0.01))
+    run = asyncio.create_task(engine.run("s1", None, None, True, stop_at="3.4", on_progress=on_progress, cancel_token=token))
+    await wait_for_pages(pages, len(FAST_PAGES))
+
+    request.gone = True
+    with pytest.raises(RunCancelled) as exc:
+        await run
+    await watcher
+    assert exc.value.reason == "client_disconnected"
+    assert llm.cancelled == total - len(FAST_PAGES)
+
+    state = engine.store.load("s1")
+    assert state.deck_content is None
+    assert sorted(int(i) for i in state.checkpoint["3.4"]["items"]) == sorted(FAST_PAGES)
+
+    # 重跑：只生成检查点之外的页面
+    engine.llm = rerun_llm = PageLLM(fast=set(range(1, total + 1)))
+    state, status, _ = await engine.run("s1", None, None, True, stop_at="3.4")
+    assert status == "ok" and state.stage == "3.4"
+    assert sorted(rerun_llm.calls) == [i for i in range(1, total + 1) if i not in FAST_PAGES]
+    assert [p.index for p in state.deck_content.pages] == list(range(1, total + 1))
+    assert state.checkpoint == {}
+
+
+@pytest.mark.asyncio
+async def test_resubmit_supersedes_running_request(tmp_path, monkeypatch):
+    engine = await engine_at_outline(tmp_path, monkeypatch)
+    engine.llm = llm = PageLLM()
+
+    pages = []
+
+    async def on_progress(event):
+        if event.get("event") == "page":
+            pages.append(event["index"])
+
+    first = asyncio.create_task(engine.run("s1", None, None, True, stop_at="3.4", on_progress=on_progress))
+    await wait_for_pages(pages, len(FAST_PAGES))
+
+    llm.release.set()
+    state, status, _ = await engine.run("s1", None, None, True, stop_at="3.4")
+    with pytest.raises(RunCancelled) as exc:
+        await first
+    assert exc.value.reason == "superseded"
+    assert status == "ok" and state.deck_content is not None
+    # 第一次运行完成的页面没有再次生成
+    assert sorted(llm.calls).count(1) == 1
+
+
+def test_cancelled_run_reports_its_stage(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import app.main as main
+
+    class CancelledEngine:
+        async def run(self, **kwargs):
+            raise RunCancelled("superseded")
+
+    store = create_session_store(str(tmp_path / "data"))
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "logger", WorkflowLogger(str(tmp_path / "data")))
+    monkeypatch.setattr(main, "engine", CancelledEngine())
+    state = store.create("s1")
+    state.stage = "3.3"
+    store.save(state)
+    client = TestClient(main.app)
+
+    def run():
+        return client.post("/api/workflow/run", json={"session_id": "s1"}).json()
+
+    assert run()["stage"] == "3.3" and run()["message"] == "cancelled: superseded"
+
+    # 3.4 进行到一半被取消：检查点记录了正在进行的阶段
+    state = store.load("s1")
+    state.checkpoint = {"3.4": {"key": "k", "reason": "superseded", "items": {}}}
+    store.save(state)
+    assert run()["stage"] == "3.4"
+
+    assert client.post("/api/workflow/run", json={}).json()["stage"] == "3.1"
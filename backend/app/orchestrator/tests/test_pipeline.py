@@ -0,0 +1,104 @@
+"""
+测试 3.3 -> 3.4 -> 布局 流水线：结果与顺序流程一致，总耗时约为最慢的单页链路而不是各阶段最慢之和
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.common.schemas import TeachingRequest
+from app.modules.content import build_base_deck, refine_with_llm, validate_deck
+from app.modules.content.core import PAGE_SCHEMA_HINT
+from app.modules.intent.parser import autofill_defaults
+from app.modules.outline import generate_outline_from_distribution
+from app.modules.render.fragments import get_fragment_cache, page_key
+from app.modules.style.core import choose_style
+from app.orchestrator.pipeline import run_pipeline
+
+SLOW = 0.4
+
+
+class DummyLogger:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, session_id, stage, kind, payload):
+        self.events.append((stage, kind, payload))
+
+
+class StageLLM:
+    """3.3 第 3 页和 3.4 第 6 页很慢，其余调用很快"""
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, **kwargs):
+        if schema_hint.startswith('{"bullets"'):
+            payload = json.loads(user_msg)
+            await asyncio.sleep(SLOW if payload["slide_index"] == 3 else 0.02)
+            return {"bullets": [f"{payload['title']} 要点1", f"{payload['title']} 要点2"]}, {}
+        if schema_hint == PAGE_SCHEMA_HINT:
+            outline = json.loads(user_msg)["current_page_outline"]
+            await asyncio.sleep(SLOW if outline["index"] == 6 else 0.02)
+            return {
+                "index": outline["index"],
+                "slide_type": outline["slide_type"],
+                "title": outline["title"],
+                "elements": [
+                    {"id": "t1", "type": "text", "content": {"text": outline["title"], "role": "title"}},
+                    {"id": "b1", "type": "bullets", "content": {"items": outline["bullets"]}},
+                ],
+            }, {}
+        await asyncio.sleep(0.02)
+        return {}, {}
+
+
+def make_request():
+    return autofill_defaults(TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    ))
+
+
+@pytest.mark.asyncio
+async def test_pipeline_matches_sequential_and_overlaps_stages(monkeypatch):
+    monkeypatch.setenv("LLM_BATCH", "0")
+    get_fragment_cache().clear()
+    req, llm = make_request(), StageLLM()
+    style = choose_style(req)
+
+    start = time.perf_counter()
+    outline = await generate_outline_from_distribution(req, llm, DummyLogger(), "seq")
+    deck = await refine_with_llm("seq", llm, DummyLogger(), req, style, outline, build_base_deck(req, style, outline))
+    sequential_s = time.perf_counter() - start
+
+    logger, events = DummyLogger(), []
+
+    async def on_progress(event):
+        events.append((event["stage"], event["event"]))
+
+    start = time.perf_counter()
+    p_outline, p_deck = await run_pipeline("pipe", req, style, llm, logger, on_progress=on_progress)
+    pipeline_s = time.perf_counter() - start
+
+    assert [s.title for s in p_outline.slides] == [s.title for s in outline.slides]
+    assert [p.title for p in p_deck.pages] == [p.title for p in deck.pages]
+    assert validate_deck(p_outline, p_deck)[0]
+    assert sequential_s >= 2 * SLOW
+    assert pipeline_s < 1.6 * SLOW
+
+    # 3.4 的页面在 3.3 全部完成之前就开始产出
+    first_page = events.index(("3.4", "page"))
+    last_slide = len(events) - 1 - events[::-1].index(("3.3", "slide"))
+    assert first_page < last_slide
+
+    # 布局候选已写入渲染缓存
+    cache = get_fragment_cache()
+    subject = req.subject_info.subject_name if req.subject_info else ""
+    assert all(cache.get(f"proposal:{page_key(page, style.style_name, subject)}") for page in p_deck.pages)
+    complete = [payload for stage, kind, payload in logger.events if (stage, kind) == ("pipeline", "complete")]
+    assert complete and complete[0]["slide_count"] == len(p_deck.pages)
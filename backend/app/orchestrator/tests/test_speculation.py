@@ -0,0 +1,103 @@
+"""
+测试推测执行：最终确认期间后台先跑 3.2 + 3.3，需求不变时直接采用，需求改变时丢弃，超出预算时不发起
+"""
+
+import pytest
+
+from app.common import LLMClient, WorkflowLogger
+from app.common.schemas import TeachingRequest
+from app.common.store import create_session_store
+from app.orchestrator import WorkflowEngine
+from app.orchestrator.speculation import SpeculativeExecutor
+
+CONFIRM = {"final_confirm": "确认，开始生成"}
+
+
+class RecordingLogger(WorkflowLogger):
+    def __init__(self, data_dir):
+        super().__init__(data_dir)
+        self.events = []
+
+    def emit(self, session_id, stage, kind, payload):
+        self.events.append((session_id, stage, kind))
+        super().emit(session_id, stage, kind, payload)
+
+
+def make_engine(tmp_path, monkeypatch, max_in_flight=2):
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    logger = RecordingLogger(data_dir)
+    engine = WorkflowEngine(
+        create_session_store(data_dir), logger, LLMClient(),
+        speculation=SpeculativeExecutor(logger, max_in_flight=max_in_flight),
+    )
+    calls = []
+    generate_outline = engine._generate_outline
+
+    async def counting_outline(session_id, req, *args, **kwargs):
+        calls.append(session_id)
+        return await generate_outline(session_id, req, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "_generate_outline", counting_outline)
+    return engine, calls
+
+
+def waiting_for_confirmation(engine, session_id):
+    req = TeachingRequest(
+        subject="液压",
+        knowledge_points=[{"id": "k1", "name": "液压泵"}],
+        teaching_scene="theory",
+        teaching_objectives={"knowledge": ["理解液压泵原理"], "ability": ["分析液压回路"], "literacy": ["安全意识"]},
+    )
+    req.interaction_stage = "final_confirm"
+    state = engine.store.create(session_id)
+    state.teaching_request = req
+    engine.store.save(state)
+
+
+@pytest.mark.asyncio
+async def test_confirmed_defaults_commit_speculated_outline(tmp_path, monkeypatch):
+    engine, calls = make_engine(tmp_path, monkeypatch)
+    waiting_for_confirmation(engine, "s1")
+
+    state, status, questions = await engine.run("s1", None, None, True)
+    assert status == "need_user_input" and questions[0].key == "final_confirm"
+    assert state.style_config is None and state.outline is None
+    await engine.speculation._speculations["s1"].task
+    assert calls == ["s1"]
+
+    state, status, _ = await engine.run("s1", None, CONFIRM, True, stop_at="3.3")
+    assert status == "ok" and state.stage == "3.3"
+    assert calls == ["s1"]  # 没有再次生成大纲
+    assert ("s1", "speculation", "commit") in engine.logger.events
+    assert len(state.outline.slides) == 10
+    assert engine.speculation.stats()["committed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_changed_request_discards_speculation(tmp_path, monkeypatch):
+    engine, calls = make_engine(tmp_path, monkeypatch)
+    waiting_for_confirmation(engine, "s1")
+    await engine.run("s1", None, None, True)
+    await engine.speculation._speculations["s1"].task
+
+    # 确认时改选了模板：指纹不同，推测结果被丢弃并重新生成
+    state, status, _ = await engine.run("s1", None, CONFIRM, True, stop_at="3.3", style_name="practice_steps")
+    assert status == "ok" and state.style_config.style_name == "practice_steps"
+    assert ("s1", "speculation", "discarded") in engine.logger.events
+    assert calls == ["s1", "s1"]
+    assert engine.speculation.stats() == {
+        "started": 1, "skipped_budget": 0, "committed": 0, "discarded": 1, "failed": 0, "running": 0, "sessions": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_speculation_respects_budget(tmp_path, monkeypatch):
+    engine, calls = make_engine(tmp_path, monkeypatch, max_in_flight=0)
+    waiting_for_confirmation(engine, "s1")
+    await engine.run("s1", None, None, True)
+    assert ("s1", "speculation", "skipped") in engine.logger.events
+
+    state, status, _ = await engine.run("s1", None, CONFIRM, True, stop_at="3.3")
+    assert status == "ok" and state.outline is not None
+    assert calls == ["s1"]
@@ -0,0 +1,90 @@
+"""
+测试 SSE 接口 /api/workflow/run/stream：session 最先、done 最后，3.4 每页的流式 delta 事件先于该页的 page 事件
+"""
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.common import LLMClient, WorkflowLogger
+from app.common.store import create_session_store
+from app.modules.content.core import PAGE_SCHEMA_HINT
+from app.orchestrator import WorkflowEngine
+from app.orchestrator.batch import BatchItem, BatchRunner
+
+
+class StreamingPageLLM:
+    """3.4 逐页生成：按块把页面 JSON 交给 on_delta，后面的页面先完成"""
+
+    def __init__(self):
+        self.streamed = []
+
+    def is_enabled(self):
+        return True
+
+    async def chat_json(self, system_prompt, user_msg, schema_hint, on_delta=None, **kwargs):
+        if schema_hint != PAGE_SCHEMA_HINT:
+            return {}, {}
+        outline = json.loads(user_msg)["current_page_outline"]
+        page = {
+            "index": outline["index"],
+            "slide_type": outline["slide_type"],
+            "title": outline["title"],
+            "elements": [
+                {"id": "t1", "type": "text", "content": {"text": outline["title"], "role": "title"}},
+                {"id": "b1", "type": "bullets", "content": {"items": outline.get("bullets") or ["要点"]}},
+            ],
+        }
+        if on_delta is not None:
+            self.streamed.append(outline["index"])
+            text = json.dumps(page, ensure_ascii=False).ljust(600)
+            for i in range(0, len(text), 150):
+                await on_delta(text[i:i + 150])
+                await asyncio.sleep(0.002 * (20 - outline["index"]))
+        return page, {}
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_reports_page_deltas_before_each_page(tmp_path, monkeypatch):
+    import app.main as main
+
+    monkeypatch.setenv("LLM_MODE", "mock")
+    data_dir = str(tmp_path / "data")
+    engine = WorkflowEngine(create_session_store(data_dir), WorkflowLogger(data_dir), LLMClient())
+    results = asyncio.run(BatchRunner(engine, stop_at="3.3").run([BatchItem("s1", "液压传动基础，讲解液压泵的工作原理，理论课")]))
+    assert results[0].status == "ok"
+    total = len(engine.store.load("s1").outline.slides)
+    engine.llm = llm = StreamingPageLLM()
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setattr(main, "logger", engine.logger)
+
+    client = TestClient(main.app)
+    response = client.post("/api/workflow/run/stream", json={"session_id": "s1", "stop_at": "3.4", "auto_fill_defaults": True})
+    events = parse_sse(response.text)
+
+    assert events[0] == ("session", {"session_id": "s1"})
+    assert events[-1][0] == "done"
+    assert events[-1][1]["status"] == "ok" and events[-1][1]["stage"] == "3.4"
+    progress = [data for kind, data in events[1:-1]]
+    assert all(kind == "progress" for kind, _ in events[1:-1])
+    assert progress[0] == {"stage": "3.4", "event": "stage_start"}
+
+    assert sorted(llm.streamed) == list(range(1, total + 1))
+    pages = [e["index"] for e in progress if e["event"] == "page"]
+    assert sorted(pages) == list(range(1, total + 1))
+    # 后面的页面先完成：page 事件按完成顺序推送
+    assert pages[0] > pages[-1]
+    for index in pages:
+        per_slide = [e for e in progress if e.get("index") == index]
+        assert [e["event"] for e in per_slide[:-1]] == ["delta"] * (len(per_slide) - 1)
+        assert per_slide[-1]["event"] == "page"
+        chars = [e["chars"] for e in per_slide[:-1]]
+        assert len(chars) >= 2 and chars == sorted(chars)
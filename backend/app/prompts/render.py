@@ -16,7 +16,7 @@ def get_layout_prompt(style_modifier: str = "") -> str:
 你会收到以下信息：
 1. **slide_content**: 当前页内容（标题、要点、图片数量）
 2. **available_layouts**: 可用布局列表
-3. **previous_layout**: 前一页使用的布局（用于避免重复）
+3. **previous_layout**: 前一页使用的布局（用于避免重复；为 null 时各页并行决策，由系统根据 alternative_layout_ids 去重）
 4. **avoid_if_possible**: 应尽量避免的布局列表
 
 {style_modifier}
@@ -48,6 +48,7 @@ def get_layout_prompt(style_modifier: str = "") -> str:
 ## 输出格式
 {{
   "selected_layout_id": "string",
+  "alternative_layout_ids": ["string"],  // 次优布局，按适合程度排序（2-3 个），用于与相邻页去重
   "reasoning": "选择理由（中文）",
   "content_refinement": {{
     "suggested_bullets": ["string"]  // 如需精简，否则 null
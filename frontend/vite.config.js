@@ -11,6 +11,10 @@ export default defineConfig({
         target: 'http://127.0.0.1:8000',
         changeOrigin: true,
       },
+      '/assets': {
+        target: 'http://127.0.0.1:8000',
+        changeOrigin: true,
+      },
       '/static': {
         target: 'http://127.0.0.1:8000',
         changeOrigin: true,